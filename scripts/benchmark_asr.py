@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# benchmark_asr.py
+"""
+语音识别上传模式基准测试
+在本地模拟NLS服务（scripts/mock_nls_server.py）上分别用实时模式和快速模式识别不同时长的PCM音频，
+对比每秒音频的识别耗时（需要安装nls SDK: pip install alibabacloud-nls-python-sdk）
+
+用法:
+    python scripts/benchmark_asr.py
+    python scripts/benchmark_asr.py --durations 5,30,60 --frame-bytes 6400 --speed 20
+    python scripts/benchmark_asr.py --external   # 使用ASR_URL指向的已启动服务
+"""
+import sys
+import os
+import time
+import argparse
+import tempfile
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.mock_nls_server import MockNlsServer, BYTES_PER_SECOND
+from src.config.config import config
+from src.services.media_processor import AliyunASRProcessor
+
+
+def make_pcm(seconds: float) -> str:
+    """生成指定时长的静音PCM文件"""
+    path = os.path.join(tempfile.gettempdir(), f"bench_asr_{seconds}s.pcm")
+    with open(path, 'wb') as f:
+        f.write(b'\x00' * int(seconds * BYTES_PER_SECOND))
+    return path
+
+
+def run(label: str, processor: AliyunASRProcessor, durations, repeat: int):
+    for seconds in durations:
+        path = make_pcm(seconds)
+        elapsed = []
+        result = None
+        for _ in range(repeat):
+            started_at = time.time()
+            result = processor.recognize_speech(path)
+            elapsed.append(time.time() - started_at)
+        avg = sum(elapsed) / len(elapsed)
+        print(f"{label:<8}{seconds:>8.0f}{avg:>10.2f}{avg / seconds:>12.3f}   {result}")
+        os.remove(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="语音识别上传模式基准测试")
+    parser.add_argument('--durations', default='5,15,30,60', help="逗号分隔的音频时长（秒）")
+    parser.add_argument('--repeat', type=int, default=2, help="每个时长重复次数")
+    parser.add_argument('--frame-bytes', type=int, default=3200, help="快速模式每帧字节数")
+    parser.add_argument('--port', type=int, default=8093, help="内置模拟服务端口")
+    parser.add_argument('--speed', type=float, default=10.0, help="模拟服务识别速度（实时倍数）")
+    parser.add_argument('--external', action='store_true', help="使用ASR_URL指向的服务（不启动内置模拟服务）")
+    args = parser.parse_args()
+
+    try:
+        import nls  # noqa: F401
+    except ImportError:
+        print("❌ 未安装nls SDK，请运行: pip install alibabacloud-nls-python-sdk")
+        return
+
+    server = None
+    if not args.external:
+        server = MockNlsServer(speed=args.speed)
+        server.start_in_thread(port=args.port)
+        config.asr_url = f"ws://127.0.0.1:{args.port}/ws/v1"
+
+    durations = [float(d) for d in args.durations.split(',')]
+    print(f"服务: {config.asr_url}  快速模式帧大小: {args.frame_bytes} 字节")
+    print(f"{'模式':<8}{'音频s':>8}{'耗时s':>10}{'耗时/音频s':>12}   结果")
+    try:
+        realtime = AliyunASRProcessor(fast_mode=False)
+        realtime.url = config.asr_url
+        run('实时', realtime, durations, args.repeat)
+
+        fast = AliyunASRProcessor(fast_mode=True, frame_bytes=args.frame_bytes)
+        fast.url = config.asr_url
+        run('快速', fast, durations, args.repeat)
+    finally:
+        if server:
+            server.stop_thread()
+
+
+if __name__ == "__main__":
+    main()
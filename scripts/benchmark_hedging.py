@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# benchmark_hedging.py
+"""
+对冲请求基准测试
+在本地模拟上游（scripts/mock_upstream.py）上分别以关闭/开启对冲发送相同的请求，对比耗时分位数和额外负载
+
+用法:
+    python scripts/benchmark_hedging.py
+    python scripts/benchmark_hedging.py --requests 400 --concurrency 8 --tail-ratio 0.1 --tail-latency 2
+    python scripts/benchmark_hedging.py --target etl
+    python scripts/benchmark_hedging.py --external http://127.0.0.1:8090   # 使用已启动的模拟上游
+"""
+import sys
+import os
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.mock_upstream import MockUpstream
+from src.services.ai_service import UserProfileExtractor
+from src.services import media_processor
+from src.services.media_processor import ETLProcessor
+from src.utils.adaptive_limiter import AdaptiveLimiter
+from src.utils.hedging import HedgePolicy
+
+
+def percentile(samples, pct):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+def make_call(target: str, base_url: str, concurrency: int, hedge):
+    """构造一次被测调用"""
+    if target == 'llm':
+        extractor = UserProfileExtractor(
+            max_concurrency=concurrency * 2,
+            limiter=AdaptiveLimiter('bench', initial_limit=concurrency * 2, max_limit=concurrency * 2),
+            hedge=hedge
+        )
+        extractor.api_endpoint = f"{base_url}/v1"
+        data = extractor.build_request("我叫张三，今年30岁，在北京做工程师")
+        return lambda: extractor.post_chat_completion(data)
+
+    # 基准测试只关注对冲效果，放开ETL并发窗口，避免排队时间混入耗时
+    media_processor.etl_limiter = AdaptiveLimiter('bench', initial_limit=concurrency * 2, max_limit=concurrency * 2)
+    processor = ETLProcessor()
+    processor.predict_url = f"{base_url}/v1/etl4llm/predict"
+    payload = {"filename": "bench.png", "b64_data": [""], "force_ocr": True, "for_gradio": False}
+    if hedge:
+        return lambda: hedge.call(lambda: processor._post_predict(payload, timeout=60),
+                                      is_success=lambda r: r.status_code == 200)
+    return lambda: processor._post_predict(payload, timeout=60)
+
+
+def run(label: str, call, total: int, concurrency: int, warmup: int, upstream, hedge):
+    # 预热：积累对冲所需的耗时样本
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(lambda _: call(), range(warmup)))
+
+    before = upstream.requests if upstream else 0
+    latencies = []
+
+    def timed(_):
+        started_at = time.time()
+        call()
+        latencies.append(time.time() - started_at)
+
+    started_at = time.time()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(timed, range(total)))
+    elapsed = time.time() - started_at
+
+    upstream_requests = (upstream.requests - before) if upstream else None
+    extra = f"{(upstream_requests - total) / total:.1%}" if upstream_requests is not None else '-'
+    print(f"{label:<10}{percentile(latencies, 50) * 1000:>9.0f}{percentile(latencies, 90) * 1000:>9.0f}"
+          f"{percentile(latencies, 99) * 1000:>9.0f}{max(latencies) * 1000:>9.0f}{elapsed:>9.1f}{extra:>10}")
+    if hedge:
+        print(f"          对冲统计: {hedge.get_stats()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对冲请求基准测试")
+    parser.add_argument('--target', choices=['llm', 'etl'], default='llm', help="被测调用")
+    parser.add_argument('--requests', type=int, default=300, help="每轮请求数")
+    parser.add_argument('--concurrency', type=int, default=8, help="并发数")
+    parser.add_argument('--warmup', type=int, default=50, help="预热请求数")
+    parser.add_argument('--budget', type=float, default=0.1, help="对冲预算比例")
+    parser.add_argument('--port', type=int, default=8091, help="内置模拟上游端口")
+    parser.add_argument('--base-latency', type=float, default=0.2)
+    parser.add_argument('--tail-ratio', type=float, default=0.05)
+    parser.add_argument('--tail-latency', type=float, default=2.0)
+    parser.add_argument('--external', help="已启动的上游地址（不启动内置模拟上游）")
+    args = parser.parse_args()
+
+    upstream = None
+    base_url = args.external
+    if not base_url:
+        upstream = MockUpstream(base_latency=args.base_latency, tail_ratio=args.tail_ratio,
+                                tail_latency=args.tail_latency, seed=7)
+        upstream.start_in_thread(port=args.port)
+        base_url = f"http://127.0.0.1:{args.port}"
+
+    print(f"目标: {args.target}  请求数: {args.requests}  并发: {args.concurrency}  上游: {base_url}")
+    print(f"{'模式':<10}{'p50ms':>9}{'p90ms':>9}{'p99ms':>9}{'maxms':>9}{'总耗时s':>9}{'额外负载':>10}")
+    try:
+        call = make_call(args.target, base_url, args.concurrency, None)
+        run('不对冲', call, args.requests, args.concurrency, args.warmup, upstream, None)
+
+        hedge = HedgePolicy('bench', percentile=90, budget_ratio=args.budget)
+        call = make_call(args.target, base_url, args.concurrency, hedge)
+        run('对冲', call, args.requests, args.concurrency, args.warmup, upstream, hedge)
+    finally:
+        if upstream:
+            upstream.stop_thread()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# benchmark_map_reduce.py
+"""
+超长聊天记录分块提取（map-reduce）基准测试
+生成合成的N条消息聊天记录，对比整段单次调用与按不同token预算分块并行调用的耗时
+
+默认使用模拟模型：耗时 = 基础耗时 + 每千token耗时 × 输入token数，超出上下文上限视为失败；
+加 --live 时调用真实的通义千问接口（需配置QWEN_API_KEY，会产生费用）
+
+用法:
+    python scripts/benchmark_map_reduce.py
+    python scripts/benchmark_map_reduce.py --messages 1000 --budgets 2000,4000,8000
+    python scripts/benchmark_map_reduce.py --messages 300 --budgets 4000 --live
+"""
+import sys
+import os
+import re
+import time
+import random
+import argparse
+from collections import Counter
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.services.ai_service import UserProfileExtractor
+from src.services.chunked_extraction import MapReduceExtractor, estimate_tokens, split_into_chunks
+
+SPEAKERS = ['李明', '王芳', '赵强', '陈静', '刘洋']
+FACTS = [
+    '我今年{age}岁', '我在{city}工作', '我是{company}的{position}', '我毕业于{school}',
+    '我已经结婚了，有一个孩子', '我的电话是138{phone}', '最近在看房子', '周末一起吃饭吧',
+    '这个项目下周要交付', '好的，收到', '哈哈哈', '我觉得这个方案还可以再优化一下'
+]
+
+
+def generate_chat_record(message_count: int, seed: int = 42) -> str:
+    """生成与message_formatter输出格式一致的聊天记录文本"""
+    rng = random.Random(seed)
+    lines = ["用户wmBenchForwarder在2025年01月01日 10:00转发了聊天记录：《项目群聊》\n\n聊天记录内容：\n"]
+    for i in range(1, message_count + 1):
+        speaker = rng.choice(SPEAKERS)
+        fact = rng.choice(FACTS).format(
+            age=rng.randint(22, 50), city=rng.choice(['北京', '上海', '深圳']),
+            company=rng.choice(['腾讯', '阿里', '字节']), position=rng.choice(['工程师', '产品经理', '总监']),
+            school=rng.choice(['清华大学', '浙江大学', '复旦大学']), phone=rng.randint(10000000, 99999999)
+        )
+        lines.append(f"{i}. {speaker}（{10 + i // 60 % 12:02d}:{i % 60:02d}）：{fact}\n")
+    return ''.join(lines)
+
+
+class MockExtractor:
+    """模拟模型：按输入token数计算耗时，取发言最多的人作为画像"""
+
+    def __init__(self, base_latency: float, seconds_per_1k_tokens: float, context_limit: int):
+        self.base_latency = base_latency
+        self.seconds_per_1k_tokens = seconds_per_1k_tokens
+        self.context_limit = context_limit
+        self.calls = 0
+
+    def _extract_single(self, text_content: str, is_chat_record: bool, model: str = None) -> dict:
+        self.calls += 1
+        tokens = estimate_tokens(text_content)
+        time.sleep(self.base_latency + self.seconds_per_1k_tokens * tokens / 1000)
+        if tokens > self.context_limit:
+            return UserProfileExtractor._error_result("AI处理失败", f"输入{tokens} tokens超出上下文上限")
+        speakers = Counter(re.findall(r'^\d+\. (\S+?)（', text_content, re.M))
+        name = speakers.most_common(1)[0][0] if speakers else '未知'
+        ages = re.findall(rf'{name}（[^）]*）：我今年(\d+)岁', text_content)
+        return {
+            "success": True,
+            "data": {
+                "summary": f"{len(speakers)}人的群聊",
+                "user_profiles": [{"name": name, "age": ages[0] if ages else "未知", "location": "未知"}]
+            },
+            "error": None
+        }
+
+
+def run(extractor, text: str, budgets, workers: int):
+    print(f"聊天记录: {len(text)} 字符, 约 {estimate_tokens(text)} tokens\n")
+    print(f"{'方式':<16}{'块数':>6}{'切分ms':>10}{'总耗时s':>10}{'成功':>6}  画像")
+
+    started_at = time.time()
+    result = extractor._extract_single(text, True)
+    elapsed = time.time() - started_at
+    profiles = result['data'].get('user_profiles', [])
+    print(f"{'单次调用':<16}{1:>6}{0:>10}{elapsed:>10.2f}{str(result['success']):>6}  {profiles[:1]}")
+
+    for budget in budgets:
+        split_started_at = time.time()
+        chunks = split_into_chunks(text, budget, True)
+        split_ms = (time.time() - split_started_at) * 1000
+        map_reduce = MapReduceExtractor(extractor, token_budget=budget, max_workers=workers)
+        started_at = time.time()
+        result = map_reduce.extract(text, True)
+        elapsed = time.time() - started_at
+        profiles = result['data'].get('user_profiles', [])
+        print(f"{'预算' + str(budget):<16}{len(chunks):>6}{split_ms:>10.1f}{elapsed:>10.2f}"
+              f"{str(result['success']):>6}  {profiles[:1]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="超长聊天记录分块提取基准测试")
+    parser.add_argument('--messages', type=int, default=1000, help="聊天记录消息条数")
+    parser.add_argument('--budgets', default='2000,4000,8000', help="token预算列表，逗号分隔")
+    parser.add_argument('--workers', type=int, default=4, help="并行提取的块数")
+    parser.add_argument('--live', action='store_true', help="调用真实的通义千问接口")
+    parser.add_argument('--base-latency', type=float, default=1.0, help="模拟模型的基础耗时（秒）")
+    parser.add_argument('--per-1k-tokens', type=float, default=0.4, help="模拟模型每千token输入的耗时（秒）")
+    parser.add_argument('--context-limit', type=int, default=30000, help="模拟模型的上下文上限（token）")
+    args = parser.parse_args()
+
+    text = generate_chat_record(args.messages)
+    budgets = [int(b) for b in args.budgets.split(',') if b.strip()]
+    if args.live:
+        extractor = UserProfileExtractor(max_concurrency=args.workers)
+    else:
+        extractor = MockExtractor(args.base_latency, args.per_1k_tokens, args.context_limit)
+    run(extractor, text, budgets, args.workers)
+
+
+if __name__ == "__main__":
+    main()
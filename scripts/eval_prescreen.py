@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# eval_prescreen.py
+"""
+画像信号预筛评估
+在标注样本上计算跳过率和误跳过率，并扫描不同阈值
+- 跳过率：被预筛跳过（不调用大模型）的样本占全部样本的比例
+- 误跳过率：标注为含画像信息却被跳过的样本占含画像样本的比例
+
+样本文件每行一个JSON：{"text": "...", "has_profile": true}
+
+用法:
+    python scripts/eval_prescreen.py
+    python scripts/eval_prescreen.py --samples my_samples.jsonl --thresholds 1,2,3,4 --show-errors
+"""
+import sys
+import os
+import json
+import argparse
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.handlers.profile_prescreen import ProfilePrescreener
+
+DEFAULT_SAMPLES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'prescreen_samples.jsonl')
+
+
+def load_samples(path: str):
+    samples = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                samples.append(json.loads(line))
+    return samples
+
+
+def evaluate(samples, threshold: int):
+    """返回 (跳过率, 误跳过率, 无信号样本放行率, 误跳过样本, 放行的无信号样本)"""
+    screener = ProfilePrescreener(threshold=threshold)
+    false_skips, false_passes = [], []
+    skipped = 0
+    positives = sum(1 for s in samples if s['has_profile'])
+    negatives = len(samples) - positives
+    for sample in samples:
+        if screener.should_extract(sample['text']):
+            if not sample['has_profile']:
+                false_passes.append(sample['text'])
+        else:
+            skipped += 1
+            if sample['has_profile']:
+                false_skips.append(sample['text'])
+    return (skipped / len(samples),
+            len(false_skips) / positives if positives else 0.0,
+            len(false_passes) / negatives if negatives else 0.0,
+            false_skips, false_passes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="画像信号预筛评估")
+    parser.add_argument('--samples', default=DEFAULT_SAMPLES, help="标注样本文件（JSONL）")
+    parser.add_argument('--thresholds', default='1,2,3,4', help="逗号分隔的阈值列表")
+    parser.add_argument('--show-errors', action='store_true', help="打印误跳过和误放行的样本")
+    args = parser.parse_args()
+
+    samples = load_samples(args.samples)
+    positives = sum(1 for s in samples if s['has_profile'])
+    print(f"样本数: {len(samples)}  含画像: {positives}  无画像: {len(samples) - positives}")
+    print(f"{'阈值':<6}{'跳过率':>10}{'误跳过率':>10}{'误放行率':>10}")
+    for threshold in [int(t) for t in args.thresholds.split(',')]:
+        skip_rate, false_skip_rate, false_pass_rate, false_skips, false_passes = evaluate(samples, threshold)
+        print(f"{threshold:<6}{skip_rate:>10.1%}{false_skip_rate:>10.1%}{false_pass_rate:>10.1%}")
+        if args.show_errors:
+            for text in false_skips:
+                print(f"    误跳过: {text}  {ProfilePrescreener.score(text)}")
+            for text in false_passes:
+                print(f"    误放行: {text}  {ProfilePrescreener.score(text)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# mock_nls_server.py
+"""
+本地模拟阿里云NLS一句话识别（SpeechRecognizer）websocket服务
+协议与nls SDK一致：StartRecognition → RecognitionStarted，二进制音频帧，StopRecognition → RecognitionCompleted 后关闭连接
+
+耗时模型：
+- 收到StartRecognition后 start_latency 秒返回RecognitionStarted
+- 服务端按 speed 倍实时速度识别（16kHz 16bit单声道，每秒音频32000字节），从收到第一帧开始计时
+- 收到StopRecognition后，等识别追上已收到的音频，再过 final_latency 秒返回识别结果
+
+用法:
+    python scripts/mock_nls_server.py --port 8092 --speed 10
+    ASR_URL=ws://127.0.0.1:8092/ws/v1 python scripts/benchmark_asr.py --external
+"""
+import sys
+import os
+import json
+import time
+import uuid
+import asyncio
+import argparse
+import threading
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiohttp import web, WSMsgType
+
+# 16kHz 16bit单声道PCM每秒字节数
+BYTES_PER_SECOND = 32000
+
+
+class MockNlsServer:
+    """可注入耗时的模拟NLS识别服务"""
+
+    def __init__(self, start_latency: float = 0.05, speed: float = 10.0, final_latency: float = 0.1):
+        self.settings = {
+            'start_latency': start_latency,
+            'speed': speed,
+            'final_latency': final_latency
+        }
+        self.sessions = 0
+        self.frames = 0
+        self._runner = None
+        self._thread = None
+        self._loop = None
+
+    @staticmethod
+    def _reply(request: dict, name: str, payload: dict = None) -> str:
+        header = request.get('header', {})
+        message = {
+            'header': {
+                'namespace': 'SpeechRecognizer',
+                'name': name,
+                'status': 20000000,
+                'status_text': 'Gateway:SUCCESS:Success.',
+                'message_id': uuid.uuid4().hex,
+                'task_id': header.get('task_id', '')
+            }
+        }
+        if payload is not None:
+            message['payload'] = payload
+        return json.dumps(message, ensure_ascii=False)
+
+    async def handle(self, request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self.sessions += 1
+        received = 0
+        first_frame_at = None
+
+        async for msg in ws:
+            if msg.type == WSMsgType.BINARY:
+                if first_frame_at is None:
+                    first_frame_at = time.time()
+                received += len(msg.data)
+                self.frames += 1
+            elif msg.type == WSMsgType.TEXT:
+                command = json.loads(msg.data)
+                name = command.get('header', {}).get('name')
+                if name == 'StartRecognition':
+                    await asyncio.sleep(self.settings['start_latency'])
+                    await ws.send_str(self._reply(command, 'RecognitionStarted'))
+                elif name == 'StopRecognition':
+                    audio_seconds = received / BYTES_PER_SECOND
+                    elapsed = time.time() - first_frame_at if first_frame_at else 0
+                    # 识别速度有限：等识别追上已收到的音频
+                    remaining = max(0.0, audio_seconds / self.settings['speed'] - elapsed)
+                    await asyncio.sleep(remaining + self.settings['final_latency'])
+                    result = {'result': f"模拟识别结果（{audio_seconds:.1f}秒音频）", 'duration': int(audio_seconds * 1000)}
+                    await ws.send_str(self._reply(command, 'RecognitionCompleted', result))
+                    await ws.close()
+            elif msg.type == WSMsgType.ERROR:
+                break
+        return ws
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get('/ws/v1', self.handle)
+        return app
+
+    async def start(self, host: str = '127.0.0.1', port: int = 8092):
+        self._runner = web.AppRunner(self.make_app())
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+    def start_in_thread(self, host: str = '127.0.0.1', port: int = 8092):
+        """在后台线程的事件循环中启动（供同步基准测试使用）"""
+        started = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            self._loop.run_until_complete(self.start(host, port))
+            started.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, name="mock-nls", daemon=True)
+        self._thread.start()
+        started.wait(10)
+
+    def stop_thread(self):
+        if self._loop:
+            asyncio.run_coroutine_threadsafe(self.stop(), self._loop).result(10)
+            self._loop.call_soon_threadsafe(self._loop.stop)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="模拟阿里云NLS一句话识别服务")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8092)
+    parser.add_argument('--start-latency', type=float, default=0.05, help="返回RecognitionStarted的耗时（秒）")
+    parser.add_argument('--speed', type=float, default=10.0, help="识别速度（实时速度的倍数）")
+    parser.add_argument('--final-latency', type=float, default=0.1, help="停止后返回结果的额外耗时（秒）")
+    args = parser.parse_args()
+
+    server = MockNlsServer(args.start_latency, args.speed, args.final_latency)
+    print(f"🚀 模拟NLS服务已启动: ws://{args.host}:{args.port}/ws/v1  {server.settings}")
+    web.run_app(server.make_app(), host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# mock_upstream.py
+"""
+本地模拟上游服务（通义千问chat/completions、ETL4LM predict），耗时可注入
+用于在不访问真实服务的情况下压测并发限制、对冲请求等行为
+
+耗时模型：每个请求以 tail_ratio 的概率耗时 tail_latency 秒，其余耗时 base_latency 秒（±jitter）；
+status_429_ratio 的请求直接返回429
+
+用法:
+    python scripts/mock_upstream.py --port 8090 --base-latency 0.3 --tail-ratio 0.05 --tail-latency 3
+    python scripts/benchmark_hedging.py --external http://127.0.0.1:8090
+
+运行中可通过 POST /admin/latency 调整耗时参数，例如:
+    curl -X POST localhost:8090/admin/latency -d '{"tail_ratio": 0.2}'
+"""
+import sys
+import os
+import json
+import random
+import asyncio
+import argparse
+import threading
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiohttp import web
+
+PROFILE_CONTENT = json.dumps({
+    "summary": "模拟用户自我介绍",
+    "user_profiles": [{"name": "张三", "gender": "男", "age": "30", "location": "北京"}]
+}, ensure_ascii=False)
+
+
+class MockUpstream:
+    """可注入耗时的模拟上游"""
+
+    def __init__(self, base_latency: float = 0.3, jitter: float = 0.1, tail_ratio: float = 0.05,
+                 tail_latency: float = 3.0, status_429_ratio: float = 0.0, seed: int = None):
+        self.settings = {
+            'base_latency': base_latency,
+            'jitter': jitter,
+            'tail_ratio': tail_ratio,
+            'tail_latency': tail_latency,
+            'status_429_ratio': status_429_ratio
+        }
+        self.rng = random.Random(seed)
+        self.requests = 0
+        self.cancelled = 0
+        self._runner = None
+        self._thread = None
+        self._loop = None
+
+    def _latency(self) -> float:
+        s = self.settings
+        if self.rng.random() < s['tail_ratio']:
+            return s['tail_latency']
+        return max(0.0, s['base_latency'] + self.rng.uniform(-s['jitter'], s['jitter']))
+
+    async def _simulate(self):
+        """返回None表示正常，否则返回错误响应"""
+        self.requests += 1
+        if self.rng.random() < self.settings['status_429_ratio']:
+            return web.json_response({"error": {"message": "Requests rate limit exceeded"}}, status=429)
+        try:
+            await asyncio.sleep(self._latency())
+        except asyncio.CancelledError:
+            # 客户端断开（对冲落后的请求被取消）
+            self.cancelled += 1
+            raise
+        return None
+
+    async def chat_completions(self, request: web.Request) -> web.Response:
+        await request.read()
+        error = await self._simulate()
+        if error is not None:
+            return error
+        return web.json_response({"choices": [{"message": {"role": "assistant", "content": PROFILE_CONTENT}}]})
+
+    async def etl_predict(self, request: web.Request) -> web.Response:
+        await request.read()
+        error = await self._simulate()
+        if error is not None:
+            return error
+        return web.json_response({
+            "status_code": 200,
+            "partitions": [{"type": "NarrativeText", "text": "张三 北京 30岁 工程师"}]
+        })
+
+    async def admin_latency(self, request: web.Request) -> web.Response:
+        updates = await request.json()
+        for key, value in updates.items():
+            if key in self.settings:
+                self.settings[key] = float(value)
+        return web.json_response({"settings": self.settings, "requests": self.requests, "cancelled": self.cancelled})
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post('/v1/chat/completions', self.chat_completions)
+        app.router.add_post('/v1/etl4llm/predict', self.etl_predict)
+        app.router.add_post('/admin/latency', self.admin_latency)
+        return app
+
+    async def start(self, host: str = '127.0.0.1', port: int = 8090):
+        self._runner = web.AppRunner(self.make_app())
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+    def start_in_thread(self, host: str = '127.0.0.1', port: int = 8090):
+        """在后台线程的事件循环中启动（供同步基准测试使用）"""
+        started = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            self._loop.run_until_complete(self.start(host, port))
+            started.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, name="mock-upstream", daemon=True)
+        self._thread.start()
+        started.wait(10)
+
+    def stop_thread(self):
+        if self._loop:
+            asyncio.run_coroutine_threadsafe(self.stop(), self._loop).result(10)
+            self._loop.call_soon_threadsafe(self._loop.stop)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="可注入耗时的模拟上游服务")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--base-latency', type=float, default=0.3, help="正常请求耗时（秒）")
+    parser.add_argument('--jitter', type=float, default=0.1, help="正常请求耗时抖动（秒）")
+    parser.add_argument('--tail-ratio', type=float, default=0.05, help="长尾请求比例")
+    parser.add_argument('--tail-latency', type=float, default=3.0, help="长尾请求耗时（秒）")
+    parser.add_argument('--status-429-ratio', type=float, default=0.0, help="返回429的比例")
+    args = parser.parse_args()
+
+    upstream = MockUpstream(args.base_latency, args.jitter, args.tail_ratio, args.tail_latency, args.status_429_ratio)
+    print(f"🚀 模拟上游已启动: http://{args.host}:{args.port}  {upstream.settings}")
+    web.run_app(upstream.make_app(), host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# replay_dead_jobs.py
+"""
+持久化任务队列运维工具
+查看任务统计、列出死信任务、重放死信任务、清理已完成任务
+
+用法:
+    python scripts/replay_dead_jobs.py stats
+    python scripts/replay_dead_jobs.py list [--limit 50]
+    python scripts/replay_dead_jobs.py replay --all
+    python scripts/replay_dead_jobs.py replay --id 12 --id 15
+    python scripts/replay_dead_jobs.py purge [--days 1]
+"""
+import sys
+import os
+import json
+import argparse
+from datetime import datetime
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.database.job_queue_db import job_queue_db
+
+
+def format_time(timestamp) -> str:
+    return datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S') if timestamp else '-'
+
+
+def show_stats():
+    """显示各状态任务数量"""
+    stats = job_queue_db.get_stats()
+    print("=== 任务队列统计 ===")
+    for status, total in stats.items():
+        print(f"  {status:<8} {total}")
+
+
+def list_dead(limit: int):
+    """列出死信任务"""
+    jobs = job_queue_db.list_dead(limit)
+    if not jobs:
+        print("✅ 没有死信任务")
+        return
+
+    print(f"=== 死信任务（最近 {len(jobs)} 条）===\n")
+    for job in jobs:
+        payload = json.loads(job['payload'])
+        print(f"ID: {job['id']}  类型: {job['job_type']}  尝试次数: {job['attempts']}")
+        print(f"创建时间: {format_time(job['created_at'])}  最后更新: {format_time(job['updated_at'])}")
+        print(f"客服账号: {payload.get('OpenKfId', '-')}  事件: {payload.get('Event', payload.get('MsgType', '-'))}")
+        print(f"错误: {job['last_error']}")
+        print("-" * 50)
+
+
+def replay(job_ids, replay_all: bool):
+    """重放死信任务"""
+    if not job_ids and not replay_all:
+        print("❌ 请指定 --id 或 --all")
+        return
+    count = job_queue_db.replay_dead(None if replay_all else job_ids)
+    print(f"🔁 已重新排队 {count} 个死信任务，运行中的服务会自动处理")
+
+
+def purge(days: float):
+    """清理已完成任务"""
+    count = job_queue_db.purge_done(days * 86400)
+    print(f"🧹 已清理 {count} 个已完成任务")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="持久化任务队列运维工具")
+    subparsers = parser.add_subparsers(dest='command')
+
+    subparsers.add_parser('stats', help='查看任务统计')
+
+    list_parser = subparsers.add_parser('list', help='列出死信任务')
+    list_parser.add_argument('--limit', type=int, default=50)
+
+    replay_parser = subparsers.add_parser('replay', help='重放死信任务')
+    replay_parser.add_argument('--id', type=int, action='append', dest='job_ids', help='任务ID，可重复指定')
+    replay_parser.add_argument('--all', action='store_true', help='重放全部死信任务')
+
+    purge_parser = subparsers.add_parser('purge', help='清理已完成任务')
+    purge_parser.add_argument('--days', type=float, default=1, help='清理多少天前完成的任务')
+
+    args = parser.parse_args()
+
+    if not job_queue_db:
+        print("❌ 任务队列不可用，请检查数据库配置")
+        sys.exit(1)
+
+    if args.command == 'stats':
+        show_stats()
+    elif args.command == 'list':
+        list_dead(args.limit)
+    elif args.command == 'replay':
+        replay(args.job_ids, args.all)
+    elif args.command == 'purge':
+        purge(args.days)
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -18,15 +18,98 @@ class WeWorkConfig:
     # 通义千问API配置
     qwen_api_key: str = os.getenv('QWEN_API_KEY')
     qwen_api_endpoint: str = os.getenv('QWEN_API_ENDPOINT', 'https://dashscope.aliyuncs.com/compatible-mode/v1')
+    llm_max_concurrency: int = int(os.getenv('LLM_MAX_CONCURRENCY', 4))  # 同时进行的大模型调用上限，按DashScope QPS配额设置
+    llm_timeout: float = float(os.getenv('LLM_TIMEOUT', 30))  # 大模型调用超时（秒）
+    llm_stream_enabled: bool = os.getenv('LLM_STREAM_ENABLED', 'false').lower() == 'true'  # 流式输出，每个用户画像解析完成即可保存
+    llm_batch_enabled: bool = os.getenv('LLM_BATCH_ENABLED', 'false').lower() == 'true'  # 短消息合并为一次大模型请求
+    llm_batch_window_ms: float = float(os.getenv('LLM_BATCH_WINDOW_MS', 300))  # 批处理收集窗口（毫秒）
+    llm_batch_max_items: int = int(os.getenv('LLM_BATCH_MAX_ITEMS', 8))  # 每批最多消息数
+    llm_batch_max_chars: int = int(os.getenv('LLM_BATCH_MAX_CHARS', 500))  # 参与批处理的消息最大长度
+    llm_token_budget: int = int(os.getenv('LLM_TOKEN_BUDGET', 6000))  # 单次画像提取的输入token预算，超出时分块提取后合并，0为不分块
+    llm_map_workers: int = int(os.getenv('LLM_MAP_WORKERS', 4))  # 分块并行提取的块数
+    llm_router_enabled: bool = os.getenv('LLM_ROUTER_ENABLED', 'false').lower() == 'true'  # 按输入选择模型档位并在超出SLO时熔断降级
+    llm_router_tiers: str = os.getenv('LLM_ROUTER_TIERS', 'qwen-turbo,qwen-plus,qwen-max')  # 模型档位，从快到强，逗号分隔
+    llm_router_short_chars: int = int(os.getenv('LLM_ROUTER_SHORT_CHARS', 200))  # 不超过该长度的消息使用最快档位
+    llm_router_long_chars: int = int(os.getenv('LLM_ROUTER_LONG_CHARS', 2000))  # 超过该长度的文本和聊天记录使用最强档位
+    llm_router_slo_p95_ms: float = float(os.getenv('LLM_ROUTER_SLO_P95_MS', 15000))  # 各档位p95耗时上限（毫秒）
+    llm_router_max_error_rate: float = float(os.getenv('LLM_ROUTER_MAX_ERROR_RATE', 0.2))  # 各档位错误率上限
+    llm_router_cooldown: float = float(os.getenv('LLM_ROUTER_COOLDOWN', 60))  # 熔断后多少秒放行探测请求
+    extraction_cache_enabled: bool = os.getenv('EXTRACTION_CACHE_ENABLED', 'true').lower() == 'true'  # 按内容哈希缓存画像提取结果
+    extraction_cache_memory_size: int = int(os.getenv('EXTRACTION_CACHE_MEMORY_SIZE', 500))  # 内存LRU层条数
+    extraction_cache_db_max_entries: int = int(os.getenv('EXTRACTION_CACHE_DB_MAX_ENTRIES', 20000))  # SQLite层条数上限
+    extraction_cache_ttl: int = int(os.getenv('EXTRACTION_CACHE_TTL', 7 * 86400))  # 缓存有效期（秒）
+    dashscope_limit_initial: int = int(os.getenv('DASHSCOPE_LIMIT_INITIAL', 4))  # DashScope自适应并发窗口初始值
+    dashscope_limit_min: int = int(os.getenv('DASHSCOPE_LIMIT_MIN', 1))  # DashScope并发窗口下限
+    dashscope_limit_max: int = int(os.getenv('DASHSCOPE_LIMIT_MAX', 16))  # DashScope并发窗口上限
+    dashscope_latency_target: float = float(os.getenv('DASHSCOPE_LATENCY_TARGET', 20))  # 耗时不超过该值（秒）时增大窗口
+    etl_limit_initial: int = int(os.getenv('ETL_LIMIT_INITIAL', 2))  # ETL自适应并发窗口初始值
+    etl_limit_min: int = int(os.getenv('ETL_LIMIT_MIN', 1))  # ETL并发窗口下限
+    etl_limit_max: int = int(os.getenv('ETL_LIMIT_MAX', 8))  # ETL并发窗口上限
+    etl_latency_target: float = float(os.getenv('ETL_LATENCY_TARGET', 120))  # 耗时不超过该值（秒）时增大窗口
+    llm_hedge_enabled: bool = os.getenv('LLM_HEDGE_ENABLED', 'false').lower() == 'true'  # 大模型非流式调用超过p90耗时时发出对冲请求
+    etl_hedge_enabled: bool = os.getenv('ETL_HEDGE_ENABLED', 'false').lower() == 'true'  # ETL图片OCR超过p90耗时时发出对冲请求
+    hedge_percentile: float = float(os.getenv('HEDGE_PERCENTILE', 90))  # 超过该分位数耗时仍未返回时对冲
+    hedge_budget_ratio: float = float(os.getenv('HEDGE_BUDGET_RATIO', 0.1))  # 对冲请求占总请求的比例上限（最大1，即负载最多翻倍）
+    prescreen_enabled: bool = os.getenv('PRESCREEN_ENABLED', 'false').lower() == 'true'  # 普通文本先做本地画像信号预筛，无信号的不调用大模型
+    prescreen_threshold: int = int(os.getenv('PRESCREEN_THRESHOLD', 2))  # 预筛得分达到该值才调用大模型
+    prescreen_reply: str = os.getenv('PRESCREEN_REPLY', '')  # 预筛跳过时的固定回复，为空则不回复
     # 阿里云ASR配置
     asr_appkey: str = os.getenv('ASR_APPKEY', 'NM5zdrGkIl8xqSzO')  # 默认值来自文档
     asr_token: str = os.getenv('ASR_TOKEN', 'be3d7dfd4e51401db4c122e2d74b06ba')  # 默认值来自文档
     asr_url: str = os.getenv('ASR_URL', 'wss://nls-gateway-cn-shanghai.aliyuncs.com/ws/v1')
+    asr_max_sessions: int = int(os.getenv('ASR_MAX_SESSIONS', 2))  # 同时进行的语音识别会话数上限（按ASR并发额度设置）
+    asr_fast_mode: bool = os.getenv('ASR_FAST_MODE', 'false').lower() == 'true'  # 语音文件按大帧连续上传，不按实时速度逐片暂停
+    asr_frame_bytes: int = int(os.getenv('ASR_FRAME_BYTES', 3200))  # 快速模式每帧字节数（3200字节为100ms的16kHz单声道音频）
+    # 媒体文件下载配置
+    media_download_chunk_size: int = int(os.getenv('MEDIA_DOWNLOAD_CHUNK_SIZE', 65536))  # 流式下载分块大小（字节）
+    media_max_voice_mb: float = float(os.getenv('MEDIA_MAX_VOICE_MB', 2))  # 语音下载大小上限（MB）
+    media_max_image_mb: float = float(os.getenv('MEDIA_MAX_IMAGE_MB', 10))  # 图片下载大小上限（MB）
+    media_max_video_mb: float = float(os.getenv('MEDIA_MAX_VIDEO_MB', 10))  # 视频下载大小上限（MB）
+    media_max_file_mb: float = float(os.getenv('MEDIA_MAX_FILE_MB', 20))  # 文件下载大小上限（MB）
+    media_cache_enabled: bool = os.getenv('MEDIA_CACHE_ENABLED', 'true').lower() == 'true'  # 按文件内容哈希缓存OCR、语音识别、文档解析结果
+    media_cache_max_mb: float = float(os.getenv('MEDIA_CACHE_MAX_MB', 100))  # 缓存结果总大小上限（MB），超出时淘汰最久未用的
+    chat_record_media_workers: int = int(os.getenv('CHAT_RECORD_MEDIA_WORKERS', 4))  # 聊天记录中图片/语音/文件并发处理线程数
+    chat_record_deadline: float = float(os.getenv('CHAT_RECORD_DEADLINE', 300))  # 单条聊天记录媒体处理截止时间（秒），超时条目用占位文本
     # ffmpeg路径配置
     ffmpeg_path: str = os.getenv('FFMPEG_PATH', r'D:\software\ffmpeg-7.1.1-essentials_build\bin\ffmpeg.exe')  # 使用用户指定的路径
     
     # 微信小程序配置
     wechat_mini_appid: str = os.getenv('WECHAT_MINI_APPID', 'wx50fc05960f4152a6')  # 你提供的AppID
     wechat_mini_secret: str = os.getenv('WECHAT_MINI_SECRET', '')  # 需要在环境变量中设置
+    
+    # 企业微信API连接配置
+    wework_connect_timeout: float = float(os.getenv('WEWORK_CONNECT_TIMEOUT', 5))  # 建连超时（秒）
+    wework_read_timeout: float = float(os.getenv('WEWORK_READ_TIMEOUT', 15))  # 读取超时（秒）
+    wework_pool_size: int = int(os.getenv('WEWORK_POOL_SIZE', 20))  # 到qyapi.weixin.qq.com的最大长连接数
+    wework_token_store: str = os.getenv('WEWORK_TOKEN_STORE', 'sqlite')  # sqlite: 多个worker共用access_token / memory: 进程内
+    wework_token_refresh_margin: int = int(os.getenv('WEWORK_TOKEN_REFRESH_MARGIN', 300))  # 过期前多少秒后台续期
+    
+    # 微信客服事件后台处理配置
+    kf_async_processing: bool = os.getenv('KF_ASYNC_PROCESSING', 'true').lower() == 'true'  # 回调只入队，由后台线程处理
+    kf_worker_count: int = int(os.getenv('KF_WORKER_COUNT', 4))  # 后台处理线程数
+    kf_queue_size: int = int(os.getenv('KF_QUEUE_SIZE', 1000))  # 内存队列最大长度
+    kf_queue_backend: str = os.getenv('KF_QUEUE_BACKEND', 'sqlite')  # sqlite: 持久化任务表 / memory: 进程内队列
+    kf_job_max_attempts: int = int(os.getenv('KF_JOB_MAX_ATTEMPTS', 5))  # 最大尝试次数，超过后进入死信
+    kf_job_lease_seconds: int = int(os.getenv('KF_JOB_LEASE_SECONDS', 600))  # 任务租约时长
+    kf_job_purge_every: int = int(os.getenv('KF_JOB_PURGE_EVERY', 500))  # 每领取N个任务清理一次已完成的历史任务，0表示不清理
+    kf_job_retention_seconds: int = int(os.getenv('KF_JOB_RETENTION_SECONDS', 86400))  # 已完成任务的保留时长
+    kf_sync_mode: str = os.getenv('KF_SYNC_MODE', 'batch')  # batch: 处理每条新消息 / latest: 只处理最新一条
+    kf_cold_start_max_age: int = int(os.getenv('KF_COLD_START_MAX_AGE', 600))  # 无游标时只处理最近N秒内的消息
+    kf_sync_lease_backend: str = os.getenv('KF_SYNC_LEASE_BACKEND', 'sqlite')  # sqlite: 多进程共享 / memory: 仅单进程
+    kf_sync_lease_seconds: int = int(os.getenv('KF_SYNC_LEASE_SECONDS', 60))  # 同步租约时长，持有期间自动续约
+    kf_lanes_enabled: bool = os.getenv('KF_LANES_ENABLED', 'false').lower() == 'true'  # 验证码/命令/文本走快车道，不排在图片、文件等媒体任务后面
+    kf_fast_lane_workers: int = int(os.getenv('KF_FAST_LANE_WORKERS', 4))  # 快车道（验证码、命令、普通文本）处理线程数
+    kf_media_lane_workers: int = int(os.getenv('KF_MEDIA_LANE_WORKERS', 2))  # 媒体车道和媒体处理池（图片、文件、语音、聊天记录）的处理线程数
+    kf_send_async: bool = os.getenv('KF_SEND_ASYNC', 'true').lower() == 'true'  # 回复消息入队后由发送线程发送
+    kf_send_worker_count: int = int(os.getenv('KF_SEND_WORKER_COUNT', 2))  # 发送线程数
+    kf_send_queue_size: int = int(os.getenv('KF_SEND_QUEUE_SIZE', 1000))  # 发送队列最大长度
+    kf_send_global_rate: float = float(os.getenv('KF_SEND_GLOBAL_RATE', 20))  # 全局每秒发送上限
+    kf_send_per_kf_rate: float = float(os.getenv('KF_SEND_PER_KF_RATE', 5))  # 每个客服账号每秒发送上限
+    kf_send_max_attempts: int = int(os.getenv('KF_SEND_MAX_ATTEMPTS', 5))  # 发送最大尝试次数
+    kf_send_lease_seconds: int = int(os.getenv('KF_SEND_LEASE_SECONDS', 60))  # 待发送回复的租约时长，进程崩溃后最多这么久由其他进程接手
+    dedup_backend: str = os.getenv('DEDUP_BACKEND', 'memory')  # memory: 进程内 / sqlite: 多个worker共享
+    dedup_max_entries: int = int(os.getenv('DEDUP_MAX_ENTRIES', 10000))  # 每类去重记录的内存上限
+    kf_event_dedup_ttl: int = int(os.getenv('KF_EVENT_DEDUP_TTL', 3600))  # 回调事件去重窗口（秒）
+    kf_msgid_dedup_ttl: int = int(os.getenv('KF_MSGID_DEDUP_TTL', 86400))  # 消息msgid去重窗口（秒）
 
 config = WeWorkConfig()
\ No newline at end of file
@@ -10,8 +10,21 @@ import logging
 import sys
 import json
 import time
+from ..config.config import config
 from ..services.wework_client import wework_client
-from ..handlers.message_handler import classify_and_handle_message, parse_message, handle_wechat_kf_event
+from ..services.wework_client_async import async_wework_client
+from ..services.kf_send_dispatcher import kf_send_dispatcher
+from ..services.ai_service import profile_extractor
+from ..handlers.profile_prescreen import prescreener
+from ..handlers.message_handler import parse_message
+from ..handlers.message_handler_async import dispatch_callback_message_async
+from ..handlers.kf_event_worker import kf_event_pool, kf_media_pool
+from ..handlers.kf_lane_scheduler import kf_lane_scheduler
+from ..services.media_processor import media_processor
+from ..utils.metrics import kf_pipeline_stats
+from ..utils.dedup_store import kf_event_dedup, kf_msgid_dedup
+from ..utils.adaptive_limiter import adaptive_limiters
+from ..utils.hedging import llm_hedge, etl_hedge
 
 
 # 配置日志
@@ -199,28 +212,28 @@ async def wework_callback(request: Request, msg_signature: str, timestamp: str,
         encrypt_msg = root.find('Encrypt').text
         
         # 验证签名
-        is_valid = wework_client.verify_signature(msg_signature, timestamp, nonce, encrypt_msg)
+        with kf_pipeline_stats.timer('callback_verify'):
+            is_valid = wework_client.verify_signature(msg_signature, timestamp, nonce, encrypt_msg)
         
         if not is_valid:
             logger.error("签名验证失败")
             raise HTTPException(status_code=400, detail="签名验证失败")
         
         # 解密消息
-        decrypted_xml = wework_client.decrypt_message(encrypt_msg)
-        
-        # 解析消息
-        message = parse_message(decrypted_xml)
-        
-        # 检查是否为微信客服事件消息
-        msg_type = message.get('MsgType')
-        event = message.get('Event')
+        with kf_pipeline_stats.timer('callback_decrypt'):
+            decrypted_xml = wework_client.decrypt_message(encrypt_msg)
+            message = parse_message(decrypted_xml)
+        
+        # 异步模式：入队后立即返回，由后台工作线程处理
+        if config.kf_async_processing and kf_event_pool.running:
+            with kf_pipeline_stats.timer('callback_enqueue'):
+                if not kf_event_pool.submit(message):
+                    # 微信客服事件只是拉取通知，丢弃后下一次事件仍会拉取到未处理的消息
+                    logger.warning("回调消息入队失败，本次事件被丢弃")
+            return PlainTextResponse("success")
         
-        if msg_type == 'event' and event == 'kf_msg_or_event':
-            # 处理微信客服事件消息
-            handle_wechat_kf_event(message)
-        else:
-            # 分类处理普通消息
-            classify_and_handle_message(message)
+        # 同步模式：在回调中直接处理，企业微信接口走异步客户端，同步代码放到线程中执行，不阻塞事件循环
+        await dispatch_callback_message_async(message)
         
         return PlainTextResponse("success")
         
@@ -232,6 +245,31 @@ async def wework_callback(request: Request, msg_signature: str, timestamp: str,
         logger.error(f"消息处理失败: {e}", exc_info=True)
         return PlainTextResponse("fail")
 
+@app.on_event("startup")
+async def start_background_workers():
+    """启动微信客服后台处理池、消息分道调度、回复发送线程和access_token续期线程"""
+    if config.kf_lanes_enabled:
+        kf_lane_scheduler.start()
+        # 媒体消息转为任务由媒体处理池处理，拉取和游标提交不等OCR/PDF解析
+        kf_media_pool.start()
+    if config.kf_async_processing:
+        kf_event_pool.start()
+    if config.kf_send_async:
+        kf_send_dispatcher.start()
+    # 后台提前续期access_token，热路径上不再等待gettoken
+    wework_client.token_manager.start()
+
+@app.on_event("shutdown")
+async def stop_background_workers():
+    """停止后台处理池，等待已入队的消息处理完毕"""
+    kf_event_pool.stop()
+    kf_media_pool.stop()
+    kf_lane_scheduler.stop()
+    kf_send_dispatcher.stop()
+    wework_client.token_manager.stop()
+    await async_wework_client.close()
+    await profile_extractor.close()
+
 # 添加根路径测试接口
 @app.get("/")
 async def root():
@@ -248,10 +286,17 @@ async def test_endpoint(request: Request):
 async def get_sync_status():
     """查看消息同步状态"""
     try:
+        from ..handlers.message_sync_optimizer import sync_optimizer
+        from ..handlers.kf_sync_coordinator import kf_sync_coordinator
+        if config.kf_sync_mode == 'latest':
+            sync_method = "latest - 每次仅处理最新1条消息"
+        else:
+            sync_method = "batch - 逐页拉取并按顺序处理每条新消息"
         return {
             "status": "success",
-            "message": "消息同步功能已简化，直接获取最新消息",
-            "sync_method": "简化版 - 每次仅获取最新1条消息"
+            "sync_method": sync_method,
+            "sync_stats": sync_optimizer.get_sync_stats(),
+            "coalescing": kf_sync_coordinator.get_stats()
         }
     except Exception as e:
         logger.error(f"获取同步状态失败: {e}")
@@ -260,6 +305,52 @@ async def get_sync_status():
             "message": str(e)
         }
 
+# 查看后台处理池和各阶段耗时
+@app.get("/stats/pipeline")
+async def get_pipeline_stats():
+    """查看回调处理模式、后台队列状态和各阶段耗时"""
+    return {
+        "status": "success",
+        "async_processing": config.kf_async_processing,
+        "worker_pool": kf_event_pool.get_stats(),
+        "media_pool": kf_media_pool.get_stats(),
+        "lanes": kf_lane_scheduler.get_stats(),
+        "send_dispatcher": kf_send_dispatcher.get_stats(),
+        "media": media_processor.get_stats(),
+        "access_token": wework_client.token_manager.get_stats(),
+        "stages": kf_pipeline_stats.snapshot()
+    }
+
+@app.get("/stats/llm")
+async def get_llm_stats():
+    """查看大模型调用并发、排队等待和模型耗时"""
+    return {
+        "status": "success",
+        "profile_extractor": profile_extractor.get_stats(),
+        "prescreen": prescreener.get_stats()
+    }
+
+@app.get("/stats/dedup")
+async def get_dedup_stats():
+    """查看回调事件和消息msgid去重的命中、未命中、淘汰计数"""
+    return {
+        "status": "success",
+        "events": kf_event_dedup.get_stats(),
+        "messages": kf_msgid_dedup.get_stats()
+    }
+
+@app.get("/stats/limiters")
+async def get_limiter_stats():
+    """查看各上游（DashScope、ETL）自适应并发窗口、进行中调用数、排队等待和对冲统计"""
+    return {
+        "status": "success",
+        "limiters": {name: limiter.get_stats() for name, limiter in adaptive_limiters.items()},
+        "hedging": {
+            "dashscope": llm_hedge.get_stats() if llm_hedge else None,
+            "etl": etl_hedge.get_stats() if etl_hedge else None
+        }
+    }
+
 # 添加微信回调的路由，以兼容不同的回调地址
 @app.get("/wechat/callback")
 async def wechat_verify(msg_signature: str, timestamp: str, nonce: str, echostr: str):
@@ -1370,4 +1461,3 @@ async def get_matches(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"获取匹配结果失败: {str(e)}"
         )
-        )
\ No newline at end of file
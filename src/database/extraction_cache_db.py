@@ -0,0 +1,147 @@
+# extraction_cache_db.py
+"""
+用户画像提取结果缓存（持久层）
+按内容哈希保存大模型的分析结果，过期或超出容量时按最近使用时间淘汰
+"""
+
+import json
+import time
+import logging
+from typing import Optional, Dict, Any
+
+logger = logging.getLogger(__name__)
+
+
+class ExtractionCacheDatabase:
+    """画像提取结果缓存表操作类（使用SQLiteDatabase管理的数据库文件）"""
+
+    def __init__(self, db_instance, ttl_seconds: float = 7 * 86400, max_entries: int = 20000):
+        """
+        初始化
+        :param db_instance: SQLite数据库实例（需提供get_connection方法）
+        :param ttl_seconds: 缓存有效期（秒）
+        :param max_entries: 最多保留的缓存条数
+        """
+        self.db = db_instance
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+
+    def create_cache_table(self) -> bool:
+        """创建缓存表"""
+        try:
+            with self.db.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS profile_extraction_cache (
+                        cache_key TEXT PRIMARY KEY,
+                        result TEXT NOT NULL,
+                        latency_ms REAL DEFAULT 0,
+                        created_at REAL NOT NULL,
+                        last_hit_at REAL NOT NULL,
+                        hits INTEGER DEFAULT 0
+                    )
+                ''')
+                cursor.execute('CREATE INDEX IF NOT EXISTS idx_extraction_cache_last_hit ON profile_extraction_cache(last_hit_at)')
+                conn.commit()
+            logger.info("画像提取缓存表创建成功")
+            return True
+        except Exception as e:
+            logger.error(f"创建画像提取缓存表失败: {e}")
+            return False
+
+    def get(self, cache_key: str) -> Optional[Dict[str, Any]]:
+        """
+        读取缓存
+        :return: {'result': 提取结果, 'latency_ms': 原始调用耗时, 'created_at': 写入时间}，未命中或已过期返回None
+        """
+        try:
+            now = time.time()
+            with self.db.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    "SELECT result, latency_ms, created_at FROM profile_extraction_cache WHERE cache_key = ? AND created_at > ?",
+                    (cache_key, now - self.ttl_seconds)
+                )
+                row = cursor.fetchone()
+                if not row:
+                    return None
+                cursor.execute(
+                    "UPDATE profile_extraction_cache SET last_hit_at = ?, hits = hits + 1 WHERE cache_key = ?",
+                    (now, cache_key)
+                )
+                conn.commit()
+                return {'result': json.loads(row['result']), 'latency_ms': row['latency_ms'], 'created_at': row['created_at']}
+        except Exception as e:
+            logger.error(f"读取画像提取缓存失败: {e}")
+            return None
+
+    def put(self, cache_key: str, result: Dict[str, Any], latency_ms: float) -> bool:
+        """写入缓存"""
+        try:
+            now = time.time()
+            with self.db.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    INSERT OR REPLACE INTO profile_extraction_cache (cache_key, result, latency_ms, created_at, last_hit_at, hits)
+                    VALUES (?, ?, ?, ?, ?, 0)
+                ''', (cache_key, json.dumps(result, ensure_ascii=False), latency_ms, now, now))
+                conn.commit()
+                return True
+        except Exception as e:
+            logger.error(f"写入画像提取缓存失败: {e}")
+            return False
+
+    def evict(self) -> int:
+        """删除过期缓存，并按最近使用时间淘汰超出容量的部分"""
+        try:
+            with self.db.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    "DELETE FROM profile_extraction_cache WHERE created_at <= ?",
+                    (time.time() - self.ttl_seconds,)
+                )
+                removed = cursor.rowcount
+                cursor.execute('''
+                    DELETE FROM profile_extraction_cache WHERE cache_key IN (
+                        SELECT cache_key FROM profile_extraction_cache
+                        ORDER BY last_hit_at DESC LIMIT -1 OFFSET ?
+                    )
+                ''', (self.max_entries,))
+                removed += cursor.rowcount
+                conn.commit()
+                return removed
+        except Exception as e:
+            logger.error(f"清理画像提取缓存失败: {e}")
+            return 0
+
+    def count(self) -> int:
+        """缓存条数"""
+        try:
+            with self.db.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT COUNT(*) AS total FROM profile_extraction_cache")
+                return cursor.fetchone()['total']
+        except Exception as e:
+            logger.error(f"统计画像提取缓存失败: {e}")
+            return 0
+
+# 创建全局实例
+def get_extraction_cache_db():
+    """获取画像提取缓存实例（复用SQLite主数据库）"""
+    try:
+        from ..config.config import config
+        from .database_sqlite_v2 import database_manager
+        cache_db = ExtractionCacheDatabase(
+            database_manager,
+            ttl_seconds=config.extraction_cache_ttl,
+            max_entries=config.extraction_cache_db_max_entries
+        )
+        if cache_db.create_cache_table():
+            cache_db.evict()
+            return cache_db
+    except Exception as e:
+        logger.error(f"无法创建画像提取缓存实例: {e}")
+    return None
+
+# 导出
+extraction_cache_db = get_extraction_cache_db()
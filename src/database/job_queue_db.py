@@ -0,0 +1,331 @@
+# job_queue_db.py
+"""
+持久化任务队列
+基于SQLite的任务表，支持租约式出队、指数退避重试和死信状态，进程重启或热重载不会丢失已入队的消息
+"""
+
+import json
+import time
+import uuid
+import random
+import logging
+from typing import Optional, Dict, Any, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 任务状态
+STATUS_PENDING = 'pending'    # 等待处理
+STATUS_LEASED = 'leased'      # 已被工作线程租用
+STATUS_DONE = 'done'          # 处理完成
+STATUS_DEAD = 'dead'          # 重试耗尽，进入死信
+
+
+class JobQueueDatabase:
+    """持久化任务队列操作类（使用SQLiteDatabase管理的数据库文件）"""
+
+    def __init__(self, db_instance, max_attempts: int = 5, lease_seconds: int = 600,
+                 base_backoff: float = 2.0, max_backoff: float = 300.0):
+        """
+        初始化
+        :param db_instance: SQLite数据库实例（需提供get_connection方法）
+        :param max_attempts: 最大尝试次数，超过后进入死信
+        :param lease_seconds: 租约时长，超时未完成的任务会被其他工作线程重新领取
+        :param base_backoff: 重试退避基数（秒）
+        :param max_backoff: 重试退避上限（秒）
+        """
+        self.db = db_instance
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+
+    def create_job_table(self) -> bool:
+        """创建任务表"""
+        try:
+            with self.db.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS job_queue (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        job_type TEXT NOT NULL,
+                        payload TEXT NOT NULL,
+                        status TEXT NOT NULL DEFAULT 'pending',
+                        attempts INTEGER DEFAULT 0,
+                        max_attempts INTEGER DEFAULT 5,
+                        available_at REAL NOT NULL,
+                        lease_owner TEXT,
+                        lease_token TEXT,
+                        lease_expires_at REAL,
+                        last_error TEXT,
+                        created_at REAL NOT NULL,
+                        updated_at REAL NOT NULL
+                    )
+                ''')
+                cursor.execute('CREATE INDEX IF NOT EXISTS idx_job_queue_status ON job_queue(status, available_at)')
+                conn.commit()
+            logger.info("任务队列表创建成功")
+            return True
+        except Exception as e:
+            logger.error(f"创建任务队列表失败: {e}")
+            return False
+
+    def enqueue(self, job_type: str, payload: Dict[str, Any], delay: float = 0) -> Optional[int]:
+        """
+        任务入队
+        :param job_type: 任务类型
+        :param payload: 任务数据（可JSON序列化）
+        :param delay: 延迟执行秒数
+        :return: 任务ID，失败返回None
+        """
+        try:
+            now = time.time()
+            with self.db.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    INSERT INTO job_queue (job_type, payload, status, max_attempts, available_at, created_at, updated_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', (job_type, json.dumps(payload, ensure_ascii=False), STATUS_PENDING,
+                      self.max_attempts, now + delay, now, now))
+                conn.commit()
+                return cursor.lastrowid
+        except Exception as e:
+            logger.error(f"任务入队失败: {e}")
+            return None
+
+    def enqueue_leased(self, job_type: str, payload: Dict[str, Any], worker_id: str) -> Optional[Tuple[int, str]]:
+        """
+        任务入队并直接由调用方持有租约（调用方马上自己处理，崩溃或租约过期后由其他工作线程领取）
+        :return: (任务ID, lease_token)，失败返回None
+        """
+        try:
+            now = time.time()
+            lease_token = uuid.uuid4().hex
+            with self.db.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    INSERT INTO job_queue (job_type, payload, status, attempts, max_attempts, available_at,
+                                           lease_owner, lease_token, lease_expires_at, created_at, updated_at)
+                    VALUES (?, ?, ?, 1, ?, ?, ?, ?, ?, ?, ?)
+                ''', (job_type, json.dumps(payload, ensure_ascii=False), STATUS_LEASED, self.max_attempts,
+                      now, worker_id, lease_token, now + self.lease_seconds, now, now))
+                conn.commit()
+                return cursor.lastrowid, lease_token
+        except Exception as e:
+            logger.error(f"任务入队失败: {e}")
+            return None
+
+    def lease(self, worker_id: str, job_types: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        """
+        租用一个可执行的任务（等待中且已到执行时间，或租约已过期）
+        :param worker_id: 工作线程标识
+        :param job_types: 只领取这些类型的任务，None表示任意类型
+        :return: 任务字典（含lease_token），没有可执行任务返回None
+        """
+        now = time.time()
+        lease_token = uuid.uuid4().hex
+
+        with self.db.get_connection() as conn:
+            cursor = conn.cursor()
+            # 立即获取写锁，避免多个进程领取同一任务
+            cursor.execute('BEGIN IMMEDIATE')
+            try:
+                # 租约过期且已无重试次数的任务直接进入死信
+                cursor.execute('''
+                    UPDATE job_queue
+                    SET status = ?, last_error = COALESCE(last_error, '租约过期'), lease_token = NULL, updated_at = ?
+                    WHERE status = ? AND lease_expires_at <= ? AND attempts >= max_attempts
+                ''', (STATUS_DEAD, now, STATUS_LEASED, now))
+
+                query = '''
+                    SELECT * FROM job_queue
+                    WHERE ((status = ? AND available_at <= ?)
+                       OR (status = ? AND lease_expires_at <= ?))
+                '''
+                params = [STATUS_PENDING, now, STATUS_LEASED, now]
+                if job_types:
+                    query += f" AND job_type IN ({','.join('?' * len(job_types))})"
+                    params.extend(job_types)
+                cursor.execute(query + ' ORDER BY available_at, id LIMIT 1', params)
+                row = cursor.fetchone()
+
+                if not row:
+                    conn.commit()
+                    return None
+
+                cursor.execute('''
+                    UPDATE job_queue
+                    SET status = ?, attempts = attempts + 1, lease_owner = ?, lease_token = ?,
+                        lease_expires_at = ?, updated_at = ?
+                    WHERE id = ?
+                ''', (STATUS_LEASED, worker_id, lease_token, now + self.lease_seconds, now, row['id']))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+        job = dict(row)
+        job['payload'] = json.loads(job['payload'])
+        job['attempts'] += 1
+        job['lease_token'] = lease_token
+        return job
+
+    def renew(self, job_id: int, lease_token: str) -> bool:
+        """延长租约（任务处理期间定期调用），租约已被其他工作线程接管时返回False"""
+        now = time.time()
+        with self.db.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE job_queue SET lease_expires_at = ?, updated_at = ?
+                WHERE id = ? AND lease_token = ? AND status = ?
+            ''', (now + self.lease_seconds, now, job_id, lease_token, STATUS_LEASED))
+            conn.commit()
+            return cursor.rowcount > 0
+
+    def complete(self, job_id: int, lease_token: str) -> bool:
+        """标记任务完成（仅当租约仍属于调用方时生效）"""
+        return self._update_leased(job_id, lease_token, '''
+            UPDATE job_queue SET status = ?, lease_token = NULL, lease_expires_at = NULL, updated_at = ?
+            WHERE id = ? AND lease_token = ?
+        ''', (STATUS_DONE, time.time(), job_id, lease_token))
+
+    def fail(self, job_id: int, lease_token: str, attempts: int, error: str) -> str:
+        """
+        标记任务失败：未超过最大尝试次数时按指数退避重新排队，否则进入死信
+        :return: 任务的新状态
+        """
+        now = time.time()
+        if attempts >= self.max_attempts:
+            self.bury(job_id, lease_token, error)
+            logger.error(f"☠️ 任务 {job_id} 重试 {attempts} 次仍失败，进入死信: {error}")
+            return STATUS_DEAD
+
+        backoff = min(self.max_backoff, self.base_backoff * (2 ** (attempts - 1)))
+        backoff *= random.uniform(0.8, 1.2)
+        self._update_leased(job_id, lease_token, '''
+            UPDATE job_queue
+            SET status = ?, available_at = ?, last_error = ?, lease_token = NULL, lease_expires_at = NULL, updated_at = ?
+            WHERE id = ? AND lease_token = ?
+        ''', (STATUS_PENDING, now + backoff, error[:2000], now, job_id, lease_token))
+        logger.warning(f"🔁 任务 {job_id} 第 {attempts} 次处理失败，{backoff:.1f}秒后重试: {error}")
+        return STATUS_PENDING
+
+    def bury(self, job_id: int, lease_token: str, error: str) -> bool:
+        """直接进入死信（不可重试的错误），可通过replay_dead重放"""
+        return self._update_leased(job_id, lease_token, '''
+            UPDATE job_queue SET status = ?, last_error = ?, lease_token = NULL, lease_expires_at = NULL, updated_at = ?
+            WHERE id = ? AND lease_token = ?
+        ''', (STATUS_DEAD, error[:2000], time.time(), job_id, lease_token))
+
+    def release(self, job_id: int, lease_token: str) -> bool:
+        """放弃租约，任务立即重新排队（停机时未处理的任务，不计为失败）"""
+        now = time.time()
+        return self._update_leased(job_id, lease_token, '''
+            UPDATE job_queue
+            SET status = ?, attempts = MAX(attempts - 1, 0), available_at = ?, lease_token = NULL,
+                lease_expires_at = NULL, updated_at = ?
+            WHERE id = ? AND lease_token = ?
+        ''', (STATUS_PENDING, now, now, job_id, lease_token))
+
+    def _update_leased(self, job_id: int, lease_token: str, query: str, params: tuple) -> bool:
+        try:
+            with self.db.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(query, params)
+                conn.commit()
+                if cursor.rowcount == 0:
+                    logger.warning(f"任务 {job_id} 的租约已失效（可能已被其他工作线程重新领取）")
+                    return False
+                return True
+        except Exception as e:
+            logger.error(f"更新任务 {job_id} 状态失败: {e}")
+            return False
+
+    def list_dead(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """获取死信任务列表"""
+        try:
+            with self.db.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT id, job_type, payload, attempts, last_error, created_at, updated_at
+                    FROM job_queue WHERE status = ?
+                    ORDER BY updated_at DESC LIMIT ?
+                ''', (STATUS_DEAD, limit))
+                return [dict(row) for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"获取死信任务失败: {e}")
+            return []
+
+    def replay_dead(self, job_ids: Optional[List[int]] = None) -> int:
+        """
+        重放死信任务：重置尝试次数并重新排队
+        :param job_ids: 指定任务ID列表，None表示全部死信任务
+        :return: 重放的任务数量
+        """
+        try:
+            now = time.time()
+            with self.db.get_connection() as conn:
+                cursor = conn.cursor()
+                query = '''
+                    UPDATE job_queue
+                    SET status = ?, attempts = 0, available_at = ?, lease_owner = NULL, updated_at = ?
+                    WHERE status = ?
+                '''
+                params = [STATUS_PENDING, now, now, STATUS_DEAD]
+                if job_ids:
+                    query += f" AND id IN ({','.join('?' * len(job_ids))})"
+                    params.extend(job_ids)
+                cursor.execute(query, params)
+                conn.commit()
+                return cursor.rowcount
+        except Exception as e:
+            logger.error(f"重放死信任务失败: {e}")
+            return 0
+
+    def purge_done(self, older_than_seconds: float = 86400) -> int:
+        """清理已完成的历史任务"""
+        try:
+            with self.db.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    "DELETE FROM job_queue WHERE status = ? AND updated_at < ?",
+                    (STATUS_DONE, time.time() - older_than_seconds)
+                )
+                conn.commit()
+                return cursor.rowcount
+        except Exception as e:
+            logger.error(f"清理已完成任务失败: {e}")
+            return 0
+
+    def get_stats(self) -> Dict[str, int]:
+        """按状态统计任务数量"""
+        try:
+            with self.db.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT status, COUNT(*) AS total FROM job_queue GROUP BY status")
+                stats = {status: 0 for status in (STATUS_PENDING, STATUS_LEASED, STATUS_DONE, STATUS_DEAD)}
+                for row in cursor.fetchall():
+                    stats[row['status']] = row['total']
+                return stats
+        except Exception as e:
+            logger.error(f"获取任务统计失败: {e}")
+            return {}
+
+# 创建全局实例
+def get_job_queue_db():
+    """获取任务队列实例（复用SQLite主数据库）"""
+    try:
+        from ..config.config import config
+        from .database_sqlite_v2 import database_manager
+        job_queue = JobQueueDatabase(
+            database_manager,
+            max_attempts=config.kf_job_max_attempts,
+            lease_seconds=config.kf_job_lease_seconds
+        )
+        job_queue.create_job_table()
+        return job_queue
+    except Exception as e:
+        logger.error(f"无法创建任务队列实例: {e}")
+        return None
+
+# 导出
+job_queue_db = get_job_queue_db()
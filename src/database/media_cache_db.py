@@ -0,0 +1,197 @@
+# media_cache_db.py
+"""
+媒体处理结果缓存（持久层）
+按媒体文件内容的sha256保存OCR、语音识别、文档解析的文本和分块元数据，另存media_id到内容哈希的别名，
+超出容量预算时按最近使用时间淘汰
+"""
+
+import json
+import time
+import logging
+from typing import Optional, Dict, Any
+
+logger = logging.getLogger(__name__)
+
+# 企业微信临时素材media_id有效期3天，别名保留时长与之一致
+ALIAS_TTL_SECONDS = 3 * 86400
+
+
+class MediaCacheDatabase:
+    """媒体处理结果缓存表操作类（使用SQLiteDatabase管理的数据库文件）"""
+
+    def __init__(self, db_instance, max_bytes: int = 100 * 1024 * 1024):
+        """
+        初始化
+        :param db_instance: SQLite数据库实例（需提供get_connection方法）
+        :param max_bytes: 缓存结果（文本+元数据）的总字节数上限
+        """
+        self.db = db_instance
+        self.max_bytes = max_bytes
+
+    def create_cache_tables(self) -> bool:
+        """创建缓存表和media_id别名表"""
+        try:
+            with self.db.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS media_result_cache (
+                        content_hash TEXT NOT NULL,
+                        kind TEXT NOT NULL,
+                        text TEXT NOT NULL,
+                        metadata TEXT,
+                        size_bytes INTEGER NOT NULL,
+                        latency_ms REAL DEFAULT 0,
+                        created_at REAL NOT NULL,
+                        last_hit_at REAL NOT NULL,
+                        hits INTEGER DEFAULT 0,
+                        PRIMARY KEY (content_hash, kind)
+                    )
+                ''')
+                cursor.execute('CREATE INDEX IF NOT EXISTS idx_media_cache_last_hit ON media_result_cache(last_hit_at)')
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS media_id_alias (
+                        media_id TEXT PRIMARY KEY,
+                        content_hash TEXT NOT NULL,
+                        created_at REAL NOT NULL
+                    )
+                ''')
+                conn.commit()
+            logger.info("媒体处理结果缓存表创建成功")
+            return True
+        except Exception as e:
+            logger.error(f"创建媒体处理结果缓存表失败: {e}")
+            return False
+
+    def get(self, content_hash: str, kind: str) -> Optional[Dict[str, Any]]:
+        """
+        按内容哈希读取缓存
+        :return: {'text', 'metadata', 'latency_ms'}，未命中返回None
+        """
+        try:
+            with self.db.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    "SELECT text, metadata, latency_ms FROM media_result_cache WHERE content_hash = ? AND kind = ?",
+                    (content_hash, kind)
+                )
+                row = cursor.fetchone()
+                if not row:
+                    return None
+                cursor.execute(
+                    "UPDATE media_result_cache SET last_hit_at = ?, hits = hits + 1 WHERE content_hash = ? AND kind = ?",
+                    (time.time(), content_hash, kind)
+                )
+                conn.commit()
+                return {
+                    'text': row['text'],
+                    'metadata': json.loads(row['metadata']) if row['metadata'] else {},
+                    'latency_ms': row['latency_ms']
+                }
+        except Exception as e:
+            logger.error(f"读取媒体处理结果缓存失败: {e}")
+            return None
+
+    def resolve_alias(self, media_id: str) -> Optional[str]:
+        """media_id对应的内容哈希，未知或已过期返回None"""
+        try:
+            with self.db.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    "SELECT content_hash FROM media_id_alias WHERE media_id = ? AND created_at > ?",
+                    (media_id, time.time() - ALIAS_TTL_SECONDS)
+                )
+                row = cursor.fetchone()
+                return row['content_hash'] if row else None
+        except Exception as e:
+            logger.error(f"读取media_id别名失败: {e}")
+            return None
+
+    def put_alias(self, media_id: str, content_hash: str) -> bool:
+        """记录media_id到内容哈希的别名"""
+        try:
+            with self.db.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    "INSERT OR REPLACE INTO media_id_alias (media_id, content_hash, created_at) VALUES (?, ?, ?)",
+                    (media_id, content_hash, time.time())
+                )
+                conn.commit()
+                return True
+        except Exception as e:
+            logger.error(f"写入media_id别名失败: {e}")
+            return False
+
+    def put(self, content_hash: str, kind: str, text: str, metadata: Dict[str, Any], latency_ms: float) -> bool:
+        """写入缓存"""
+        try:
+            now = time.time()
+            metadata_json = json.dumps(metadata or {}, ensure_ascii=False)
+            size_bytes = len(text.encode('utf-8')) + len(metadata_json.encode('utf-8'))
+            with self.db.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    INSERT OR REPLACE INTO media_result_cache
+                        (content_hash, kind, text, metadata, size_bytes, latency_ms, created_at, last_hit_at, hits)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0)
+                ''', (content_hash, kind, text, metadata_json, size_bytes, latency_ms, now, now))
+                conn.commit()
+                return True
+        except Exception as e:
+            logger.error(f"写入媒体处理结果缓存失败: {e}")
+            return False
+
+    def evict(self) -> int:
+        """按最近使用时间淘汰超出容量预算的结果，并清理过期的别名"""
+        try:
+            with self.db.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    DELETE FROM media_result_cache WHERE rowid IN (
+                        SELECT rowid FROM (
+                            SELECT rowid, SUM(size_bytes) OVER (ORDER BY last_hit_at DESC) AS running_bytes
+                            FROM media_result_cache
+                        ) WHERE running_bytes > ?
+                    )
+                ''', (self.max_bytes,))
+                removed = cursor.rowcount
+                cursor.execute(
+                    "DELETE FROM media_id_alias WHERE created_at <= ?",
+                    (time.time() - ALIAS_TTL_SECONDS,)
+                )
+                conn.commit()
+                return removed
+        except Exception as e:
+            logger.error(f"清理媒体处理结果缓存失败: {e}")
+            return 0
+
+    def usage(self) -> Dict[str, int]:
+        """缓存条数和占用字节数"""
+        try:
+            with self.db.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT COUNT(*) AS total, COALESCE(SUM(size_bytes), 0) AS bytes FROM media_result_cache")
+                row = cursor.fetchone()
+                return {'entries': row['total'], 'bytes': row['bytes']}
+        except Exception as e:
+            logger.error(f"统计媒体处理结果缓存失败: {e}")
+            return {'entries': 0, 'bytes': 0}
+
+# 创建全局实例
+def get_media_cache_db():
+    """获取媒体处理结果缓存实例（复用SQLite主数据库）"""
+    try:
+        from ..config.config import config
+        from .database_sqlite_v2 import database_manager
+        cache_db = MediaCacheDatabase(
+            database_manager,
+            max_bytes=int(config.media_cache_max_mb * 1024 * 1024)
+        )
+        if cache_db.create_cache_tables():
+            cache_db.evict()
+            return cache_db
+    except Exception as e:
+        logger.error(f"无法创建媒体处理结果缓存实例: {e}")
+    return None
+
+# 导出
+media_cache_db = get_media_cache_db()
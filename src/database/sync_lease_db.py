@@ -0,0 +1,229 @@
+# sync_lease_db.py
+"""
+微信客服账号同步租约
+多个uvicorn worker或多台主机部署时，同一客服账号同一时间只允许一个进程调用sync_msg；
+未拿到租约的进程只标记"待补拉"，由持有租约的进程在本轮拉取结束后再拉一次
+"""
+
+import time
+import threading
+import logging
+from typing import Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class SyncLeaseDatabase:
+    """同步租约的SQLite实现（使用SQLiteDatabase管理的数据库文件，多进程共享）"""
+
+    backend = 'sqlite'
+
+    def __init__(self, db_instance, lease_seconds: float = 60):
+        """
+        初始化
+        :param db_instance: SQLite数据库实例（需提供get_connection方法）
+        :param lease_seconds: 租约时长，持有者需在到期前续约
+        """
+        self.db = db_instance
+        self.lease_seconds = lease_seconds
+
+    def create_lease_table(self) -> bool:
+        """创建租约表"""
+        try:
+            with self.db.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS kf_sync_leases (
+                        open_kfid TEXT PRIMARY KEY,
+                        owner TEXT NOT NULL,
+                        expires_at REAL NOT NULL,
+                        pending INTEGER DEFAULT 0,
+                        pending_token TEXT,
+                        updated_at REAL NOT NULL
+                    )
+                ''')
+                conn.commit()
+            logger.info("同步租约表创建成功")
+            return True
+        except Exception as e:
+            logger.error(f"创建同步租约表失败: {e}")
+            return False
+
+    def acquire(self, open_kfid: str, owner: str) -> bool:
+        """获取租约：无人持有、已过期或本进程已持有时成功"""
+        now = time.time()
+        with self.db.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            try:
+                cursor.execute("SELECT owner, expires_at FROM kf_sync_leases WHERE open_kfid = ?", (open_kfid,))
+                row = cursor.fetchone()
+                if row and row['owner'] != owner and row['expires_at'] > now:
+                    conn.commit()
+                    return False
+                # 新持有者会完整拉取一次，之前的待补拉标记可以清除
+                cursor.execute('''
+                    INSERT OR REPLACE INTO kf_sync_leases (open_kfid, owner, expires_at, pending, pending_token, updated_at)
+                    VALUES (?, ?, ?, 0, NULL, ?)
+                ''', (open_kfid, owner, now + self.lease_seconds, now))
+                conn.commit()
+                return True
+            except Exception:
+                conn.rollback()
+                raise
+
+    def renew(self, open_kfid: str, owner: str) -> bool:
+        """续约，租约已被他人接管时返回False"""
+        now = time.time()
+        with self.db.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE kf_sync_leases SET expires_at = ?, updated_at = ?
+                WHERE open_kfid = ? AND owner = ?
+            ''', (now + self.lease_seconds, now, open_kfid, owner))
+            conn.commit()
+            return cursor.rowcount > 0
+
+    def mark_pending(self, open_kfid: str, token: str = '') -> bool:
+        """
+        在他人持有的有效租约上标记待补拉
+        :return: 标记成功返回True；租约已不存在或已过期返回False（调用方应重新尝试获取租约）
+        """
+        now = time.time()
+        with self.db.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE kf_sync_leases
+                SET pending = 1, pending_token = COALESCE(NULLIF(?, ''), pending_token), updated_at = ?
+                WHERE open_kfid = ? AND expires_at > ?
+            ''', (token, now, open_kfid, now))
+            conn.commit()
+            return cursor.rowcount > 0
+
+    def release(self, open_kfid: str, owner: str) -> Tuple[bool, str]:
+        """
+        释放租约。如有待补拉标记，则保留并续约租约、清除标记
+        :return: (是否已释放, 待补拉使用的token)；未释放时调用方需再拉取一次后再次调用release
+        """
+        now = time.time()
+        with self.db.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            try:
+                cursor.execute(
+                    "SELECT pending, pending_token FROM kf_sync_leases WHERE open_kfid = ? AND owner = ?",
+                    (open_kfid, owner)
+                )
+                row = cursor.fetchone()
+                if row and row['pending']:
+                    cursor.execute('''
+                        UPDATE kf_sync_leases SET pending = 0, pending_token = NULL, expires_at = ?, updated_at = ?
+                        WHERE open_kfid = ?
+                    ''', (now + self.lease_seconds, now, open_kfid))
+                    conn.commit()
+                    return False, row['pending_token'] or ''
+                cursor.execute("DELETE FROM kf_sync_leases WHERE open_kfid = ? AND owner = ?", (open_kfid, owner))
+                conn.commit()
+                return True, ''
+            except Exception:
+                conn.rollback()
+                raise
+
+    def abandon(self, open_kfid: str, owner: str) -> bool:
+        """同步失败时放弃租约（保留待补拉标记，让下一个获取者处理）"""
+        try:
+            with self.db.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    "UPDATE kf_sync_leases SET expires_at = 0, updated_at = ? WHERE open_kfid = ? AND owner = ?",
+                    (time.time(), open_kfid, owner)
+                )
+                conn.commit()
+                return cursor.rowcount > 0
+        except Exception as e:
+            logger.error(f"放弃同步租约失败: {e}")
+            return False
+
+
+class MemorySyncLease:
+    """同步租约的进程内实现（单进程部署或测试使用，接口与SyncLeaseDatabase一致）"""
+
+    backend = 'memory'
+
+    def __init__(self, lease_seconds: float = 60):
+        self.lease_seconds = lease_seconds
+        # open_kfid -> {'owner', 'expires_at', 'pending', 'pending_token'}
+        self._leases = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, open_kfid: str, owner: str) -> bool:
+        now = time.time()
+        with self._lock:
+            lease = self._leases.get(open_kfid)
+            if lease and lease['owner'] != owner and lease['expires_at'] > now:
+                return False
+            self._leases[open_kfid] = {
+                'owner': owner,
+                'expires_at': now + self.lease_seconds,
+                'pending': False,
+                'pending_token': ''
+            }
+            return True
+
+    def renew(self, open_kfid: str, owner: str) -> bool:
+        with self._lock:
+            lease = self._leases.get(open_kfid)
+            if not lease or lease['owner'] != owner:
+                return False
+            lease['expires_at'] = time.time() + self.lease_seconds
+            return True
+
+    def mark_pending(self, open_kfid: str, token: str = '') -> bool:
+        with self._lock:
+            lease = self._leases.get(open_kfid)
+            if not lease or lease['expires_at'] <= time.time():
+                return False
+            lease['pending'] = True
+            lease['pending_token'] = token or lease['pending_token']
+            return True
+
+    def release(self, open_kfid: str, owner: str) -> Tuple[bool, str]:
+        with self._lock:
+            lease = self._leases.get(open_kfid)
+            if not lease or lease['owner'] != owner:
+                return True, ''
+            if lease['pending']:
+                token = lease['pending_token']
+                lease['pending'] = False
+                lease['pending_token'] = ''
+                lease['expires_at'] = time.time() + self.lease_seconds
+                return False, token
+            del self._leases[open_kfid]
+            return True, ''
+
+    def abandon(self, open_kfid: str, owner: str) -> bool:
+        with self._lock:
+            lease = self._leases.get(open_kfid)
+            if not lease or lease['owner'] != owner:
+                return False
+            lease['expires_at'] = 0
+            return True
+
+
+# 创建全局实例
+def get_sync_lease_backend():
+    """根据配置获取同步租约后端（sqlite复用主数据库，memory仅限单进程）"""
+    from ..config.config import config
+    if config.kf_sync_lease_backend == 'sqlite':
+        try:
+            from .database_sqlite_v2 import database_manager
+            lease_db = SyncLeaseDatabase(database_manager, lease_seconds=config.kf_sync_lease_seconds)
+            if lease_db.create_lease_table():
+                return lease_db
+        except Exception as e:
+            logger.error(f"无法创建同步租约数据库实例: {e}")
+        logger.warning("SQLite同步租约不可用，回退到进程内租约")
+    return MemorySyncLease(lease_seconds=config.kf_sync_lease_seconds)
+
+# 导出
+sync_lease_backend = get_sync_lease_backend()
@@ -0,0 +1,143 @@
+# sync_state_db.py
+"""
+微信客服消息同步状态持久化
+保存每个客服账号的sync_msg游标和已处理的msgid，重启后从上次的位置继续拉取，不会重放历史消息
+"""
+
+import time
+import logging
+from typing import Optional, List, Tuple, Set
+
+logger = logging.getLogger(__name__)
+
+# 已处理消息标记的保留时长（微信客服消息最多保留3天，多留几天即可）
+PROCESSED_RETENTION_SECONDS = 7 * 86400
+
+
+class SyncStateDatabase:
+    """同步游标和已处理消息标记的数据库操作类（使用SQLiteDatabase管理的数据库文件）"""
+
+    def __init__(self, db_instance):
+        """
+        初始化
+        :param db_instance: SQLite数据库实例（需提供get_connection方法）
+        """
+        self.db = db_instance
+
+    def create_sync_tables(self) -> bool:
+        """创建同步状态表"""
+        try:
+            with self.db.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS kf_sync_cursors (
+                        open_kfid TEXT PRIMARY KEY,
+                        cursor TEXT NOT NULL,
+                        updated_at REAL NOT NULL
+                    )
+                ''')
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS kf_processed_messages (
+                        msgid TEXT PRIMARY KEY,
+                        open_kfid TEXT,
+                        send_time INTEGER,
+                        processed_at REAL NOT NULL
+                    )
+                ''')
+                cursor.execute('CREATE INDEX IF NOT EXISTS idx_kf_processed_at ON kf_processed_messages(processed_at)')
+                conn.commit()
+            logger.info("同步状态表创建成功")
+            return True
+        except Exception as e:
+            logger.error(f"创建同步状态表失败: {e}")
+            return False
+
+    def get_cursor(self, open_kfid: str) -> Optional[str]:
+        """获取客服账号的同步游标"""
+        try:
+            with self.db.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT cursor FROM kf_sync_cursors WHERE open_kfid = ?", (open_kfid,))
+                row = cursor.fetchone()
+                return row['cursor'] if row else None
+        except Exception as e:
+            logger.error(f"获取同步游标失败: {e}")
+            return None
+
+    def commit_page(self, open_kfid: str, next_cursor: Optional[str], processed: List[Tuple[str, int]]) -> bool:
+        """
+        在同一个事务中保存游标和本页已处理的消息标记
+        :param open_kfid: 客服账号ID
+        :param next_cursor: 下一页游标（为空时只写入消息标记）
+        :param processed: [(msgid, send_time), ...]
+        """
+        try:
+            now = time.time()
+            with self.db.get_connection() as conn:
+                cursor = conn.cursor()
+                if processed:
+                    cursor.executemany('''
+                        INSERT OR IGNORE INTO kf_processed_messages (msgid, open_kfid, send_time, processed_at)
+                        VALUES (?, ?, ?, ?)
+                    ''', [(msgid, open_kfid, send_time, now) for msgid, send_time in processed])
+                if next_cursor:
+                    cursor.execute('''
+                        INSERT OR REPLACE INTO kf_sync_cursors (open_kfid, cursor, updated_at)
+                        VALUES (?, ?, ?)
+                    ''', (open_kfid, next_cursor, now))
+                conn.commit()
+            return True
+        except Exception as e:
+            logger.error(f"保存同步状态失败: {e}")
+            return False
+
+    def mark_processed(self, open_kfid: str, msgid: str, send_time: int) -> bool:
+        """立即标记单条消息已处理（不推进游标）"""
+        return self.commit_page(open_kfid, None, [(msgid, send_time)])
+
+    def filter_processed(self, msgids: List[str]) -> Set[str]:
+        """返回msgids中已处理过的部分"""
+        if not msgids:
+            return set()
+        try:
+            with self.db.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    f"SELECT msgid FROM kf_processed_messages WHERE msgid IN ({','.join('?' * len(msgids))})",
+                    msgids
+                )
+                return {row['msgid'] for row in cursor.fetchall()}
+        except Exception as e:
+            logger.error(f"查询已处理消息失败: {e}")
+            return set()
+
+    def purge_processed(self, older_than_seconds: float = PROCESSED_RETENTION_SECONDS) -> int:
+        """清理过期的已处理消息标记"""
+        try:
+            with self.db.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    "DELETE FROM kf_processed_messages WHERE processed_at < ?",
+                    (time.time() - older_than_seconds,)
+                )
+                conn.commit()
+                return cursor.rowcount
+        except Exception as e:
+            logger.error(f"清理已处理消息标记失败: {e}")
+            return 0
+
+# 创建全局实例
+def get_sync_state_db():
+    """获取同步状态数据库实例（复用SQLite主数据库）"""
+    try:
+        from .database_sqlite_v2 import database_manager
+        sync_state = SyncStateDatabase(database_manager)
+        sync_state.create_sync_tables()
+        sync_state.purge_processed()
+        return sync_state
+    except Exception as e:
+        logger.error(f"无法创建同步状态数据库实例: {e}")
+        return None
+
+# 导出
+sync_state_db = get_sync_state_db()
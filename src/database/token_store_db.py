@@ -0,0 +1,142 @@
+# token_store_db.py
+"""
+access_token共享存储
+多个worker进程共用同一份企业微信access_token，并通过刷新锁保证同一时间只有一个进程去调用gettoken
+"""
+
+import time
+import logging
+from typing import Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class TokenStoreDatabase:
+    """access_token存储操作类（使用SQLiteDatabase管理的数据库文件）"""
+
+    def __init__(self, db_instance):
+        """
+        初始化
+        :param db_instance: SQLite数据库实例（需提供get_connection方法）
+        """
+        self.db = db_instance
+
+    def create_token_table(self) -> bool:
+        """创建access_token表"""
+        try:
+            with self.db.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS access_tokens (
+                        name TEXT PRIMARY KEY,
+                        token TEXT,
+                        expires_at REAL DEFAULT 0,
+                        refresh_owner TEXT,
+                        refresh_until REAL DEFAULT 0,
+                        updated_at REAL NOT NULL
+                    )
+                ''')
+                conn.commit()
+            logger.info("access_token表创建成功")
+            return True
+        except Exception as e:
+            logger.error(f"创建access_token表失败: {e}")
+            return False
+
+    def get_token(self, name: str) -> Tuple[Optional[str], float]:
+        """获取已保存的token及其过期时间"""
+        try:
+            with self.db.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT token, expires_at FROM access_tokens WHERE name = ?", (name,))
+                row = cursor.fetchone()
+                if row and row['token']:
+                    return row['token'], row['expires_at']
+        except Exception as e:
+            logger.error(f"读取access_token失败: {e}")
+        return None, 0
+
+    def save_token(self, name: str, token: str, expires_at: float) -> bool:
+        """保存token并释放刷新锁"""
+        try:
+            now = time.time()
+            with self.db.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    INSERT INTO access_tokens (name, token, expires_at, refresh_owner, refresh_until, updated_at)
+                    VALUES (?, ?, ?, NULL, 0, ?)
+                    ON CONFLICT(name) DO UPDATE SET
+                        token = excluded.token, expires_at = excluded.expires_at,
+                        refresh_owner = NULL, refresh_until = 0, updated_at = excluded.updated_at
+                ''', (name, token, expires_at, now))
+                conn.commit()
+                return True
+        except Exception as e:
+            logger.error(f"保存access_token失败: {e}")
+            return False
+
+    def invalidate_token(self, name: str, token: str) -> bool:
+        """作废指定token（仅当存储中仍是该token时生效，避免把其他进程刚刷新的token清掉）"""
+        try:
+            with self.db.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    "UPDATE access_tokens SET token = NULL, expires_at = 0, updated_at = ? WHERE name = ? AND token = ?",
+                    (time.time(), name, token)
+                )
+                conn.commit()
+                return cursor.rowcount > 0
+        except Exception as e:
+            logger.error(f"作废access_token失败: {e}")
+            return False
+
+    def claim_refresh(self, name: str, owner: str, seconds: float) -> bool:
+        """
+        获取刷新锁，持有期间其他进程等待而不是同时调用gettoken
+        :param seconds: 锁的有效期，持有者异常退出后锁会自动失效
+        """
+        now = time.time()
+        try:
+            with self.db.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    INSERT INTO access_tokens (name, refresh_owner, refresh_until, updated_at)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT(name) DO UPDATE SET
+                        refresh_owner = excluded.refresh_owner, refresh_until = excluded.refresh_until,
+                        updated_at = excluded.updated_at
+                    WHERE access_tokens.refresh_until <= ? OR access_tokens.refresh_owner = excluded.refresh_owner
+                ''', (name, owner, now + seconds, now, now))
+                conn.commit()
+                return cursor.rowcount > 0
+        except Exception as e:
+            logger.error(f"获取access_token刷新锁失败: {e}")
+            # 存储不可用时允许本进程自行刷新
+            return True
+
+    def release_refresh(self, name: str, owner: str):
+        """释放刷新锁（刷新失败时调用）"""
+        try:
+            with self.db.get_connection() as conn:
+                conn.execute(
+                    "UPDATE access_tokens SET refresh_owner = NULL, refresh_until = 0 WHERE name = ? AND refresh_owner = ?",
+                    (name, owner)
+                )
+                conn.commit()
+        except Exception as e:
+            logger.error(f"释放access_token刷新锁失败: {e}")
+
+# 创建全局实例
+def get_token_store_db():
+    """获取access_token存储实例（复用SQLite主数据库）"""
+    try:
+        from .database_sqlite_v2 import database_manager
+        token_store = TokenStoreDatabase(database_manager)
+        if token_store.create_token_table():
+            return token_store
+    except Exception as e:
+        logger.error(f"无法创建access_token存储实例: {e}")
+    return None
+
+# 导出
+token_store_db = get_token_store_db()
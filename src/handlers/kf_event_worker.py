@@ -0,0 +1,318 @@
+# kf_event_worker.py
+"""
+微信客服事件后台处理池
+回调接口只负责验签、解密和入队，耗时的消息拉取、AI分析、入库和回复由后台工作线程完成
+支持两种队列：进程内内存队列，或持久化到SQLite的任务表（重启不丢消息，失败自动重试）
+"""
+import logging
+import os
+import queue
+import socket
+import threading
+import time
+from typing import Dict, Any, Callable
+
+from ..config.config import config
+from ..database.job_queue_db import job_queue_db
+from ..utils.metrics import kf_pipeline_stats
+from .message_handler import dispatch_callback_message, process_kf_media_job
+
+logger = logging.getLogger(__name__)
+
+# 停止信号
+_STOP = object()
+
+# 回调消息的任务类型
+JOB_TYPE_CALLBACK = 'callback'
+# 拉取消息时转交媒体车道的图片、文件、语音、聊天记录消息
+JOB_TYPE_KF_MEDIA = 'kf_media'
+
+
+class _JobLeaseKeeper:
+    """任务处理期间定期续约的后台线程，避免耗时任务（长语音、大文件）超过租约后被重复领取"""
+
+    def __init__(self, job_queue, job: Dict[str, Any]):
+        self.job_queue = job_queue
+        self.job_id = job['id']
+        self.lease_token = job['lease_token']
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"kf-job-lease-{self.job_id}", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join(5)
+
+    def _run(self):
+        interval = max(1.0, self.job_queue.lease_seconds / 3)
+        while not self._stop.wait(interval):
+            try:
+                if not self.job_queue.renew(self.job_id, self.lease_token):
+                    logger.warning(f"⚠️ 任务 {self.job_id} 的租约已被其他工作线程接管")
+                    return
+            except Exception as e:
+                logger.error(f"续约任务 {self.job_id} 失败: {e}")
+
+
+class KfEventWorkerPool:
+    """后台工作线程池 - 从队列中取出回调消息并调用处理函数"""
+
+    def __init__(self, handler: Callable[[Dict[str, Any]], None], worker_count: int = 4,
+                 max_queue_size: int = 1000, job_queue=None, poll_interval: float = 1.0,
+                 purge_every: int = 500, retention_seconds: float = 86400, job_type: str = JOB_TYPE_CALLBACK):
+        """
+        :param handler: 消息处理函数，抛出异常表示处理失败
+        :param worker_count: 工作线程数
+        :param max_queue_size: 内存队列最大长度（仅内存模式）
+        :param job_queue: 持久化任务队列（JobQueueDatabase），为None时使用内存队列
+        :param poll_interval: 持久化模式下空闲轮询间隔（秒）
+        :param purge_every: 持久化模式下每领取N个任务清理一次已完成的历史任务，0表示不清理
+        :param retention_seconds: 已完成任务的保留时长（秒）
+        :param job_type: 任务类型，持久化模式下只领取该类型的任务；也用作线程名和耗时统计的前缀
+        """
+        self.handler = handler
+        self.job_type = job_type
+        # 回调任务沿用原来的统计名，其他类型加前缀
+        self._metric_prefix = '' if job_type == JOB_TYPE_CALLBACK else f"{job_type}."
+        self.worker_count = max(1, worker_count)
+        self.job_queue = job_queue
+        self.poll_interval = poll_interval
+        self.purge_every = max(0, purge_every)
+        self.retention_seconds = retention_seconds
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._wakeup = threading.Event()
+        self._workers = []
+        self._running = False
+        self._lock = threading.Lock()
+
+        # 运行统计
+        self._submitted = 0
+        self._rejected = 0
+        self._processed = 0
+        self._failed = 0
+        self._in_flight = 0
+        self._leases_since_purge = 0
+        self._purged = 0
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    @property
+    def durable(self) -> bool:
+        return self.job_queue is not None
+
+    def start(self):
+        """启动工作线程"""
+        with self._lock:
+            if self._running:
+                return
+            self._running = True
+            target = self._durable_worker_loop if self.durable else self._worker_loop
+            for i in range(self.worker_count):
+                worker = threading.Thread(
+                    target=target,
+                    name=f"kf-worker-{self.job_type}-{i}",
+                    daemon=True
+                )
+                worker.start()
+                self._workers.append(worker)
+        mode = "持久化任务表" if self.durable else "内存队列"
+        logger.info(f"✅ 微信客服后台处理池已启动（{self.job_type}），工作线程数: {self.worker_count}，队列: {mode}")
+
+    def stop(self, timeout: float = 30):
+        """
+        停止工作线程（停机排空）
+        内存模式：处理完已入队的消息后退出；持久化模式：不再领取新任务，等待处理中的任务完成，
+        未处理的任务保留在任务表中，下次启动后继续处理。最多等待timeout秒
+        """
+        with self._lock:
+            if not self._running:
+                return
+            self._running = False
+            workers = list(self._workers)
+            self._workers = []
+
+        if self.durable:
+            self._wakeup.set()
+        else:
+            for _ in workers:
+                self._queue.put(_STOP)
+
+        deadline = time.time() + timeout
+        for worker in workers:
+            worker.join(max(0, deadline - time.time()))
+
+        if self.durable:
+            still_running = sum(1 for worker in workers if worker.is_alive())
+            if still_running:
+                logger.warning(f"⚠️ 后台处理池停止时仍有 {still_running} 个任务在处理，租约过期后将被重新领取")
+        else:
+            remaining = self._queue.qsize()
+            if remaining:
+                logger.warning(f"⚠️ 后台处理池停止时仍有 {remaining} 条消息未处理")
+        logger.info(f"🛑 微信客服后台处理池已停止（{self.job_type}）")
+
+    def submit(self, message: Dict[str, Any]) -> bool:
+        """
+        提交回调消息到队列
+
+        Returns:
+            bool: 入队成功返回True，队列已满或未启动返回False
+        """
+        if not self._running:
+            return False
+
+        if self.durable:
+            job_id = self.job_queue.enqueue(self.job_type, message)
+            if job_id is None:
+                with self._lock:
+                    self._rejected += 1
+                return False
+            with self._lock:
+                self._submitted += 1
+            self._wakeup.set()
+            return True
+
+        try:
+            self._queue.put_nowait((time.time(), message))
+        except queue.Full:
+            with self._lock:
+                self._rejected += 1
+            logger.error(f"❌ 后台处理队列已满（{self._queue.maxsize}），消息被丢弃")
+            return False
+
+        with self._lock:
+            self._submitted += 1
+        return True
+
+    def _worker_loop(self):
+        """工作线程主循环（内存队列）"""
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                self._queue.task_done()
+                break
+
+            enqueued_at, message = item
+            kf_pipeline_stats.record(f"{self._metric_prefix}queue_wait", time.time() - enqueued_at)
+            try:
+                self._run_handler(message)
+            except Exception as e:
+                logger.error(f"后台处理回调消息失败: {e}", exc_info=True)
+            finally:
+                self._queue.task_done()
+
+    def _durable_worker_loop(self):
+        """工作线程主循环（持久化任务表）"""
+        worker_id = f"{socket.gethostname()}:{os.getpid()}:{threading.current_thread().name}"
+        while self._running:
+            try:
+                job = self.job_queue.lease(worker_id, job_types=[self.job_type])
+            except Exception as e:
+                logger.error(f"领取任务失败: {e}")
+                job = None
+
+            if not job:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+
+            kf_pipeline_stats.record(f"{self._metric_prefix}queue_wait", max(0, time.time() - job['available_at']))
+            self._maybe_purge()
+            keeper = _JobLeaseKeeper(self.job_queue, job)
+            keeper.start()
+            try:
+                self._run_handler(job['payload'])
+            except Exception as e:
+                keeper.stop()
+                self.job_queue.fail(job['id'], job['lease_token'], job['attempts'], str(e))
+            else:
+                keeper.stop()
+                self.job_queue.complete(job['id'], job['lease_token'])
+
+    def _maybe_purge(self):
+        """每领取purge_every个任务清理一次已完成的历史任务，避免任务表无限增长"""
+        if not self.purge_every:
+            return
+        with self._lock:
+            self._leases_since_purge += 1
+            if self._leases_since_purge < self.purge_every:
+                return
+            self._leases_since_purge = 0
+        purged = self.job_queue.purge_done(self.retention_seconds)
+        if purged:
+            with self._lock:
+                self._purged += purged
+            logger.info(f"🧹 已清理 {purged} 个已完成的历史任务")
+
+    def _run_handler(self, message: Dict[str, Any]):
+        """调用处理函数并记录耗时与计数，异常会继续向上抛出"""
+        with self._lock:
+            self._in_flight += 1
+        try:
+            with kf_pipeline_stats.timer(f"{self._metric_prefix}process"):
+                self.handler(message)
+            with self._lock:
+                self._processed += 1
+        except Exception:
+            with self._lock:
+                self._failed += 1
+            raise
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取处理池运行状态"""
+        with self._lock:
+            stats = {
+                'running': self._running,
+                'job_type': self.job_type,
+                'backend': 'sqlite' if self.durable else 'memory',
+                'worker_count': self.worker_count,
+                'queue_size': self._queue.qsize(),
+                'max_queue_size': self._queue.maxsize,
+                'in_flight': self._in_flight,
+                'submitted': self._submitted,
+                'rejected': self._rejected,
+                'processed': self._processed,
+                'failed': self._failed
+            }
+        if self.durable:
+            stats['purged'] = self._purged
+            stats['jobs'] = self.job_queue.get_stats()
+        return stats
+
+
+def _select_job_queue():
+    """根据配置选择队列后端"""
+    if config.kf_queue_backend == 'sqlite':
+        if job_queue_db:
+            return job_queue_db
+        logger.warning("持久化任务队列不可用，回退到内存队列")
+    return None
+
+
+# 全局后台处理池实例
+kf_event_pool = KfEventWorkerPool(
+    dispatch_callback_message,
+    worker_count=config.kf_worker_count,
+    max_queue_size=config.kf_queue_size,
+    job_queue=_select_job_queue(),
+    purge_every=config.kf_job_purge_every,
+    retention_seconds=config.kf_job_retention_seconds
+)
+
+# 媒体消息后台处理池：拉取消息时图片、文件等转为任务交给它处理，游标提交和后面的验证码不用等OCR/PDF解析
+# （已完成任务由回调处理池统一清理）
+kf_media_pool = KfEventWorkerPool(
+    process_kf_media_job,
+    worker_count=config.kf_media_lane_workers,
+    max_queue_size=config.kf_queue_size,
+    job_queue=_select_job_queue(),
+    purge_every=0,
+    job_type=JOB_TYPE_KF_MEDIA
+)
@@ -0,0 +1,200 @@
+# kf_lane_scheduler.py
+"""
+微信客服消息分道调度
+验证码、命令、普通文本处理快且对时延敏感（小程序用户在看倒计时），图片/文件/语音/聊天记录要等OCR、PDF解析、ASR，
+一条可能要几十秒。两类消息各用一条车道和独立的工作线程，快车道的消息不会排在媒体任务后面：
+- fast车道：按优先级出队，验证码 > 命令 > 普通文本
+- media车道：其余类型，先进先出
+每条车道分别统计排队等待和处理耗时
+"""
+import itertools
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, Any, Callable, Optional
+
+from ..config.config import config
+from ..utils.metrics import LatencyStats
+from .message_classifier import classifier
+
+logger = logging.getLogger(__name__)
+
+# 停止信号（优先级最低，排在所有任务之后）
+_STOP_PRIORITY = 99
+
+LANE_FAST = 'fast'
+LANE_MEDIA = 'media'
+
+# 消息类别 → (车道, 车道内优先级，越小越先处理)
+MESSAGE_CLASSES = {
+    'verify_code': (LANE_FAST, 0),
+    'command': (LANE_FAST, 1),
+    'text': (LANE_FAST, 2),
+    'media': (LANE_MEDIA, 0)
+}
+
+
+def classify_kf_message(kf_msg: Dict[str, Any]) -> str:
+    """按处理成本给微信客服消息分类：verify_code / command / text / media"""
+    if kf_msg.get('msgtype', '') != 'text':
+        return 'media'
+    content = kf_msg.get('text', {}).get('content', '')
+    if content and len(content) == 6 and content.isdigit():
+        return 'verify_code'
+    if classifier.is_command(content.strip()):
+        return 'command'
+    return 'text'
+
+
+class _Lane:
+    """单条车道：优先级队列 + 工作线程"""
+
+    def __init__(self, name: str, worker_count: int):
+        self.name = name
+        self.worker_count = max(1, worker_count)
+        self.queue = queue.PriorityQueue()
+        self.workers = []
+        self.in_flight = 0
+
+
+class KfLaneScheduler:
+    """分道调度器 - 快车道和媒体车道各自排队、各自处理"""
+
+    def __init__(self, fast_workers: int = 4, media_workers: int = 2):
+        """
+        :param fast_workers: 快车道（验证码、命令、普通文本）工作线程数
+        :param media_workers: 媒体车道（图片、文件、语音、聊天记录等）工作线程数
+        """
+        self._lanes = {
+            LANE_FAST: _Lane(LANE_FAST, fast_workers),
+            LANE_MEDIA: _Lane(LANE_MEDIA, media_workers)
+        }
+        # 同优先级按入队顺序处理
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self._running = False
+        self.stats = LatencyStats()
+
+        # 运行统计
+        self._submitted = {name: 0 for name in MESSAGE_CLASSES}
+        self._failed = 0
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    def start(self):
+        """启动各车道工作线程"""
+        with self._lock:
+            if self._running:
+                return
+            self._running = True
+            for lane in self._lanes.values():
+                for i in range(lane.worker_count):
+                    worker = threading.Thread(
+                        target=self._worker_loop,
+                        args=(lane,),
+                        name=f"kf-lane-{lane.name}-{i}",
+                        daemon=True
+                    )
+                    worker.start()
+                    lane.workers.append(worker)
+        logger.info(f"✅ 消息分道调度已启动，快车道线程: {self._lanes[LANE_FAST].worker_count}，"
+                    f"媒体车道线程: {self._lanes[LANE_MEDIA].worker_count}")
+
+    def stop(self, timeout: float = 30):
+        """停止工作线程，处理完已入队的任务后退出，最多等待timeout秒"""
+        with self._lock:
+            if not self._running:
+                return
+            self._running = False
+            lanes = list(self._lanes.values())
+
+        for lane in lanes:
+            for _ in lane.workers:
+                lane.queue.put((_STOP_PRIORITY, next(self._sequence), None))
+
+        deadline = time.time() + timeout
+        for lane in lanes:
+            for worker in lane.workers:
+                worker.join(max(0, deadline - time.time()))
+            lane.workers = []
+        logger.info("🛑 消息分道调度已停止")
+
+    def submit(self, message_class: str, func: Callable[[], Any]) -> Future:
+        """
+        按消息类别把任务放入对应车道
+
+        调度器未启动时在当前线程直接执行，同样记录耗时
+
+        Returns:
+            Future: 任务完成后得到func的返回值或异常
+        """
+        lane_name, priority = MESSAGE_CLASSES.get(message_class, MESSAGE_CLASSES['media'])
+        with self._lock:
+            self._submitted[message_class] = self._submitted.get(message_class, 0) + 1
+        future = Future()
+        job = (func, future, message_class, time.time())
+        if not self._running:
+            self._run(self._lanes[lane_name], job)
+            return future
+        self._lanes[lane_name].queue.put((priority, next(self._sequence), job))
+        return future
+
+    def _worker_loop(self, lane: _Lane):
+        """车道工作线程主循环"""
+        while True:
+            _, _, job = lane.queue.get()
+            if job is None:
+                break
+            self._run(lane, job)
+
+    def _run(self, lane: _Lane, job):
+        """执行任务并按车道、类别记录排队与处理耗时"""
+        func, future, message_class, enqueued_at = job
+        started_at = time.time()
+        self.stats.record(f"{lane.name}.queue_wait", started_at - enqueued_at)
+        with self._lock:
+            lane.in_flight += 1
+        try:
+            future.set_result(func())
+        except Exception as e:
+            with self._lock:
+                self._failed += 1
+            logger.error(f"❌ {lane.name}车道任务失败 ({message_class}): {e}")
+            future.set_exception(e)
+        finally:
+            finished_at = time.time()
+            with self._lock:
+                lane.in_flight -= 1
+            self.stats.record(f"{lane.name}.process", finished_at - started_at)
+            # 从入队到处理完成，即用户感知的时延
+            self.stats.record(f"{message_class}.total", finished_at - enqueued_at)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取各车道队列长度、进行中任务数和耗时统计"""
+        with self._lock:
+            stats = {
+                'running': self._running,
+                'lanes': {
+                    lane.name: {
+                        'worker_count': lane.worker_count,
+                        'queue_size': lane.queue.qsize(),
+                        'in_flight': lane.in_flight
+                    }
+                    for lane in self._lanes.values()
+                },
+                'submitted': dict(self._submitted),
+                'failed': self._failed
+            }
+        stats['latency'] = self.stats.snapshot()
+        return stats
+
+
+# 全局分道调度实例
+kf_lane_scheduler = KfLaneScheduler(
+    fast_workers=config.kf_fast_lane_workers,
+    media_workers=config.kf_media_lane_workers
+)
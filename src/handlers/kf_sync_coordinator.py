@@ -0,0 +1,196 @@
+# kf_sync_coordinator.py
+"""
+微信客服消息同步合并器
+同一客服账号同一时间只运行一个sync_msg拉取；拉取进行中到达的回调只设置dirty标记，
+当前拉取结束后再补拉一次，多次回调合并为一次补拉
+跨进程时通过同步租约保证只有一个进程拉取，其他进程把回调转为租约上的待补拉标记
+"""
+import logging
+import os
+import socket
+import threading
+from typing import Dict, Any, Callable
+
+from ..database.sync_lease_db import sync_lease_backend
+
+logger = logging.getLogger(__name__)
+
+
+class SyncLeaseUnavailableError(RuntimeError):
+    """多次尝试后既拿不到同步租约也无法标记待补拉，由任务队列重试本次回调"""
+
+
+class _SyncState:
+    """单个客服账号的同步状态"""
+    __slots__ = ('running', 'dirty', 'token')
+
+    def __init__(self):
+        self.running = False
+        self.dirty = False
+        self.token = ''
+
+
+class _LeaseKeeper:
+    """同步进行期间定期续约的后台线程"""
+
+    def __init__(self, lease_backend, open_kfid: str, owner: str):
+        self.lease_backend = lease_backend
+        self.open_kfid = open_kfid
+        self.owner = owner
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"kf-lease-{open_kfid}", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join(5)
+
+    def _run(self):
+        interval = max(1.0, self.lease_backend.lease_seconds / 3)
+        while not self._stop.wait(interval):
+            try:
+                if not self.lease_backend.renew(self.open_kfid, self.owner):
+                    logger.warning(f"⚠️ 客服账号 {self.open_kfid} 的同步租约已被其他进程接管")
+                    return
+            except Exception as e:
+                logger.error(f"续约同步租约失败: {e}")
+
+
+class KfSyncCoordinator:
+    """按open_kfid合并并发的kf_msg_or_event回调"""
+
+    def __init__(self, lease_backend=None, owner_id: str = None):
+        """
+        :param lease_backend: 同步租约后端（SyncLeaseDatabase / MemorySyncLease），为None时只做进程内合并
+        :param owner_id: 本进程的租约持有者标识
+        """
+        self.lease_backend = lease_backend
+        self.owner_id = owner_id or f"{socket.gethostname()}:{os.getpid()}"
+        self._states: Dict[str, _SyncState] = {}
+        self._lock = threading.Lock()
+
+        # 运行统计
+        self._started = 0
+        self._coalesced = 0
+        self._forwarded = 0
+        self._follow_ups = 0
+        self._lease_failures = 0
+
+    def run(self, open_kfid: str, token: str, sync_func: Callable[[str], None]) -> bool:
+        """
+        执行一次同步，如果该账号已有同步在进行中（本进程或其他进程）则只标记待补拉
+
+        Args:
+            open_kfid: 客服账号ID
+            token: 回调中的Token，补拉时使用最近一次回调的Token
+            sync_func: 同步函数，参数为token，抛出异常表示同步失败
+
+        Returns:
+            bool: 本次调用实际执行了同步返回True，被合并返回False
+
+        Raises:
+            SyncLeaseUnavailableError: 租约反复获取失败，调用方应重试本次回调
+        """
+        with self._lock:
+            state = self._states.setdefault(open_kfid, _SyncState())
+            if state.running:
+                state.dirty = True
+                state.token = token or state.token
+                self._coalesced += 1
+                logger.info(f"客服账号 {open_kfid} 正在同步，本次回调合并到补拉")
+                return False
+            state.running = True
+            state.dirty = False
+
+        try:
+            acquired = not self.lease_backend or self._acquire_lease(open_kfid, token)
+        except Exception:
+            with self._lock:
+                state.running = False
+                state.dirty = False
+            raise
+        if not acquired:
+            with self._lock:
+                state.running = False
+                state.dirty = False
+            return False
+
+        with self._lock:
+            self._started += 1
+
+        keeper = None
+        if self.lease_backend:
+            keeper = _LeaseKeeper(self.lease_backend, open_kfid, self.owner_id)
+            keeper.start()
+
+        try:
+            while True:
+                sync_func(token)
+                with self._lock:
+                    if state.dirty:
+                        # 同步期间本进程有新回调，补拉一次
+                        state.dirty = False
+                        token = state.token or token
+                    else:
+                        released, pending_token = self._release_lease(open_kfid)
+                        if released:
+                            state.running = False
+                            return True
+                        # 其他进程在同步期间收到回调，补拉一次
+                        token = pending_token or token
+                    self._follow_ups += 1
+                logger.info(f"🔁 客服账号 {open_kfid} 同步期间有新回调，补拉一次")
+        except Exception:
+            # 失败时由调用方重试，重试会覆盖被合并的回调
+            if self.lease_backend:
+                self.lease_backend.abandon(open_kfid, self.owner_id)
+            with self._lock:
+                state.running = False
+                state.dirty = False
+            raise
+        finally:
+            if keeper:
+                keeper.stop()
+
+    def _acquire_lease(self, open_kfid: str, token: str) -> bool:
+        """获取跨进程租约；已被其他进程持有时转为待补拉标记并返回False，都失败时抛出SyncLeaseUnavailableError"""
+        attempts = 3
+        for _ in range(attempts):
+            if self.lease_backend.acquire(open_kfid, self.owner_id):
+                return True
+            if self.lease_backend.mark_pending(open_kfid, token):
+                with self._lock:
+                    self._forwarded += 1
+                logger.info(f"客服账号 {open_kfid} 正由其他进程同步，本次回调转为待补拉")
+                return False
+            # 租约恰好过期，重新尝试获取
+        with self._lock:
+            self._lease_failures += 1
+        logger.warning(f"⚠️ 客服账号 {open_kfid} 连续 {attempts} 次既未获取到同步租约也未能标记待补拉，交由任务队列重试")
+        raise SyncLeaseUnavailableError(f"客服账号 {open_kfid} 的同步租约不可用")
+
+    def _release_lease(self, open_kfid: str):
+        """释放跨进程租约（调用方持有self._lock）"""
+        if not self.lease_backend:
+            return True, ''
+        return self.lease_backend.release(open_kfid, self.owner_id)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取合并统计"""
+        with self._lock:
+            return {
+                'owner_id': self.owner_id,
+                'lease_backend': self.lease_backend.backend if self.lease_backend else None,
+                'started': self._started,
+                'coalesced': self._coalesced,
+                'forwarded': self._forwarded,
+                'follow_ups': self._follow_ups,
+                'lease_failures': self._lease_failures,
+                'running_accounts': [kfid for kfid, state in self._states.items() if state.running]
+            }
+
+
+# 全局同步合并器实例
+kf_sync_coordinator = KfSyncCoordinator(lease_backend=sync_lease_backend)
@@ -5,9 +5,35 @@ from typing import Dict, Any, Optional
 from datetime import datetime
 import logging
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from ..config.config import config
 
 logger = logging.getLogger(__name__)
 
+# 聊天记录中需要下载处理的媒体条目类型 -> 处理方法
+CHAT_RECORD_MEDIA_TYPES = {
+    'image': '_process_chat_record_image',
+    'voice': '_process_chat_record_voice',
+    'file': '_process_chat_record_file'
+}
+
+# 聊天记录媒体条目的共享线程池（所有聊天记录共用，限制同时处理的媒体数）
+_media_pool: Optional[ThreadPoolExecutor] = None
+_media_pool_lock = threading.Lock()
+
+
+def _get_media_pool() -> ThreadPoolExecutor:
+    global _media_pool
+    if _media_pool is None:
+        with _media_pool_lock:
+            if _media_pool is None:
+                _media_pool = ThreadPoolExecutor(max_workers=config.chat_record_media_workers,
+                                                 thread_name_prefix="chat-record-media")
+    return _media_pool
+
 class MessageTextExtractor:
     """消息文本提取器 - 将各种类型的消息转换为纯文本，用于用户画像提取"""
     
@@ -124,7 +150,7 @@ class MessageTextExtractor:
             from ..services.media_processor import media_processor
             
             # 先下载文件
-            file_path = media_processor.download_media(media_id)
+            file_path = media_processor.download_media(media_id, 'file')
             if not file_path:
                 return f"{context}发送了一个文件，但下载失败。"
             
@@ -245,14 +271,21 @@ class MessageTextExtractor:
         return f"{context}分享了小程序：《{title}》（AppID: {app_id}）"
     
     def _extract_chat_record_content(self, message: Dict[str, Any]) -> str:
-        """提取聊天记录内容 - 这是最重要的功能"""
+        """
+        提取聊天记录内容 - 这是最重要的功能
+        
+        图片、语音、文件条目交给有界线程池并发处理，按条目序号输出；
+        超过整条记录的截止时间仍未完成的条目用占位文本代替，已完成的结果照常返回
+        """
         context = self._get_user_context(message)
         merged_msg = message.get('merged_msg', {})
         title = merged_msg.get('title', '无标题')
         items = merged_msg.get('item', [])
         
-        text_content = f"{context}转发了聊天记录：《{title}》\n\n聊天记录内容：\n"
-        
+        started_at = time.time()
+        lines = []
+        # 序号 -> (Future, 超时占位文本)
+        pending = {}
         for i, item in enumerate(items, 1):
             sender_name = item.get('sender_name', '未知')
             msg_content = item.get('msg_content', '')
@@ -279,17 +312,14 @@ class MessageTextExtractor:
                 
                 if msg_type == 'text':
                     actual_content = content_json.get('text', {}).get('content', msg_content)
-                elif msg_type == 'image':
-                    # 处理聊天记录中的图片
-                    actual_content = self._process_chat_record_image(content_json)
-                elif msg_type == 'voice':
-                    # 处理聊天记录中的语音
-                    actual_content = self._process_chat_record_voice(content_json)
+                elif msg_type in CHAT_RECORD_MEDIA_TYPES:
+                    # 图片OCR、语音识别、文件解析耗时长，提交到线程池并发处理
+                    handler = getattr(self, CHAT_RECORD_MEDIA_TYPES[msg_type])
+                    pending[i] = (_get_media_pool().submit(handler, content_json),
+                                  self._chat_record_timeout_placeholder(msg_type, content_json))
+                    actual_content = None
                 elif msg_type == 'video':
                     actual_content = "[发送了视频]" 
-                elif msg_type == 'file':
-                    # 处理聊天记录中的文件
-                    actual_content = self._process_chat_record_file(content_json)
                 elif msg_type == 'location':
                     # 处理聊天记录中的位置信息
                     actual_content = self._process_chat_record_location(content_json)
@@ -303,10 +333,52 @@ class MessageTextExtractor:
             except:
                 actual_content = msg_content
             
+            lines.append((i, sender_name, time_formatted, actual_content))
+        
+        if pending:
+            contents = self._collect_chat_record_media(pending, started_at + config.chat_record_deadline)
+        else:
+            contents = {}
+        
+        text_content = f"{context}转发了聊天记录：《{title}》\n\n聊天记录内容：\n"
+        for i, sender_name, time_formatted, actual_content in lines:
+            if i in contents:
+                actual_content = contents[i]
             text_content += f"{i}. {sender_name}（{time_formatted}）：{actual_content}\n"
         
         return text_content
     
+    def _collect_chat_record_media(self, pending: Dict[int, Any], deadline: float) -> Dict[int, str]:
+        """等待聊天记录中的媒体条目处理完成，截止时间到达后未完成的条目返回占位文本"""
+        done, not_done = wait([future for future, _ in pending.values()], timeout=max(0, deadline - time.time()))
+        contents = {}
+        for i, (future, placeholder) in pending.items():
+            if future in done:
+                try:
+                    contents[i] = future.result()
+                except Exception as e:
+                    logger.error(f"处理聊天记录第{i}条媒体消息失败: {e}")
+                    contents[i] = placeholder
+            else:
+                # 尚未开始的直接取消；已在处理的继续执行，结果写入媒体缓存供下次使用
+                future.cancel()
+                contents[i] = placeholder
+        if not_done:
+            logger.warning(f"⏱️ 聊天记录媒体处理超过 {config.chat_record_deadline} 秒，"
+                           f"{len(not_done)}/{len(pending)} 条使用占位文本")
+        return contents
+    
+    @staticmethod
+    def _chat_record_timeout_placeholder(msg_type: str, content_json: Dict[str, Any]) -> str:
+        """媒体条目未在截止时间内处理完成时的占位文本"""
+        if msg_type == 'image':
+            return "[发送了图片，识别超时]"
+        if msg_type == 'voice':
+            return "[发送了语音，识别超时]"
+        file_data = content_json.get('file', {})
+        filename = file_data.get('filename', '') or file_data.get('title', '') or '文件'
+        return f"[发送了文件《{filename}》，解析超时]"
+    
     def _process_chat_record_image(self, content_json: Dict[str, Any]) -> str:
         """处理聊天记录中的图片消息"""
         try:
@@ -4,8 +4,17 @@ import xml.etree.ElementTree as ET
 from typing import Dict, Any
 from .message_classifier import classifier
 from .message_formatter import text_extractor
+from .message_sync_optimizer import sync_optimizer
+from ..utils.dedup_store import kf_event_dedup
+from .kf_sync_coordinator import kf_sync_coordinator
 from ..services.ai_service import profile_extractor
+from ..services.kf_send_dispatcher import kf_send_dispatcher
+from ..config.config import config
+from ..utils.metrics import kf_pipeline_stats
+from .profile_prescreen import prescreener
+from .kf_lane_scheduler import kf_lane_scheduler, classify_kf_message
 import time
+from concurrent.futures import wait
 
 logger = logging.getLogger(__name__)
 
@@ -36,6 +45,20 @@ def parse_message(xml_data: str) -> Dict[str, Any]:
         logger.error(f"消息解析失败: {e}")
         return {}
 
+def _prescreen_skip(message: Dict[str, Any], message_type: str) -> bool:
+    """
+    普通文本在调用大模型前做本地画像信号预筛，返回True表示跳过提取
+    只对用户原文打分（格式化后的文本带有固定前缀），其他类型消息不预筛
+    """
+    if not config.prescreen_enabled or message_type != 'general_text':
+        return False
+    content = message.get('Content', '')
+    if prescreener.should_extract(content):
+        return False
+    score, signals = prescreener.score(content)
+    logger.info(f"⏭️ 文本无画像信号，跳过大模型提取 (得分: {score}, 信号: {signals})")
+    return True
+
 def process_message(message: Dict[str, Any]) -> None:
     """
     统一的消息处理流程 - 用于用户画像提取
@@ -61,6 +84,10 @@ def process_message(message: Dict[str, Any]) -> None:
         print(f"📝 已提取文本内容")
         logger.info(f"提取的文本内容: {text_content[:300]}...")
         
+        if _prescreen_skip(message, message_type):
+            print(f"⏭️ 未检测到画像信号，跳过分析")
+            return
+        
         # 步骤3: AI提取用户画像
         print(f"🤖 正在分析用户画像...")
         is_chat_record = (message_type == 'chat_record')
@@ -142,6 +169,105 @@ def process_message(message: Dict[str, Any]) -> None:
         logger.error(f"消息处理过程中发生错误: {e}", exc_info=True)
         print(f"❌ 消息处理失败: {e}")
 
+def _make_profile_saver(message: Dict[str, Any], user_id: str, text_content: str, message_type: str,
+                        start_time: float):
+    """构造画像保存回调：每个用户画像保存到数据库并记录处理日志"""
+    def save_profile(profile: Dict[str, Any], ai_response: Dict[str, Any]) -> None:
+        """保存单个用户画像（流式输出时在画像解析完成后立即调用，不等整个响应结束）"""
+        try:
+            profile_id = db.save_user_profile(
+                wechat_user_id=user_id,
+                profile_data=profile,
+                raw_message=text_content,
+                message_type=message_type,
+                ai_response=ai_response
+            )
+            
+            if profile_id:
+                logger.info(f"💾 用户画像已保存到数据库 (ID: {profile_id})")
+                
+                # 记录消息处理日志
+                processing_time = int((time.time() - start_time) * 1000)
+                db.log_message(
+                    wechat_user_id=user_id,
+                    message_id=message.get('MsgId', ''),
+                    message_type=message_type,
+                    success=True,
+                    processing_time_ms=processing_time,
+                    profile_id=profile_id
+                )
+            else:
+                logger.warning("用户画像保存失败")
+                
+        except Exception as save_error:
+            logger.error(f"保存用户画像到数据库失败: {save_error}")
+    
+    return save_profile
+
+def _format_profile_reply(profile_result: Dict[str, Any], message_type: str) -> str:
+    """把画像提取结果格式化为回复给用户的文本"""
+    if profile_result.get('success', False):
+        profile_data = profile_result.get('data', {})
+        summary = profile_data.get('summary', '')
+        user_profiles = profile_data.get('user_profiles', [])
+        
+        print(f"✅ 用户画像分析成功")
+        logger.info(f"用户画像分析结果: {profile_data}")
+        
+        # 构建格式化的回复文本
+        result_text = "🤖 AI分析结果\n\n"
+        
+        if summary:
+            result_text += f"📋 消息总结:\n{summary}\n\n"
+        
+        if user_profiles:
+            result_text += f"👤 用户画像分析 (共{len(user_profiles)}个):\n\n"
+            
+            for i, profile in enumerate(user_profiles, 1):
+                result_text += f"=== 用户画像 {i} ===\n"
+                
+                key_mapping = {
+                    'name': '姓名',
+                    'gender': '性别', 
+                    'age': '年龄',
+                    'phone': '电话',
+                    'location': '所在地',
+                    'marital_status': '婚育状况',
+                    'education': '学历',
+                    'company': '公司',
+                    'position': '职位',
+                    'asset_level': '资产水平',
+                    'personality': '性格'
+                }
+                
+                # 只显示有值且不为"未知"的字段
+                valid_fields = []
+                for key, value in profile.items():
+                    if value and value != "未知":
+                        key_name = key_mapping.get(key, key)
+                        valid_fields.append(f"{key_name}: {value}")
+                
+                if valid_fields:
+                    result_text += "\n".join(valid_fields)
+                else:
+                    result_text += "暂无明确信息"
+                
+                result_text += "\n\n"
+        else:
+            result_text += "📋 未能从消息中提取到明确的用户画像信息。\n\n"
+        
+        result_text += "---\n✨ 由AI智能分析生成"
+        
+        print(f"✅ 消息处理完成 - 类型: {message_type}")
+        return result_text
+        
+    else:
+        error_msg = profile_result.get('error', '未知错误')
+        print(f"❌ 用户画像分析失败: {error_msg}")
+        logger.error(f"用户画像分析失败: {profile_result}")
+        
+        return f"❌ 消息分析失败: {error_msg}\n请稍后再试或联系技术支持。"
+
 def process_message_and_get_result(message: Dict[str, Any]) -> str:
     """
     处理消息并返回格式化的分析结果文本，用于发送给用户
@@ -166,103 +292,19 @@ def process_message_and_get_result(message: Dict[str, Any]) -> str:
         print(f"📝 已提取文本内容")
         logger.info(f"提取的文本内容: {text_content[:300]}...")
         
+        if _prescreen_skip(message, message_type):
+            print(f"⏭️ 未检测到画像信号，跳过分析")
+            return config.prescreen_reply
+        
         # 步骤3: AI提取用户画像
         print(f"🤖 正在分析用户画像...")
         is_chat_record = (message_type == 'chat_record')
         if is_chat_record:
             print(f"📋 检测到聊天记录，将分析聊天记录中主要对话者的用户画像（排除转发者，仅返回一人）")
-        profile_result = profile_extractor.extract_user_profile(text_content, is_chat_record)
         
-        if profile_result.get('success', False):
-            profile_data = profile_result.get('data', {})
-            summary = profile_data.get('summary', '')
-            user_profiles = profile_data.get('user_profiles', [])
-            
-            print(f"✅ 用户画像分析成功")
-            logger.info(f"用户画像分析结果: {profile_data}")
-            
-            # 构建格式化的回复文本
-            result_text = "🤖 AI分析结果\n\n"
-            
-            if summary:
-                result_text += f"📋 消息总结:\n{summary}\n\n"
-            
-            if user_profiles:
-                result_text += f"👤 用户画像分析 (共{len(user_profiles)}个):\n\n"
-                
-                for i, profile in enumerate(user_profiles, 1):
-                    result_text += f"=== 用户画像 {i} ===\n"
-                    
-                    key_mapping = {
-                        'name': '姓名',
-                        'gender': '性别', 
-                        'age': '年龄',
-                        'phone': '电话',
-                        'location': '所在地',
-                        'marital_status': '婚育状况',
-                        'education': '学历',
-                        'company': '公司',
-                        'position': '职位',
-                        'asset_level': '资产水平',
-                        'personality': '性格'
-                    }
-                    
-                    # 只显示有值且不为"未知"的字段
-                    valid_fields = []
-                    for key, value in profile.items():
-                        if value and value != "未知":
-                            key_name = key_mapping.get(key, key)
-                            valid_fields.append(f"{key_name}: {value}")
-                    
-                    if valid_fields:
-                        result_text += "\n".join(valid_fields)
-                    else:
-                        result_text += "暂无明确信息"
-                    
-                    result_text += "\n\n"
-                    
-                    # 保存到数据库
-                    try:
-                        profile_id = db.save_user_profile(
-                            wechat_user_id=user_id,
-                            profile_data=profile,
-                            raw_message=text_content,
-                            message_type=message_type,
-                            ai_response=profile_data
-                        )
-                        
-                        if profile_id:
-                            logger.info(f"💾 用户画像已保存到数据库 (ID: {profile_id})")
-                            
-                            # 记录消息处理日志
-                            processing_time = int((time.time() - start_time) * 1000) if 'start_time' in locals() else None
-                            db.log_message(
-                                wechat_user_id=user_id,
-                                message_id=message.get('MsgId', ''),
-                                message_type=message_type,
-                                success=True,
-                                processing_time_ms=processing_time,
-                                profile_id=profile_id
-                            )
-                        else:
-                            logger.warning("用户画像保存失败")
-                            
-                    except Exception as save_error:
-                        logger.error(f"保存用户画像到数据库失败: {save_error}")
-            else:
-                result_text += "📋 未能从消息中提取到明确的用户画像信息。\n\n"
-            
-            result_text += "---\n✨ 由AI智能分析生成"
-            
-            print(f"✅ 消息处理完成 - 类型: {message_type}")
-            return result_text
-            
-        else:
-            error_msg = profile_result.get('error', '未知错误')
-            print(f"❌ 用户画像分析失败: {error_msg}")
-            logger.error(f"用户画像分析失败: {profile_result}")
-            
-            return f"❌ 消息分析失败: {error_msg}\n请稍后再试或联系技术支持。"
+        save_profile = _make_profile_saver(message, user_id, text_content, message_type, start_time)
+        profile_result = profile_extractor.extract_user_profile(text_content, is_chat_record, on_profile=save_profile)
+        return _format_profile_reply(profile_result, message_type)
         
     except Exception as e:
         logger.error(f"消息处理过程中发生错误: {e}", exc_info=True)
@@ -275,10 +317,145 @@ def classify_and_handle_message(message: Dict[str, Any]) -> None:
     """
     process_message(message)
 
+def dispatch_callback_message(message: Dict[str, Any]) -> None:
+    """
+    根据回调消息类型分发处理 - 微信客服事件走kf事件处理，其余走普通消息处理
+    """
+    if message.get('MsgType') == 'event' and message.get('Event') == 'kf_msg_or_event':
+        handle_wechat_kf_event(message)
+    else:
+        classify_and_handle_message(message)
+
+def _send_kf_reply(external_userid: str, open_kfid: str, content: str) -> None:
+    """
+    回复微信客服用户：发送调度器运行时入队后立即返回（限速与限流重试由发送线程负责），
+    否则直接调用send_msg
+    """
+    if kf_send_dispatcher.running and kf_send_dispatcher.submit(external_userid, open_kfid, content):
+        return
+    from ..services.wework_client import wework_client
+    with kf_pipeline_stats.timer('send_reply'):
+        wework_client.send_text_message(external_userid, open_kfid, content)
+
+def _bind_verify_code(code: str, external_userid: str) -> str:
+    """用6位验证码完成小程序账号与微信客服用户的绑定，返回发给用户的绑定结果"""
+    try:
+        from ..core.binding_api import get_cache, set_cache, delete_cache
+        from ..database.binding_db import binding_db
+        
+        # 通过验证码查找会话token
+        bind_token = get_cache(f"verify_code:{code}")
+        logger.info(f"查找验证码 {code} 对应的token: {bind_token}")
+        
+        if not bind_token:
+            result = {"success": False, "message": "验证码无效或已过期"}
+        else:
+            # 获取会话数据
+            session_data = get_cache(f"bind_session:{bind_token}")
+            
+            if not session_data:
+                result = {"success": False, "message": "绑定会话已过期"}
+            elif session_data.get('status') == 'completed':
+                result = {"success": False, "message": "该验证码已被使用"}
+            else:
+                # 保存绑定关系
+                openid = session_data.get('openid')
+                if binding_db and binding_db.save_user_binding(openid, external_userid):
+                    # 更新会话状态
+                    session_data['status'] = 'completed'
+                    session_data['external_userid'] = external_userid
+                    session_data['completed_at'] = time.time()
+                    
+                    # 保留会话数据1分钟供查询
+                    set_cache(f"bind_session:{bind_token}", session_data, 60)
+                    
+                    # 清除验证码映射
+                    delete_cache(f"verify_code:{code}")
+                    
+                    result = {"success": True, "message": "绑定成功"}
+                    logger.info(f"绑定成功: openid={openid}, external_userid={external_userid}")
+                else:
+                    result = {"success": False, "message": "保存绑定关系失败"}
+        
+        logger.info(f"验证码绑定处理完成: {result}")
+        if result.get('success'):
+            return "✅ 绑定成功！请返回小程序查看。"
+        return f"❌ 绑定失败：{result.get('message', '未知错误')}"
+        
+    except Exception as bind_error:
+        logger.error(f"处理验证码绑定失败: {bind_error}")
+        print(f"❌ 处理验证码绑定失败: {bind_error}")
+        return "绑定处理失败，请稍后再试。"
+
+def _handle_kf_message(kf_msg: Dict[str, Any], open_kfid: str) -> None:
+    """
+    处理单条微信客服消息：验证码绑定，或画像分析并回复用户
+    """
+    from ..services.wework_client import wework_client
+    
+    # 首先检查是否是验证码消息
+    # 从微信客服消息中提取文本内容
+    msg_type = kf_msg.get('msgtype', '')
+    msg_content = ''
+    if msg_type == 'text':
+        msg_content = kf_msg.get('text', {}).get('content', '')
+    external_userid = kf_msg.get('external_userid', '')
+    
+    # 调试日志
+    logger.info(f"消息类型: {msg_type}, 内容: {msg_content}, 长度: {len(msg_content)}, 是否为数字: {msg_content.isdigit() if msg_content else False}")
+    print(f"🔍 检查验证码: type={msg_type}, content='{msg_content}', len={len(msg_content)}, isdigit={msg_content.isdigit() if msg_content else False}")
+    
+    # 检查是否是6位数字验证码
+    if msg_content and len(msg_content) == 6 and msg_content.isdigit():
+        print(f"🔑 收到验证码: {msg_content} from {external_userid}")
+        logger.info(f"收到验证码: {msg_content} from {external_userid}")
+        
+        reply_msg = _bind_verify_code(msg_content, external_userid)
+        _send_kf_reply(external_userid, open_kfid, reply_msg)
+        print(f"✅ 绑定结果已发送: {reply_msg}")
+        
+        # 验证码消息不进行画像分析，直接返回
+        return
+    
+    # 转换消息格式（非验证码消息）
+    converted_msg = wework_client._convert_kf_message(kf_msg)
+    
+    if converted_msg:
+        print(f"📝 处理消息: {kf_msg.get('msgid', '')}")
+        
+        # 处理消息并获取用户画像结果
+        with kf_pipeline_stats.timer('analysis'):
+            profile_result = process_message_and_get_result(converted_msg)
+        
+        # 发送分析结果给用户
+        if profile_result:
+            external_userid = kf_msg.get('external_userid', '')
+            if external_userid:
+                try:
+                    print("📤 发送分析结果给用户...")
+                    _send_kf_reply(external_userid, open_kfid, profile_result)
+                    print("✅ 分析结果已提交发送")
+                    logger.info(f"分析结果已提交发送给用户 {external_userid}")
+                except Exception as send_error:
+                    logger.error(f"发送消息给用户失败: {send_error}")
+                    print(f"❌ 发送消息失败: {send_error}")
+            else:
+                logger.warning("缺少用户ID，无法发送回复")
+                print("⚠️ 缺少用户ID，无法发送回复")
+        else:
+            print("⚠️ 没有生成分析结果，不发送回复")
+    else:
+        logger.error("消息转换失败")
+        print("❌ 消息转换失败")
+
 def handle_wechat_kf_event(message: Dict[str, Any]) -> None:
     """
-    处理微信客服事件消息 - 简化版本，只获取最新一条消息
+    处理微信客服事件消息
+    
+    batch模式（默认）：逐页拉取sync_msg结果，按时间顺序处理每一条未处理过的客户消息
+    latest模式：拉取所有消息后只处理最新的一条
     """
+    event_id = None
     try:
         # 防重复处理机制
         corp_id = message.get('ToUserName', '')
@@ -288,145 +465,216 @@ def handle_wechat_kf_event(message: Dict[str, Any]) -> None:
         
         event_id = f"{corp_id}_{open_kfid}_{token}_{create_time}"
         
-        # 简单的内存去重（生产环境建议使用Redis）
-        if not hasattr(handle_wechat_kf_event, '_processed_events'):
-            handle_wechat_kf_event._processed_events = set()
-        
-        if event_id in handle_wechat_kf_event._processed_events:
+        # 有界去重（按时间窗口过期，DEDUP_BACKEND=sqlite 时多进程共享）
+        if kf_event_dedup.check_and_add(event_id):
             print(f"⚠️ 事件 {event_id} 已经处理过，跳过重复处理")
             logger.info(f"事件 {event_id} 已经处理过，跳过重复处理")
             return
         
-        handle_wechat_kf_event._processed_events.add(event_id)
-        
         print(f"[微信客服事件] 企业ID: {corp_id}, 事件: kf_msg_or_event, 客服账号: {open_kfid}")
         print(f"Token: {token}, 时间: {create_time}")
         
-        from ..services.wework_client import wework_client
-        
-        # 拉取所有消息，返回最新的1条
-        print("🔄 拉取所有消息，获取最新的...")
-        logger.info("开始调用sync_kf_messages接口拉取所有消息")
+        # 同一客服账号同时只拉取一次，拉取期间到达的回调合并为一次补拉
+        kf_sync_coordinator.run(open_kfid, token, lambda sync_token: _sync_kf_account(sync_token, open_kfid))
+            
+    except Exception as e:
+        logger.error(f"处理微信客服事件时发生错误: {e}", exc_info=True)
+        print(f"❌ 处理微信客服事件失败: {e}")
+        # 处理失败时移除去重标记，允许重试
+        if event_id:
+            kf_event_dedup.discard(event_id)
+        # 向上抛出，由后台处理池按重试策略重新处理
+        raise
+
+def _sync_kf_account(token: str, open_kfid: str) -> None:
+    """按同步模式拉取并处理客服账号的新消息"""
+    from ..services.wework_client import wework_client
+    # 以持久化游标为准，多进程部署时其他进程可能已推进游标
+    wework_client.reload_kf_cursor(open_kfid)
+    if config.kf_sync_mode == 'latest':
+        _handle_latest_kf_message(token, open_kfid)
+    else:
+        _handle_kf_message_batches(token, open_kfid)
+
+def _handle_latest_kf_message(token: str, open_kfid: str) -> None:
+    """拉取所有消息，只处理最新的1条"""
+    from ..services.wework_client import wework_client
+    
+    print("🔄 拉取所有消息，获取最新的...")
+    logger.info("开始调用sync_kf_messages接口拉取所有消息")
+    with kf_pipeline_stats.timer('sync_msg'):
         messages = wework_client.sync_kf_messages(token=token, open_kf_id=open_kfid, get_latest_only=True)
-        logger.info(f"sync_kf_messages调用完成，共获取到 {len(messages) if messages else 0} 条消息")
-        print(f"共获取到 {len(messages) if messages else 0} 条消息")
+    logger.info(f"sync_kf_messages调用完成，共获取到 {len(messages) if messages else 0} 条消息")
+    print(f"共获取到 {len(messages) if messages else 0} 条消息")
+    
+    if messages:
+        print(f"✅ 获取到最新消息")
+        message_class = classify_kf_message(messages[0])
+        # 媒体消息转为任务后立即返回，不阻塞本账号的下一次拉取
+        if message_class == 'media' and _hand_off_media_message(messages[0], open_kfid):
+            return
+        kf_lane_scheduler.submit(message_class, lambda: _handle_kf_message(messages[0], open_kfid)).result()
+    else:
+        print("📭 未获取到新消息")
+        logger.info("未获取到新消息")
+
+def _handle_kf_message_batches(token: str, open_kfid: str) -> None:
+    """
+    逐页拉取消息并按顺序处理每一条新的客户消息
+    
+    - 每页拉取后立即处理，处理完一页后把游标和本页的已处理标记在同一事务中持久化
+    - 跳过已处理过的msgid、客服发出的消息和系统事件
+    - 冷启动（没有游标）时只处理最近的消息，避免重放全部历史
+    - 每条消息按类别交给分道调度：验证码、命令、文本由快车道处理，本页的快车道消息处理完后提交游标；
+      图片/文件/语音/聊天记录转为媒体处理池的持久化任务，不等处理完成，由任务处理成功后自行标记
+      （因此同一用户的文本回复可能先于之前发送的图片，OCR/PDF解析期间到达的验证码不用等它）
+    - 媒体处理池未启动时媒体消息也交给分道调度，本页处理完后再提交游标
+    """
+    from ..services.wework_client import wework_client
+    from ..database.sync_state_db import sync_state_db
+    
+    cold_start = not wework_client.has_kf_cursor(open_kfid)
+    min_send_time = time.time() - config.kf_cold_start_max_age if cold_start else 0
+    if cold_start:
+        logger.info(f"客服账号 {open_kfid} 没有同步游标，只处理最近 {config.kf_cold_start_max_age} 秒内的消息")
+    
+    processed_count = 0
+    skipped_count = 0
+    handed_off_count = 0
+    
+    pages = wework_client.iter_kf_message_pages(token=token, open_kf_id=open_kfid, auto_commit=False)
+    while True:
+        with kf_pipeline_stats.timer('sync_msg'):
+            page = next(pages, None)
+        if page is None:
+            break
         
-        if messages:
-            print(f"✅ 获取到最新消息")
-            logger.info(f"获取到 {len(messages)} 条最新消息")
-            
-            # 只处理最新的一条消息
-            latest_msg = messages[0]
-            
-            # 首先检查是否是验证码消息
-            # 从微信客服消息中提取文本内容
-            msg_type = latest_msg.get('msgtype', '')
-            msg_content = ''
-            if msg_type == 'text':
-                msg_content = latest_msg.get('text', {}).get('content', '')
-            external_userid = latest_msg.get('external_userid', '')
-            
-            # 调试日志
-            logger.info(f"消息类型: {msg_type}, 内容: {msg_content}, 长度: {len(msg_content)}, 是否为数字: {msg_content.isdigit() if msg_content else False}")
-            print(f"🔍 检查验证码: type={msg_type}, content='{msg_content}', len={len(msg_content)}, isdigit={msg_content.isdigit() if msg_content else False}")
-            
-            # 检查是否是6位数字验证码
-            if msg_content and len(msg_content) == 6 and msg_content.isdigit():
-                print(f"🔑 收到验证码: {msg_content} from {external_userid}")
-                logger.info(f"收到验证码: {msg_content} from {external_userid}")
-                
-                # 处理验证码绑定
-                try:
-                    from ..core.binding_api import get_cache, set_cache, delete_cache
-                    from ..database.binding_db import binding_db
-                    
-                    # 通过验证码查找会话token
-                    bind_token = get_cache(f"verify_code:{msg_content}")
-                    logger.info(f"查找验证码 {msg_content} 对应的token: {bind_token}")
-                    
-                    if not bind_token:
-                        result = {"success": False, "message": "验证码无效或已过期"}
-                    else:
-                        # 获取会话数据
-                        session_data = get_cache(f"bind_session:{bind_token}")
-                        
-                        if not session_data:
-                            result = {"success": False, "message": "绑定会话已过期"}
-                        elif session_data.get('status') == 'completed':
-                            result = {"success": False, "message": "该验证码已被使用"}
-                        else:
-                            # 保存绑定关系
-                            openid = session_data.get('openid')
-                            if binding_db and binding_db.save_user_binding(openid, external_userid):
-                                # 更新会话状态
-                                session_data['status'] = 'completed'
-                                session_data['external_userid'] = external_userid
-                                session_data['completed_at'] = time.time()
-                                
-                                # 保留会话数据1分钟供查询
-                                set_cache(f"bind_session:{bind_token}", session_data, 60)
-                                
-                                # 清除验证码映射
-                                delete_cache(f"verify_code:{msg_content}")
-                                
-                                result = {"success": True, "message": "绑定成功"}
-                                logger.info(f"绑定成功: openid={openid}, external_userid={external_userid}")
-                            else:
-                                result = {"success": False, "message": "保存绑定关系失败"}
-                    
-                    # 发送绑定结果消息给用户
-                    if result.get('success'):
-                        reply_msg = "✅ 绑定成功！请返回小程序查看。"
-                    else:
-                        reply_msg = f"❌ 绑定失败：{result.get('message', '未知错误')}"
-                    
-                    wework_client.send_text_message(external_userid, open_kfid, reply_msg)
-                    print(f"✅ 绑定结果已发送: {reply_msg}")
-                    logger.info(f"验证码绑定处理完成: {result}")
-                    
-                except Exception as bind_error:
-                    logger.error(f"处理验证码绑定失败: {bind_error}")
-                    print(f"❌ 处理验证码绑定失败: {bind_error}")
-                    # 发送错误消息给用户
-                    error_msg = "绑定处理失败，请稍后再试。"
-                    wework_client.send_text_message(external_userid, open_kfid, error_msg)
-                
-                # 验证码消息不进行画像分析，直接返回
-                return
+        to_handle, page_marks, skipped = _select_new_kf_messages(page['msg_list'], open_kfid, min_send_time,
+                                                                 sync_state_db)
+        skipped_count += skipped
+        
+        # [(msgid, send_time, Future)]，处理成功后才标记为已处理
+        handled = []
+        for kf_msg in to_handle:
+            msgid = kf_msg.get('msgid', '')
+            send_time = kf_msg.get('send_time', 0)
             
-            # 转换消息格式（非验证码消息）
-            converted_msg = wework_client._convert_kf_message(latest_msg)
+            message_class = classify_kf_message(kf_msg)
+            if message_class == 'media' and _hand_off_media_message(kf_msg, open_kfid):
+                handed_off_count += 1
+                continue
             
-            if converted_msg:
-                print(f"📝 处理消息: {latest_msg.get('msgid', '')}")
-                
-                # 处理消息并获取用户画像结果
-                profile_result = process_message_and_get_result(converted_msg)
-                
-                # 发送分析结果给用户
-                if profile_result:
-                    external_userid = latest_msg.get('external_userid', '')
-                    if external_userid:
-                        try:
-                            print("📤 发送分析结果给用户...")
-                            wework_client.send_text_message(external_userid, open_kfid, profile_result)
-                            print("✅ 分析结果已发送给用户")
-                            logger.info(f"分析结果已发送给用户 {external_userid}")
-                        except Exception as send_error:
-                            logger.error(f"发送消息给用户失败: {send_error}")
-                            print(f"❌ 发送消息失败: {send_error}")
-                    else:
-                        logger.warning("缺少用户ID，无法发送回复")
-                        print("⚠️ 缺少用户ID，无法发送回复")
-                else:
-                    print("⚠️ 没有生成分析结果，不发送回复")
-            else:
-                logger.error("消息转换失败")
-                print("❌ 消息转换失败")
-        else:
-            print("📭 未获取到新消息")
-            logger.info("未获取到新消息")
-            
-    except Exception as e:
-        logger.error(f"处理微信客服事件时发生错误: {e}", exc_info=True)
-        print(f"❌ 处理微信客服事件失败: {e}")
\ No newline at end of file
+            future = kf_lane_scheduler.submit(
+                message_class,
+                lambda kf_msg=kf_msg: _handle_and_mark_kf_message(kf_msg, open_kfid, sync_state_db)
+            )
+            handled.append((msgid, send_time, future))
+            processed_count += 1
+            # 调度器未启动时在当前线程执行，失败后不再处理本页后面的消息
+            if future.done() and future.exception() is not None:
+                break
+        
+        # 等本页的消息全部处理完（避免失败重试时与仍在车道中处理的消息并发），
+        # 只标记处理成功的消息；任意一条失败则不提交游标，由后台处理池重试
+        wait([future for _, _, future in handled])
+        first_error = None
+        for msgid, send_time, future in handled:
+            error = future.exception()
+            if error is not None:
+                first_error = first_error or error
+            elif msgid:
+                sync_optimizer.mark_message_processed(msgid, send_time, open_kfid)
+                page_marks.append((msgid, send_time))
+        if first_error is not None:
+            raise first_error
+        
+        # 游标和本页已处理标记一起提交
+        wework_client.commit_kf_page(open_kfid, page['next_cursor'], page_marks)
+    
+    logger.info(f"客服账号 {open_kfid} 同步完成: 处理 {processed_count} 条，转交媒体车道 {handed_off_count} 条，"
+                f"跳过 {skipped_count} 条")
+    print(f"✅ 本次同步处理 {processed_count} 条新消息，转交媒体车道 {handed_off_count} 条，跳过 {skipped_count} 条")
+
+def _select_new_kf_messages(msg_list, open_kfid: str, min_send_time: float, sync_state_db):
+    """
+    从一页sync_msg结果中挑出需要处理的客户消息（按发送时间排序）
+    
+    跳过已处理过的msgid（同一页内重复的msgid只保留一条）；客服发出的消息、系统事件和冷启动窗口之前的消息
+    直接标记为已处理
+    
+    Returns:
+        tuple: (需要处理的消息列表, 本页直接标记的[(msgid, send_time)], 跳过的条数)
+    """
+    msg_list = sorted(msg_list, key=lambda x: x.get('send_time', 0))
+    
+    # 先查内存，再批量查询持久化的已处理标记
+    unknown_ids = [m.get('msgid') for m in msg_list
+                   if m.get('msgid') and not sync_optimizer.is_message_processed(m.get('msgid'))]
+    stored_ids = sync_state_db.filter_processed(unknown_ids) if sync_state_db else set()
+    new_ids = set(unknown_ids) - stored_ids
+    
+    to_handle = []
+    page_marks = []
+    skipped = 0
+    for kf_msg in msg_list:
+        msgid = kf_msg.get('msgid', '')
+        send_time = kf_msg.get('send_time', 0)
+        
+        if msgid and msgid not in new_ids:
+            skipped += 1
+            continue
+        if msgid:
+            new_ids.discard(msgid)
+        
+        # 只处理客户发送的消息（origin: 3-客户 4-系统事件 5-接待人员）
+        if kf_msg.get('origin', 3) != 3 or send_time < min_send_time:
+            skipped += 1
+            if msgid:
+                sync_optimizer.mark_message_processed(msgid, send_time, open_kfid)
+                page_marks.append((msgid, send_time))
+            continue
+        
+        to_handle.append(kf_msg)
+    return to_handle, page_marks, skipped
+
+def _hand_off_media_message(kf_msg: Dict[str, Any], open_kfid: str) -> bool:
+    """把媒体消息转为媒体处理池的任务，不等待处理完成；处理池未启动或入队失败时返回False"""
+    from .kf_event_worker import kf_media_pool
+    if not kf_media_pool.running:
+        return False
+    return kf_media_pool.submit({'open_kfid': open_kfid, 'kf_msg': kf_msg, 'enqueued_at': time.time()})
+
+def process_kf_media_job(payload: Dict[str, Any]) -> None:
+    """
+    媒体处理池的任务处理函数：处理拉取时转交的图片、文件、语音、聊天记录消息
+    
+    处理成功后标记为已处理；抛出异常时由媒体处理池按重试策略重新处理
+    """
+    from ..database.sync_state_db import sync_state_db
+    
+    kf_msg = payload['kf_msg']
+    open_kfid = payload['open_kfid']
+    msgid = kf_msg.get('msgid', '')
+    # 同一页提交游标失败后重新拉取时，同一条消息可能被转交两次
+    if msgid and (sync_optimizer.is_message_processed(msgid) or
+                  (sync_state_db and sync_state_db.filter_processed([msgid]))):
+        logger.info(f"媒体消息 {msgid} 已处理过，跳过")
+        return
+    
+    started_at = time.time()
+    kf_lane_scheduler.stats.record('media.queue_wait', started_at - payload.get('enqueued_at', started_at))
+    try:
+        _handle_and_mark_kf_message(kf_msg, open_kfid, sync_state_db)
+    finally:
+        finished_at = time.time()
+        kf_lane_scheduler.stats.record('media.process', finished_at - started_at)
+    kf_lane_scheduler.stats.record('media.total', finished_at - payload.get('enqueued_at', started_at))
+    if msgid:
+        sync_optimizer.mark_message_processed(msgid, kf_msg.get('send_time', 0), open_kfid)
+
+def _handle_and_mark_kf_message(kf_msg: Dict[str, Any], open_kfid: str, sync_state_db) -> None:
+    """处理单条客服消息，已回复的消息立即落盘，避免本页中途崩溃后重复回复"""
+    _handle_kf_message(kf_msg, open_kfid)
+    msgid = kf_msg.get('msgid', '')
+    if msgid and sync_state_db:
+        sync_state_db.mark_processed(open_kfid, msgid, kf_msg.get('send_time', 0))
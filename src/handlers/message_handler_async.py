@@ -0,0 +1,216 @@
+# message_handler_async.py
+"""
+微信客服消息的事件循环处理路径（同步回调模式，KF_ASYNC_PROCESSING=false）
+回调在事件循环中直接处理：sync_msg拉取和send_msg回复走异步企业微信客户端（aiohttp长连接池），
+文本消息的画像分析走大模型异步接口（extract_user_profile_async），等待上游时不占用线程；
+数据库读写和验证码绑定仍是同步代码，放到线程中执行
+去重、同步合并、已处理标记和游标提交的规则与后台处理池的同步路径一致
+"""
+import asyncio
+import logging
+import time
+from typing import Dict, Any
+
+from ..config.config import config
+from ..utils.dedup_store import kf_event_dedup
+from ..utils.metrics import kf_pipeline_stats
+from ..services.ai_service import profile_extractor
+from ..services.kf_send_dispatcher import kf_send_dispatcher
+from ..services.wework_client import wework_client
+from ..services.wework_client_async import async_wework_client
+from .kf_lane_scheduler import classify_kf_message
+from .message_classifier import classifier
+from .message_formatter import text_extractor
+from .kf_sync_coordinator import kf_sync_coordinator
+from .message_sync_optimizer import sync_optimizer
+from .message_handler import (
+    dispatch_callback_message, _bind_verify_code, _format_profile_reply, _handle_kf_message,
+    _hand_off_media_message, _make_profile_saver, _prescreen_skip, _select_new_kf_messages
+)
+
+logger = logging.getLogger(__name__)
+
+
+async def dispatch_callback_message_async(message: Dict[str, Any]) -> None:
+    """根据回调消息类型分发处理 - 微信客服事件在事件循环中处理，其余消息在线程中处理"""
+    if message.get('MsgType') == 'event' and message.get('Event') == 'kf_msg_or_event':
+        await handle_wechat_kf_event_async(message)
+    else:
+        await asyncio.to_thread(dispatch_callback_message, message)
+
+
+async def handle_wechat_kf_event_async(message: Dict[str, Any]) -> None:
+    """handle_wechat_kf_event的异步版本"""
+    corp_id = message.get('ToUserName', '')
+    open_kfid = message.get('OpenKfId', '')
+    token = message.get('Token', '')
+    create_time = message.get('CreateTime', '')
+    event_id = f"{corp_id}_{open_kfid}_{token}_{create_time}"
+
+    if await asyncio.to_thread(kf_event_dedup.check_and_add, event_id):
+        logger.info(f"事件 {event_id} 已经处理过，跳过重复处理")
+        return
+
+    loop = asyncio.get_running_loop()
+
+    def sync_func(sync_token: str) -> None:
+        # 合并器在线程中等待（含跨进程租约），实际拉取和回复回到事件循环中执行
+        asyncio.run_coroutine_threadsafe(_sync_kf_account_async(sync_token, open_kfid), loop).result()
+
+    try:
+        await asyncio.to_thread(kf_sync_coordinator.run, open_kfid, token, sync_func)
+    except Exception as e:
+        logger.error(f"处理微信客服事件时发生错误: {e}", exc_info=True)
+        # 处理失败时移除去重标记，企业微信下一次回调时重试
+        await asyncio.to_thread(kf_event_dedup.discard, event_id)
+        raise
+
+
+async def _sync_kf_account_async(token: str, open_kfid: str) -> None:
+    """按同步模式拉取并处理客服账号的新消息"""
+    # 以持久化游标为准，多进程部署时其他进程可能已推进游标
+    await asyncio.to_thread(wework_client.reload_kf_cursor, open_kfid)
+    if config.kf_sync_mode == 'latest':
+        await _handle_latest_kf_message_async(token, open_kfid)
+    else:
+        await _handle_kf_message_batches_async(token, open_kfid)
+
+
+async def _handle_latest_kf_message_async(token: str, open_kfid: str) -> None:
+    """拉取所有消息，只处理最新的1条"""
+    with kf_pipeline_stats.timer('sync_msg'):
+        messages = await async_wework_client.sync_kf_messages(token=token, open_kf_id=open_kfid,
+                                                              get_latest_only=True)
+    if messages:
+        await _handle_kf_message_async(messages[0], open_kfid)
+    else:
+        logger.info("未获取到新消息")
+
+
+async def _handle_kf_message_batches_async(token: str, open_kfid: str) -> None:
+    """
+    逐页拉取消息并按顺序处理每一条新的客户消息（规则同_handle_kf_message_batches）
+
+    本页消息依次处理，每条处理成功后立即落盘已处理标记；任意一条失败则不提交游标，
+    由企业微信的下一次回调重新拉取。媒体处理池运行时媒体消息转为任务，不等处理完成
+    """
+    from ..database.sync_state_db import sync_state_db
+
+    cold_start = not await asyncio.to_thread(wework_client.has_kf_cursor, open_kfid)
+    min_send_time = time.time() - config.kf_cold_start_max_age if cold_start else 0
+    if cold_start:
+        logger.info(f"客服账号 {open_kfid} 没有同步游标，只处理最近 {config.kf_cold_start_max_age} 秒内的消息")
+
+    processed_count = 0
+    skipped_count = 0
+
+    pages = async_wework_client.iter_kf_message_pages(token=token, open_kf_id=open_kfid, auto_commit=False)
+    async for page in pages:
+        to_handle, page_marks, skipped = await asyncio.to_thread(
+            _select_new_kf_messages, page['msg_list'], open_kfid, min_send_time, sync_state_db
+        )
+        skipped_count += skipped
+
+        for kf_msg in to_handle:
+            msgid = kf_msg.get('msgid', '')
+            send_time = kf_msg.get('send_time', 0)
+            handed_off = await _handle_kf_message_async(kf_msg, open_kfid)
+            processed_count += 1
+            if handed_off or not msgid:
+                continue
+            # 已回复的消息立即落盘，避免本页中途失败后重复回复
+            if sync_state_db:
+                await asyncio.to_thread(sync_state_db.mark_processed, open_kfid, msgid, send_time)
+            sync_optimizer.mark_message_processed(msgid, send_time, open_kfid)
+            page_marks.append((msgid, send_time))
+
+        # 游标和本页已处理标记一起提交
+        await asyncio.to_thread(wework_client.commit_kf_page, open_kfid, page['next_cursor'], page_marks)
+
+    logger.info(f"客服账号 {open_kfid} 同步完成: 处理 {processed_count} 条，跳过 {skipped_count} 条")
+
+
+async def _handle_kf_message_async(kf_msg: Dict[str, Any], open_kfid: str) -> bool:
+    """
+    处理单条微信客服消息：验证码绑定，或画像分析并回复用户
+
+    Returns:
+        bool: 媒体消息已转为媒体处理池的任务（由任务自己标记已处理）时返回True
+    """
+    message_class = classify_kf_message(kf_msg)
+    external_userid = kf_msg.get('external_userid', '')
+
+    if message_class == 'verify_code':
+        code = kf_msg.get('text', {}).get('content', '')
+        logger.info(f"收到验证码: {code} from {external_userid}")
+        reply_msg = await asyncio.to_thread(_bind_verify_code, code, external_userid)
+        await _send_kf_reply_async(external_userid, open_kfid, reply_msg)
+        return False
+
+    if message_class == 'media':
+        if await asyncio.to_thread(_hand_off_media_message, kf_msg, open_kfid):
+            return True
+        # 下载、OCR、ASR都是同步实现，整条消息在线程中处理
+        await asyncio.to_thread(_handle_kf_message, kf_msg, open_kfid)
+        return False
+
+    converted_msg = wework_client._convert_kf_message(kf_msg)
+    if not converted_msg:
+        logger.error("消息转换失败")
+        return False
+
+    with kf_pipeline_stats.timer('analysis'):
+        profile_result = await process_message_and_get_result_async(converted_msg)
+
+    if profile_result and external_userid:
+        try:
+            await _send_kf_reply_async(external_userid, open_kfid, profile_result)
+        except Exception as send_error:
+            logger.error(f"发送消息给用户失败: {send_error}")
+    elif profile_result:
+        logger.warning("缺少用户ID，无法发送回复")
+    return False
+
+
+async def process_message_and_get_result_async(message: Dict[str, Any]) -> str:
+    """process_message_and_get_result的异步版本：等待大模型时不占用线程，画像保存在线程中执行"""
+    start_time = time.time()
+    try:
+        user_id = message.get('FromUserName')
+        if not user_id:
+            logger.warning("消息中缺少用户ID，跳过处理")
+            return ""
+        
+        message_type = classifier.classify_message(message)
+        text_content = await asyncio.to_thread(text_extractor.extract_text, message, message_type)
+        logger.info(f"提取的文本内容: {text_content[:300]}...")
+        
+        if _prescreen_skip(message, message_type):
+            return config.prescreen_reply
+        
+        is_chat_record = (message_type == 'chat_record')
+        profile_result = await profile_extractor.extract_user_profile_async(text_content, is_chat_record)
+        
+        if profile_result.get('success', False):
+            save_profile = _make_profile_saver(message, user_id, text_content, message_type, start_time)
+            profile_data = profile_result.get('data', {})
+            
+            def save_all():
+                for profile in profile_data.get('user_profiles', []):
+                    save_profile(profile, profile_data)
+            
+            await asyncio.to_thread(save_all)
+        return _format_profile_reply(profile_result, message_type)
+        
+    except Exception as e:
+        logger.error(f"消息处理过程中发生错误: {e}", exc_info=True)
+        return f"❌ 消息处理出现异常: {str(e)}\n请稍后再试或联系技术支持。"
+
+
+async def _send_kf_reply_async(external_userid: str, open_kfid: str, content: str) -> None:
+    """回复微信客服用户：发送调度器运行时入队（限速与重试由发送线程负责），否则通过异步客户端直接发送"""
+    if kf_send_dispatcher.running and await asyncio.to_thread(
+            kf_send_dispatcher.submit, external_userid, open_kfid, content):
+        return
+    with kf_pipeline_stats.timer('send_reply'):
+        await async_wework_client.send_text_message(external_userid, open_kfid, content)
@@ -4,6 +4,8 @@ import time
 from typing import Dict, List, Optional, Any
 from datetime import datetime
 
+from ..utils.dedup_store import kf_msgid_dedup
+
 logger = logging.getLogger(__name__)
 
 class MessageSyncOptimizer:
@@ -14,8 +16,8 @@ class MessageSyncOptimizer:
         self._last_processed = {}
         # 存储游标信息
         self._cursors = {}
-        # 存储已处理的消息ID，防止重复处理
-        self._processed_messages = set()
+        # 已处理的消息ID，防止重复处理（有界、按时间窗口过期）
+        self._processed_messages = kf_msgid_dedup
         # 清理时间间隔（秒）
         self._cleanup_interval = 3600  # 1小时
         self._last_cleanup = time.time()
@@ -69,8 +71,8 @@ class MessageSyncOptimizer:
                 send_time = msg.get('send_time', 0)
                 
                 # 检查是否是新消息
-                if (msg_id not in self._processed_messages and 
-                    send_time > last_processed_time):
+                if (send_time > last_processed_time and
+                    not self._processed_messages.contains(msg_id)):
                     new_messages.append(msg)
                     self._processed_messages.add(msg_id)
             
@@ -124,7 +126,7 @@ class MessageSyncOptimizer:
                 send_time = msg.get('send_time', 0)
                 
                 # 只处理比上次处理时间更新的消息
-                if send_time > last_processed_time and msg_id not in self._processed_messages:
+                if send_time > last_processed_time and not self._processed_messages.contains(msg_id):
                     new_messages.append(msg)
                     self._processed_messages.add(msg_id)
                 else:
@@ -181,12 +183,6 @@ class MessageSyncOptimizer:
             for key in expired_keys:
                 del self._last_processed[key]
             
-            # 清理过期的消息ID（保留最近1000条）
-            if len(self._processed_messages) > 1000:
-                # 简单的LRU清理，保留一半
-                messages_list = list(self._processed_messages)
-                self._processed_messages = set(messages_list[:500])
-            
             self._last_cleanup = current_time
             logger.info(f"清理完成，删除了 {len(expired_keys)} 个过期记录")
     
@@ -205,13 +201,14 @@ class MessageSyncOptimizer:
     
     def is_message_processed(self, msg_id: str) -> bool:
         """检查消息是否已处理"""
-        return msg_id in self._processed_messages
+        return self._processed_messages.contains(msg_id)
     
     def get_sync_stats(self) -> Dict[str, Any]:
         """获取同步统计信息"""
         return {
             'tracked_kf_accounts': len(self._last_processed),
             'processed_messages_count': len(self._processed_messages),
+            'processed_messages_dedup': self._processed_messages.get_stats(),
             'last_cleanup': datetime.fromtimestamp(self._last_cleanup).strftime('%Y-%m-%d %H:%M:%S'),
             'kf_accounts': {
                 key: {
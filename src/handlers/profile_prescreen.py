@@ -0,0 +1,94 @@
+# profile_prescreen.py
+"""
+画像信号本地预筛
+"好的"、"谢谢"、表情这类文本没有任何画像信息，调用大模型只会得到"未知"。
+用正则和词典给文本打分（电话、年龄、姓名、公司/职位、城市、学历、婚育等），低于阈值的文本不调用大模型
+"""
+import re
+import threading
+from typing import Dict, Any, List, Tuple
+
+from ..config.config import config
+
+# 常见姓氏（覆盖绝大多数人口）
+_SURNAMES = (
+    "王李张刘陈杨黄赵吴周徐孙马朱胡郭何高林罗郑梁谢宋唐许韩冯邓曹彭曾肖田董袁潘于蒋蔡余杜叶程苏魏吕丁任沈"
+    "姚卢姜崔钟谭陆汪范金石廖贾夏韦付方白邹孟熊秦邱江尹薛闫段雷侯龙史陶黎贺顾毛郝龚邵万钱严覃武戴莫孔向汤"
+)
+
+_CITIES = (
+    "北京|上海|天津|重庆|广州|深圳|杭州|南京|苏州|成都|武汉|西安|长沙|郑州|青岛|厦门|宁波|合肥|福州|济南|"
+    "沈阳|大连|哈尔滨|长春|石家庄|太原|南昌|南宁|昆明|贵阳|海口|兰州|银川|西宁|乌鲁木齐|拉萨|呼和浩特|"
+    "无锡|佛山|东莞|珠海|温州|绍兴|常州|徐州|烟台|香港|澳门|台北"
+)
+
+# (信号名, 正则, 分值)
+_SIGNALS: List[Tuple[str, re.Pattern, int]] = [
+    ('phone', re.compile(r'(?<!\d)1[3-9]\d[\s-]?\d{4}[\s-]?\d{4}(?!\d)|\d{3,4}-\d{7,8}'), 3),
+    ('email', re.compile(r'[\w.+-]+@[\w-]+\.[\w.]+'), 2),
+    ('wechat', re.compile(r'微信号?[:：\s]*[a-zA-Z][\w-]{5,19}'), 2),
+    ('age', re.compile(r'\d{1,2}\s*岁|年龄|(?<!\d)[6-9]0后|(?<!\d)0[0-9]后|(?:19|20)\d{2}年(?:出)?生|属[鼠牛虎兔龙蛇马羊猴鸡狗猪]'), 2),
+    ('name_intro', re.compile(r'我叫|我是|我姓|姓名|名字|称呼|本人|自我介绍|名片'), 2),
+    ('chinese_name', re.compile(rf'(?:叫|是|姓名[:：]?)\s*[{_SURNAMES}][一-龥]{{1,2}}'), 1),
+    ('company', re.compile(r'公司|集团|科技|银行|医院|学校|大学|学院|研究院|研究所|事务所|工作室|有限|股份|单位|创业'), 2),
+    ('position', re.compile(r'经理|总监|工程师|主管|老师|教师|医生|护士|律师|会计|总裁|董事|CEO|CTO|创始人|合伙人|老板|'
+                            r'产品|设计师|销售|程序员|公务员|职位|职务|上班|工作'), 1),
+    ('location', re.compile(rf'{_CITIES}|[一-龥]{{2,}}(?:省|市|区|县)|住在|老家|坐标|定居'), 1),
+    ('education', re.compile(r'本科|硕士|博士|研究生|大专|专科|高中|毕业|学历|学校|专业'), 1),
+    ('marital', re.compile(r'已婚|未婚|离异|单身|结婚|孩子|儿子|女儿|老公|老婆|对象'), 1),
+    ('gender', re.compile(r'男生|女生|先生|女士|男性|女性|性别|小伙|姑娘'), 1),
+    ('asset', re.compile(r'年薪|月薪|收入|存款|买房|有房|有车|资产|投资|身价'), 1),
+    ('personality', re.compile(r'性格|脾气|内向|外向|开朗|爱好|兴趣'), 1),
+]
+
+
+class ProfilePrescreener:
+    """文本画像信号打分器"""
+
+    def __init__(self, threshold: int = 2):
+        """
+        :param threshold: 得分达到该值才调用大模型
+        """
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._screened = 0
+        self._skipped = 0
+
+    @staticmethod
+    def score(text: str) -> Tuple[int, List[str]]:
+        """
+        计算文本的画像信号得分
+
+        Returns:
+            tuple: (得分, 命中的信号名列表)
+        """
+        text = (text or '').strip()
+        if not text:
+            return 0, []
+        signals = [name for name, pattern, _ in _SIGNALS if pattern.search(text)]
+        total = sum(weight for name, _, weight in _SIGNALS if name in signals)
+        return total, signals
+
+    def should_extract(self, text: str) -> bool:
+        """文本是否值得调用大模型提取画像，同时记录跳过率"""
+        total, _ = self.score(text)
+        passed = total >= self.threshold
+        with self._lock:
+            self._screened += 1
+            if not passed:
+                self._skipped += 1
+        return passed
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取预筛统计"""
+        with self._lock:
+            return {
+                'threshold': self.threshold,
+                'screened': self._screened,
+                'skipped': self._skipped,
+                'skip_rate': round(self._skipped / self._screened, 4) if self._screened else 0.0
+            }
+
+
+# 全局预筛实例
+prescreener = ProfilePrescreener(threshold=config.prescreen_threshold)
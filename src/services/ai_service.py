@@ -1,37 +1,104 @@
 # ai_service_v2.py
+import asyncio
+import threading
+import time
 import requests
 import json
+import aiohttp
+from typing import Optional
+from requests.adapters import HTTPAdapter
 from ..config.config import config
+from ..utils.metrics import llm_stats
+from ..utils.json_stream import StreamingProfileParser
+from ..utils.adaptive_limiter import dashscope_limiter
+from ..utils.hedging import llm_hedge, upstream_timer
+from .extraction_cache import extraction_cache, make_cache_key
+from .model_router import create_model_router
 import logging
 
 logger = logging.getLogger(__name__)
 
+# 画像提取使用的模型（未开启模型路由时）
+PROFILE_MODEL = "qwen-max"
+# 提示词版本，修改提示词或输出格式时递增，使旧的缓存结果失效
+PROMPT_VERSION = "v1"
+
+
+def _is_ok_status(result) -> bool:
+    """对冲判定：(HTTP状态码, 响应文本) 中状态码为200才算成功"""
+    return result[0] == 200
+
 class UserProfileExtractor:
     """用户画像提取器 - 基于文本内容分析用户画像"""
     
-    def __init__(self):
+    def __init__(self, max_concurrency: int = 4, timeout: float = 30, cache=None, stream: bool = False,
+                 router=None, limiter=None, hedge=None):
+        """
+        Args:
+            max_concurrency: 同时进行的大模型调用上限（同步调用和异步调用分别计数）
+            timeout: 单次调用超时（秒）
+            cache: 结果缓存（ProfileExtractionCache），为None时不缓存
+            stream: 同步调用是否使用流式输出（SSE），每个用户画像解析完成即可回调
+            router: 模型档位路由（ModelRouter），为None时固定使用PROFILE_MODEL
+            limiter: DashScope自适应并发限制器（AdaptiveLimiter），默认与向量服务共用dashscope_limiter；
+                max_concurrency是本进程的硬上限，实际并发由限制器按429/超时动态调整
+            hedge: 对冲策略（HedgePolicy），非流式调用超过p90耗时未返回时再发一个相同请求，为None时不对冲
+        """
         self.api_key = config.qwen_api_key
         self.api_endpoint = config.qwen_api_endpoint
         self.headers = {
             'Authorization': f'Bearer {self.api_key}',
             'Content-Type': 'application/json'
         }
-    
-    def extract_user_profile(self, text_content: str, is_chat_record: bool = False) -> dict:
-        """
-        从文本内容中提取用户画像
+        self.max_concurrency = max(1, max_concurrency)
+        self.timeout = timeout
+        self.cache = cache
+        self.stream = stream
+        self.router = router
+        self.limiter = limiter or dashscope_limiter
+        self.hedge = hedge
+        # 短消息批处理（ProfileBatcher），由enable_batching开启
+        self.batcher = None
+        # 超长文本分块提取（MapReduceExtractor），由enable_map_reduce开启
+        self.map_reduce = None
         
-        Args:
-            text_content (str): 从消息中提取的纯文本内容
-            is_chat_record (bool): 是否为聊天记录分析
-            
-        Returns:
-            dict: 包含用户画像信息的字典
-        """
-        try:
-            # 根据是否为聊天记录选择不同的提示词
-            if is_chat_record:
-                prompt = f"""
+        # 同步调用：共享长连接 + 并发上限
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_concurrency)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self._sync_slots = threading.BoundedSemaphore(self.max_concurrency)
+        
+        # 异步调用：首次使用时在当前事件循环中创建
+        self._async_session = None
+        self._async_slots = None
+        
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self._in_flight = 0
+    
+    def enable_batching(self, window_ms: float, max_items: int, max_chars: int):
+        """开启短消息批处理：在时间窗口内收集多条短消息合并为一次请求"""
+        from .profile_batcher import ProfileBatcher
+        self.batcher = ProfileBatcher(self, window_ms=window_ms, max_items=max_items, max_chars=max_chars,
+                                      max_workers=self.max_concurrency)
+    
+    def enable_map_reduce(self, token_budget: int, max_workers: int):
+        """开启超长文本分块提取：输入超出token预算时按发言/段落切块并行提取后合并"""
+        from .chunked_extraction import MapReduceExtractor
+        self.map_reduce = MapReduceExtractor(self, token_budget=token_budget, max_workers=max_workers)
+    
+    def choose_model(self, text_content: str, is_chat_record: bool = False) -> str:
+        """选择本次调用的模型（开启路由时按输入和各档位健康状况选择）"""
+        if self.router:
+            return self.router.choose(text_content, is_chat_record)
+        return PROFILE_MODEL
+    
+    def build_request(self, text_content: str, is_chat_record: bool = False, model: str = None) -> dict:
+        """构造通义千问chat/completions请求体（model为None时按输入选择模型）"""
+        # 根据是否为聊天记录选择不同的提示词
+        if is_chat_record:
+            prompt = f"""
                 请分析以下聊天记录，并构建聊天记录中对话参与者的详细用户画像：
                 "{text_content}"
                 
@@ -62,15 +129,15 @@ class UserProfileExtractor:
                 
                 请从聊天记录的实际对话内容中提取以下用户画像信息：
                 """
-            else:
-                prompt = f"""
+        else:
+            prompt = f"""
                 请分析以下用户消息，并构建详细的用户画像：
                 "{text_content}"
                 
                 请从消息中提取以下用户画像信息：
                 """
-                
-            prompt += """
+            
+        prompt += """
             
             1. 姓名（主键）- 必填
             2. 性别 - 男/女/未知
@@ -120,10 +187,10 @@ class UserProfileExtractor:
             7. 请直接返回JSON，不要有任何额外的说明或注释
             8. 对于学历和公司字段，只需要填写核心信息，不要添加过多解释
             """
-            
-            # 根据分析类型构造不同的系统角色
-            if is_chat_record:
-                system_content = """你是一个专业的聊天记录分析助手。你的任务是分析转发的聊天记录中的对话参与者，但绝对不能分析转发者本人。
+        
+        # 根据分析类型构造不同的系统角色
+        if is_chat_record:
+            system_content = """你是一个专业的聊天记录分析助手。你的任务是分析转发的聊天记录中的对话参与者，但绝对不能分析转发者本人。
                 
 关键规则：
 1. 识别转发者：从"用户XXX转发了聊天记录"中识别XXX为转发者
@@ -133,141 +200,520 @@ class UserProfileExtractor:
 5. 严格遵循JSON格式，不要包含任何额外内容
 
 记住：转发聊天记录的行为本身不提供用户画像信息，只有聊天记录内容中其他人的发言才有价值。"""
-            else:
-                system_content = "你是一个专业的用户画像分析助手。请严格按照要求的JSON格式返回结果，不要包含任何JSON之外的内容、注释或解释。"
+        else:
+            system_content = "你是一个专业的用户画像分析助手。请严格按照要求的JSON格式返回结果，不要包含任何JSON之外的内容、注释或解释。"
+        
+        # 构造请求数据
+        data = {
+            "model": model or self.choose_model(text_content, is_chat_record),
+            "messages": [
+                {"role": "system", "content": system_content},
+                {"role": "user", "content": prompt}
+            ],
+            "temperature": 0.3  # 降低温度使输出更稳定
+        }
+        return data
+    
+    def parse_profile_response(self, ai_response: str) -> dict:
+        """解析模型返回的文本，提取用户画像JSON（兼容markdown代码块和被截断的JSON）"""
+        logger.info(f"AI响应长度: {len(ai_response)} 字符")
+        logger.info(f"AI原始响应前500字符: {ai_response[:500]}...")
+        
+        # 如果响应太长，记录完整内容
+        if len(ai_response) > 1000:
+            logger.info(f"AI完整响应: {ai_response}")
+        
+        # 保存原始响应用于调试
+        original_response = ai_response
+        try:
+            # 处理可能的markdown代码块格式
+            if ai_response.startswith("```json"):
+                ai_response = ai_response[7:]
+            if ai_response.endswith("```"):
+                ai_response = ai_response[:-3]
             
-            # 构造请求数据
-            data = {
-                "model": "qwen-max",
-                "messages": [
-                    {"role": "system", "content": system_content},
-                    {"role": "user", "content": prompt}
-                ],
-                "temperature": 0.3  # 降低温度使输出更稳定
-            }
+            # 清理响应中的额外空白字符
+            ai_response = ai_response.strip()
             
-            logger.info("正在调用通义千问API分析用户画像")
-            logger.info(f"文本内容长度: {len(text_content)} 字符")
-            logger.info(f"文本内容预览: {text_content[:200]}...")
+            # 尝试找到JSON的开始和结束位置
+            start_pos = ai_response.find('{')
+            end_pos = ai_response.rfind('}')
             
-            # 发送请求到通义千问API
-            response = requests.post(
-                f"{self.api_endpoint}/chat/completions",
-                headers=self.headers,
-                data=json.dumps(data),
-                timeout=30
-            )
+            logger.info(f"JSON位置: 开始={start_pos}, 结束={end_pos}")
             
-            # 检查响应状态
-            if response.status_code == 200:
-                result = response.json()
-                logger.info("成功获取通义千问API响应")
+            if start_pos != -1 and end_pos != -1 and end_pos > start_pos:
+                json_str = ai_response[start_pos:end_pos+1]
+                logger.info(f"提取的JSON字符串长度: {len(json_str)}")
                 
-                # 解析响应内容
-                ai_response = result['choices'][0]['message']['content']
-                logger.info(f"AI响应长度: {len(ai_response)} 字符")
-                logger.info(f"AI原始响应前500字符: {ai_response[:500]}...")
+                # 验证JSON括号匹配
+                brace_count = json_str.count('{') - json_str.count('}')
+                bracket_count = json_str.count('[') - json_str.count(']')
                 
-                # 如果响应太长，记录完整内容
-                if len(ai_response) > 1000:
-                    logger.info(f"AI完整响应: {ai_response}")
+                if brace_count != 0 or bracket_count != 0:
+                    logger.warning(f"JSON括号不匹配: 大括号差={brace_count}, 方括号差={bracket_count}")
+                    # 尝试修复截断的JSON
+                    if brace_count > 0:
+                        json_str += '}' * brace_count
+                    if bracket_count > 0:
+                        json_str += ']' * bracket_count
+                    logger.info("尝试修复JSON括号...")
+                
+                parsed_result = json.loads(json_str)
+                logger.info("✅ 用户画像分析成功")
+                logger.info(f"提取到 {len(parsed_result.get('user_profiles', []))} 个用户画像")
                 
-                # 尝试解析JSON
-                try:
-                    # 保存原始响应用于调试
-                    original_response = ai_response
-                    
-                    # 处理可能的markdown代码块格式
-                    if ai_response.startswith("```json"):
-                        ai_response = ai_response[7:]
-                    if ai_response.endswith("```"):
-                        ai_response = ai_response[:-3]
-                    
-                    # 清理响应中的额外空白字符
-                    ai_response = ai_response.strip()
-                    
-                    # 尝试找到JSON的开始和结束位置
-                    start_pos = ai_response.find('{')
-                    end_pos = ai_response.rfind('}')
-                    
-                    logger.info(f"JSON位置: 开始={start_pos}, 结束={end_pos}")
-                    
-                    if start_pos != -1 and end_pos != -1 and end_pos > start_pos:
-                        json_str = ai_response[start_pos:end_pos+1]
-                        logger.info(f"提取的JSON字符串长度: {len(json_str)}")
-                        
-                        # 验证JSON括号匹配
-                        brace_count = json_str.count('{') - json_str.count('}')
-                        bracket_count = json_str.count('[') - json_str.count(']')
-                        
-                        if brace_count != 0 or bracket_count != 0:
-                            logger.warning(f"JSON括号不匹配: 大括号差={brace_count}, 方括号差={bracket_count}")
-                            # 尝试修复截断的JSON
-                            if brace_count > 0:
-                                json_str += '}' * brace_count
-                            if bracket_count > 0:
-                                json_str += ']' * bracket_count
-                            logger.info("尝试修复JSON括号...")
-                        
-                        parsed_result = json.loads(json_str)
-                        logger.info("✅ 用户画像分析成功")
-                        logger.info(f"提取到 {len(parsed_result.get('user_profiles', []))} 个用户画像")
-                        
-                        return {
-                            "success": True,
-                            "data": parsed_result,
-                            "error": None
-                        }
-                    else:
-                        raise json.JSONDecodeError("No valid JSON found", ai_response, 0)
-                        
-                except json.JSONDecodeError:
-                    # 如果JSON解析失败，返回原始响应
-                    logger.warning("无法解析AI响应为JSON格式")
-                    logger.warning(f"原始AI响应: {original_response}")
-                    return {
-                        "success": False,
-                        "data": {
-                            "summary": "AI处理完成，但无法解析详细结果",
-                            "user_profiles": []
-                        },
-                        "error": "JSON解析失败"
-                    }
-            else:
-                error_msg = f"通义千问API调用失败，状态码: {response.status_code}"
-                logger.error(error_msg)
-                logger.error(f"响应内容: {response.text}")
                 return {
-                    "success": False,
-                    "data": {
-                        "summary": "AI处理失败",
-                        "user_profiles": []
-                    },
-                    "error": error_msg
+                    "success": True,
+                    "data": parsed_result,
+                    "error": None
                 }
+            else:
+                raise json.JSONDecodeError("No valid JSON found", ai_response, 0)
+                
+        except json.JSONDecodeError:
+            # 如果JSON解析失败，返回原始响应
+            logger.warning("无法解析AI响应为JSON格式")
+            logger.warning(f"原始AI响应: {original_response}")
+            return self._error_result("AI处理完成，但无法解析详细结果", "JSON解析失败")
+    
+    def _handle_completion(self, status_code: int, body: str) -> dict:
+        """处理chat/completions接口的HTTP响应"""
+        if status_code == 200:
+            result = json.loads(body)
+            logger.info("成功获取通义千问API响应")
+            ai_response = result['choices'][0]['message']['content']
+            return self.parse_profile_response(ai_response)
+        
+        error_msg = f"通义千问API调用失败，状态码: {status_code}"
+        logger.error(error_msg)
+        logger.error(f"响应内容: {body}")
+        return self._error_result("AI处理失败", error_msg)
+    
+    @staticmethod
+    def _error_result(summary: str, error: str) -> dict:
+        return {
+            "success": False,
+            "data": {
+                "summary": summary,
+                "user_profiles": []
+            },
+            "error": error
+        }
+    
+    def _log_request(self, text_content: str):
+        logger.info("正在调用通义千问API分析用户画像")
+        logger.info(f"文本内容长度: {len(text_content)} 字符")
+        logger.info(f"文本内容预览: {text_content[:200]}...")
+    
+    def _enter_queue(self) -> float:
+        with self._lock:
+            self._waiting += 1
+        return time.time()
+    
+    def _leave_queue(self, queued_at: float) -> float:
+        """拿到调用名额：记录排队耗时，返回模型调用开始时间"""
+        now = time.time()
+        llm_stats.record('queue_wait', now - queued_at)
+        with self._lock:
+            self._waiting -= 1
+            self._in_flight += 1
+        return now
+    
+    def _finish_call(self, started_at: float, model: str, ok: Optional[bool]):
+        """调用结束：记录模型耗时，开启路由时反馈给对应档位（ok为None表示调用被取消，不计入路由统计）"""
+        latency = time.time() - started_at
+        llm_stats.record('model_latency', latency)
+        if self.router and ok is not None:
+            self.router.record(model, latency, ok)
+        with self._lock:
+            self._in_flight -= 1
+    
+    def extract_user_profile(self, text_content: str, is_chat_record: bool = False, on_profile=None) -> dict:
+        """
+        从文本内容中提取用户画像
+        
+        Args:
+            text_content (str): 从消息中提取的纯文本内容
+            is_chat_record (bool): 是否为聊天记录分析
+            on_profile (callable): 可选，on_profile(profile, ai_response)，每个用户画像调用一次；
+                流式输出时在画像解析完成后立即调用（ai_response为当时已解析的部分），
+                否则在结果返回前依次调用
+            
+        Returns:
+            dict: 包含用户画像信息的字典
+        """
+        emitted = []
+        
+        def emit(profile, ai_response):
+            emitted.append(profile)
+            self._call_on_profile(on_profile, profile, ai_response)
+        
+        stream_callback = emit if on_profile else None
+        # 先确定模型：缓存键和实际请求使用同一个模型，降级模型的结果不会冒充强模型的结果
+        model = self.choose_model(text_content, is_chat_record)
+        if not self.cache:
+            result = self._extract(text_content, is_chat_record, stream_callback, model)
+        else:
+            cache_key = make_cache_key(text_content, is_chat_record, PROMPT_VERSION, model)
+            result = self.cache.get_or_compute(
+                cache_key, lambda: self._extract(text_content, is_chat_record, stream_callback, model)
+            )
+        
+        # 缓存命中、批处理或非流式调用时，补发尚未回调的画像
+        if on_profile and result.get('success'):
+            profile_data = result.get('data', {})
+            for profile in profile_data.get('user_profiles', [])[len(emitted):]:
+                self._call_on_profile(on_profile, profile, profile_data)
+        return result
+    
+    @staticmethod
+    def _call_on_profile(on_profile, profile: dict, ai_response: dict):
+        """回调异常不影响画像提取"""
+        try:
+            on_profile(profile, ai_response)
+        except Exception as e:
+            logger.error(f"用户画像回调处理失败: {e}", exc_info=True)
+    
+    def _extract(self, text_content: str, is_chat_record: bool, on_profile=None, model: str = None) -> dict:
+        """调用大模型提取用户画像（不经过缓存），超长文本分块提取，开启批处理时短消息合并到批量请求"""
+        if self.map_reduce and self.map_reduce.needs_split(text_content):
+            return self.map_reduce.extract(text_content, is_chat_record, model)
+        if self.batcher and self.batcher.accepts(text_content, is_chat_record):
+            return self.batcher.submit(text_content, model)
+        return self._extract_single(text_content, is_chat_record, on_profile, model)
+    
+    def _extract_single(self, text_content: str, is_chat_record: bool, on_profile=None, model: str = None) -> dict:
+        """单条消息调用一次大模型"""
+        if self.stream:
+            return self._extract_streaming(text_content, is_chat_record, on_profile, model)
+        try:
+            data = self.build_request(text_content, is_chat_record, model)
+            self._log_request(text_content)
+            status_code, body = self.post_chat_completion(data)
+            return self._handle_completion(status_code, body)
                 
         except requests.exceptions.Timeout:
             error_msg = "通义千问API调用超时"
             logger.error(error_msg)
-            return {
-                "success": False,
-                "data": {
-                    "summary": "AI处理超时",
-                    "user_profiles": []
-                },
-                "error": error_msg
-            }
+            return self._error_result("AI处理超时", error_msg)
         except Exception as e:
             error_msg = f"处理消息时发生错误: {e}"
             logger.error(error_msg, exc_info=True)
-            return {
-                "success": False,
-                "data": {
-                    "summary": "处理失败",
-                    "user_profiles": []
-                },
-                "error": error_msg
+            return self._error_result("处理失败", error_msg)
+    
+    def post_chat_completion(self, data: dict):
+        """
+        调用chat/completions接口（受并发上限约束，排队时间与模型耗时分开统计；开启对冲时可能并发发出两次）
+        
+        Returns:
+            tuple: (HTTP状态码, 响应文本)
+        """
+        if self.hedge:
+            return self.hedge.call(lambda: self._post_once(data), is_success=_is_ok_status)
+        return self._post_once(data)
+    
+    def _post_once(self, data: dict):
+        """发出一次chat/completions请求"""
+        queued_at = self._enter_queue()
+        self._sync_slots.acquire()
+        try:
+            with self.limiter.slot() as call:
+                started_at = self._leave_queue(queued_at)
+                ok = False
+                try:
+                    # 对冲延迟只按HTTP请求本身的耗时计算，不含上面的排队时间
+                    with upstream_timer():
+                        response = self.session.post(
+                            f"{self.api_endpoint}/chat/completions",
+                            headers=self.headers,
+                            data=json.dumps(data),
+                            timeout=self.timeout
+                        )
+                    ok = response.status_code == 200
+                    call.report_status(response.status_code)
+                finally:
+                    self._finish_call(started_at, data['model'], ok)
+        finally:
+            self._sync_slots.release()
+        return response.status_code, response.text
+    
+    def _extract_streaming(self, text_content: str, is_chat_record: bool, on_profile=None, model: str = None) -> dict:
+        """
+        流式调用大模型：边接收边增量解析，每个用户画像完整后立即回调；
+        连接中断或超时时保留已完整解析的画像（结果标记partial，不写入缓存）
+        """
+        data = self.build_request(text_content, is_chat_record, model)
+        data['stream'] = True
+        self._log_request(text_content)
+        parser = StreamingProfileParser()
+        interrupted = None
+        
+        queued_at = self._enter_queue()
+        self._sync_slots.acquire()
+        try:
+            with self.limiter.slot() as call:
+                started_at = self._leave_queue(queued_at)
+                ok = False
+                try:
+                    with self.session.post(
+                        f"{self.api_endpoint}/chat/completions",
+                        headers=self.headers,
+                        data=json.dumps(data),
+                        timeout=self.timeout,
+                        stream=True
+                    ) as response:
+                        call.report_status(response.status_code)
+                        if response.status_code != 200:
+                            return self._handle_completion(response.status_code, response.text)
+                        try:
+                            for content in self._iter_stream_content(response):
+                                for profile in parser.feed(content):
+                                    if len(parser.items) == 1:
+                                        llm_stats.record('first_profile', time.time() - started_at)
+                                    if on_profile:
+                                        on_profile(profile, parser.result())
+                        except requests.exceptions.RequestException as e:
+                            interrupted = str(e)
+                            if isinstance(e, requests.exceptions.Timeout):
+                                call.overload()
+                            else:
+                                call.fail()
+                        ok = interrupted is None
+                finally:
+                    self._finish_call(started_at, data['model'], ok)
+        except requests.exceptions.Timeout:
+            error_msg = "通义千问API调用超时"
+            logger.error(error_msg)
+            return self._error_result("AI处理超时", error_msg)
+        except Exception as e:
+            error_msg = f"处理消息时发生错误: {e}"
+            logger.error(error_msg, exc_info=True)
+            return self._error_result("处理失败", error_msg)
+        finally:
+            self._sync_slots.release()
+        
+        parsed = parser.result()
+        if parsed is None:
+            logger.warning("流式响应中没有可解析的JSON")
+            return self._error_result("AI处理完成，但无法解析详细结果", interrupted or "JSON解析失败")
+        
+        result = {"success": True, "data": parsed, "error": None}
+        if interrupted or not parser.complete:
+            logger.warning(f"⚠️ 流式响应不完整（{interrupted or '输出被截断'}），"
+                           f"保留已解析的 {len(parser.items)} 个用户画像")
+            result["partial"] = True
+        logger.info(f"✅ 用户画像分析成功，提取到 {len(parsed.get('user_profiles', []))} 个用户画像")
+        return result
+    
+    @staticmethod
+    def _iter_stream_content(response):
+        """解析SSE响应，逐段返回choices[0].delta.content"""
+        for line in response.iter_lines():
+            if not line or not line.startswith(b'data:'):
+                continue
+            payload = line[5:].strip()
+            if payload == b'[DONE]':
+                break
+            chunk = json.loads(payload)
+            choices = chunk.get('choices') or []
+            if choices:
+                content = (choices[0].get('delta') or {}).get('content')
+                if content:
+                    yield content
+    
+    def build_batch_request(self, texts: list, model: str = None) -> dict:
+        """构造多条短消息合并分析的请求体，共用一份系统提示词和字段说明"""
+        message_lines = "\n".join(
+            f"[m{i}] {json.dumps(text, ensure_ascii=False)}" for i, text in enumerate(texts, 1)
+        )
+        prompt = f"""
+            以下是{len(texts)}条相互独立的用户消息，请分别为每条消息构建用户画像，不同消息之间的信息不要混用：
+            {message_lines}
+            
+            每条消息提取：姓名（必填）、性别、年龄、电话、所在地、婚育、学历（学校）、公司（行业）、职位、资产水平、性格。
+            无法从消息中提取的信息填写"未知"，只提取明确提到的信息，不要推测。
+            
+            请严格按照以下JSON格式返回结果，results中每条消息对应一个元素，id与消息编号一致：
+            {{
+                "results": [
+                    {{
+                        "id": "m1",
+                        "summary": "消息的主要内容总结（不超过50个字）",
+                        "user_profiles": [
+                            {{
+                                "name": "姓名",
+                                "gender": "性别",
+                                "age": "年龄",
+                                "phone": "电话",
+                                "location": "所在地",
+                                "marital_status": "婚育情况",
+                                "education": "学历（学校）",
+                                "company": "公司（行业）",
+                                "position": "职位",
+                                "asset_level": "资产水平",
+                                "personality": "性格描述"
+                            }}
+                        ]
+                    }}
+                ]
+            }}
+            
+            请直接返回JSON，不要有任何额外的说明或注释
+            """
+        return {
+            "model": model or self.choose_model(''.join(texts)),
+            "messages": [
+                {"role": "system", "content": "你是一个专业的用户画像分析助手。请严格按照要求的JSON格式返回结果，不要包含任何JSON之外的内容、注释或解释。"},
+                {"role": "user", "content": prompt}
+            ],
+            "temperature": 0.3
+        }
+    
+    def extract_batch(self, texts: list, model: str = None) -> list:
+        """
+        一次请求分析多条短消息
+        
+        Returns:
+            list: 与texts一一对应的结果；模型漏掉的消息对应位置为None，由调用方单独重试
+        """
+        try:
+            logger.info(f"正在批量分析 {len(texts)} 条消息的用户画像")
+            status_code, body = self.post_chat_completion(self.build_batch_request(texts, model))
+            completion = self._handle_completion(status_code, body)
+        except Exception as e:
+            logger.error(f"批量画像分析失败: {e}")
+            return [None] * len(texts)
+        
+        if not completion.get('success'):
+            return [None] * len(texts)
+        
+        results = {}
+        for item in completion['data'].get('results', []):
+            if isinstance(item, dict) and item.get('id'):
+                results[str(item['id'])] = {
+                    "success": True,
+                    "data": {
+                        "summary": item.get('summary', ''),
+                        "user_profiles": item.get('user_profiles', [])
+                    },
+                    "error": None
+                }
+        return [results.get(f"m{i}") for i in range(1, len(texts) + 1)]
+    
+    def _get_async_session(self) -> aiohttp.ClientSession:
+        if self._async_session is None or self._async_session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_concurrency, keepalive_timeout=60)
+            self._async_session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+            self._async_slots = asyncio.Semaphore(self.max_concurrency)
+        return self._async_session
+    
+    async def extract_user_profile_async(self, text_content: str, is_chat_record: bool = False) -> dict:
+        """
+        从文本内容中提取用户画像（异步版本，供事件循环中调用，不阻塞其他请求）
+        
+        参数和返回值与extract_user_profile一致
+        """
+        model = self.choose_model(text_content, is_chat_record)
+        if not self.cache:
+            return await self._extract_async(text_content, is_chat_record, model)
+        cache_key = make_cache_key(text_content, is_chat_record, PROMPT_VERSION, model)
+        return await self.cache.get_or_compute_async(
+            cache_key, lambda: self._extract_async(text_content, is_chat_record, model)
+        )
+    
+    async def _extract_async(self, text_content: str, is_chat_record: bool, model: str = None) -> dict:
+        """调用大模型提取用户画像（异步，不经过缓存），超长文本的分块提取是同步实现，在线程中执行"""
+        if self.map_reduce and self.map_reduce.needs_split(text_content):
+            return await asyncio.to_thread(self.map_reduce.extract, text_content, is_chat_record, model)
+        try:
+            data = self.build_request(text_content, is_chat_record, model)
+            self._log_request(text_content)
+            if self.hedge:
+                status_code, body = await self.hedge.call_async(lambda: self._post_once_async(data),
+                                                                  is_success=_is_ok_status)
+            else:
+                status_code, body = await self._post_once_async(data)
+            return self._handle_completion(status_code, body)
+        
+        except asyncio.TimeoutError:
+            error_msg = "通义千问API调用超时"
+            logger.error(error_msg)
+            return self._error_result("AI处理超时", error_msg)
+        except Exception as e:
+            error_msg = f"处理消息时发生错误: {e}"
+            logger.error(error_msg, exc_info=True)
+            return self._error_result("处理失败", error_msg)
+    
+    async def _post_once_async(self, data: dict):
+        """发出一次chat/completions请求（异步），返回 (HTTP状态码, 响应文本)"""
+        session = self._get_async_session()
+        queued_at = self._enter_queue()
+        async with self._async_slots:
+            async with self.limiter.async_slot() as call:
+                started_at = self._leave_queue(queued_at)
+                ok = False
+                try:
+                    with upstream_timer():
+                        async with session.post(
+                            f"{self.api_endpoint}/chat/completions",
+                            headers=self.headers,
+                            data=json.dumps(data)
+                        ) as response:
+                            status_code = response.status
+                            body = await response.text()
+                    ok = status_code == 200
+                    call.report_status(status_code)
+                except asyncio.CancelledError:
+                    # 对冲中落后的请求被取消
+                    ok = None
+                    raise
+                finally:
+                    self._finish_call(started_at, data['model'], ok)
+        return status_code, body
+    
+    async def close(self):
+        """关闭异步连接池"""
+        if self._async_session and not self._async_session.closed:
+            await self._async_session.close()
+        self._async_session = None
+    
+    def get_stats(self) -> dict:
+        """获取并发与耗时统计：queue_wait为等待调用名额的时间，model_latency为模型接口耗时"""
+        with self._lock:
+            stats = {
+                'max_concurrency': self.max_concurrency,
+                'in_flight': self._in_flight,
+                'waiting': self._waiting
             }
+        stats['stages'] = llm_stats.snapshot()
+        stats['cache'] = self.cache.get_stats() if self.cache else None
+        stats['batching'] = self.batcher.get_stats() if self.batcher else None
+        stats['map_reduce'] = self.map_reduce.get_stats() if self.map_reduce else None
+        stats['router'] = self.router.get_stats() if self.router else None
+        stats['limiter'] = self.limiter.get_stats()
+        stats['hedge'] = self.hedge.get_stats() if self.hedge else None
+        return stats
 
 # 全局用户画像提取器实例
-profile_extractor = UserProfileExtractor()
\ No newline at end of file
+profile_extractor = UserProfileExtractor(
+    max_concurrency=config.llm_max_concurrency,
+    timeout=config.llm_timeout,
+    cache=extraction_cache,
+    stream=config.llm_stream_enabled,
+    router=create_model_router(config),
+    hedge=llm_hedge
+)
+if config.llm_batch_enabled:
+    profile_extractor.enable_batching(
+        window_ms=config.llm_batch_window_ms,
+        max_items=config.llm_batch_max_items,
+        max_chars=config.llm_batch_max_chars
+    )
+if config.llm_token_budget > 0:
+    profile_extractor.enable_map_reduce(
+        token_budget=config.llm_token_budget,
+        max_workers=config.llm_map_workers
+    )
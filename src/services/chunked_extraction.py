@@ -0,0 +1,194 @@
+# chunked_extraction.py
+"""
+超长文本的分块画像提取（map-reduce）
+几百上千条的转发聊天记录、长PDF/OCR文本整段放进一个提示词会超出上下文或被模型截断，耗时也随长度增长。
+按token预算切块（聊天记录按发言、文档按段落），各块并行提取，再在本地合并：
+- 聊天记录：按姓名合并各块画像，只保留信息最丰富的一人（与提示词要求一致；转发者由各块的提示词排除）
+- 其他文本：按姓名合并，保留全部画像
+"""
+import logging
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Tuple
+
+from ..utils.metrics import llm_stats
+
+logger = logging.getLogger(__name__)
+
+# 聊天记录中的一条发言："序号. 发言人（时间）：内容"
+_TURN_PATTERN = re.compile(r'^\d+\. ', re.M)
+_CJK_PATTERN = re.compile(r'[\u2e80-\u9fff\uac00-\ud7af\uff00-\uffef]')
+_UNKNOWN_VALUES = ('', '未知', None)
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算token数：中日韩字符约1个token，其余字符约4个字符1个token"""
+    if not text:
+        return 0
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def _hard_split(text: str, budget: int) -> List[str]:
+    """单段超出预算时按长度硬切"""
+    pieces = []
+    step = max(1, budget)
+    while text:
+        # 按字符估算，中文为主时1字符≈1token，保守切分
+        pieces.append(text[:step])
+        text = text[step:]
+    return pieces
+
+
+def split_into_chunks(text: str, token_budget: int, is_chat_record: bool) -> List[str]:
+    """
+    按token预算切块，每块都带上原文的开头说明（转发者、文件来源等）
+
+    聊天记录按发言切分，其他文本按空行分隔的段落切分，不会从一条发言或一个段落中间断开（单条超出预算时除外）
+    """
+    if is_chat_record:
+        starts = [m.start() for m in _TURN_PATTERN.finditer(text)]
+        if not starts:
+            return [text]
+        header = text[:starts[0]]
+        units = [text[start:end] for start, end in zip(starts, starts[1:] + [len(text)])]
+    else:
+        header, _, body = text.partition('\n')
+        header += '\n'
+        units = [part + '\n\n' for part in body.split('\n\n') if part.strip()]
+
+    budget = max(1, token_budget - estimate_tokens(header))
+    chunks = []
+    current, current_tokens = [], 0
+    for unit in units:
+        unit_tokens = estimate_tokens(unit)
+        if unit_tokens > budget:
+            pieces = _hard_split(unit, budget)
+        else:
+            pieces = [unit]
+        for piece in pieces:
+            piece_tokens = estimate_tokens(piece)
+            if current and current_tokens + piece_tokens > budget:
+                chunks.append(header + ''.join(current))
+                current, current_tokens = [], 0
+            current.append(piece)
+            current_tokens += piece_tokens
+    if current:
+        chunks.append(header + ''.join(current))
+    return chunks
+
+
+def _known_fields(profile: Dict[str, Any]) -> int:
+    return sum(1 for key, value in profile.items() if key != 'name' and value not in _UNKNOWN_VALUES)
+
+
+def merge_profiles(profiles: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """按姓名合并画像：同名画像逐字段补全未知值，保持首次出现的顺序"""
+    merged: Dict[str, Dict[str, Any]] = {}
+    for profile in profiles:
+        if not isinstance(profile, dict):
+            continue
+        # 模型偶尔把姓名输出成数字或列表，统一转成字符串再比较
+        raw_name = profile.get('name')
+        name = '' if raw_name is None else str(raw_name).strip()
+        if name in _UNKNOWN_VALUES:
+            continue
+        target = merged.setdefault(name, {})
+        for key, value in profile.items():
+            if target.get(key) in _UNKNOWN_VALUES and value not in _UNKNOWN_VALUES:
+                target[key] = value
+            else:
+                target.setdefault(key, value)
+    return list(merged.values())
+
+
+class MapReduceExtractor:
+    """超长文本分块提取"""
+
+    def __init__(self, extractor, token_budget: int = 6000, max_workers: int = 4):
+        """
+        :param extractor: UserProfileExtractor，各块通过其_extract_single调用大模型（受其并发上限约束）
+        :param token_budget: 单次调用的输入token预算，超出时分块
+        :param max_workers: 并行提取的块数
+        """
+        self.extractor = extractor
+        self.token_budget = token_budget
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="profile-map")
+        self._lock = threading.Lock()
+
+        # 运行统计
+        self._documents = 0
+        self._chunks = 0
+        self._failed_chunks = 0
+
+    def needs_split(self, text_content: str) -> bool:
+        return estimate_tokens(text_content) > self.token_budget
+
+    def extract(self, text_content: str, is_chat_record: bool, model: str = None) -> Dict[str, Any]:
+        """分块并行提取后合并，返回结构与extract_user_profile一致；各块使用同一个模型（为None时各块分别选择）"""
+        started_at = time.time()
+        chunks = split_into_chunks(text_content, self.token_budget, is_chat_record)
+        logger.info(f"✂️ 文本约 {estimate_tokens(text_content)} tokens，超出预算 {self.token_budget}，"
+                    f"切分为 {len(chunks)} 块并行提取")
+
+        results = list(self._executor.map(
+            lambda chunk: self.extractor._extract_single(chunk, is_chat_record, model=model), chunks
+        ))
+        succeeded = [result for result in results if result.get('success')]
+        with self._lock:
+            self._documents += 1
+            self._chunks += len(chunks)
+            self._failed_chunks += len(results) - len(succeeded)
+        llm_stats.record('map_reduce', time.time() - started_at)
+
+        if not succeeded:
+            return results[0]
+        if len(succeeded) < len(results):
+            logger.warning(f"⚠️ {len(results) - len(succeeded)}/{len(results)} 块提取失败，使用其余块的结果")
+        return self.reduce(text_content, succeeded, is_chat_record)
+
+    @staticmethod
+    def reduce(text_content: str, results: List[Dict[str, Any]], is_chat_record: bool) -> Dict[str, Any]:
+        """合并各块结果（本地合并，不再调用大模型）"""
+        tagged: List[Tuple[Dict[str, Any], str]] = []
+        for result in results:
+            data = result.get('data', {})
+            for profile in data.get('user_profiles', []):
+                if isinstance(profile, dict):
+                    tagged.append((profile, data.get('summary', '')))
+
+        profiles = merge_profiles([profile for profile, _ in tagged])
+        summaries = [result['data'].get('summary', '') for result in results if result['data'].get('summary')]
+        summary = summaries[0] if summaries else ''
+
+        if is_chat_record:
+            # 转发说明中只有转发者的用户ID，无法与模型返回的姓名对应；每块都带着转发说明，由提示词排除转发者
+            if profiles:
+                best = max(profiles, key=_known_fields)
+                profiles = [best]
+                # 使用产出该人物的第一块的总结
+                summary = next((s for p, s in tagged if p.get('name') == best.get('name') and s), summary)
+            else:
+                profiles = []
+
+        return {
+            "success": True,
+            "data": {
+                "summary": summary,
+                "user_profiles": profiles
+            },
+            "error": None
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取分块提取统计"""
+        with self._lock:
+            return {
+                'token_budget': self.token_budget,
+                'documents': self._documents,
+                'chunks': self._chunks,
+                'avg_chunks': round(self._chunks / self._documents, 2) if self._documents else 0.0,
+                'failed_chunks': self._failed_chunks
+            }
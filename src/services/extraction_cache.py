@@ -0,0 +1,213 @@
+# extraction_cache.py
+"""
+用户画像提取结果缓存
+同一段聊天记录或名片图片经常被多次转发、或因回调重试被重复分析，按内容哈希缓存大模型结果：
+- 内存LRU层：进程内最近使用的结果，与SQLite层使用同一TTL
+- SQLite层：持久化，多进程共享，按TTL和容量淘汰
+- 并发相同请求只发起一次大模型调用，其余等待同一结果
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Callable, Awaitable, Optional
+
+from ..config.config import config
+from ..database.extraction_cache_db import extraction_cache_db
+
+logger = logging.getLogger(__name__)
+
+# 每写入多少条持久化缓存执行一次淘汰
+_EVICT_EVERY = 200
+
+
+def make_cache_key(text_content: str, is_chat_record: bool, prompt_version: str, model: str) -> str:
+    """按(规范化文本, 是否聊天记录, 提示词版本, 模型)计算缓存键"""
+    normalized = re.sub(r'\s+', ' ', text_content or '').strip()
+    raw = json.dumps([normalized, bool(is_chat_record), prompt_version, model], ensure_ascii=False)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class _InFlight:
+    """进行中的同步调用，相同请求等待其结果"""
+    __slots__ = ('event', 'result')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+
+
+class ProfileExtractionCache:
+    """画像提取结果的两级缓存"""
+
+    def __init__(self, memory_size: int = 500, store=None, ttl_seconds: float = 7 * 86400):
+        """
+        :param memory_size: 内存LRU层的最大条数
+        :param store: 持久化层（ExtractionCacheDatabase），为None时只使用内存
+        :param ttl_seconds: 缓存有效期（秒），从结果写入时开始计算
+        """
+        self.memory_size = memory_size
+        self.store = store
+        self.ttl_seconds = ttl_seconds
+        # cache_key -> {'result', 'latency_ms', 'expires_at'}
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._in_flight: Dict[str, _InFlight] = {}
+        self._async_in_flight: Dict[str, asyncio.Future] = {}
+        self._puts = 0
+
+        # 运行统计
+        self._requests = 0
+        self._memory_hits = 0
+        self._store_hits = 0
+        self._shared = 0
+        self._misses = 0
+        self._saved_seconds = 0.0
+
+    def _lookup(self, cache_key: str) -> Optional[Dict[str, Any]]:
+        """依次查询内存层和持久化层，命中时记录节省的耗时"""
+        now = time.time()
+        with self._lock:
+            self._requests += 1
+            entry = self._memory.get(cache_key)
+            if entry and entry['expires_at'] <= now:
+                # 过期条目删除后按未命中处理
+                del self._memory[cache_key]
+                entry = None
+            if entry:
+                self._memory.move_to_end(cache_key)
+                self._memory_hits += 1
+                self._saved_seconds += entry['latency_ms'] / 1000
+                return entry['result']
+
+        entry = self.store.get(cache_key) if self.store else None
+        if entry:
+            # 按持久化层的写入时间计算过期时间，从持久化层读回不会延长有效期
+            entry = {
+                'result': entry['result'],
+                'latency_ms': entry['latency_ms'],
+                'expires_at': entry.get('created_at', now) + self.ttl_seconds
+            }
+            with self._lock:
+                self._remember(cache_key, entry)
+                self._store_hits += 1
+                self._saved_seconds += entry['latency_ms'] / 1000
+            return entry['result']
+        return None
+
+    def _remember(self, cache_key: str, entry: Dict[str, Any]):
+        """写入内存层（调用方持有self._lock）"""
+        self._memory[cache_key] = entry
+        self._memory.move_to_end(cache_key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def _save(self, cache_key: str, result: Dict[str, Any], latency_ms: float):
+        """只缓存成功且完整的结果，失败或流式中断的结果下次重新调用"""
+        if not result.get('success') or result.get('partial'):
+            return
+        entry = {'result': result, 'latency_ms': latency_ms, 'expires_at': time.time() + self.ttl_seconds}
+        with self._lock:
+            self._remember(cache_key, entry)
+            self._puts += 1
+            evict = self._puts % _EVICT_EVERY == 0
+        if self.store:
+            self.store.put(cache_key, result, latency_ms)
+            if evict:
+                self.store.evict()
+
+    def get_or_compute(self, cache_key: str, compute: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        """读取缓存，未命中时调用compute；相同cache_key的并发调用共享一次compute"""
+        result = self._lookup(cache_key)
+        if result is not None:
+            return result
+
+        with self._lock:
+            waiter = self._in_flight.get(cache_key)
+            if waiter:
+                self._shared += 1
+            else:
+                owner = self._in_flight[cache_key] = _InFlight()
+                self._misses += 1
+
+        if waiter:
+            waiter.event.wait()
+            if waiter.result is not None:
+                return waiter.result
+            # 进行中的调用异常退出，自行调用
+            return compute()
+
+        started_at = time.time()
+        try:
+            owner.result = compute()
+            self._save(cache_key, owner.result, (time.time() - started_at) * 1000)
+            return owner.result
+        finally:
+            with self._lock:
+                self._in_flight.pop(cache_key, None)
+            owner.event.set()
+
+    async def get_or_compute_async(self, cache_key: str,
+                                   compute: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        """get_or_compute的异步版本，持久化层的读写在线程中执行"""
+        result = await asyncio.to_thread(self._lookup, cache_key)
+        if result is not None:
+            return result
+
+        with self._lock:
+            pending = self._async_in_flight.get(cache_key)
+            if pending is None:
+                owner = self._async_in_flight[cache_key] = asyncio.get_running_loop().create_future()
+                self._misses += 1
+            else:
+                self._shared += 1
+
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        started_at = time.time()
+        try:
+            result = await compute()
+            await asyncio.to_thread(self._save, cache_key, result, (time.time() - started_at) * 1000)
+            owner.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            owner.cancel()
+            raise
+        except Exception as e:
+            owner.set_exception(e)
+            # 避免没有等待者时出现"exception was never retrieved"警告
+            owner.exception()
+            raise
+        finally:
+            with self._lock:
+                self._async_in_flight.pop(cache_key, None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取命中率和节省的大模型耗时"""
+        store_size = self.store.count() if self.store else 0
+        with self._lock:
+            hits = self._memory_hits + self._store_hits + self._shared
+            return {
+                'requests': self._requests,
+                'memory_hits': self._memory_hits,
+                'store_hits': self._store_hits,
+                'in_flight_shared': self._shared,
+                'misses': self._misses,
+                'hit_ratio': round(hits / self._requests, 4) if self._requests else 0.0,
+                'saved_seconds': round(self._saved_seconds, 2),
+                'memory_size': len(self._memory),
+                'store_size': store_size
+            }
+
+
+# 全局画像提取缓存实例
+extraction_cache = ProfileExtractionCache(
+    memory_size=config.extraction_cache_memory_size,
+    store=extraction_cache_db,
+    ttl_seconds=config.extraction_cache_ttl
+) if config.extraction_cache_enabled else None
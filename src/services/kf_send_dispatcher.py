@@ -0,0 +1,413 @@
+# kf_send_dispatcher.py
+"""
+微信客服消息发送调度器
+处理线程只负责把回复放入发送队列，由发送线程按令牌桶限速（全局 + 每个客服账号）调用send_msg；
+遇到频率限制或网络错误时带抖动的指数退避重试，不再因为限流丢失分析结果
+配置持久化任务队列时，每条回复同时写入任务表（kf_send任务）：发送成功后标记完成，
+进程重启或停机超时未发出的回复由恢复线程重新领取发送（msgid不变，企业微信按msgid去重）
+"""
+import heapq
+import itertools
+import logging
+import os
+import random
+import socket
+import threading
+import time
+import uuid
+from typing import Dict, Any, Callable, Optional
+
+from ..config.config import config
+from ..database.job_queue_db import JobQueueDatabase, job_queue_db
+from ..utils.metrics import kf_pipeline_stats
+from .wework_client import wework_client
+
+logger = logging.getLogger(__name__)
+
+# 可重试的错误码：系统繁忙、接口调用频率/并发超限
+RETRYABLE_ERRCODES = (-1, 45009, 45033)
+
+# 待发送回复的任务类型
+JOB_TYPE_SEND = 'kf_send'
+
+
+class TokenBucket:
+    """令牌桶（非阻塞，调用方持有调度器的锁）"""
+
+    def __init__(self, rate: float, capacity: float):
+        """
+        :param rate: 每秒补充的令牌数
+        :param capacity: 桶容量（允许的突发数量）
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def wait_time(self, now: float) -> float:
+        """距离有可用令牌还需等待的秒数"""
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+
+class KfSendDispatcher:
+    """微信客服消息发送调度器"""
+
+    def __init__(self, send_func: Callable[[Dict[str, Any]], Dict[str, Any]], worker_count: int = 2,
+                 max_queue_size: int = 1000, global_rate: float = 20, per_kf_rate: float = 5,
+                 max_attempts: int = 5, base_backoff: float = 1.0, max_backoff: float = 60.0, job_queue=None):
+        """
+        :param send_func: 调用send_msg的函数，参数为请求体，返回接口结果（不检查errcode）
+        :param worker_count: 发送线程数
+        :param max_queue_size: 发送队列最大长度，超过后拒绝入队（背压）
+        :param global_rate: 全局每秒发送上限
+        :param per_kf_rate: 每个客服账号每秒发送上限
+        :param max_attempts: 最大尝试次数
+        :param base_backoff: 重试退避基数（秒）
+        :param max_backoff: 重试退避上限（秒）
+        :param job_queue: 持久化任务队列（JobQueueDatabase），为None时回复只保存在内存中
+        """
+        self.send_func = send_func
+        self.worker_count = max(1, worker_count)
+        self.max_queue_size = max_queue_size
+        self.global_rate = global_rate
+        self.per_kf_rate = per_kf_rate
+        self.max_attempts = max_attempts
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.job_queue = job_queue
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:kf-sender"
+
+        # 待发送消息：(可发送时间, 序号, 消息)
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._global_bucket = TokenBucket(global_rate, max(1.0, global_rate))
+        self._kf_buckets: Dict[str, TokenBucket] = {}
+        self._workers = []
+        self._running = False
+        self._in_flight = 0
+        # 本进程持有租约的回复：任务ID -> 消息（队列中和发送中的）
+        self._held: Dict[int, Dict[str, Any]] = {}
+        self._maintainer = None
+        self._maintain_stop = threading.Event()
+
+        # 运行统计
+        self._submitted = 0
+        self._rejected = 0
+        self._sent = 0
+        self._retried = 0
+        self._throttled = 0
+        self._failed = 0
+        self._recovered = 0
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    @property
+    def durable(self) -> bool:
+        return self.job_queue is not None
+
+    def start(self):
+        """启动发送线程"""
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+            for i in range(self.worker_count):
+                worker = threading.Thread(target=self._worker_loop, name=f"kf-sender-{i}", daemon=True)
+                worker.start()
+                self._workers.append(worker)
+            if self.durable:
+                self._maintain_stop.clear()
+                self._maintainer = threading.Thread(target=self._maintain_loop, name="kf-sender-lease", daemon=True)
+                self._maintainer.start()
+        mode = "持久化任务表" if self.durable else "内存队列"
+        logger.info(f"✅ 微信客服消息发送调度器已启动，发送线程数: {self.worker_count}，队列: {mode}")
+
+    def stop(self, timeout: float = 30):
+        """
+        停止发送线程，最多等待timeout秒把队列中的消息发完
+        持久化模式下未发出的回复放回任务表，下次启动后继续发送
+        """
+        deadline = time.time() + timeout
+        with self._cond:
+            while (self._heap or self._in_flight) and time.time() < deadline:
+                self._cond.wait(min(0.5, max(0, deadline - time.time())))
+            self._running = False
+            workers = list(self._workers)
+            self._workers = []
+            remaining = [item for _, _, item in self._heap]
+            self._heap = []
+            self._cond.notify_all()
+
+        self._maintain_stop.set()
+        if self._maintainer:
+            self._maintainer.join(5)
+            self._maintainer = None
+        for worker in workers:
+            worker.join(max(0, deadline - time.time()))
+
+        if remaining and self.durable:
+            released = 0
+            for item in remaining:
+                if item.get('job_id') and self.job_queue.release(item['job_id'], item['lease_token']):
+                    released += 1
+                self._forget(item)
+            logger.warning(f"⚠️ 发送调度器停止时仍有 {len(remaining)} 条消息未发送，"
+                           f"{released} 条已放回任务表，下次启动后发送")
+        elif remaining:
+            logger.warning(f"⚠️ 发送调度器停止时仍有 {len(remaining)} 条消息未发送")
+        logger.info("🛑 微信客服消息发送调度器已停止")
+
+    def submit(self, external_userid: str, open_kfid: str, content: str) -> bool:
+        """
+        文本消息入队
+
+        Returns:
+            bool: 入队成功返回True，队列已满或未启动返回False
+        """
+        item = {
+            'payload': {
+                'touser': external_userid,
+                'open_kfid': open_kfid,
+                # 指定msgid，重试时企业微信按msgid去重，不会重复发送
+                'msgid': uuid.uuid4().hex,
+                'msgtype': 'text',
+                'text': {'content': content}
+            },
+            'open_kfid': open_kfid,
+            'attempts': 0,
+            'enqueued_at': time.time()
+        }
+        with self._cond:
+            if not self._running:
+                return False
+            if len(self._heap) >= self.max_queue_size:
+                self._rejected += 1
+                logger.error(f"❌ 发送队列已满（{self.max_queue_size}），消息未入队")
+                return False
+
+        if self.durable:
+            # 先落盘再入内存队列，进程崩溃或停机超时后由恢复线程重新发送
+            leased = self.job_queue.enqueue_leased(JOB_TYPE_SEND, item['payload'], self.worker_id)
+            if leased is None:
+                with self._cond:
+                    self._rejected += 1
+                return False
+            item['job_id'], item['lease_token'] = leased
+
+        with self._cond:
+            if item.get('job_id'):
+                self._held[item['job_id']] = item
+            self._push(item, time.monotonic())
+            self._submitted += 1
+        return True
+
+    def _push(self, item: Dict[str, Any], ready_at: float):
+        """放入队列（调用方持有self._cond）"""
+        heapq.heappush(self._heap, (ready_at, next(self._seq), item))
+        self._cond.notify()
+
+    def _next_item(self) -> Optional[Dict[str, Any]]:
+        """取出下一条可发送且拿到令牌的消息；停止时返回None"""
+        with self._cond:
+            while True:
+                if not self._running:
+                    return None
+                now = time.monotonic()
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                ready_at, _, item = self._heap[0]
+                if ready_at > now:
+                    self._cond.wait(ready_at - now)
+                    continue
+
+                heapq.heappop(self._heap)
+                kf_bucket = self._kf_buckets.get(item['open_kfid'])
+                if kf_bucket is None:
+                    kf_bucket = TokenBucket(self.per_kf_rate, max(1.0, self.per_kf_rate))
+                    self._kf_buckets[item['open_kfid']] = kf_bucket
+                wait = max(self._global_bucket.wait_time(now), kf_bucket.wait_time(now))
+                if wait > 0:
+                    # 没有令牌时放回队列，不阻塞其他客服账号的消息
+                    self._push(item, now + wait)
+                    continue
+
+                self._global_bucket.take()
+                kf_bucket.take()
+                self._in_flight += 1
+                return item
+
+    def _worker_loop(self):
+        """发送线程主循环"""
+        while True:
+            item = self._next_item()
+            if item is None:
+                break
+            try:
+                self._send(item)
+            finally:
+                with self._cond:
+                    self._in_flight -= 1
+                    self._cond.notify_all()
+
+    def _send(self, item: Dict[str, Any]):
+        """发送一条消息，失败时按错误类型重试或放弃"""
+        item['attempts'] += 1
+        if item['attempts'] == 1:
+            kf_pipeline_stats.record('send_queue_wait', time.time() - item['enqueued_at'])
+
+        error = None
+        retryable = True
+        try:
+            with kf_pipeline_stats.timer('send_msg'):
+                result = self.send_func(item['payload'])
+            errcode = result.get('errcode')
+            if errcode == 0:
+                with self._cond:
+                    self._sent += 1
+                self._settle(item)
+                return
+            error = f"errcode={errcode}, errmsg={result.get('errmsg')}"
+            retryable = errcode in RETRYABLE_ERRCODES
+            if retryable:
+                with self._cond:
+                    self._throttled += 1
+        except Exception as e:
+            # 网络错误、超时等
+            error = str(e)
+
+        if retryable and item['attempts'] < self.max_attempts:
+            backoff = min(self.max_backoff, self.base_backoff * (2 ** (item['attempts'] - 1)))
+            backoff *= random.uniform(0.5, 1.5)
+            with self._cond:
+                self._retried += 1
+                self._push(item, time.monotonic() + backoff)
+            logger.warning(f"🔁 发送消息第 {item['attempts']} 次失败，{backoff:.1f}秒后重试: {error}")
+            return
+
+        with self._cond:
+            self._failed += 1
+        logger.error(f"❌ 发送消息失败（已尝试 {item['attempts']} 次），放弃发送: {error}")
+        self._settle(item, error)
+
+    def _settle(self, item: Dict[str, Any], error: Optional[str] = None):
+        """发送成功时标记任务完成，放弃发送时进入死信（可用replay_dead_jobs.py重放）"""
+        self._forget(item)
+        if not item.get('job_id'):
+            return
+        try:
+            if error is None:
+                self.job_queue.complete(item['job_id'], item['lease_token'])
+            else:
+                self.job_queue.bury(item['job_id'], item['lease_token'], error)
+        except Exception as e:
+            logger.error(f"更新发送任务 {item['job_id']} 状态失败: {e}")
+
+    def _forget(self, item: Dict[str, Any]):
+        with self._cond:
+            if item.get('job_id'):
+                self._held.pop(item['job_id'], None)
+
+    def _maintain_loop(self):
+        """持久化模式：定期续约本进程持有的回复，并领取其他进程遗留（崩溃、停机超时）的待发送回复"""
+        interval = max(1.0, self.job_queue.lease_seconds / 3)
+        while True:
+            try:
+                self._renew_held()
+                self._recover()
+            except Exception as e:
+                logger.error(f"发送任务维护失败: {e}")
+            if self._maintain_stop.wait(interval):
+                break
+
+    def _renew_held(self):
+        with self._cond:
+            held = [(job_id, item['lease_token']) for job_id, item in self._held.items()]
+        for job_id, lease_token in held:
+            if not self.job_queue.renew(job_id, lease_token):
+                logger.warning(f"⚠️ 发送任务 {job_id} 的租约已失效")
+
+    def _recover(self):
+        """领取待发送或租约已过期的回复放入内存队列，直到队列满"""
+        while self._running:
+            with self._cond:
+                if len(self._heap) >= self.max_queue_size:
+                    return
+            job = self.job_queue.lease(self.worker_id, job_types=[JOB_TYPE_SEND])
+            if not job:
+                return
+            with self._cond:
+                existing = self._held.get(job['id'])
+                if existing:
+                    # 本进程的租约过期后被自己重新领取，沿用队列中的消息
+                    existing['lease_token'] = job['lease_token']
+                    continue
+                item = {
+                    'payload': job['payload'],
+                    'open_kfid': job['payload'].get('open_kfid', ''),
+                    'attempts': 0,
+                    'enqueued_at': job['created_at'],
+                    'job_id': job['id'],
+                    'lease_token': job['lease_token']
+                }
+                self._held[job['id']] = item
+                self._push(item, time.monotonic())
+                self._recovered += 1
+            logger.info(f"♻️ 恢复未发送的回复（任务 {job['id']}，第 {job['attempts']} 次领取）")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取发送队列状态"""
+        with self._cond:
+            return {
+                'running': self._running,
+                'backend': 'sqlite' if self.durable else 'memory',
+                'worker_count': self.worker_count,
+                'queue_depth': len(self._heap),
+                'max_queue_size': self.max_queue_size,
+                'in_flight': self._in_flight,
+                'global_rate': self.global_rate,
+                'per_kf_rate': self.per_kf_rate,
+                'submitted': self._submitted,
+                'rejected': self._rejected,
+                'sent': self._sent,
+                'retried': self._retried,
+                'throttled': self._throttled,
+                'failed': self._failed,
+                'recovered': self._recovered
+            }
+
+
+def _select_send_queue():
+    """根据配置选择回复的持久化队列（与后台处理池共用任务表，租约时长和尝试次数单独配置）"""
+    if config.kf_queue_backend == 'sqlite' and job_queue_db:
+        return JobQueueDatabase(
+            job_queue_db.db,
+            max_attempts=config.kf_send_max_attempts,
+            lease_seconds=config.kf_send_lease_seconds
+        )
+    return None
+
+
+# 全局发送调度器实例
+kf_send_dispatcher = KfSendDispatcher(
+    wework_client.send_kf_message,
+    worker_count=config.kf_send_worker_count,
+    max_queue_size=config.kf_send_queue_size,
+    global_rate=config.kf_send_global_rate,
+    per_kf_rate=config.kf_send_per_kf_rate,
+    max_attempts=config.kf_send_max_attempts,
+    job_queue=_select_send_queue()
+)
@@ -0,0 +1,157 @@
+# media_cache.py
+"""
+媒体处理结果缓存
+同一张名片图片、同一份PDF经常被多次转发，转发的聊天记录里还会重复出现相同的media_id，
+每次都下载、转码、调用ETL/ASR要几十秒到几分钟。按媒体文件内容的sha256缓存提取出的文本：
+- media_id别名：见过的media_id不用下载，直接命中
+- 内容哈希：新的media_id下载后只需计算一次哈希
+"""
+import hashlib
+import logging
+import threading
+import time
+from typing import Dict, Any, Optional, Callable, Tuple
+
+from ..config.config import config
+from ..database.media_cache_db import media_cache_db
+
+logger = logging.getLogger(__name__)
+
+# 每写入多少条执行一次容量淘汰
+_EVICT_EVERY = 50
+
+# 计算哈希时的读取块大小
+_HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_sha256(file_path: str) -> str:
+    """分块计算文件内容的sha256"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class _InFlight:
+    """进行中的媒体处理，相同内容、相同处理方式的请求等待其结果"""
+    __slots__ = ('event', 'result')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+
+
+class MediaResultCache:
+    """按内容哈希缓存OCR、语音识别、文档解析结果"""
+
+    def __init__(self, store):
+        """
+        :param store: 持久化层（MediaCacheDatabase）
+        """
+        self.store = store
+        self._lock = threading.Lock()
+        self._in_flight: Dict[Tuple[str, str], _InFlight] = {}
+        self._puts = 0
+
+        # 运行统计
+        self._requests = 0
+        self._alias_hits = 0
+        self._content_hits = 0
+        self._shared = 0
+        self._misses = 0
+        self._saved_seconds = 0.0
+
+    def get_by_media_id(self, media_id: str, kind: str) -> Optional[Dict[str, Any]]:
+        """通过media_id别名查找结果（无需下载），未命中返回None"""
+        with self._lock:
+            self._requests += 1
+        content_hash = self.store.resolve_alias(media_id) if media_id else None
+        entry = self.store.get(content_hash, kind) if content_hash else None
+        if entry:
+            with self._lock:
+                self._alias_hits += 1
+                self._saved_seconds += entry['latency_ms'] / 1000
+            logger.info(f"♻️ 媒体结果缓存命中（media_id）: {kind}")
+        return entry
+
+    def get_or_compute(self, content_hash: str, kind: str, media_id: str,
+                       compute: Callable[[], Tuple[Optional[str], Dict[str, Any], bool]]) -> Optional[str]:
+        """
+        按内容哈希查找结果，未命中时调用compute；相同(content_hash, kind)的并发调用共享一次compute
+        （同一条聊天记录里重复出现的图片只做一次OCR）
+
+        :param compute: compute() -> (文本, 元数据, 是否可缓存)
+        :return: 提取出的文本
+        """
+        entry = self.store.get(content_hash, kind)
+        if media_id:
+            self.store.put_alias(media_id, content_hash)
+        key = (content_hash, kind)
+        with self._lock:
+            if entry:
+                self._content_hits += 1
+                self._saved_seconds += entry['latency_ms'] / 1000
+                waiter = owner = None
+            else:
+                waiter = self._in_flight.get(key)
+                if waiter:
+                    self._shared += 1
+                else:
+                    owner = self._in_flight[key] = _InFlight()
+                    self._misses += 1
+        if entry:
+            logger.info(f"♻️ 媒体结果缓存命中（内容哈希）: {kind}")
+            return entry['text']
+
+        if waiter:
+            waiter.event.wait()
+            if waiter.result is not None:
+                logger.info(f"♻️ 复用进行中的媒体处理结果: {kind}")
+                return waiter.result
+            # 进行中的处理失败，自行处理
+            text, _, _ = compute()
+            return text
+
+        started_at = time.time()
+        try:
+            text, metadata, cacheable = compute()
+            if cacheable:
+                self.put(content_hash, kind, text, metadata, (time.time() - started_at) * 1000)
+            owner.result = text
+            return text
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+            owner.event.set()
+
+    def put(self, content_hash: str, kind: str, text: str, metadata: Dict[str, Any] = None, latency_ms: float = 0):
+        """保存提取结果"""
+        self.store.put(content_hash, kind, text, metadata or {}, latency_ms)
+        with self._lock:
+            self._puts += 1
+            evict = self._puts % _EVICT_EVERY == 0
+        if evict:
+            self.store.evict()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取命中率、节省的处理耗时和容量占用"""
+        usage = self.store.usage()
+        with self._lock:
+            hits = self._alias_hits + self._content_hits + self._shared
+            return {
+                'requests': self._requests,
+                'alias_hits': self._alias_hits,
+                'content_hits': self._content_hits,
+                'shared': self._shared,
+                'misses': self._misses,
+                'hit_ratio': round(hits / self._requests, 4) if self._requests else 0.0,
+                'saved_seconds': round(self._saved_seconds, 2),
+                'entries': usage['entries'],
+                'bytes': usage['bytes'],
+                'max_bytes': self.store.max_bytes
+            }
+
+
+# 全局媒体处理结果缓存实例
+media_cache = MediaResultCache(media_cache_db) if config.media_cache_enabled and media_cache_db else None
@@ -5,11 +5,21 @@ import base64
 import logging
 import time
 import json
-from typing import Dict, List, Optional, Tuple
+import itertools
+import tempfile
+import threading
+from typing import Any, Dict, List, Optional, Tuple
 from ..config.config import config
+from ..utils.adaptive_limiter import etl_limiter
+from ..utils.hedging import etl_hedge, upstream_timer
+from ..utils.metrics import media_stats
+from .media_cache import media_cache, file_sha256
 
 logger = logging.getLogger(__name__)
 
+# 识别文件类型只需要文件开头的字节
+HEADER_SNIFF_BYTES = 1024
+
 class ETLProcessor:
     """ETL4LM接口处理器 - 支持图片OCR和PDF文档解析"""
     
@@ -27,6 +37,16 @@ class ETLProcessor:
         self.supported_image_types = ['.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.webp']
         self.supported_doc_types = ['.pdf', '.doc', '.docx']
     
+    def _post_predict(self, payload: Dict, timeout: float) -> requests.Response:
+        """调用ETL预测接口（受etl自适应并发窗口约束）"""
+        with etl_limiter.slot() as call:
+            # 对冲延迟只按HTTP请求本身的耗时计算，不含自适应窗口的排队时间
+            with upstream_timer():
+                response = requests.post(self.predict_url, json=payload, headers=self.headers, timeout=timeout)
+            # 429/5xx缩小并发窗口，其他非200不增大窗口
+            call.report_status(response.status_code)
+        return response
+    
     def process_image_ocr(self, image_data: bytes, filename: str) -> Dict:
         """
         处理图片OCR识别
@@ -58,7 +78,12 @@ class ETLProcessor:
             # 发送请求 - 图片OCR相对较快，3分钟应该足够
             logger.info("⏳ 图片OCR识别中，预计1-3分钟...")
             start_time = time.time()
-            response = requests.post(self.predict_url, json=payload, headers=self.headers, timeout=180)
+            if etl_hedge:
+                # 相同图片重复识别结果一致，长尾请求可对冲
+                response = etl_hedge.call(lambda: self._post_predict(payload, timeout=180),
+                                           is_success=lambda r: r.status_code == 200)
+            else:
+                response = self._post_predict(payload, timeout=180)
             processing_time = time.time() - start_time
             logger.info(f"✅ 图片OCR完成，耗时: {processing_time:.2f}秒")
             
@@ -172,7 +197,7 @@ class ETLProcessor:
             # 发送请求 - PDF处理通常需要更长时间，特别是复杂文档
             logger.info("⏳ PDF解析可能需要较长时间（最多5分钟），请耐心等待...")
             start_time = time.time()
-            response = requests.post(self.predict_url, json=payload, headers=self.headers, timeout=300)
+            response = self._post_predict(payload, timeout=300)
             processing_time = time.time() - start_time
             logger.info(f"✅ PDF解析完成，耗时: {processing_time:.2f}秒")
             
@@ -313,71 +338,99 @@ class ETLProcessor:
 # 全局ETL处理器实例
 etl_processor = ETLProcessor()
 
-class AliyunASRProcessor:
-    """阿里云ASR语音识别处理器"""
+class _ASRSession:
+    """单次语音识别会话：每次识别使用独立的识别器和回调状态，并发识别互不干扰"""
     
-    def __init__(self):
-        self.appkey = config.asr_appkey
-        self.token = config.asr_token
-        self.url = config.asr_url
-        self._recognition_result = None
-        self._recognition_complete = False
-        self._recognition_error = None
-        self._connection_active = False
-    
-    def _reset_state(self):
-        """重置识别状态"""
-        self._recognition_result = None
-        self._recognition_complete = False
-        self._recognition_error = None
-        self._connection_active = False
-        # 清除启动确认标志
-        if hasattr(self, '_start_confirmed'):
-            delattr(self, '_start_confirmed')
-        
-    def _on_start(self, message, *args):
+    def __init__(self, session_id: int):
+        self.session_id = session_id
+        self.result = None
+        self.complete = False
+        self.error = None
+        self.start_confirmed = False
+        self.connection_active = False
+        # 回调线程通过事件通知等待中的识别线程，不用轮询
+        self.started = threading.Event()
+        self.finished = threading.Event()
+        
+    def on_start(self, message, *args):
         """识别开始回调"""
-        logger.info("🎤 ASR识别开始")
-        self._start_confirmed = True  # 标记启动确认
-        self._recognition_complete = False
-        self._recognition_error = None
-        self._connection_active = True  # 标记连接活跃
+        logger.info(f"🎤 ASR识别开始 (会话 {self.session_id})")
+        self.start_confirmed = True  # 标记启动确认
+        self.complete = False
+        self.error = None
+        self.connection_active = True  # 标记连接活跃
+        self.started.set()
         
-    def _on_result_changed(self, message, *args):
+    def on_result_changed(self, message, *args):
         """中间结果回调"""
-        # logger.info(f"🔄 ASR中间结果: {message}")
         try:
             result = json.loads(message)
             if result.get('header', {}).get('status') == 20000000:
-                self._recognition_result = result.get('payload', {}).get('result', '')
+                self.result = result.get('payload', {}).get('result', '')
         except:
             pass
             
-    def _on_completed(self, message, *args):
+    def on_completed(self, message, *args):
         """识别完成回调"""
-        logger.info("✅ ASR识别完成")
+        logger.info(f"✅ ASR识别完成 (会话 {self.session_id})")
         try:
             result = json.loads(message)
             if result.get('header', {}).get('status') == 20000000:
-                self._recognition_result = result.get('payload', {}).get('result', '')
-                if self._recognition_result:
-                    logger.info(f"📝 识别结果: {self._recognition_result}")
-                self._recognition_complete = True
+                self.result = result.get('payload', {}).get('result', '')
+                if self.result:
+                    logger.info(f"📝 识别结果: {self.result}")
+                self.complete = True
             else:
-                self._recognition_error = f"ASR错误: {result.get('header', {}).get('status_text', '未知错误')}"
+                self.error = f"ASR错误: {result.get('header', {}).get('status_text', '未知错误')}"
         except Exception as e:
-            self._recognition_error = f"解析ASR结果失败: {str(e)}"
+            self.error = f"解析ASR结果失败: {str(e)}"
+        self.finished.set()
             
-    def _on_error(self, message, *args):
+    def on_error(self, message, *args):
         """错误回调"""
-        logger.error(f"❌ ASR错误: {message}")
-        self._recognition_error = f"ASR服务错误: {message}"
+        logger.error(f"❌ ASR错误 (会话 {self.session_id}): {message}")
+        self.error = f"ASR服务错误: {message}"
+        self.finished.set()
         
-    def _on_close(self, *args):
+    def on_close(self, *args):
         """连接关闭回调"""
-        logger.info("🔚 ASR连接关闭")
-        self._connection_active = False  # 标记连接断开
-        self._recognition_complete = True
+        logger.info(f"🔚 ASR连接关闭 (会话 {self.session_id})")
+        self.connection_active = False  # 标记连接断开
+        self.complete = True
+        self.started.set()
+        self.finished.set()
+
+
+class AliyunASRProcessor:
+    """
+    阿里云ASR语音识别处理器
+    
+    每次识别创建独立的会话，同时进行的会话数不超过max_sessions（与ASR并发额度对应），超出的排队等待
+    
+    实时模式按640字节（20ms音频）分片并在每片后暂停，模拟实时音频流；
+    快速模式按frame_bytes大小分片连续发送，由websocket发送速度决定上传耗时，适合已录制好的语音文件
+    """
+    
+    def __init__(self, max_sessions: int = 2, fast_mode: bool = False, frame_bytes: int = 3200):
+        """
+        :param max_sessions: 同时进行的识别会话数上限
+        :param fast_mode: 是否使用快速模式上传音频
+        :param frame_bytes: 快速模式下每次发送的字节数（16kHz 16bit单声道下3200字节为100ms音频）
+        """
+        self.appkey = config.asr_appkey
+        self.token = config.asr_token
+        self.url = config.asr_url
+        self.max_sessions = max(1, max_sessions)
+        self.fast_mode = fast_mode
+        self.frame_bytes = max(640, frame_bytes)
+        self._slots = threading.BoundedSemaphore(self.max_sessions)
+        self._session_ids = itertools.count(1)
+        self._lock = threading.Lock()
+        
+        # 运行统计
+        self._active = 0
+        self._sessions = 0
+        self._failed = 0
         
     def recognize_speech(self, audio_file_path: str) -> Optional[str]:
         """
@@ -389,6 +442,26 @@ class AliyunASRProcessor:
         Returns:
             str: 识别的文本内容，失败返回None
         """
+        queued_at = time.time()
+        with self._slots:
+            started_at = time.time()
+            media_stats.record('asr_queue_wait', started_at - queued_at)
+            with self._lock:
+                self._active += 1
+            result = None
+            try:
+                result = self._run_session(audio_file_path)
+                return result
+            finally:
+                media_stats.record('asr_session', time.time() - started_at)
+                with self._lock:
+                    self._active -= 1
+                    self._sessions += 1
+                    if not result or result.startswith('['):
+                        self._failed += 1
+    
+    def _run_session(self, audio_file_path: str) -> Optional[str]:
+        """在独立会话中完成一次识别"""
         try:
             # 检查nls模块是否可用
             try:
@@ -397,29 +470,27 @@ class AliyunASRProcessor:
                 logger.error("阿里云ASR SDK未安装，请运行: pip install alibabacloud-nls")
                 return "[语音识别失败: ASR SDK未安装]"
             
-            logger.info(f"🎤 开始语音识别: {audio_file_path}")
+            session = _ASRSession(next(self._session_ids))
+            logger.info(f"🎤 开始语音识别 (会话 {session.session_id}): {audio_file_path}")
             
             # 读取音频文件
             with open(audio_file_path, 'rb') as f:
                 audio_data = f.read()
             
-            # 重置识别状态
-            self._reset_state()
-            
             # 启用NLS SDK调试日志（可选）
             # nls.enableTrace(True)
             
-            # 创建识别器
+            # 创建识别器（回调绑定到本次会话）
             sr = nls.NlsSpeechRecognizer(
                 url=self.url,
                 token=self.token,
                 appkey=self.appkey,
-                on_start=self._on_start,
-                on_result_changed=self._on_result_changed,
-                on_completed=self._on_completed,
-                on_error=self._on_error,
-                on_close=self._on_close,
-                callback_args=["voice_recognition"]  # 添加回调参数
+                on_start=session.on_start,
+                on_result_changed=session.on_result_changed,
+                on_completed=session.on_completed,
+                on_error=session.on_error,
+                on_close=session.on_close,
+                callback_args=[f"voice_recognition_{session.session_id}"]  # 添加回调参数
             )
             
             # 开始识别
@@ -437,12 +508,9 @@ class AliyunASRProcessor:
                 return "[语音识别失败: 调用启动方法失败]"
             
             # 等待识别真正开始（等待on_start回调）
-            start_wait = 0
-            while not hasattr(self, '_start_confirmed') and start_wait < 10:
-                time.sleep(0.1)
-                start_wait += 0.1
+            session.started.wait(10)
             
-            if not hasattr(self, '_start_confirmed'):
+            if not session.start_confirmed:
                 logger.error("等待ASR启动超时")
                 sr.shutdown()  # 确保关闭连接
                 return "[语音识别失败: 启动超时]"
@@ -450,27 +518,29 @@ class AliyunASRProcessor:
             logger.info("✅ ASR识别启动成功")
             
             # 再次检查连接是否仍然活跃
-            if not self._connection_active:
+            if not session.connection_active:
                 logger.error("ASR连接未激活，无法发送音频数据")
                 sr.shutdown()
                 return "[语音识别失败: 连接未激活]"
             
-            # 发送音频数据（每次发送640字节）
+            # 发送音频数据（实时模式每次640字节并暂停，快速模式按frame_bytes连续发送）
             try:
-                slices = zip(*(iter(audio_data),) * 640)
+                frame_bytes = self.frame_bytes if self.fast_mode else 640
+                pace = 0 if self.fast_mode else 0.01
                 chunk_count = 0
-                total_chunks = len(audio_data) // 640
+                send_started_at = time.time()
                 
-                for chunk in slices:
+                for offset in range(0, len(audio_data), frame_bytes):
                     # 在每次发送前检查连接状态
-                    if not self._connection_active:
+                    if not session.connection_active:
                         logger.warning(f"连接在发送第{chunk_count}块时断开")
                         break
                         
                     try:
-                        sr.send_audio(bytes(chunk))
+                        sr.send_audio(audio_data[offset:offset + frame_bytes])
                         chunk_count += 1
-                        time.sleep(0.01)  # 模拟实时发送
+                        if pace:
+                            time.sleep(pace)  # 模拟实时发送
                     except Exception as send_error:
                         logger.error(f"发送音频数据失败: {send_error}")
                         # 如果是连接问题，停止发送
@@ -478,6 +548,7 @@ class AliyunASRProcessor:
                             return "[语音识别失败: 连接问题]"
                         raise send_error
                 
+                media_stats.record('asr_upload', time.time() - send_started_at)
                 logger.info(f"📊 音频数据发送完成 ({chunk_count} 块)")
                 
                 if chunk_count == 0:
@@ -495,23 +566,21 @@ class AliyunASRProcessor:
             stop_result = sr.stop(timeout=10)
             
             # 等待识别完成（最多等待30秒）
-            wait_time = 0
-            while not self._recognition_complete and not self._recognition_error and wait_time < 30:
-                time.sleep(0.1)
-                wait_time += 0.1
+            wait_started_at = time.time()
+            session.finished.wait(30)
                 
-            logger.info(f"🔍 识别等待结束 ({wait_time:.1f}秒)")
+            logger.info(f"🔍 识别等待结束 ({time.time() - wait_started_at:.1f}秒)")
             
             # 关闭连接
             sr.shutdown()
             
             # 返回结果
-            if self._recognition_error:
-                logger.error(f"语音识别出错: {self._recognition_error}")
-                return f"[语音识别失败: {self._recognition_error}]"
-            elif self._recognition_result:
-                logger.info(f"✅ 语音识别成功: {self._recognition_result}")
-                return self._recognition_result
+            if session.error:
+                logger.error(f"语音识别出错: {session.error}")
+                return f"[语音识别失败: {session.error}]"
+            elif session.result:
+                logger.info(f"✅ 语音识别成功: {session.result}")
+                return session.result
             else:
                 logger.warning("语音识别未返回结果")
                 return "[语音识别失败: 未识别到内容]"
@@ -519,9 +588,24 @@ class AliyunASRProcessor:
         except Exception as e:
             logger.error(f"语音识别异常: {e}")
             return f"[语音识别异常: {str(e)}]"
+    
+    def get_stats(self) -> Dict:
+        """获取并发会话数和识别统计"""
+        with self._lock:
+            return {
+                'max_sessions': self.max_sessions,
+                'fast_mode': self.fast_mode,
+                'active': self._active,
+                'sessions': self._sessions,
+                'failed': self._failed
+            }
 
 # 全局ASR处理器实例
-asr_processor = AliyunASRProcessor()
+asr_processor = AliyunASRProcessor(
+    max_sessions=config.asr_max_sessions,
+    fast_mode=config.asr_fast_mode,
+    frame_bytes=config.asr_frame_bytes
+)
 
 class MediaProcessor:
     """多媒体处理器 - 处理语音转文字和文件内容提取"""
@@ -530,75 +614,193 @@ class MediaProcessor:
         self.temp_dir = "temp_media"
         if not os.path.exists(self.temp_dir):
             os.makedirs(self.temp_dir)
+        self.download_chunk_size = config.media_download_chunk_size
+        # 各类型媒体的下载大小上限（字节）
+        self.max_download_bytes = {
+            'voice': int(config.media_max_voice_mb * 1024 * 1024),
+            'image': int(config.media_max_image_mb * 1024 * 1024),
+            'video': int(config.media_max_video_mb * 1024 * 1024),
+            'file': int(config.media_max_file_mb * 1024 * 1024)
+        }
+        self._stats_lock = threading.Lock()
+        self._downloads = 0
+        self._download_aborted = 0
+        self._download_bytes = 0
+        self._download_seconds = 0.0
     
-    def download_media(self, media_id: str) -> Optional[str]:
+    def download_media(self, media_id: str, media_type: Optional[str] = None) -> Optional[str]:
         """
         通过MediaID下载媒体文件
         
+        流式下载：按固定大小分块直接写入临时文件，内存占用与文件大小无关；
+        只用开头的字节识别文件类型；超过该类型的大小上限时立即中止
+        
         Args:
             media_id: 媒体文件ID
+            media_type: 媒体类型（voice/image/video/file），决定大小上限，为空时按Content-Type判断
             
         Returns:
             str: 下载后的本地文件路径，失败返回None
         """
+        part_path = None
         try:
-            from wework_client import wework_client
-            
-            # 获取access_token
-            access_token = wework_client.get_access_token()
-            
-            # 下载媒体文件
-            download_url = f"https://qyapi.weixin.qq.com/cgi-bin/media/get?access_token={access_token}&media_id={media_id}"
-            
-            response = requests.get(download_url, timeout=30)
-            
-            if response.status_code == 200:
-                # 根据Content-Type确定文件扩展名
-                content_type = response.headers.get('Content-Type', '')
-                if 'audio' in content_type.lower():
-                    ext = '.amr'  # 微信语音通常是amr格式
-                elif 'image' in content_type.lower():
-                    ext = '.jpg'
-                elif 'application/pdf' in content_type.lower():
-                    ext = '.pdf'
-                elif 'application/msword' in content_type.lower():
-                    ext = '.doc'
-                elif 'application/vnd.openxmlformats-officedocument.wordprocessingml.document' in content_type.lower():
-                    ext = '.docx'
-                elif 'application/vnd.ms-excel' in content_type.lower():
-                    ext = '.xls'
-                elif 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet' in content_type.lower():
-                    ext = '.xlsx'
-                else:
-                    ext = '.tmp'
+            from .wework_client import wework_client
+            from .token_manager import INVALID_TOKEN_ERRCODES
+            
+            # 与_post_api一致：token失效（40014/42001）时作废并重试一次
+            for attempt in range(2):
+                access_token = wework_client.get_access_token()
                 
-                # 保存文件
-                file_path = os.path.join(self.temp_dir, f"{media_id}{ext}")
-                with open(file_path, 'wb') as f:
-                    f.write(response.content)
+                # 下载媒体文件
+                download_url = f"https://qyapi.weixin.qq.com/cgi-bin/media/get?access_token={access_token}&media_id={media_id}"
                 
-                # 如果Content-Type识别失败（扩展名为.tmp），尝试通过文件头识别
-                if ext == '.tmp':
-                    actual_ext = self._detect_file_type_by_header(response.content)
-                    if actual_ext and actual_ext != '.tmp':
-                        # 重命名文件
-                        new_file_path = os.path.join(self.temp_dir, f"{media_id}{actual_ext}")
-                        try:
-                            os.rename(file_path, new_file_path)
-                            file_path = new_file_path
-                            logger.info(f"通过文件头识别文件类型: {actual_ext}")
-                        except:
-                            pass
+                started_at = time.time()
+                with wework_client.session.get(download_url, timeout=30, stream=True) as response:
+                    if response.status_code != 200:
+                        logger.error(f"媒体文件下载失败: HTTP {response.status_code}")
+                        return None
+                    
+                    # 根据Content-Type确定文件扩展名
+                    content_type = response.headers.get('Content-Type', '').lower()
+                    ext = self._ext_from_content_type(content_type)
+                    
+                    media_type = media_type or self._media_type_from_content_type(content_type)
+                    max_bytes = self.max_download_bytes.get(media_type, self.max_download_bytes['file'])
+                    content_length = int(response.headers.get('Content-Length') or 0)
+                    if content_length > max_bytes:
+                        self._record_download(0, time.time() - started_at, aborted=True)
+                        logger.error(f"❌ 媒体文件过大，放弃下载: {content_length} 字节 > {media_type}上限 {max_bytes} 字节")
+                        return None
+                    
+                    # 分块写入临时文件，只保留开头用于识别文件类型
+                    # 文件名唯一，同一media_id被并发下载（聊天记录并发处理、任务重试）时互不覆盖
+                    fd, part_path = tempfile.mkstemp(prefix=f"{media_id}_", suffix='.part', dir=self.temp_dir)
+                    header = b''
+                    size = 0
+                    with os.fdopen(fd, 'wb') as f:
+                        for chunk in response.iter_content(chunk_size=self.download_chunk_size):
+                            if not chunk:
+                                continue
+                            size += len(chunk)
+                            if size > max_bytes:
+                                break
+                            if len(header) < HEADER_SNIFF_BYTES:
+                                header += chunk[:HEADER_SNIFF_BYTES - len(header)]
+                            f.write(chunk)
                 
-                logger.info(f"媒体文件下载成功: {file_path}")
-                return file_path
-            else:
-                logger.error(f"媒体文件下载失败: HTTP {response.status_code}")
+                elapsed = time.time() - started_at
+                if size > max_bytes:
+                    os.remove(part_path)
+                    self._record_download(size, elapsed, aborted=True)
+                    logger.error(f"❌ 媒体文件超过{media_type}大小上限 {max_bytes} 字节，已中止下载")
+                    return None
+                
+                # 企业微信出错时返回JSON错误信息而不是文件（与真正的txt/json附件区分：只看errcode）
+                api_error = self._parse_api_error(content_type, header, size)
+                if not api_error:
+                    break
+                os.remove(part_path)
+                part_path = None
+                if api_error.get('errcode') in INVALID_TOKEN_ERRCODES and attempt == 0:
+                    logger.warning(f"⚠️ 下载媒体文件时access_token失效（errcode={api_error.get('errcode')}），刷新后重试")
+                    wework_client.token_manager.invalidate(access_token)
+                    continue
+                logger.error(f"媒体文件下载失败: errcode={api_error.get('errcode')}, errmsg={api_error.get('errmsg', '')}")
                 return None
+            self._record_download(size, elapsed)
+            
+            # 如果Content-Type识别失败（扩展名为.tmp），尝试通过文件头识别
+            if ext == '.tmp':
+                actual_ext = self._detect_file_type_by_header(header)
+                if actual_ext and actual_ext != '.tmp':
+                    ext = actual_ext
+                    logger.info(f"通过文件头识别文件类型: {actual_ext}")
+            
+            file_path = part_path[:-len('.part')] + ext
+            os.replace(part_path, file_path)
+            
+            throughput = size / elapsed / 1024 if elapsed > 0 else 0
+            logger.info(f"媒体文件下载成功: {file_path} ({size} 字节, {elapsed:.2f}秒, {throughput:.0f} KB/s)")
+            return file_path
                 
         except Exception as e:
             logger.error(f"下载媒体文件时发生错误: {e}")
+            if part_path and os.path.exists(part_path):
+                try:
+                    os.remove(part_path)
+                except OSError:
+                    pass
+            return None
+    
+    @staticmethod
+    def _parse_api_error(content_type: str, header: bytes, size: int) -> Optional[Dict[str, Any]]:
+        """响应体是企业微信的错误JSON（含非0的errcode）时返回该JSON，否则返回None"""
+        if size > HEADER_SNIFF_BYTES or ('json' not in content_type and 'text/plain' not in content_type):
+            return None
+        try:
+            body = json.loads(header.decode('utf-8'))
+        except (ValueError, UnicodeDecodeError):
             return None
+        if isinstance(body, dict) and body.get('errcode'):
+            return body
+        return None
+    
+    @staticmethod
+    def _ext_from_content_type(content_type: str) -> str:
+        """根据Content-Type确定文件扩展名，无法识别时返回.tmp"""
+        if 'audio' in content_type:
+            return '.amr'  # 微信语音通常是amr格式
+        elif 'image' in content_type:
+            return '.jpg'
+        elif 'application/pdf' in content_type:
+            return '.pdf'
+        elif 'application/msword' in content_type:
+            return '.doc'
+        elif 'application/vnd.openxmlformats-officedocument.wordprocessingml.document' in content_type:
+            return '.docx'
+        elif 'application/vnd.ms-excel' in content_type:
+            return '.xls'
+        elif 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet' in content_type:
+            return '.xlsx'
+        return '.tmp'
+    
+    @staticmethod
+    def _media_type_from_content_type(content_type: str) -> str:
+        """根据Content-Type判断媒体类型（决定大小上限）"""
+        if 'audio' in content_type:
+            return 'voice'
+        if 'image' in content_type:
+            return 'image'
+        if 'video' in content_type:
+            return 'video'
+        return 'file'
+    
+    def _record_download(self, size: int, elapsed: float, aborted: bool = False):
+        """记录下载字节数、耗时和中止次数"""
+        media_stats.record('download', elapsed)
+        with self._stats_lock:
+            self._download_bytes += size
+            self._download_seconds += elapsed
+            if aborted:
+                self._download_aborted += 1
+            else:
+                self._downloads += 1
+    
+    def get_stats(self) -> Dict:
+        """获取媒体下载次数、字节数、吞吐量和耗时统计"""
+        with self._stats_lock:
+            stats = {
+                'downloads': self._downloads,
+                'aborted': self._download_aborted,
+                'bytes': self._download_bytes,
+                'throughput_kbps': round(self._download_bytes / self._download_seconds / 1024, 1)
+                if self._download_seconds else 0.0,
+                'max_bytes': dict(self.max_download_bytes)
+            }
+        stats['latency'] = media_stats.snapshot()
+        stats['result_cache'] = media_cache.get_stats() if media_cache else None
+        stats['asr'] = asr_processor.get_stats()
+        return stats
     
     def _detect_file_type_by_header(self, file_data: bytes) -> str:
         """通过文件头部魔术数字检测文件类型"""
@@ -657,34 +859,15 @@ class MediaProcessor:
         Returns:
             str: 识别出的文字内容，失败返回None
         """
-        try:
-            # 1. 下载语音文件
-            voice_file = self.download_media(media_id)
-            if not voice_file:
-                logger.error("语音文件下载失败")
-                return None
-            
-            # 2. 调用语音识别服务
-            # TODO: 这里需要集成具体的语音识别服务
-            # 可选方案：
-            # - 阿里云语音识别
-            # - 腾讯云语音识别  
-            # - 百度语音识别
-            # - OpenAI Whisper本地部署
-            
+        def recognize(voice_file: str):
+            # 调用阿里云语音识别服务
             logger.info(f"开始语音识别: {voice_file}")
-            
-            # 示例：使用阿里云语音识别（需要配置相关API密钥）
             text_result = self._call_speech_recognition_api(voice_file)
-            
-            # 3. 清理临时文件
-            try:
-                os.remove(voice_file)
-            except:
-                pass
-            
-            return text_result
-            
+            # 识别失败时返回"[...]"提示文本，不缓存
+            return text_result, {}, bool(text_result) and not text_result.startswith('[')
+        
+        try:
+            return self._process_media(media_id, 'voice', 'speech', recognize)
         except Exception as e:
             logger.error(f"语音转文字失败: {e}")
             return None
@@ -812,16 +995,10 @@ class MediaProcessor:
         Returns:
             str: 文件文本内容，失败返回None
         """
-        try:
-            # 1. 下载文件
-            file_path = self.download_media(media_id)
-            if not file_path:
-                logger.error("文件下载失败")
-                return None
-            
-            # 2. 根据文件类型提取内容
-            file_ext = filename.lower().split('.')[-1] if '.' in filename else ''
-            
+        file_ext = filename.lower().split('.')[-1] if '.' in filename else ''
+        
+        def extract(file_path: str):
+            # 根据文件类型提取内容
             content = None
             if file_ext == 'txt':
                 content = self._extract_txt_content(file_path)
@@ -833,15 +1010,12 @@ class MediaProcessor:
                 content = self._extract_excel_content(file_path)
             else:
                 logger.warning(f"不支持的文件格式: {file_ext}")
-            
-            # 3. 清理临时文件
-            try:
-                os.remove(file_path)
-            except:
-                pass
-            
-            return content
-            
+            # 解析失败、功能待实现时返回"[...]"提示文本，不缓存
+            cacheable = bool(content) and not content.startswith('[')
+            return content, {'filename': filename, 'file_ext': file_ext}, cacheable
+        
+        try:
+            return self._process_media(media_id, 'file', f"file.{file_ext}", extract)
         except Exception as e:
             logger.error(f"文件内容提取失败: {e}")
             return None
@@ -857,39 +1031,68 @@ class MediaProcessor:
         Returns:
             str: OCR识别出的文字内容，失败返回None
         """
-        try:
-            # 1. 下载图片文件
-            image_file = self.download_media(media_id)
-            if not image_file:
-                logger.error("图片文件下载失败")
-                return None
-            
+        def ocr(image_file: str):
             logger.info(f"🖼️ 开始OCR识别: {image_file}")
             
-            # 2. 读取图片数据
+            # 读取图片数据
             with open(image_file, 'rb') as f:
                 image_data = f.read()
             
-            # 3. 使用ETL处理器进行OCR
+            # 使用ETL处理器进行OCR
             result = etl_processor.process_image_ocr(image_data, filename or os.path.basename(image_file))
             
-            # 4. 清理临时文件
-            try:
-                os.remove(image_file)
-            except:
-                pass
-            
             if result['success']:
                 logger.info(f"✅ 图片OCR成功，提取文本长度: {len(result['text'])}")
-                return result['text']
-            else:
-                logger.error(f"❌ ETL图片OCR失败: {result.get('error', 'Unknown error')}")
-                return f"[图片OCR失败: {result.get('error', 'Unknown error')}]"
-                
+                metadata = dict(result.get('metadata', {}), partitions=result.get('raw_partitions', []))
+                return result['text'], metadata, True
+            logger.error(f"❌ ETL图片OCR失败: {result.get('error', 'Unknown error')}")
+            return f"[图片OCR失败: {result.get('error', 'Unknown error')}]", {}, False
+        
+        try:
+            return self._process_media(media_id, 'image', 'image_ocr', ocr)
         except Exception as e:
             logger.error(f"图片OCR处理失败: {e}")
             return f"[图片OCR异常: {str(e)}]"
     
+    def _process_media(self, media_id: str, media_type: str, kind: str, extract) -> Optional[str]:
+        """
+        下载媒体文件并提取文本，结果按内容哈希缓存
+        
+        依次查media_id别名（不用下载）和内容哈希（下载后计算一次哈希），都未命中时调用extract
+        
+        Args:
+            media_id: 媒体文件ID
+            media_type: 媒体类型（决定下载大小上限）
+            kind: 处理方式，和内容哈希一起作为缓存键（如image_ocr、speech、file.pdf）
+            extract: extract(file_path) -> (文本, 元数据, 是否可缓存)
+            
+        Returns:
+            str: 提取出的文本，下载失败返回None
+        """
+        if media_cache:
+            cached = media_cache.get_by_media_id(media_id, kind)
+            if cached:
+                return cached['text']
+        
+        file_path = self.download_media(media_id, media_type)
+        if not file_path:
+            logger.error(f"{media_type}文件下载失败")
+            return None
+        
+        try:
+            if media_cache:
+                # 相同内容的并发请求（聊天记录里重复的图片）共享一次处理
+                return media_cache.get_or_compute(file_sha256(file_path), kind, media_id, lambda: extract(file_path))
+            text, _, _ = extract(file_path)
+            return text
+        finally:
+            # 清理临时文件：download_media每次调用返回独立的唯一路径（mkstemp），
+            # 只删除本次调用下载的文件，不会影响并发处理同一media_id的其他调用
+            try:
+                os.remove(file_path)
+            except OSError:
+                pass
+    
     def _extract_txt_content(self, file_path: str) -> Optional[str]:
         """提取TXT文件内容"""
         try:
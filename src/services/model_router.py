@@ -0,0 +1,183 @@
+# model_router.py
+"""
+画像提取的模型分级路由
+- 按输入长度和消息类型选择模型档位：短消息用快速模型，聊天记录和长文本用最强模型
+- 按档位统计滑动窗口内的p95耗时和错误率，超出SLO时熔断该档位，改用更快的档位
+- 熔断冷却结束后放行一次探测请求，探测正常则恢复；探测请求超过冷却时间仍未上报结果（如命中缓存、调用方异常）时放行下一次探测
+"""
+import logging
+import threading
+import time
+from collections import deque
+from typing import Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 熔断器状态
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class _TierState:
+    """单个模型档位的滑动窗口统计和熔断状态"""
+
+    def __init__(self, model: str, window_size: int):
+        self.model = model
+        # (耗时秒, 是否成功)
+        self.samples = deque(maxlen=window_size)
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.probing = False
+        self.probe_started_at = 0.0
+        self.requests = 0
+        self.trips = 0
+
+    def p95(self) -> float:
+        latencies = sorted(latency for latency, _ in self.samples)
+        if not latencies:
+            return 0.0
+        return latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+
+    def error_rate(self) -> float:
+        if not self.samples:
+            return 0.0
+        return sum(1 for _, ok in self.samples if not ok) / len(self.samples)
+
+
+class ModelRouter:
+    """模型档位路由与熔断"""
+
+    def __init__(self, tiers: List[str], short_chars: int = 200, long_chars: int = 2000,
+                 slo_p95_ms: float = 8000, max_error_rate: float = 0.2, window_size: int = 50,
+                 min_samples: int = 10, cooldown: float = 60):
+        """
+        :param tiers: 模型档位，从快到强排列，如 ["qwen-turbo", "qwen-plus", "qwen-max"]
+        :param short_chars: 不超过该长度的普通消息使用最快档位
+        :param long_chars: 超过该长度的文本（以及所有聊天记录）使用最强档位，其余使用中间档位
+        :param slo_p95_ms: p95耗时上限（毫秒），超出时熔断
+        :param max_error_rate: 错误率上限，超出时熔断
+        :param window_size: 每个档位保留最近多少次调用
+        :param min_samples: 样本数达到该值后才判断是否熔断
+        :param cooldown: 熔断后多少秒放行探测请求
+        """
+        if not tiers:
+            raise ValueError("至少需要一个模型档位")
+        self.tiers = [_TierState(model, window_size) for model in tiers]
+        self._by_model = {tier.model: tier for tier in self.tiers}
+        self.short_chars = short_chars
+        self.long_chars = long_chars
+        self.slo_p95 = slo_p95_ms / 1000
+        self.max_error_rate = max_error_rate
+        self.min_samples = min_samples
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._failovers = 0
+
+    def preferred_index(self, text_content: str, is_chat_record: bool) -> int:
+        """按输入选择的档位（不考虑熔断）"""
+        length = len(text_content or '')
+        if is_chat_record or length > self.long_chars:
+            return len(self.tiers) - 1
+        if length <= self.short_chars:
+            return 0
+        return min(1, len(self.tiers) - 1)
+
+    def choose(self, text_content: str, is_chat_record: bool = False) -> str:
+        """选择本次调用的模型：首选档位熔断时依次降级到更快的档位，全部熔断时仍使用首选档位"""
+        preferred = self.preferred_index(text_content, is_chat_record)
+        now = time.time()
+        with self._lock:
+            for index in range(preferred, -1, -1):
+                tier = self.tiers[index]
+                if self._available(tier, now):
+                    tier.requests += 1
+                    if index != preferred:
+                        self._failovers += 1
+                    return tier.model
+            tier = self.tiers[preferred]
+            tier.requests += 1
+            return tier.model
+
+    def _available(self, tier: _TierState, now: float) -> bool:
+        """档位是否可用（调用方持有self._lock）；冷却结束的熔断档位放行一次探测"""
+        if tier.state == CLOSED:
+            return True
+        if tier.state == OPEN and now - tier.opened_at >= self.cooldown:
+            tier.state = HALF_OPEN
+            tier.probing = False
+        if tier.state == HALF_OPEN and tier.probing and now - tier.probe_started_at >= self.cooldown:
+            # 探测请求一直没有上报结果，放弃等待，避免档位一直停在半开状态
+            logger.warning(f"⚠️ 模型 {tier.model} 的探测请求 {self.cooldown:.0f} 秒未上报结果，重新探测")
+            tier.probing = False
+        if tier.state == HALF_OPEN and not tier.probing:
+            tier.probing = True
+            tier.probe_started_at = now
+            return True
+        return False
+
+    def record(self, model: str, latency: float, ok: bool):
+        """记录一次调用结果，更新熔断状态"""
+        tier = self._by_model.get(model)
+        if tier is None:
+            return
+        with self._lock:
+            if tier.state == HALF_OPEN:
+                if ok and latency <= self.slo_p95:
+                    tier.state = CLOSED
+                    tier.samples.clear()
+                    logger.info(f"✅ 模型 {model} 探测正常，恢复使用")
+                else:
+                    self._trip(tier, f"探测失败（耗时{latency:.1f}秒, 成功={ok}）")
+                tier.probing = False
+                return
+
+            tier.samples.append((latency, ok))
+            if tier.state != CLOSED or len(tier.samples) < self.min_samples:
+                return
+            p95, error_rate = tier.p95(), tier.error_rate()
+            if p95 > self.slo_p95 or error_rate > self.max_error_rate:
+                self._trip(tier, f"p95={p95 * 1000:.0f}ms, 错误率={error_rate:.0%}")
+
+    def _trip(self, tier: _TierState, reason: str):
+        """熔断档位（调用方持有self._lock）"""
+        tier.state = OPEN
+        tier.opened_at = time.time()
+        tier.trips += 1
+        logger.warning(f"⚡ 模型 {tier.model} 超出SLO已熔断 {self.cooldown:.0f} 秒: {reason}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取各档位状态"""
+        with self._lock:
+            return {
+                'slo_p95_ms': int(self.slo_p95 * 1000),
+                'max_error_rate': self.max_error_rate,
+                'failovers': self._failovers,
+                'tiers': [
+                    {
+                        'model': tier.model,
+                        'state': tier.state,
+                        'requests': tier.requests,
+                        'samples': len(tier.samples),
+                        'p95_ms': round(tier.p95() * 1000, 1),
+                        'error_rate': round(tier.error_rate(), 4),
+                        'trips': tier.trips
+                    }
+                    for tier in self.tiers
+                ]
+            }
+
+
+def create_model_router(config) -> Optional[ModelRouter]:
+    """按配置创建路由器，未开启时返回None（固定使用PROFILE_MODEL）"""
+    if not config.llm_router_enabled:
+        return None
+    tiers = [model.strip() for model in config.llm_router_tiers.split(',') if model.strip()]
+    return ModelRouter(
+        tiers,
+        short_chars=config.llm_router_short_chars,
+        long_chars=config.llm_router_long_chars,
+        slo_p95_ms=config.llm_router_slo_p95_ms,
+        max_error_rate=config.llm_router_max_error_rate,
+        cooldown=config.llm_router_cooldown
+    )
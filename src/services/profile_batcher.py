@@ -0,0 +1,160 @@
+# profile_batcher.py
+"""
+用户画像提取的微批处理
+短消息（一句话的自我介绍、补充信息等）单独调用大模型时，系统提示词和字段说明占了大部分token，
+在一个时间窗口内收集多条短消息合并为一次请求，模型按消息编号返回结果后再拆分给各自的调用方
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class _PendingItem:
+    """等待批处理的一条消息"""
+    __slots__ = ('text', 'model', 'deadline', 'event', 'result')
+
+    def __init__(self, text: str, model: Optional[str], deadline: float):
+        self.text = text
+        self.model = model
+        # 调用方等待结果的截止时间（time.monotonic），从提交时开始计算
+        self.deadline = deadline
+        self.event = threading.Event()
+        self.result: Optional[Dict[str, Any]] = None
+
+
+class ProfileBatcher:
+    """短消息画像提取批处理器"""
+
+    def __init__(self, extractor, window_ms: float = 300, max_items: int = 8, max_chars: int = 500,
+                 max_workers: int = 4):
+        """
+        :param extractor: UserProfileExtractor，提供extract_batch和_extract_single
+        :param window_ms: 收集窗口（毫秒），从第一条消息入队开始计时
+        :param max_items: 每批最多消息数，凑满立即发送
+        :param max_chars: 参与批处理的消息最大长度，更长的消息单独调用
+        :param max_workers: 同时执行的批量请求数，与大模型并发上限一致
+        """
+        self.extractor = extractor
+        self.window = window_ms / 1000
+        self.max_items = max(1, max_items)
+        self.max_chars = max_chars
+
+        self._pending: List[_PendingItem] = []
+        self._window_started_at = 0.0
+        self._cond = threading.Condition()
+        self._flusher: Optional[threading.Thread] = None
+        # 批量请求在线程池中执行，收集下一批不必等待上一批返回
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="profile-batch")
+
+        # 运行统计
+        self._batches = 0
+        self._batched_items = 0
+        self._single_items = 0
+        self._fallbacks = 0
+
+    def accepts(self, text_content: str, is_chat_record: bool) -> bool:
+        """聊天记录和长消息不参与批处理"""
+        return not is_chat_record and len(text_content or '') <= self.max_chars
+
+    def submit(self, text_content: str, model: str = None) -> Dict[str, Any]:
+        """放入当前批次并等待结果（阻塞调用方线程），model为调用方确定的模型"""
+        # 留出窗口和一次模型调用的时间，从提交时开始计时，超时后单独调用
+        item = _PendingItem(text_content, model, time.monotonic() + self.window + self.extractor.timeout + 5)
+        with self._cond:
+            self._ensure_flusher()
+            if not self._pending:
+                self._window_started_at = time.monotonic()
+            self._pending.append(item)
+            self._cond.notify()
+
+        if not item.event.wait(max(0.0, item.deadline - time.monotonic())):
+            logger.warning("⚠️ 批处理结果等待超时，改为单独调用")
+            with self._cond:
+                self._fallbacks += 1
+            return self.extractor._extract_single(text_content, False, model=model)
+        return item.result
+
+    def _ensure_flusher(self):
+        """启动收集线程（调用方持有self._cond）"""
+        if self._flusher is None or not self._flusher.is_alive():
+            self._flusher = threading.Thread(target=self._flush_loop, name="profile-batcher", daemon=True)
+            self._flusher.start()
+
+    def _flush_loop(self):
+        """窗口到期或凑满max_items时取出一批交给线程池"""
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                while len(self._pending) < self.max_items:
+                    remaining = self._window_started_at + self.window - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = self._pending[:self.max_items]
+                self._pending = self._pending[self.max_items:]
+                if self._pending:
+                    # 剩余消息开始新的窗口
+                    self._window_started_at = time.monotonic()
+            # 同一批中模型不同的消息分开请求
+            groups: Dict[Optional[str], List[_PendingItem]] = {}
+            for item in batch:
+                groups.setdefault(item.model, []).append(item)
+            for model, items in groups.items():
+                self._executor.submit(self._run_batch, model, items)
+
+    def _run_batch(self, model: Optional[str], batch: List[_PendingItem]):
+        """同一模型的一批消息合并为一次请求，模型漏掉的消息单独重试"""
+        # 在线程池中排队期间调用方可能已超时并改为单独调用，这些消息不再发送，避免重复调用大模型
+        batch = [item for item in batch if item.deadline > time.monotonic()]
+        if not batch:
+            return
+        try:
+            if len(batch) == 1:
+                with self._cond:
+                    self._single_items += 1
+                batch[0].result = self.extractor._extract_single(batch[0].text, False, model=model)
+                return
+
+            results = self.extractor.extract_batch([item.text for item in batch], model)
+            missing = [item for item, result in zip(batch, results) if result is None]
+            for item, result in zip(batch, results):
+                if result is not None:
+                    item.result = result
+                    item.event.set()
+            with self._cond:
+                self._batches += 1
+                self._batched_items += len(batch)
+                self._fallbacks += len(missing)
+            if missing:
+                logger.warning(f"⚠️ 批量结果缺少 {len(missing)}/{len(batch)} 条，改为单独调用")
+            for item in missing:
+                item.result = self.extractor._extract_single(item.text, False, model=model)
+                item.event.set()
+        except Exception as e:
+            logger.error(f"批处理执行失败: {e}", exc_info=True)
+            for item in batch:
+                if item.result is None:
+                    item.result = self.extractor._error_result("处理失败", str(e))
+        finally:
+            for item in batch:
+                item.event.set()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取批处理统计"""
+        with self._cond:
+            return {
+                'window_ms': int(self.window * 1000),
+                'max_items': self.max_items,
+                'max_chars': self.max_chars,
+                'pending': len(self._pending),
+                'batches': self._batches,
+                'batched_items': self._batched_items,
+                'avg_batch_size': round(self._batched_items / self._batches, 2) if self._batches else 0.0,
+                'single_items': self._single_items,
+                'fallbacks': self._fallbacks
+            }
@@ -0,0 +1,171 @@
+# token_manager.py
+"""
+access_token管理器
+- 单飞刷新：并发调用方只触发一次gettoken请求
+- 提前续期：后台线程在过期前主动刷新，热路径上不再等待gettoken
+- 跨进程共享：token保存在SQLite中，多个worker进程共用；刷新锁保证同一时间只有一个进程刷新
+"""
+import logging
+import os
+import random
+import socket
+import threading
+import time
+from typing import Callable, Optional, Tuple, Dict, Any
+
+logger = logging.getLogger(__name__)
+
+# access_token无效或已过期的错误码，遇到时作废token并重试一次
+INVALID_TOKEN_ERRCODES = (40014, 42001)
+
+
+class AccessTokenManager:
+    """access_token管理器"""
+
+    def __init__(self, name: str, fetch_func: Callable[[], Tuple[str, int]], store=None,
+                 refresh_margin: float = 300, expiry_margin: float = 60, wait_timeout: float = 10):
+        """
+        :param name: token在共享存储中的名称
+        :param fetch_func: 调用gettoken的函数，返回 (access_token, expires_in)
+        :param store: 共享存储（TokenStoreDatabase），为None时只在进程内缓存
+        :param refresh_margin: 后台线程在过期前多少秒开始续期
+        :param expiry_margin: 距过期不足多少秒时视为无效，调用方需同步刷新
+        :param wait_timeout: 其他进程正在刷新时最多等待的秒数
+        """
+        self.name = name
+        self.fetch_func = fetch_func
+        self.store = store
+        self.refresh_margin = refresh_margin
+        self.expiry_margin = expiry_margin
+        self.wait_timeout = wait_timeout
+        self.owner_id = f"{socket.gethostname()}:{os.getpid()}"
+
+        self._token: Optional[str] = None
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._refresher: Optional[threading.Thread] = None
+
+        # 运行统计
+        self._fetches = 0
+        self._store_hits = 0
+        self._invalidations = 0
+        self._errors = 0
+
+    def _is_fresh(self, expires_at: float) -> bool:
+        return time.time() < expires_at - self.expiry_margin
+
+    def peek(self) -> Optional[str]:
+        """不加锁读取本地缓存，未缓存或即将过期返回None"""
+        token, expires_at = self._token, self._expires_at
+        return token if token and self._is_fresh(expires_at) else None
+
+    def get_token(self) -> str:
+        """获取有效的access_token，必要时刷新"""
+        token = self.peek()
+        if token:
+            return token
+
+        with self._lock:
+            token = self.peek()
+            if token:
+                return token
+            return self._refresh_locked()
+
+    def invalidate(self, token: str):
+        """作废指定token（接口返回40014/42001时调用）"""
+        with self._lock:
+            if self._token == token:
+                self._token = None
+                self._expires_at = 0
+            self._invalidations += 1
+        if self.store:
+            self.store.invalidate_token(self.name, token)
+        logger.warning("⚠️ access_token已失效，已作废并将重新获取")
+
+    def _load_from_store(self) -> Optional[str]:
+        """从共享存储读取其他进程刷新的token"""
+        if not self.store:
+            return None
+        token, expires_at = self.store.get_token(self.name)
+        if token and token != self._token and self._is_fresh(expires_at):
+            self._token, self._expires_at = token, expires_at
+            self._store_hits += 1
+            return token
+        return None
+
+    def _refresh_locked(self) -> str:
+        """刷新token（调用方持有self._lock），共享存储中已有更新的token时直接使用"""
+        if self.store:
+            token, expires_at = self.store.get_token(self.name)
+            if token and expires_at > self._expires_at and self._is_fresh(expires_at):
+                self._token, self._expires_at = token, expires_at
+                self._store_hits += 1
+                return token
+
+        if self.store and not self.store.claim_refresh(self.name, self.owner_id, self.wait_timeout):
+            # 其他进程正在刷新，等待其写入共享存储
+            deadline = time.time() + self.wait_timeout
+            while time.time() < deadline:
+                time.sleep(0.2)
+                token = self._load_from_store()
+                if token:
+                    return token
+            logger.warning("等待其他进程刷新access_token超时，本进程自行刷新")
+
+        try:
+            token, expires_in = self.fetch_func()
+        except Exception:
+            self._errors += 1
+            if self.store:
+                self.store.release_refresh(self.name, self.owner_id)
+            raise
+
+        self._fetches += 1
+        self._token = token
+        self._expires_at = time.time() + expires_in
+        if self.store:
+            self.store.save_token(self.name, token, self._expires_at)
+        logger.info(f"🔑 access_token已刷新，有效期 {expires_in} 秒")
+        return token
+
+    def start(self):
+        """启动后台续期线程"""
+        if self._refresher and self._refresher.is_alive():
+            return
+        self._stop.clear()
+        self._refresher = threading.Thread(target=self._refresh_loop, name="wework-token-refresher", daemon=True)
+        self._refresher.start()
+
+    def stop(self):
+        """停止后台续期线程"""
+        self._stop.set()
+        if self._refresher:
+            self._refresher.join(5)
+            self._refresher = None
+
+    def _refresh_loop(self):
+        """进入续期窗口后主动刷新；多个进程随机错开唤醒时间，先到者刷新，其余从共享存储读取"""
+        while not self._stop.is_set():
+            try:
+                with self._lock:
+                    if time.time() >= self._expires_at - self.refresh_margin:
+                        self._refresh_locked()
+                    remaining = self._expires_at - self.refresh_margin - time.time()
+                delay = max(1.0, remaining + random.uniform(0, 30))
+            except Exception as e:
+                logger.error(f"后台刷新access_token失败: {e}")
+                delay = 30.0
+            self._stop.wait(delay)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取token管理统计"""
+        return {
+            'shared_store': bool(self.store),
+            'expires_in': max(0, int(self._expires_at - time.time())) if self._token else 0,
+            'background_refresh': bool(self._refresher and self._refresher.is_alive()),
+            'fetches': self._fetches,
+            'store_hits': self._store_hits,
+            'invalidations': self._invalidations,
+            'errors': self._errors
+        }
@@ -10,6 +10,7 @@ from typing import List, Dict, Tuple, Optional
 import aiohttp
 import asyncio
 from dotenv import load_dotenv
+from ..utils.adaptive_limiter import dashscope_limiter
 
 load_dotenv()
 
@@ -64,21 +65,24 @@ class VectorService:
             if not self.session:
                 self.session = aiohttp.ClientSession()
                 
-            async with self.session.post(
-                f"{self.api_endpoint}/embeddings",
-                headers=headers,
-                json=data
-            ) as response:
-                if response.status == 200:
-                    result = await response.json()
-                    # 提取向量
-                    if result.get('data') and len(result['data']) > 0:
-                        embedding = result['data'][0].get('embedding')
-                        return embedding
-                else:
-                    error_text = await response.text()
-                    print(f"向量化API错误: {response.status} - {error_text}")
-                    return None
+            # 与画像提取共用DashScope并发窗口
+            async with dashscope_limiter.async_slot() as call:
+                async with self.session.post(
+                    f"{self.api_endpoint}/embeddings",
+                    headers=headers,
+                    json=data
+                ) as response:
+                    if response.status == 200:
+                        result = await response.json()
+                        # 提取向量
+                        if result.get('data') and len(result['data']) > 0:
+                            embedding = result['data'][0].get('embedding')
+                            return embedding
+                    else:
+                        call.report_status(response.status)
+                        error_text = await response.text()
+                        print(f"向量化API错误: {response.status} - {error_text}")
+                        return None
                     
         except Exception as e:
             print(f"获取向量时出错: {e}")
@@ -4,39 +4,73 @@ import base64
 import time
 import requests
 import json
+from requests.adapters import HTTPAdapter
 from Crypto.Cipher import AES
 from Crypto.Util.Padding import unpad
 from ..config.config import config
+from ..database.sync_state_db import sync_state_db
+from ..database.token_store_db import token_store_db
+from .token_manager import AccessTokenManager, INVALID_TOKEN_ERRCODES
+
+WEWORK_API_BASE = 'https://qyapi.weixin.qq.com/cgi-bin'
 
 class WeWorkClient:
-    def __init__(self, config):
+    def __init__(self, config, cursor_store=None, token_store=None):
         self.config = config
-        self._access_token = None
-        self._token_expires_at = 0
-        # 用于存储不同客服账号的消息游标
+        # 用于存储不同客服账号的消息游标（内存缓存）
         self._kf_cursors = {}
+        # 游标持久化存储（SyncStateDatabase），重启后从上次位置继续拉取
+        self._cursor_store = cursor_store
+        # 复用长连接，避免每次请求都重新进行TCP+TLS握手
+        self.timeout = (config.wework_connect_timeout, config.wework_read_timeout)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=config.wework_pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        # access_token由管理器统一刷新，token_store不为空时多个worker进程共用
+        secret_digest = hashlib.sha1((config.secret or '').encode()).hexdigest()[:8]
+        self.token_manager = AccessTokenManager(
+            f"wework:{config.corp_id}:{secret_digest}",
+            self._fetch_access_token,
+            store=token_store,
+            refresh_margin=config.wework_token_refresh_margin
+        )
     
     def get_access_token(self):
         """获取access_token"""
-        if self._access_token and time.time() < self._token_expires_at:
-            return self._access_token
-        
-        url = 'https://qyapi.weixin.qq.com/cgi-bin/gettoken'
+        return self.token_manager.get_token()
+    
+    def _fetch_access_token(self):
+        """调用gettoken接口，返回 (access_token, expires_in)"""
+        url = f'{WEWORK_API_BASE}/gettoken'
         params = {
             'corpid': self.config.corp_id,
             'corpsecret': self.config.secret
         }
         
-        response = requests.get(url, params=params)
+        response = self.session.get(url, params=params, timeout=self.timeout)
         data = response.json()
         
         if data.get('errcode') == 0:
-            self._access_token = data['access_token']
-            self._token_expires_at = time.time() + data.get('expires_in', 7200) - 300
-            return self._access_token
+            return data['access_token'], data.get('expires_in', 7200)
         
         raise Exception(f"获取token失败: {data.get('errmsg')}")
     
+    def _post_api(self, path, payload):
+        """调用需要access_token的POST接口，token失效（40014/42001）时作废并重试一次"""
+        for attempt in range(2):
+            access_token = self.get_access_token()
+            response = self.session.post(
+                f"{WEWORK_API_BASE}/{path}?access_token={access_token}",
+                json=payload,
+                timeout=self.timeout
+            )
+            result = response.json()
+            if result.get('errcode') in INVALID_TOKEN_ERRCODES and attempt == 0:
+                self.token_manager.invalidate(access_token)
+                continue
+            return result
+    
     def verify_signature(self, signature, timestamp, nonce, encrypt_msg=None):
         """验证签名"""
         import logging
@@ -129,6 +163,118 @@ class WeWorkClient:
             logger.error(f"解密过程出错: {e}", exc_info=True)
             raise Exception(f"消息解密失败: {e}")
 
+    def _get_kf_cursor(self, cursor_key):
+        """获取游标，内存中没有时从持久化存储加载"""
+        if cursor_key not in self._kf_cursors and self._cursor_store:
+            stored_cursor = self._cursor_store.get_cursor(cursor_key)
+            if stored_cursor:
+                self._kf_cursors[cursor_key] = stored_cursor
+        return self._kf_cursors.get(cursor_key, "")
+
+    def reload_kf_cursor(self, open_kf_id=None):
+        """丢弃内存中的游标，下次拉取时从持久化存储重新加载（其他进程可能已推进游标）"""
+        if self._cursor_store:
+            self._kf_cursors.pop(open_kf_id or "default", None)
+
+    def has_kf_cursor(self, open_kf_id=None):
+        """是否已有该客服账号的同步游标（没有游标时sync_msg会从头拉取历史消息）"""
+        return bool(self._get_kf_cursor(open_kf_id or "default"))
+
+    def commit_kf_page(self, open_kf_id, next_cursor, processed=None):
+        """
+        推进游标：在同一个事务中持久化游标和本页已处理的消息标记
+        
+        Args:
+            open_kf_id: 客服账号ID
+            next_cursor: 下一页游标
+            processed: 本页已处理的消息 [(msgid, send_time), ...]
+        """
+        cursor_key = open_kf_id or "default"
+        if self._cursor_store:
+            if not self._cursor_store.commit_page(cursor_key, next_cursor, processed or []):
+                raise Exception("保存同步游标失败")
+        if next_cursor:
+            self._kf_cursors[cursor_key] = next_cursor
+
+    def iter_kf_message_pages(self, token=None, open_kf_id=None, limit=1000, auto_commit=True):
+        """
+        逐页拉取微信客服消息（生成器），每拉到一页立即返回
+        
+        调用方处理完当前页并请求下一页时才推进游标；处理过程中抛出异常或中途停止迭代，
+        游标停留在当前页之前，下次同步会重新拉取该页
+        
+        Args:
+            token: 回调事件返回的token
+            open_kf_id: 客服账号ID
+            limit: 每页拉取的消息数量，默认1000（最大值）
+            auto_commit: 是否在请求下一页时自动保存游标；为False时由调用方通过commit_kf_page
+                         把游标和已处理消息标记一起提交
+            
+        Yields:
+            dict: {"msg_list": 本页消息, "next_cursor": 下一页游标, "has_more": 是否还有更多}
+        """
+        import logging
+        logger = logging.getLogger(__name__)
+        
+        cursor_key = open_kf_id or "default"
+        current_cursor = self._get_kf_cursor(cursor_key)
+        
+        while True:
+            # 构造请求参数
+            payload = {
+                "token": token,
+                "limit": limit
+            }
+            
+            if open_kf_id:
+                payload["open_kfid"] = open_kf_id
+                
+            if current_cursor:
+                payload["cursor"] = current_cursor
+                logger.info(f"📍 使用cursor拉取: {current_cursor}")
+            else:
+                logger.info("📍 首次拉取，不使用cursor")
+            
+            logger.info("🔗 调用sync_msg接口")
+            logger.info(f"📋 请求参数: {payload}")
+            
+            # 发送POST请求
+            result = self._post_api("kf/sync_msg", payload)
+            
+            # 检查是否有错误
+            if result.get("errcode") != 0:
+                raise Exception(f"sync_msg接口调用失败: {result.get('errmsg')}")
+            
+            # 获取返回数据
+            msg_list = result.get("msg_list", [])
+            has_more = result.get("has_more", 0)
+            next_cursor = result.get("next_cursor", "")
+            
+            logger.info(f"✅ 本次获取消息: 消息数={len(msg_list)}, has_more={has_more}")
+            
+            yield {
+                "msg_list": msg_list,
+                "next_cursor": next_cursor,
+                "has_more": has_more
+            }
+            
+            # 调用方已处理完本页，更新cursor
+            if next_cursor:
+                current_cursor = next_cursor
+                if auto_commit:
+                    self.commit_kf_page(open_kf_id, next_cursor)
+                logger.info(f"📱 更新cursor: {next_cursor}")
+            
+            # 如果没有更多消息，退出循环
+            if has_more == 0:
+                logger.info("📭 已拉取完所有消息")
+                break
+                
+            # 如果本次没有返回消息但has_more=1，也退出避免死循环
+            if not msg_list and has_more == 1:
+                logger.warning("⚠️ has_more=1但msg_list为空，退出循环")
+                break
+
     def sync_kf_messages(self, token=None, open_kf_id=None, limit=1000, get_latest_only=True):
         """
         同步微信客服消息 - 拉取所有消息然后返回最新的
@@ -145,73 +291,10 @@ class WeWorkClient:
         logger.info(f"🔍 sync_kf_messages被调用，参数: limit={limit}, get_latest_only={get_latest_only}")
         
         try:
-            # 获取access_token
-            access_token = self.get_access_token()
-            if not access_token:
-                raise Exception("无法获取access_token")
-            
-            # 构造请求URL
-            url = f"https://qyapi.weixin.qq.com/cgi-bin/kf/sync_msg?access_token={access_token}"
-            
-            cursor_key = open_kf_id or "default"
-            all_messages = []
-            
             # 循环拉取所有消息，直到has_more=0
-            current_cursor = self._kf_cursors.get(cursor_key, "")
-            
-            while True:
-                # 构造请求参数
-                payload = {
-                    "token": token,
-                    "limit": limit
-                }
-                
-                if open_kf_id:
-                    payload["open_kfid"] = open_kf_id
-                    
-                if current_cursor:
-                    payload["cursor"] = current_cursor
-                    logger.info(f"📍 使用cursor拉取: {current_cursor}")
-                else:
-                    logger.info("📍 首次拉取，不使用cursor")
-                
-                logger.info(f"🔗 调用sync_msg接口: {url}")
-                logger.info(f"📋 请求参数: {payload}")
-                
-                # 发送POST请求
-                response = requests.post(url, json=payload)
-                result = response.json()
-                
-                # 检查是否有错误
-                if result.get("errcode") != 0:
-                    raise Exception(f"sync_msg接口调用失败: {result.get('errmsg')}")
-                
-                # 获取返回数据
-                msg_list = result.get("msg_list", [])
-                has_more = result.get("has_more", 0)
-                next_cursor = result.get("next_cursor", "")
-                
-                logger.info(f"✅ 本次获取消息: 消息数={len(msg_list)}, has_more={has_more}")
-                
-                # 添加到总消息列表
-                if msg_list:
-                    all_messages.extend(msg_list)
-                
-                # 更新cursor
-                if next_cursor:
-                    current_cursor = next_cursor
-                    self._kf_cursors[cursor_key] = next_cursor
-                    logger.info(f"📱 更新cursor: {next_cursor}")
-                
-                # 如果没有更多消息，退出循环
-                if has_more == 0:
-                    logger.info("📭 已拉取完所有消息")
-                    break
-                    
-                # 如果本次没有返回消息但has_more=1，也退出避免死循环
-                if not msg_list and has_more == 1:
-                    logger.warning("⚠️ has_more=1但msg_list为空，退出循环")
-                    break
+            all_messages = []
+            for page in self.iter_kf_message_pages(token=token, open_kf_id=open_kf_id, limit=limit):
+                all_messages.extend(page["msg_list"])
             
             logger.info(f"🎉 总共拉取到 {len(all_messages)} 条消息")
             
@@ -287,20 +370,16 @@ class WeWorkClient:
             logger.error(f"消息转换失败: {e}", exc_info=True)
             return None
     
+    def send_kf_message(self, payload):
+        """调用kf/send_msg接口，返回接口原始结果（不检查errcode，由调用方决定是否重试）"""
+        return self._post_api("kf/send_msg", payload)
+    
     def send_text_message(self, external_userid, open_kfid, content):
         """发送文本消息到微信客服用户"""
         import logging
         logger = logging.getLogger(__name__)
         
         try:
-            # 获取access_token
-            access_token = self.get_access_token()
-            if not access_token:
-                raise Exception("无法获取access_token")
-            
-            # 构造请求URL
-            url = f"https://qyapi.weixin.qq.com/cgi-bin/kf/send_msg?access_token={access_token}"
-            
             # 构造请求参数
             payload = {
                 "touser": external_userid,
@@ -311,12 +390,11 @@ class WeWorkClient:
                 }
             }
                         
-            logger.info(f"发送文本消息: {url}")
+            logger.info("发送文本消息")
             logger.info(f"请求参数: {payload}")
             
             # 发送POST请求
-            response = requests.post(url, json=payload)
-            result = response.json()
+            result = self.send_kf_message(payload)
             
             logger.info(f"发送消息接口返回: {result}")
             
@@ -333,4 +411,8 @@ class WeWorkClient:
    
             
 
-wework_client = WeWorkClient(config)
\ No newline at end of file
+wework_client = WeWorkClient(
+    config,
+    cursor_store=sync_state_db,
+    token_store=token_store_db if config.wework_token_store == 'sqlite' else None
+)
\ No newline at end of file
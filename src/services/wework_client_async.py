@@ -0,0 +1,154 @@
+# wework_client_async.py
+"""
+企业微信API异步客户端
+基于aiohttp的共享长连接池，限制到qyapi.weixin.qq.com的并发连接数并设置明确的超时，
+在事件循环中调用时不会阻塞；access_token和消息游标与同步客户端wework_client共用
+"""
+import asyncio
+import logging
+from typing import Dict, Any, List, Optional, AsyncIterator
+
+import aiohttp
+
+from ..config.config import config
+from .wework_client import wework_client, WEWORK_API_BASE
+from .token_manager import INVALID_TOKEN_ERRCODES
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncWeWorkClient:
+    """企业微信API异步客户端"""
+
+    def __init__(self, config, sync_client):
+        """
+        :param config: WeWorkConfig配置
+        :param sync_client: 同步客户端，共用其access_token管理器和游标存储
+        """
+        self.config = config
+        self.sync_client = sync_client
+        self.timeout = aiohttp.ClientTimeout(
+            total=config.wework_connect_timeout + config.wework_read_timeout,
+            connect=config.wework_connect_timeout
+        )
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """获取共享会话（首次使用时在当前事件循环中创建）"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.config.wework_pool_size,
+                limit_per_host=self.config.wework_pool_size,
+                keepalive_timeout=60
+            )
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+        return self._session
+
+    async def close(self):
+        """关闭连接池"""
+        if self._session and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def _request(self, method: str, path: str, **kwargs) -> Dict[str, Any]:
+        session = self._get_session()
+        async with session.request(method, f"{WEWORK_API_BASE}/{path}", **kwargs) as response:
+            return await response.json(content_type=None)
+
+    async def get_access_token(self) -> str:
+        """获取access_token（与同步客户端共用管理器，需要刷新时在线程中执行，不阻塞事件循环）"""
+        token_manager = self.sync_client.token_manager
+        return token_manager.peek() or await asyncio.to_thread(token_manager.get_token)
+
+    async def _post_api(self, path: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """调用需要access_token的POST接口，token失效（40014/42001）时作废并重试一次"""
+        for attempt in range(2):
+            access_token = await self.get_access_token()
+            result = await self._request('POST', path, params={'access_token': access_token}, json=payload)
+            if result.get('errcode') in INVALID_TOKEN_ERRCODES and attempt == 0:
+                await asyncio.to_thread(self.sync_client.token_manager.invalidate, access_token)
+                continue
+            return result
+
+    async def iter_kf_message_pages(self, token=None, open_kf_id=None, limit=1000,
+                                    auto_commit=True) -> AsyncIterator[Dict[str, Any]]:
+        """
+        逐页拉取微信客服消息（异步生成器），游标推进规则与同步客户端的iter_kf_message_pages一致
+        """
+        cursor_key = open_kf_id or "default"
+        current_cursor = self.sync_client._get_kf_cursor(cursor_key)
+
+        while True:
+            payload = {"token": token, "limit": limit}
+            if open_kf_id:
+                payload["open_kfid"] = open_kf_id
+            if current_cursor:
+                payload["cursor"] = current_cursor
+
+            result = await self._post_api('kf/sync_msg', payload)
+            if result.get("errcode") != 0:
+                raise Exception(f"sync_msg接口调用失败: {result.get('errmsg')}")
+
+            msg_list = result.get("msg_list", [])
+            has_more = result.get("has_more", 0)
+            next_cursor = result.get("next_cursor", "")
+            logger.info(f"✅ 本次获取消息: 消息数={len(msg_list)}, has_more={has_more}")
+
+            yield {
+                "msg_list": msg_list,
+                "next_cursor": next_cursor,
+                "has_more": has_more
+            }
+
+            if next_cursor:
+                current_cursor = next_cursor
+                if auto_commit:
+                    await asyncio.to_thread(self.sync_client.commit_kf_page, open_kf_id, next_cursor)
+
+            if has_more == 0:
+                break
+            if not msg_list and has_more == 1:
+                logger.warning("⚠️ has_more=1但msg_list为空，退出循环")
+                break
+
+    async def sync_kf_messages(self, token=None, open_kf_id=None, limit=1000,
+                               get_latest_only=True) -> List[Dict[str, Any]]:
+        """同步微信客服消息，参数和返回值与同步客户端一致"""
+        try:
+            all_messages = []
+            async for page in self.iter_kf_message_pages(token=token, open_kf_id=open_kf_id, limit=limit):
+                all_messages.extend(page["msg_list"])
+
+            if not all_messages:
+                return []
+            if get_latest_only:
+                all_messages.sort(key=lambda x: x.get('send_time', 0), reverse=True)
+                return [all_messages[0]]
+            return all_messages
+        except Exception as e:
+            logger.error(f"sync_kf_messages处理失败: {e}", exc_info=True)
+            raise Exception(f"同步微信客服消息失败: {e}")
+
+    async def send_text_message(self, external_userid, open_kfid, content) -> Dict[str, Any]:
+        """发送文本消息到微信客服用户"""
+        try:
+            payload = {
+                "touser": external_userid,
+                "open_kfid": open_kfid,
+                "msgtype": "text",
+                "text": {
+                    "content": content
+                }
+            }
+            result = await self._post_api('kf/send_msg', payload)
+            logger.info(f"发送消息接口返回: {result}")
+            if result.get("errcode") != 0:
+                raise Exception(f"发送消息接口调用失败: {result.get('errmsg')}")
+            return result
+        except Exception as e:
+            logger.error(f"发送文本消息失败: {e}", exc_info=True)
+            raise Exception(f"发送文本消息失败: {e}")
+
+
+# 全局异步客户端实例
+async_wework_client = AsyncWeWorkClient(config, wework_client)
@@ -0,0 +1,260 @@
+# adaptive_limiter.py
+"""
+自适应并发限制（AIMD）
+每个上游服务（DashScope、ETL）一个限制器，同步线程和事件循环共用同一个并发窗口：
+- 调用成功且耗时正常时加性增大窗口（每个窗口的调用全部成功约+1）
+- 遇到429/5xx、超时时乘性减小窗口，且短时间内只减一次，避免同一波失败把窗口压到最小
+- 其他非200响应和业务错误不调整窗口（不算成功，不会放大窗口）
+- 超出窗口的调用按先来先得排队
+"""
+import asyncio
+import threading
+import time
+import logging
+from collections import deque
+from contextlib import contextmanager, asynccontextmanager
+from typing import Dict, Any, Optional
+
+import requests
+
+from ..config.config import config
+from .metrics import LatencyStats
+
+logger = logging.getLogger(__name__)
+
+# 视为过载信号的异常（超时）
+OVERLOAD_EXCEPTIONS = (requests.exceptions.Timeout, asyncio.TimeoutError)
+# 视为过载信号的HTTP状态码（限流和网关/服务不可用）
+OVERLOAD_STATUS = (429, 500, 502, 503, 504)
+
+
+class _Waiter:
+    """排队中的调用：同步调用等待Event，异步调用等待Future"""
+    __slots__ = ('event', 'loop', 'future', 'granted')
+
+    def __init__(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.loop = loop
+        self.future = loop.create_future() if loop else None
+        self.event = None if loop else threading.Event()
+        self.granted = False
+
+    def wake(self):
+        if self.loop:
+            self.loop.call_soon_threadsafe(self._resolve)
+        else:
+            self.event.set()
+
+    def _resolve(self):
+        if not self.future.done():
+            self.future.set_result(True)
+
+
+class _Call:
+    """一次受限调用，调用方通过overload()上报429等过载响应，或直接用report_status()上报HTTP状态码"""
+    __slots__ = ('overloaded', 'failed')
+
+    def __init__(self):
+        self.overloaded = False
+        self.failed = False
+
+    def overload(self):
+        self.overloaded = True
+
+    def fail(self):
+        """非过载类失败（如业务错误），不调整窗口"""
+        self.failed = True
+
+    def report_status(self, status_code: int):
+        """按HTTP状态码上报结果：200为成功，429/5xx为过载，其他为失败（不增大窗口）"""
+        if status_code in OVERLOAD_STATUS:
+            self.overload()
+        elif status_code != 200:
+            self.fail()
+
+
+class AdaptiveLimiter:
+    """AIMD自适应并发限制器"""
+
+    def __init__(self, name: str, initial_limit: int = 4, min_limit: int = 1, max_limit: int = 16,
+                 latency_target: float = 20.0, decrease_factor: float = 0.5, decrease_interval: float = 1.0):
+        """
+        :param name: 上游服务名称
+        :param initial_limit: 初始并发窗口
+        :param min_limit: 窗口下限
+        :param max_limit: 窗口上限
+        :param latency_target: 耗时不超过该值（秒）的成功调用才会增大窗口
+        :param decrease_factor: 过载时窗口乘以该系数
+        :param decrease_interval: 两次减小窗口的最小间隔（秒）
+        """
+        self.name = name
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.latency_target = latency_target
+        self.decrease_factor = decrease_factor
+        self.decrease_interval = decrease_interval
+
+        self._limit = float(min(self.max_limit, max(self.min_limit, initial_limit)))
+        self._in_flight = 0
+        self._waiters = deque()
+        self._lock = threading.Lock()
+        self._last_decrease = 0.0
+        self._waits = LatencyStats()
+
+        # 运行统计
+        self._calls = 0
+        self._overloads = 0
+        self._increases = 0
+        self._decreases = 0
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    def _grant_locked(self):
+        """按窗口放行排队的调用（调用方持有self._lock）"""
+        while self._waiters and self._in_flight < int(self._limit):
+            waiter = self._waiters.popleft()
+            waiter.granted = True
+            self._in_flight += 1
+            waiter.wake()
+
+    def _try_acquire_locked(self) -> bool:
+        if not self._waiters and self._in_flight < int(self._limit):
+            self._in_flight += 1
+            return True
+        return False
+
+    def acquire(self):
+        """获取调用名额（阻塞当前线程）"""
+        queued_at = time.time()
+        with self._lock:
+            if self._try_acquire_locked():
+                self._waits.record('queue_wait', 0.0)
+                return
+            waiter = _Waiter()
+            self._waiters.append(waiter)
+        waiter.event.wait()
+        self._waits.record('queue_wait', time.time() - queued_at)
+
+    async def acquire_async(self):
+        """获取调用名额（异步，不阻塞事件循环）"""
+        queued_at = time.time()
+        with self._lock:
+            if self._try_acquire_locked():
+                self._waits.record('queue_wait', 0.0)
+                return
+            waiter = _Waiter(asyncio.get_running_loop())
+            self._waiters.append(waiter)
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter.granted:
+                    # 已经分配了名额，退还给下一个调用
+                    self._in_flight -= 1
+                    self._grant_locked()
+                else:
+                    self._waiters.remove(waiter)
+            raise
+        self._waits.record('queue_wait', time.time() - queued_at)
+
+    def release(self, latency: float, overloaded: bool = False, failed: bool = False):
+        """归还名额并根据结果调整窗口"""
+        now = time.time()
+        with self._lock:
+            self._in_flight -= 1
+            self._calls += 1
+            if overloaded:
+                self._overloads += 1
+                if now - self._last_decrease >= self.decrease_interval:
+                    old_limit = self._limit
+                    self._limit = max(self.min_limit, self._limit * self.decrease_factor)
+                    self._last_decrease = now
+                    self._decreases += 1
+                    logger.warning(f"📉 {self.name} 过载，并发窗口 {old_limit:.1f} → {self._limit:.1f}")
+            elif not failed and latency <= self.latency_target and self._limit < self.max_limit:
+                self._limit = min(self.max_limit, self._limit + 1 / self._limit)
+                self._increases += 1
+            self._grant_locked()
+
+    def _finish(self, call: _Call, started_at: float, error: Optional[BaseException]):
+        if error is not None:
+            if isinstance(error, OVERLOAD_EXCEPTIONS):
+                call.overloaded = True
+            else:
+                call.failed = True
+        self.release(time.time() - started_at, call.overloaded, call.failed)
+
+    @contextmanager
+    def slot(self):
+        """
+        同步调用上下文：
+
+            with limiter.slot() as call:
+                response = requests.post(...)
+                call.report_status(response.status_code)
+        """
+        self.acquire()
+        call = _Call()
+        started_at = time.time()
+        try:
+            yield call
+        except BaseException as e:
+            self._finish(call, started_at, e)
+            raise
+        self._finish(call, started_at, None)
+
+    @asynccontextmanager
+    async def async_slot(self):
+        """异步调用上下文，用法同slot"""
+        await self.acquire_async()
+        call = _Call()
+        started_at = time.time()
+        try:
+            yield call
+        except BaseException as e:
+            self._finish(call, started_at, e)
+            raise
+        self._finish(call, started_at, None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取窗口、并发与排队状态"""
+        with self._lock:
+            stats = {
+                'limit': int(self._limit),
+                'limit_exact': round(self._limit, 2),
+                'min_limit': self.min_limit,
+                'max_limit': self.max_limit,
+                'in_flight': self._in_flight,
+                'queued': len(self._waiters),
+                'calls': self._calls,
+                'overloads': self._overloads,
+                'increases': self._increases,
+                'decreases': self._decreases
+            }
+        stats['queue_wait'] = self._waits.snapshot().get('queue_wait')
+        return stats
+
+
+# DashScope（通义千问对话、向量）共用的限制器
+dashscope_limiter = AdaptiveLimiter(
+    'dashscope',
+    initial_limit=config.dashscope_limit_initial,
+    min_limit=config.dashscope_limit_min,
+    max_limit=config.dashscope_limit_max,
+    latency_target=config.dashscope_latency_target
+)
+# ETL4LM（图片OCR、PDF解析）限制器
+etl_limiter = AdaptiveLimiter(
+    'etl',
+    initial_limit=config.etl_limit_initial,
+    min_limit=config.etl_limit_min,
+    max_limit=config.etl_limit_max,
+    latency_target=config.etl_latency_target
+)
+
+# 按上游名称索引，供 /stats/limiters 查看
+adaptive_limiters = {
+    'dashscope': dashscope_limiter,
+    'etl': etl_limiter
+}
@@ -0,0 +1,216 @@
+# dedup_store.py
+"""
+有界去重存储
+按写入时间过期（TTL）并限制最大条数，O(1)检查；可选SQLite共享模式，使多个uvicorn worker看到同一份去重记录
+"""
+import threading
+import time
+import logging
+from collections import OrderedDict
+from typing import Dict, Any
+
+from ..config.config import config
+
+logger = logging.getLogger(__name__)
+
+
+class DedupStore:
+    """去重存储 - 记录最近出现过的key，超过TTL或超出容量的旧key会被淘汰"""
+
+    def __init__(self, namespace: str, ttl_seconds: float = 3600, max_entries: int = 10000, db_instance=None):
+        """
+        :param namespace: 命名空间（如 kf_event / kf_msgid），SQLite模式下用于区分不同用途
+        :param ttl_seconds: key的有效期（秒）
+        :param max_entries: 内存中最多保留的key数量
+        :param db_instance: SQLite数据库实例，提供时启用多进程共享模式
+        """
+        self.namespace = namespace
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.db = db_instance
+        # key -> 过期时间；TTL固定，插入顺序即过期顺序（SQLite模式下以数据库为准，内存只记录本进程写入的key）
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._ops_since_purge = 0
+
+        if self.db:
+            self._create_table()
+
+    def _create_table(self):
+        try:
+            with self.db.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS dedup_keys (
+                        namespace TEXT NOT NULL,
+                        dedup_key TEXT NOT NULL,
+                        expires_at REAL NOT NULL,
+                        PRIMARY KEY (namespace, dedup_key)
+                    )
+                ''')
+                cursor.execute('CREATE INDEX IF NOT EXISTS idx_dedup_keys_expires ON dedup_keys(namespace, expires_at)')
+                conn.commit()
+        except Exception as e:
+            logger.error(f"创建去重表失败，回退到内存模式: {e}")
+            self.db = None
+
+    def _expire(self, now: float):
+        """从最旧的一端淘汰过期key"""
+        while self._entries:
+            key, expires_at = next(iter(self._entries.items()))
+            if expires_at > now:
+                break
+            self._entries.popitem(last=False)
+            self._expirations += 1
+
+    def _remember(self, key: str, now: float):
+        """写入内存（调用方持有锁）"""
+        self._entries[key] = now + self.ttl_seconds
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._evictions += 1
+
+    def check_and_add(self, key: str) -> bool:
+        """
+        检查key是否已存在，不存在则写入
+
+        Returns:
+            bool: 已存在（重复）返回True，首次出现返回False
+        """
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            if self.db:
+                exists = self._shared_check_and_add(key, now)
+            else:
+                exists = key in self._entries
+            if exists:
+                self._hits += 1
+                return True
+
+            self._remember(key, now)
+            self._misses += 1
+            return False
+
+    def contains(self, key: str) -> bool:
+        """检查key是否存在（不写入）"""
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            if self.db:
+                found = self._shared_contains(key, now)
+            else:
+                found = key in self._entries
+            if found:
+                self._hits += 1
+            else:
+                self._misses += 1
+            return found
+
+    def add(self, key: str):
+        """写入key"""
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            self._remember(key, now)
+            if self.db:
+                self._shared_check_and_add(key, now)
+
+    def discard(self, key: str):
+        """移除key（如处理失败需要允许重试时）"""
+        with self._lock:
+            self._entries.pop(key, None)
+            if self.db:
+                try:
+                    with self.db.get_connection() as conn:
+                        conn.execute(
+                            "DELETE FROM dedup_keys WHERE namespace = ? AND dedup_key = ?",
+                            (self.namespace, key)
+                        )
+                        conn.commit()
+                except Exception as e:
+                    logger.error(f"删除去重记录失败: {e}")
+
+    def _shared_check_and_add(self, key: str, now: float) -> bool:
+        """SQLite共享模式：原子地检查并写入，已存在且未过期返回True"""
+        try:
+            with self.db.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    "DELETE FROM dedup_keys WHERE namespace = ? AND dedup_key = ? AND expires_at <= ?",
+                    (self.namespace, key, now)
+                )
+                cursor.execute(
+                    "INSERT OR IGNORE INTO dedup_keys (namespace, dedup_key, expires_at) VALUES (?, ?, ?)",
+                    (self.namespace, key, now + self.ttl_seconds)
+                )
+                exists = cursor.rowcount == 0
+                self._ops_since_purge += 1
+                if self._ops_since_purge >= 1000:
+                    cursor.execute(
+                        "DELETE FROM dedup_keys WHERE namespace = ? AND expires_at <= ?",
+                        (self.namespace, now)
+                    )
+                    self._ops_since_purge = 0
+                conn.commit()
+                return exists
+        except Exception as e:
+            logger.error(f"共享去重检查失败: {e}")
+            return False
+
+    def _shared_contains(self, key: str, now: float) -> bool:
+        try:
+            with self.db.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    "SELECT 1 FROM dedup_keys WHERE namespace = ? AND dedup_key = ? AND expires_at > ?",
+                    (self.namespace, key, now)
+                )
+                return cursor.fetchone() is not None
+        except Exception as e:
+            logger.error(f"共享去重查询失败: {e}")
+            return False
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._expire(time.time())
+            return len(self._entries)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取命中、未命中、淘汰计数"""
+        with self._lock:
+            self._expire(time.time())
+            return {
+                'backend': 'sqlite' if self.db else 'memory',
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self._hits,
+                'misses': self._misses,
+                'evictions': self._evictions,
+                'expirations': self._expirations
+            }
+
+
+def create_dedup_store(namespace: str, ttl_seconds: float) -> DedupStore:
+    """根据配置创建去重存储（DEDUP_BACKEND=sqlite 时共享主数据库）"""
+    db_instance = None
+    if config.dedup_backend == 'sqlite':
+        try:
+            from ..database.database_sqlite_v2 import database_manager
+            db_instance = database_manager
+        except Exception as e:
+            logger.warning(f"SQLite去重存储不可用，使用内存模式: {e}")
+    return DedupStore(namespace, ttl_seconds=ttl_seconds, max_entries=config.dedup_max_entries, db_instance=db_instance)
+
+
+# 微信客服回调事件去重
+kf_event_dedup = create_dedup_store('kf_event', config.kf_event_dedup_ttl)
+# 微信客服消息msgid去重
+kf_msgid_dedup = create_dedup_store('kf_msgid', config.kf_msgid_dedup_ttl)
@@ -0,0 +1,246 @@
+# hedging.py
+"""
+对冲请求（hedged requests）
+幂等调用超过该上游滚动p90耗时仍未返回时，再发一个相同的请求，取先返回的结果并放弃另一个：
+- 对冲延迟取最近成功调用耗时的分位数，样本不足时不对冲
+- 调用方传入is_success判断返回值（如HTTP状态码），429/5xx等不成功的返回值不计入耗时、不算对冲胜者
+- 被对冲的函数用upstream_timer()包住HTTP调用本身，耗时窗口不包含并发名额、自适应窗口的排队时间
+- 每个上游有预算上限：对冲次数不超过请求数的budget_ratio（不超过1，即负载最多翻倍）
+- 同步调用在线程中执行，落后的请求无法中断，其结果被丢弃；异步调用直接取消落后的任务
+"""
+import asyncio
+import threading
+import time
+import logging
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable, Awaitable, Dict, Any, Optional, TypeVar
+
+from ..config.config import config
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+# 本次调用中HTTP请求本身的耗时（线程和asyncio任务各自独立）
+_upstream_latency: ContextVar[Optional[float]] = ContextVar('hedge_upstream_latency', default=None)
+
+
+@contextmanager
+def upstream_timer():
+    """包住被对冲函数里的HTTP调用，对冲延迟按其耗时计算；未使用时按整个函数的耗时计算"""
+    started_at = time.time()
+    try:
+        yield
+    finally:
+        _upstream_latency.set(time.time() - started_at)
+
+
+class HedgePolicy:
+    """单个上游的对冲策略：滚动耗时窗口 + 对冲预算"""
+
+    def __init__(self, name: str, percentile: float = 90, budget_ratio: float = 0.1, window_size: int = 200,
+                 min_samples: int = 20, min_delay: float = 0.05, max_workers: int = 32):
+        """
+        :param name: 上游名称
+        :param percentile: 超过该分位数耗时仍未返回时发出对冲请求
+        :param budget_ratio: 对冲请求占总请求的比例上限（0~1）
+        :param window_size: 滚动耗时窗口大小
+        :param min_samples: 样本数达到该值后才开始对冲
+        :param min_delay: 对冲延迟下限（秒）
+        :param max_workers: 同步调用的执行线程数
+        """
+        self.name = name
+        self.percentile = percentile
+        self.budget_ratio = min(1.0, max(0.0, budget_ratio))
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.max_workers = max_workers
+        self._latencies = deque(maxlen=window_size)
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        # 对冲预算：每个请求积累budget_ratio，每次对冲消耗1
+        self._budget = 0.0
+
+        # 运行统计
+        self._requests = 0
+        self._hedged = 0
+        self._hedge_wins = 0
+        self._budget_exhausted = 0
+
+    def record(self, latency: float):
+        """记录一次完成的请求耗时"""
+        with self._lock:
+            self._latencies.append(latency)
+
+    def hedge_delay(self) -> Optional[float]:
+        """当前对冲延迟（秒），样本不足时返回None"""
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                return None
+            samples = sorted(self._latencies)
+        index = min(len(samples) - 1, int(len(samples) * self.percentile / 100))
+        return max(self.min_delay, samples[index])
+
+    def _start_request(self):
+        with self._lock:
+            self._requests += 1
+            self._budget = min(10.0, self._budget + self.budget_ratio)
+
+    def _try_spend(self) -> bool:
+        """消耗一次对冲预算"""
+        with self._lock:
+            if self._budget >= 1.0:
+                self._budget -= 1.0
+                self._hedged += 1
+                return True
+            self._budget_exhausted += 1
+            return False
+
+    def _record_win(self):
+        with self._lock:
+            self._hedge_wins += 1
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                        thread_name_prefix=f"hedge-{self.name}")
+        return self._executor
+
+    @staticmethod
+    def _succeeded(result, is_success: Optional[Callable[[Any], bool]]) -> bool:
+        return is_success is None or is_success(result)
+
+    def _record_success(self, result, is_success, started_at: float):
+        """成功完成时才记录耗时（快速返回的429/5xx不能拉低对冲延迟），优先使用upstream_timer测得的HTTP耗时"""
+        if self._succeeded(result, is_success):
+            latency = _upstream_latency.get()
+            self.record(latency if latency is not None else time.time() - started_at)
+
+    def _timed(self, func: Callable[[], T], is_success: Optional[Callable[[T], bool]]) -> Callable[[], T]:
+        """包装同步调用并记录耗时"""
+        def run():
+            reset_token = _upstream_latency.set(None)
+            try:
+                started_at = time.time()
+                result = func()
+                self._record_success(result, is_success, started_at)
+                return result
+            finally:
+                _upstream_latency.reset(reset_token)
+        return run
+
+    def call(self, func: Callable[[], T], is_success: Optional[Callable[[T], bool]] = None) -> T:
+        """
+        执行同步幂等调用，超过对冲延迟仍未返回时并发发出第二个请求，返回先成功的结果；
+        两个请求都未成功时返回（或抛出）先完成的那个结果
+
+        :param is_success: 判断返回值是否成功（如HTTP状态码为200），不成功的返回值不计入耗时、不作为对冲胜者；
+                           为None时不抛异常即视为成功
+        """
+        self._start_request()
+        delay = self.hedge_delay()
+        timed = self._timed(func, is_success)
+        if delay is None:
+            return timed()
+
+        executor = self._get_executor()
+        primary = executor.submit(timed)
+        done, _ = wait([primary], timeout=delay)
+        if done or not self._try_spend():
+            return primary.result()
+
+        logger.info(f"🔀 {self.name} 请求超过 {delay:.2f}秒 未返回，发出对冲请求")
+        hedge = executor.submit(timed)
+        pending = {primary, hedge}
+        first_failed = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None and self._succeeded(future.result(), is_success):
+                    if future is hedge:
+                        self._record_win()
+                    for other in pending:
+                        other.cancel()
+                    return future.result()
+                first_failed = first_failed or future
+        return first_failed.result()
+
+    async def call_async(self, factory: Callable[[], Awaitable[T]],
+                         is_success: Optional[Callable[[T], bool]] = None) -> T:
+        """call的异步版本，factory每次调用返回一个新的协程；先成功的结果返回后取消另一个任务"""
+        self._start_request()
+        delay = self.hedge_delay()
+
+        async def timed():
+            reset_token = _upstream_latency.set(None)
+            try:
+                started_at = time.time()
+                result = await factory()
+                self._record_success(result, is_success, started_at)
+                return result
+            finally:
+                _upstream_latency.reset(reset_token)
+
+        if delay is None:
+            return await timed()
+
+        primary = asyncio.ensure_future(timed())
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done or not self._try_spend():
+            return await primary
+
+        logger.info(f"🔀 {self.name} 请求超过 {delay:.2f}秒 未返回，发出对冲请求")
+        hedge = asyncio.ensure_future(timed())
+        pending = {primary, hedge}
+        first_failed = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.cancelled():
+                        continue
+                    if task.exception() is None and self._succeeded(task.result(), is_success):
+                        if task is hedge:
+                            self._record_win()
+                        return task.result()
+                    first_failed = first_failed or task
+            if first_failed is None:
+                raise asyncio.CancelledError()
+            return first_failed.result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取对冲统计"""
+        delay = self.hedge_delay()
+        with self._lock:
+            return {
+                'percentile': self.percentile,
+                'budget_ratio': self.budget_ratio,
+                'hedge_delay_ms': round(delay * 1000, 1) if delay is not None else None,
+                'samples': len(self._latencies),
+                'requests': self._requests,
+                'hedged': self._hedged,
+                'hedge_wins': self._hedge_wins,
+                'budget_exhausted': self._budget_exhausted,
+                'extra_load': round(self._hedged / self._requests, 4) if self._requests else 0.0
+            }
+
+
+def create_hedge_policy(name: str, enabled: bool) -> Optional[HedgePolicy]:
+    """按配置创建对冲策略，未开启时返回None"""
+    if not enabled:
+        return None
+    return HedgePolicy(name, percentile=config.hedge_percentile, budget_ratio=config.hedge_budget_ratio)
+
+
+# 大模型对话请求（相同请求体重复发送不影响结果）
+llm_hedge = create_hedge_policy('dashscope', config.llm_hedge_enabled)
+# ETL图片OCR请求
+etl_hedge = create_hedge_policy('etl', config.etl_hedge_enabled)
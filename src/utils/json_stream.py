@@ -0,0 +1,148 @@
+# json_stream.py
+"""
+增量JSON解析
+大模型流式输出时逐段喂入文本，顶层对象中指定数组（默认user_profiles）的每个元素一旦完整就立即返回，
+不必等整个响应结束；输出被截断时按已完整解析的部分恢复结果，而不是靠补括号猜测
+"""
+import json
+from typing import Dict, Any, List, Optional
+
+
+class _Frame:
+    """解析栈中的一层容器"""
+    __slots__ = ('is_object', 'key', 'expect_key')
+
+    def __init__(self, is_object: bool):
+        self.is_object = is_object
+        self.key = None
+        self.expect_key = is_object
+
+
+class StreamingProfileParser:
+    """增量解析模型输出中的用户画像JSON"""
+
+    def __init__(self, array_key: str = 'user_profiles'):
+        """
+        :param array_key: 需要逐个元素返回的顶层数组字段名
+        """
+        self.array_key = array_key
+        self.items: List[Dict[str, Any]] = []
+        # 已完整解析的顶层字符串字段（如summary）
+        self.fields: Dict[str, Any] = {}
+
+        self._buf = ''
+        self._pos = 0
+        self._stack: List[_Frame] = []
+        self._root_start: Optional[int] = None
+        self._root_end: Optional[int] = None
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._array_depth: Optional[int] = None
+        self._item_start: Optional[int] = None
+
+    @property
+    def complete(self) -> bool:
+        """顶层对象是否已闭合"""
+        return self._root_end is not None
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        """
+        喂入一段文本
+
+        Returns:
+            list: 本次新解析出的完整数组元素
+        """
+        if self.complete or not chunk:
+            return []
+        self._buf += chunk
+        new_items = []
+        buf = self._buf
+
+        for i in range(self._pos, len(buf)):
+            c = buf[i]
+            if self._root_start is None:
+                # 跳过```json等前缀
+                if c == '{':
+                    self._root_start = i
+                    self._stack.append(_Frame(True))
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == '\\':
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    self._on_string(buf[self._string_start:i + 1])
+                continue
+
+            if c == '"':
+                self._in_string = True
+                self._string_start = i
+            elif c == '{' or c == '[':
+                parent = self._stack[-1]
+                if parent.is_object:
+                    parent.expect_key = False
+                if c == '{' and len(self._stack) == self._array_depth:
+                    self._item_start = i
+                self._stack.append(_Frame(c == '{'))
+                if c == '[' and len(self._stack) == 2 and parent.key == self.array_key:
+                    self._array_depth = 2
+            elif c == '}' or c == ']':
+                self._stack.pop()
+                if c == '}' and self._item_start is not None and len(self._stack) == self._array_depth:
+                    item = self._load(buf[self._item_start:i + 1])
+                    self._item_start = None
+                    if isinstance(item, dict):
+                        self.items.append(item)
+                        new_items.append(item)
+                elif c == ']' and self._array_depth is not None and len(self._stack) < self._array_depth:
+                    self._array_depth = None
+                if not self._stack:
+                    self._root_end = i
+                    self._pos = i + 1
+                    return new_items
+            elif c == ':':
+                self._stack[-1].expect_key = False
+            elif c == ',':
+                frame = self._stack[-1]
+                if frame.is_object:
+                    frame.expect_key = True
+                    frame.key = None
+
+        self._pos = len(buf)
+        return new_items
+
+    def _on_string(self, raw: str):
+        """字符串结束：对象中的键，或顶层对象的字符串值"""
+        frame = self._stack[-1]
+        if not frame.is_object:
+            return
+        if frame.expect_key:
+            frame.key = self._load(raw)
+        elif len(self._stack) == 1 and frame.key:
+            self.fields[frame.key] = self._load(raw)
+
+    @staticmethod
+    def _load(raw: str):
+        try:
+            return json.loads(raw)
+        except json.JSONDecodeError:
+            return None
+
+    def result(self) -> Optional[Dict[str, Any]]:
+        """
+        获取解析结果：顶层对象完整时返回完整JSON；被截断时返回已完整的字段和数组元素；
+        没有任何JSON内容时返回None
+        """
+        if self._root_start is None:
+            return None
+        if self.complete:
+            parsed = self._load(self._buf[self._root_start:self._root_end + 1])
+            if isinstance(parsed, dict):
+                return parsed
+        recovered = dict(self.fields)
+        recovered[self.array_key] = list(self.items)
+        return recovered
@@ -0,0 +1,79 @@
+# metrics.py
+"""
+运行时指标统计
+线程安全的滑动窗口耗时统计，供各处理阶段记录耗时并通过 /stats 接口查看
+"""
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Any, Optional
+
+
+class LatencyStats:
+    """滑动窗口耗时统计 - 按阶段保留最近N次耗时，计算平均值和分位数"""
+    
+    def __init__(self, window_size: int = 500):
+        self.window_size = window_size
+        self._samples = {}
+        self._counts = {}
+        self._totals = {}
+        self._lock = threading.Lock()
+    
+    def record(self, stage: str, seconds: float):
+        """记录一次阶段耗时（秒）"""
+        with self._lock:
+            if stage not in self._samples:
+                self._samples[stage] = deque(maxlen=self.window_size)
+                self._counts[stage] = 0
+                self._totals[stage] = 0.0
+            self._samples[stage].append(seconds)
+            self._counts[stage] += 1
+            self._totals[stage] += seconds
+    
+    @contextmanager
+    def timer(self, stage: str):
+        """计时上下文管理器，退出时自动记录耗时"""
+        start_time = time.time()
+        try:
+            yield
+        finally:
+            self.record(stage, time.time() - start_time)
+    
+    def percentile(self, stage: str, pct: float) -> Optional[float]:
+        """获取阶段耗时的分位数（秒），无样本时返回None"""
+        with self._lock:
+            samples = sorted(self._samples.get(stage, ()))
+        if not samples:
+            return None
+        index = min(len(samples) - 1, int(len(samples) * pct / 100))
+        return samples[index]
+    
+    def snapshot(self) -> Dict[str, Any]:
+        """获取所有阶段的统计快照（毫秒）"""
+        with self._lock:
+            stages = {
+                stage: (sorted(samples), self._counts[stage], self._totals[stage])
+                for stage, samples in self._samples.items()
+            }
+        
+        result = {}
+        for stage, (samples, count, total) in stages.items():
+            if not samples:
+                continue
+            result[stage] = {
+                'count': count,
+                'avg_ms': round(total / count * 1000, 1),
+                'p50_ms': round(samples[len(samples) // 2] * 1000, 1),
+                'p95_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000, 1),
+                'max_ms': round(samples[-1] * 1000, 1)
+            }
+        return result
+
+
+# 微信客服消息处理链路的阶段耗时统计
+kf_pipeline_stats = LatencyStats()
+# 大模型调用的排队等待与模型耗时统计
+llm_stats = LatencyStats()
+# 媒体文件下载等处理耗时统计
+media_stats = LatencyStats()
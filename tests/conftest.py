@@ -0,0 +1,37 @@
+# conftest.py
+"""
+pytest公共配置
+- 导入src前把DATABASE_PATH指向临时文件，测试不会写入仓库里的数据库
+- sqlite_db：每个测试独立的临时SQLite数据库（提供get_connection，与SQLiteDatabase接口一致）
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+from contextlib import contextmanager
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ['DATABASE_PATH'] = os.path.join(tempfile.mkdtemp(prefix='wxkf-test-'), 'test.db')
+
+
+class TempSQLiteDatabase:
+    """测试用的SQLite数据库"""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+
+    @contextmanager
+    def get_connection(self):
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+
+@pytest.fixture
+def sqlite_db(tmp_path):
+    return TempSQLiteDatabase(str(tmp_path / 'test.db'))
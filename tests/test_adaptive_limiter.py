@@ -0,0 +1,111 @@
+# test_adaptive_limiter.py
+"""
+AIMD自适应并发限制测试
+- 成功且耗时正常时加性增大窗口，429/5xx和超时乘性减小，短时间内只减一次
+- 业务错误和慢调用不增大窗口
+- 超出窗口的调用排队，同步线程和事件循环共用同一窗口；取消排队的异步调用不占名额
+"""
+import asyncio
+import threading
+import time
+
+import pytest
+import requests
+
+from src.utils.adaptive_limiter import AdaptiveLimiter
+
+
+def test_success_increases_additively():
+    limiter = AdaptiveLimiter('test', initial_limit=2, max_limit=4)
+    for _ in range(2):
+        with limiter.slot() as call:
+            call.report_status(200)
+    # 窗口为2时，2次成功约+1
+    assert limiter.get_stats()['limit_exact'] == pytest.approx(2.9, abs=0.05)
+    for _ in range(20):
+        with limiter.slot():
+            pass
+    assert limiter.limit == 4
+
+
+def test_overload_decreases_once_per_interval():
+    limiter = AdaptiveLimiter('test', initial_limit=8, decrease_interval=0.2)
+    for status in (429, 503):
+        with limiter.slot() as call:
+            call.report_status(status)
+    assert limiter.limit == 4
+    assert limiter.get_stats()['decreases'] == 1
+
+    time.sleep(0.25)
+    with pytest.raises(requests.exceptions.Timeout):
+        with limiter.slot():
+            raise requests.exceptions.Timeout()
+    assert limiter.limit == 2
+    assert limiter.get_stats()['overloads'] == 3
+
+
+def test_business_errors_and_slow_calls_do_not_increase():
+    limiter = AdaptiveLimiter('test', initial_limit=2, latency_target=0.05)
+    with limiter.slot() as call:
+        call.report_status(400)
+    with pytest.raises(ValueError):
+        with limiter.slot():
+            raise ValueError('bad response')
+    with limiter.slot():
+        time.sleep(0.1)
+    stats = limiter.get_stats()
+    assert stats['limit_exact'] == 2 and stats['increases'] == 0 and stats['decreases'] == 0
+
+
+def test_calls_beyond_window_queue():
+    limiter = AdaptiveLimiter('test', initial_limit=1, max_limit=1)
+    release = threading.Event()
+    order = []
+
+    def hold():
+        with limiter.slot():
+            order.append('first')
+            release.wait(5)
+
+    holder = threading.Thread(target=hold)
+    holder.start()
+    time.sleep(0.05)
+
+    def second():
+        with limiter.slot():
+            order.append('second')
+
+    waiter = threading.Thread(target=second)
+    waiter.start()
+    time.sleep(0.05)
+    assert order == ['first'] and limiter.get_stats()['queued'] == 1
+    release.set()
+    holder.join(5)
+    waiter.join(5)
+    assert order == ['first', 'second']
+    assert limiter.get_stats()['in_flight'] == 0
+
+
+def test_async_waiter_shares_window_and_cancel_frees_slot():
+    limiter = AdaptiveLimiter('test', initial_limit=1, max_limit=1)
+
+    async def scenario():
+        limiter.acquire()
+        cancelled = asyncio.ensure_future(limiter.acquire_async())
+        await asyncio.sleep(0.05)
+        assert limiter.get_stats()['queued'] == 1
+        cancelled.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await cancelled
+        assert limiter.get_stats()['queued'] == 0
+
+        granted = asyncio.ensure_future(limiter.acquire_async())
+        await asyncio.sleep(0.05)
+        assert not granted.done()
+        # 同步线程归还名额后，事件循环中的等待者被唤醒
+        await asyncio.to_thread(limiter.release, 0.01)
+        await asyncio.wait_for(granted, 1)
+        limiter.release(0.01)
+
+    asyncio.run(scenario())
+    assert limiter.get_stats()['in_flight'] == 0
@@ -0,0 +1,147 @@
+# test_ai_service.py
+"""
+大模型调用连接池与并发上限测试
+- 同步调用共享长连接，同时进行的调用数不超过max_concurrency，排队中的调用计入waiting
+- 非200响应返回失败结果，429反馈给自适应限制器
+- 异步版本（本地aiohttp服务模拟chat/completions）同样受并发上限约束，超时返回失败结果
+"""
+import asyncio
+import json
+import threading
+import time
+
+from aiohttp import web
+
+from src.services.ai_service import UserProfileExtractor
+from src.utils.adaptive_limiter import AdaptiveLimiter
+
+
+def _completion(name):
+    content = json.dumps({'summary': '自我介绍', 'user_profiles': [{'name': name}]}, ensure_ascii=False)
+    return json.dumps({'choices': [{'message': {'content': content}}]})
+
+
+class Concurrency:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active = 0
+        self.peak = 0
+
+    def enter(self):
+        with self.lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+
+    def leave(self):
+        with self.lock:
+            self.active -= 1
+
+
+class FakeResponse:
+    def __init__(self, status_code, text):
+        self.status_code = status_code
+        self.text = text
+
+
+def _extractor(**kwargs):
+    options = dict(max_concurrency=2, timeout=5, limiter=AdaptiveLimiter('test', initial_limit=8, max_limit=8))
+    options.update(kwargs)
+    return UserProfileExtractor(**options)
+
+
+def test_sync_calls_bounded_by_max_concurrency(monkeypatch):
+    extractor = _extractor()
+    concurrency = Concurrency()
+    waiting = []
+
+    def post(url, headers=None, data=None, timeout=None):
+        concurrency.enter()
+        waiting.append(extractor.get_stats()['waiting'])
+        time.sleep(0.1)
+        concurrency.leave()
+        return FakeResponse(200, _completion('张三'))
+
+    monkeypatch.setattr(extractor.session, 'post', post)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(extractor.extract_user_profile('我叫张三')))
+               for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    assert concurrency.peak == 2
+    assert max(waiting) > 0
+    assert [result['data']['user_profiles'] for result in results] == [[{'name': '张三'}]] * 5
+    stats = extractor.get_stats()
+    assert stats['in_flight'] == 0 and stats['waiting'] == 0
+
+
+def test_sync_error_status_reported_to_limiter(monkeypatch):
+    limiter = AdaptiveLimiter('test', initial_limit=8)
+    extractor = _extractor(limiter=limiter)
+    monkeypatch.setattr(extractor.session, 'post', lambda *args, **kwargs: FakeResponse(429, 'Too Many Requests'))
+
+    result = extractor.extract_user_profile('我叫张三')
+    assert not result['success'] and '429' in result['error']
+    assert limiter.get_stats()['overloads'] == 1 and limiter.limit == 4
+
+
+async def _serve(handler):
+    app = web.Application()
+    app.router.add_post('/v1/chat/completions', handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}/v1"
+
+
+def test_async_calls_bounded_by_max_concurrency():
+    concurrency = Concurrency()
+
+    async def complete(request):
+        concurrency.enter()
+        try:
+            body = await request.json()
+            await asyncio.sleep(0.1)
+            return web.Response(text=_completion(body['messages'][-1]['content'].split('我叫')[-1][:2]),
+                                content_type='application/json')
+        finally:
+            concurrency.leave()
+
+    async def scenario():
+        runner, endpoint = await _serve(complete)
+        extractor = _extractor()
+        extractor.api_endpoint = endpoint
+        try:
+            names = ['张三', '李四', '王五', '赵六']
+            results = await asyncio.gather(*(extractor.extract_user_profile_async(f"我叫{name}") for name in names))
+            assert [result['data']['user_profiles'][0]['name'] for result in results] == names
+            assert extractor.get_stats()['in_flight'] == 0
+        finally:
+            await extractor.close()
+            await runner.cleanup()
+
+    asyncio.run(scenario())
+    assert concurrency.peak == 2
+
+
+def test_async_timeout_returns_error():
+    async def slow(request):
+        await asyncio.sleep(1.0)
+        return web.Response(text=_completion('张三'), content_type='application/json')
+
+    async def scenario():
+        runner, endpoint = await _serve(slow)
+        extractor = _extractor(timeout=0.2)
+        extractor.api_endpoint = endpoint
+        try:
+            return await extractor.extract_user_profile_async('我叫张三')
+        finally:
+            await extractor.close()
+            await runner.cleanup()
+
+    result = asyncio.run(scenario())
+    assert not result['success'] and result['data']['summary'] == 'AI处理超时'
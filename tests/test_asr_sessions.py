@@ -0,0 +1,109 @@
+# test_asr_sessions.py
+"""
+语音识别会话测试（用假的nls模块代替阿里云SDK）
+- 每次识别使用独立会话，并发识别的结果互不串扰
+- 同时进行的会话数不超过max_sessions，超出的排队
+- 实时模式按640字节分片，快速模式按frame_bytes连续发送
+- 服务端报错时返回失败文本并计入失败次数
+"""
+import json
+import sys
+import threading
+import time
+import types
+
+import pytest
+
+from src.services.media_processor import AliyunASRProcessor
+
+
+class FakeRecognizer:
+    """按nls.NlsSpeechRecognizer的回调顺序模拟一次识别：识别结果为收到的音频内容"""
+    lock = threading.Lock()
+    active = 0
+    max_active = 0
+    frames = []
+    fail = False
+
+    def __init__(self, url, token, appkey, on_start, on_result_changed, on_completed, on_error, on_close,
+                 callback_args=None):
+        self.callbacks = {'start': on_start, 'completed': on_completed, 'error': on_error, 'close': on_close}
+        self.audio = b''
+
+    def start(self, **kwargs):
+        with FakeRecognizer.lock:
+            FakeRecognizer.active += 1
+            FakeRecognizer.max_active = max(FakeRecognizer.max_active, FakeRecognizer.active)
+        threading.Thread(target=self.callbacks['start'], args=('{}',)).start()
+        return True
+
+    def send_audio(self, data):
+        FakeRecognizer.frames.append(len(data))
+        self.audio += data
+
+    def stop(self, timeout=10):
+        def finish():
+            time.sleep(0.05)
+            if FakeRecognizer.fail:
+                self.callbacks['error']('quota exceeded')
+                return
+            message = {'header': {'status': 20000000}, 'payload': {'result': self.audio.decode().strip('.')}}
+            self.callbacks['completed'](json.dumps(message))
+
+        threading.Thread(target=finish).start()
+
+    def shutdown(self):
+        with FakeRecognizer.lock:
+            FakeRecognizer.active -= 1
+
+
+@pytest.fixture(autouse=True)
+def fake_nls(monkeypatch):
+    FakeRecognizer.active = FakeRecognizer.max_active = 0
+    FakeRecognizer.frames = []
+    FakeRecognizer.fail = False
+    monkeypatch.setitem(sys.modules, 'nls', types.SimpleNamespace(NlsSpeechRecognizer=FakeRecognizer))
+
+
+def _audio(tmp_path, name, size=3200):
+    path = tmp_path / f"{name}.pcm"
+    path.write_bytes(name.encode().ljust(size, b'.'))
+    return str(path)
+
+
+def test_concurrent_sessions_are_isolated_and_bounded(tmp_path):
+    processor = AliyunASRProcessor(max_sessions=2, fast_mode=True)
+    names = ['zhangsan', 'lisi', 'wangwu', 'zhaoliu']
+    results = {}
+
+    def recognize(name):
+        results[name] = processor.recognize_speech(_audio(tmp_path, name))
+
+    threads = [threading.Thread(target=recognize, args=(name,)) for name in names]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+
+    assert results == {name: name for name in names}
+    assert FakeRecognizer.max_active == 2
+    stats = processor.get_stats()
+    assert stats['sessions'] == 4 and stats['failed'] == 0 and stats['active'] == 0
+
+
+def test_realtime_and_fast_frames(tmp_path):
+    path = _audio(tmp_path, 'zhangsan', size=6400)
+    AliyunASRProcessor(fast_mode=False).recognize_speech(path)
+    assert FakeRecognizer.frames == [640] * 10
+
+    FakeRecognizer.frames = []
+    AliyunASRProcessor(fast_mode=True, frame_bytes=3200).recognize_speech(path)
+    assert FakeRecognizer.frames == [3200] * 2
+
+
+def test_server_error_counts_as_failure(tmp_path):
+    FakeRecognizer.fail = True
+    processor = AliyunASRProcessor()
+    result = processor.recognize_speech(_audio(tmp_path, 'zhangsan'))
+    assert result.startswith('[语音识别失败') and 'quota exceeded' in result
+    assert processor.get_stats()['failed'] == 1
@@ -0,0 +1,106 @@
+# test_chat_record_media.py
+"""
+聊天记录媒体条目并发处理测试
+- 图片、语音条目并发处理，输出仍按条目序号排列
+- 超过整条记录的截止时间未完成的条目用占位文本，已完成的结果照常返回
+- 单个条目处理出错时使用占位文本，不影响其他条目
+"""
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from src.config.config import config
+from src.handlers import message_formatter
+from src.handlers.message_formatter import MessageTextExtractor
+from src.services.media_processor import media_processor
+
+
+def _item(sender, content):
+    return {'sender_name': sender, 'send_time': int(time.time()), 'msg_content': json.dumps(content, ensure_ascii=False)}
+
+
+def _chat_record(*items):
+    return {'FromUserName': 'wm_user', 'merged_msg': {'title': '群聊', 'item': list(items)}}
+
+
+@pytest.fixture(autouse=True)
+def media_pool(monkeypatch):
+    pool = ThreadPoolExecutor(max_workers=4)
+    monkeypatch.setattr(message_formatter, '_media_pool', pool)
+    yield pool
+    pool.shutdown(wait=True)
+
+
+def _lines(text):
+    return text.split('聊天记录内容：\n', 1)[1].splitlines()
+
+
+def test_media_items_processed_concurrently_in_order(monkeypatch):
+    def ocr(media_id, filename=None):
+        time.sleep(0.3 if media_id == 'img_1' else 0.1)
+        return f"{media_id}识别结果"
+
+    def speech(media_id):
+        time.sleep(0.2)
+        return '我是张三'
+
+    monkeypatch.setattr(media_processor, 'process_image_ocr', ocr)
+    monkeypatch.setattr(media_processor, 'speech_to_text', speech)
+    message = _chat_record(
+        _item('张三', {'msgtype': 'image', 'image': {'media_id': 'img_1'}}),
+        _item('张三', {'msgtype': 'text', 'text': {'content': '你好'}}),
+        _item('张三', {'msgtype': 'voice', 'voice': {'media_id': 'voice_1'}}),
+        _item('张三', {'msgtype': 'image', 'image': {'media_id': 'img_2'}})
+    )
+
+    started_at = time.time()
+    text = MessageTextExtractor().extract_text(message, 'chat_record')
+    # 串行需要0.6秒
+    assert time.time() - started_at < 0.5
+
+    lines = _lines(text)
+    assert lines[0].startswith('1. 张三') and 'img_1识别结果' in lines[0]
+    assert lines[1].endswith('：你好')
+    assert '识别内容：我是张三' in lines[2]
+    assert 'img_2识别结果' in lines[3]
+
+
+def test_deadline_uses_placeholder(monkeypatch):
+    monkeypatch.setattr(config, 'chat_record_deadline', 0.2)
+
+    def ocr(media_id, filename=None):
+        time.sleep(1.0 if media_id == 'slow' else 0.01)
+        return '名片文字'
+
+    monkeypatch.setattr(media_processor, 'process_image_ocr', ocr)
+    monkeypatch.setattr(media_processor, 'extract_file_content', lambda media_id, filename: time.sleep(1.0) or '简历')
+    message = _chat_record(
+        _item('李四', {'msgtype': 'image', 'image': {'media_id': 'slow'}}),
+        _item('李四', {'msgtype': 'image', 'image': {'media_id': 'fast'}}),
+        _item('李四', {'msgtype': 'file', 'file': {'media_id': 'doc', 'filename': '简历.pdf'}})
+    )
+
+    started_at = time.time()
+    lines = _lines(MessageTextExtractor().extract_text(message, 'chat_record'))
+    assert time.time() - started_at < 0.6
+    assert lines[0].endswith('[发送了图片，识别超时]')
+    assert '名片文字' in lines[1]
+    assert lines[2].endswith('[发送了文件《简历.pdf》，解析超时]')
+
+
+def test_failed_item_uses_placeholder(monkeypatch):
+    message = _chat_record(
+        _item('王五', {'msgtype': 'voice', 'voice': {'media_id': 'voice_1'}}),
+        _item('王五', {'msgtype': 'text', 'text': {'content': '在上海'}})
+    )
+
+    def broken(content_json):
+        raise RuntimeError('boom')
+
+    extractor = MessageTextExtractor()
+    monkeypatch.setattr(extractor, '_process_chat_record_voice', broken)
+    lines = _lines(extractor.extract_text(message, 'chat_record'))
+    assert lines[0].endswith('[发送了语音，识别超时]')
+    assert lines[1].endswith('：在上海')
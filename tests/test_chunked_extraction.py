@@ -0,0 +1,107 @@
+# test_chunked_extraction.py
+"""
+超长文本分块提取测试
+- 聊天记录按发言、其他文本按段落切块，每块都带原文开头说明，且不超出预算
+- 同名画像合并补全未知字段；姓名为数字、列表等非字符串时不报错
+- 聊天记录只保留信息最丰富的一人；失败的块被忽略
+"""
+import threading
+
+from src.services.chunked_extraction import (
+    MapReduceExtractor, estimate_tokens, merge_profiles, split_into_chunks
+)
+
+CHAT_HEADER = "用户wm_user转发了聊天记录：\n"
+
+
+def _chat(turns):
+    return CHAT_HEADER + ''.join(f"{i}. 张三（10:{i:02d}）：{'我在杭州做销售' * 3}\n" for i in range(1, turns + 1))
+
+
+def test_estimate_tokens():
+    assert estimate_tokens('') == 0
+    assert estimate_tokens('张三李四') == 4
+    assert estimate_tokens('abcdefgh') == 2
+
+
+def test_chat_record_split_by_turns_within_budget():
+    text = _chat(30)
+    chunks = split_into_chunks(text, token_budget=200, is_chat_record=True)
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert chunk.startswith(CHAT_HEADER)
+        assert estimate_tokens(chunk) <= 200
+        # 不从一条发言中间断开
+        assert chunk.endswith('\n')
+    turns = [line for chunk in chunks for line in chunk[len(CHAT_HEADER):].splitlines()]
+    assert turns == text[len(CHAT_HEADER):].splitlines()
+
+
+def test_document_split_by_paragraphs_and_hard_split():
+    header = "用户发送了文件 report.pdf：\n"
+    paragraphs = ['第一段' * 20, '第二段' * 20, '超长段落' * 200]
+    chunks = split_into_chunks(header + '\n\n'.join(paragraphs), token_budget=150, is_chat_record=False)
+    assert all(chunk.startswith(header) and estimate_tokens(chunk) <= 150 for chunk in chunks)
+    assert ''.join(chunk[len(header):] for chunk in chunks).replace('\n', '') == ''.join(paragraphs)
+
+
+def test_merge_profiles_fills_unknown_fields():
+    merged = merge_profiles([
+        {'name': '张三', 'age': '未知', 'location': '杭州'},
+        {'name': ' 张三 ', 'age': '30', 'location': '上海'},
+        {'name': '未知', 'age': '40'},
+        {'name': '李四'}
+    ])
+    assert merged == [{'name': '张三', 'age': '30', 'location': '杭州'}, {'name': '李四'}]
+
+
+def test_merge_profiles_non_string_names():
+    merged = merge_profiles([
+        {'name': 7, 'age': '未知'},
+        {'name': '7', 'age': '30'},
+        {'name': ['张三']},
+        {'name': None, 'age': '40'},
+        'not a profile'
+    ])
+    assert [profile['age'] for profile in merged if profile.get('age')] == ['30']
+    assert len(merged) == 2
+
+
+class FakeExtractor:
+    def __init__(self, fail_chunks=0):
+        self.fail_chunks = fail_chunks
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def _extract_single(self, chunk, is_chat_record, model=None):
+        with self._lock:
+            index = len(self.calls)
+            self.calls.append(chunk)
+        if index < self.fail_chunks:
+            return {'success': False, 'data': {'summary': '', 'user_profiles': []}, 'error': 'timeout'}
+        profiles = [{'name': '张三', 'age': '30' if index % 2 else '未知', 'location': '杭州'}]
+        if index == 1:
+            profiles.append({'name': '王五'})
+        return {'success': True, 'data': {'summary': f"第{index}块", 'user_profiles': profiles}, 'error': None}
+
+
+def test_map_reduce_chat_record_keeps_richest_person():
+    extractor = FakeExtractor()
+    map_reduce = MapReduceExtractor(extractor, token_budget=200, max_workers=2)
+    text = _chat(30)
+    assert map_reduce.needs_split(text)
+
+    result = map_reduce.extract(text, is_chat_record=True)
+    assert len(extractor.calls) > 1
+    assert result['success']
+    assert result['data']['user_profiles'] == [{'name': '张三', 'age': '30', 'location': '杭州'}]
+    assert map_reduce.get_stats()['chunks'] == len(extractor.calls)
+
+
+def test_map_reduce_ignores_failed_chunks():
+    extractor = FakeExtractor(fail_chunks=1)
+    map_reduce = MapReduceExtractor(extractor, token_budget=200, max_workers=1)
+    result = map_reduce.extract(_chat(30), is_chat_record=False)
+    assert result['success']
+    assert sorted(profile['name'] for profile in result['data']['user_profiles']) == ['张三', '王五']
+    assert map_reduce.get_stats()['failed_chunks'] == 1
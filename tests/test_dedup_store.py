@@ -0,0 +1,61 @@
+# test_dedup_store.py
+"""
+有界去重存储测试
+- 内存模式按TTL过期、按容量淘汰
+- SQLite共享模式下两个实例（模拟两个worker进程）看到同一份去重记录
+"""
+import time
+
+from src.utils.dedup_store import DedupStore
+
+
+def test_check_and_add_and_discard():
+    store = DedupStore('test', ttl_seconds=60, max_entries=10)
+    assert not store.check_and_add('e1')
+    assert store.check_and_add('e1')
+    store.discard('e1')
+    assert not store.contains('e1')
+    assert not store.check_and_add('e1')
+
+
+def test_entries_expire_after_ttl():
+    store = DedupStore('test', ttl_seconds=0.05, max_entries=10)
+    store.add('e1')
+    assert store.contains('e1')
+    time.sleep(0.1)
+    assert not store.contains('e1')
+    assert len(store) == 0
+    assert store.get_stats()['expirations'] == 1
+
+
+def test_capacity_evicts_oldest():
+    store = DedupStore('test', ttl_seconds=60, max_entries=3)
+    for n in range(5):
+        store.add(f"e{n}")
+    assert len(store) == 3
+    assert not store.contains('e0') and not store.contains('e1')
+    assert store.contains('e4')
+    assert store.get_stats()['evictions'] == 2
+
+
+def test_sqlite_store_shared_between_instances(sqlite_db):
+    worker_a = DedupStore('kf_event', ttl_seconds=60, db_instance=sqlite_db)
+    worker_b = DedupStore('kf_event', ttl_seconds=60, db_instance=sqlite_db)
+    other_namespace = DedupStore('kf_msgid', ttl_seconds=60, db_instance=sqlite_db)
+
+    assert not worker_a.check_and_add('e1')
+    assert worker_b.check_and_add('e1')
+    assert worker_b.contains('e1')
+    assert not other_namespace.contains('e1')
+    assert worker_b.get_stats()['backend'] == 'sqlite'
+
+    worker_b.discard('e1')
+    assert not worker_a.check_and_add('e1')
+
+
+def test_sqlite_store_expired_key_can_be_added_again(sqlite_db):
+    worker_a = DedupStore('kf_event', ttl_seconds=0.05, db_instance=sqlite_db)
+    worker_b = DedupStore('kf_event', ttl_seconds=0.05, db_instance=sqlite_db)
+    assert not worker_a.check_and_add('e1')
+    time.sleep(0.1)
+    assert not worker_b.check_and_add('e1')
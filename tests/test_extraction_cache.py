@@ -0,0 +1,97 @@
+# test_extraction_cache.py
+"""
+画像提取结果缓存测试
+- 缓存键忽略空白差异，区分聊天记录、提示词版本和模型
+- 并发相同请求只调用一次大模型（同步和异步）
+- 失败结果不缓存；内存层和持久化层（临时SQLite）都按写入时间过期
+"""
+import asyncio
+import threading
+import time
+
+from src.database.extraction_cache_db import ExtractionCacheDatabase
+from src.services.extraction_cache import ProfileExtractionCache, make_cache_key
+
+
+def _ok(name='张三'):
+    return {'success': True, 'data': {'summary': '', 'user_profiles': [{'name': name}]}}
+
+
+def test_cache_key_normalizes_whitespace():
+    key = make_cache_key('我叫 张三\n在杭州', False, 'v1', 'qwen-plus')
+    assert key == make_cache_key('  我叫 张三  在杭州 ', False, 'v1', 'qwen-plus')
+    assert key != make_cache_key('我叫 张三 在杭州', True, 'v1', 'qwen-plus')
+    assert key != make_cache_key('我叫 张三 在杭州', False, 'v2', 'qwen-plus')
+    assert key != make_cache_key('我叫 张三 在杭州', False, 'v1', 'qwen-turbo')
+
+
+def test_concurrent_requests_share_one_call():
+    cache = ProfileExtractionCache()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.2)
+        return _ok()
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_compute('k', compute)))
+               for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert results == [_ok()] * 5
+    assert cache.get_or_compute('k', compute) == _ok()
+    stats = cache.get_stats()
+    assert stats['misses'] == 1 and stats['in_flight_shared'] == 4 and stats['memory_hits'] == 1
+
+
+def test_failed_result_not_cached():
+    cache = ProfileExtractionCache()
+    failed = {'success': False, 'data': {'summary': '', 'user_profiles': []}, 'error': 'timeout'}
+    assert cache.get_or_compute('k', lambda: failed) == failed
+    assert cache.get_or_compute('k', _ok) == _ok()
+
+
+def test_store_survives_restart_and_expires(sqlite_db):
+    store = ExtractionCacheDatabase(sqlite_db, ttl_seconds=0.3)
+    store.create_cache_table()
+    first = ProfileExtractionCache(store=store, ttl_seconds=0.3)
+    first.get_or_compute('k', _ok)
+
+    # 新进程从持久化层读到结果
+    second = ProfileExtractionCache(store=store, ttl_seconds=0.3)
+    assert second.get_or_compute('k', lambda: _ok('李四')) == _ok()
+    assert second.get_stats()['store_hits'] == 1
+
+    # 按写入时间过期，过期后重新调用
+    time.sleep(0.35)
+    assert second.get_or_compute('k', lambda: _ok('李四')) == _ok('李四')
+    assert store.count() == 1
+
+
+def test_memory_entry_expires():
+    cache = ProfileExtractionCache(ttl_seconds=0.05)
+    cache.get_or_compute('k', _ok)
+    time.sleep(0.1)
+    assert cache.get_or_compute('k', lambda: _ok('李四')) == _ok('李四')
+
+
+def test_async_requests_share_one_call():
+    cache = ProfileExtractionCache()
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.1)
+        return _ok()
+
+    async def scenario():
+        return await asyncio.gather(*(cache.get_or_compute_async('k', compute) for _ in range(4)))
+
+    assert asyncio.run(scenario()) == [_ok()] * 4
+    assert len(calls) == 1
+    assert cache.get_stats()['in_flight_shared'] == 3
@@ -0,0 +1,109 @@
+# test_hedging.py
+"""
+对冲请求测试
+- 样本不足时不对冲；超过分位数耗时未返回时发出对冲请求，先成功的结果胜出
+- 对冲次数受预算限制；不成功的返回值不计入耗时窗口
+- upstream_timer只计HTTP调用本身的耗时，不含排队时间
+- 异步版本取消落后的任务
+"""
+import asyncio
+import threading
+import time
+
+from src.utils.hedging import HedgePolicy, upstream_timer
+
+
+def _policy(**kwargs):
+    options = dict(percentile=90, budget_ratio=1.0, min_samples=5, min_delay=0.01)
+    options.update(kwargs)
+    return HedgePolicy('test', **options)
+
+
+def _warm(policy, latency=0.05, count=5):
+    for _ in range(count):
+        policy.record(latency)
+
+
+def test_no_hedge_without_samples():
+    policy = _policy()
+    calls = []
+    assert policy.call(lambda: calls.append(1) or 'ok') == 'ok'
+    assert policy.hedge_delay() is None
+    assert len(calls) == 1 and policy.get_stats()['hedged'] == 0
+
+
+def test_slow_primary_is_hedged():
+    policy = _policy()
+    _warm(policy)
+    attempts = []
+    lock = threading.Lock()
+
+    def call():
+        with lock:
+            attempts.append(1)
+            first = len(attempts) == 1
+        time.sleep(1.0 if first else 0.01)
+        return 'slow' if first else 'fast'
+
+    started_at = time.time()
+    assert policy.call(call) == 'fast'
+    assert time.time() - started_at < 0.5
+    stats = policy.get_stats()
+    assert stats['hedged'] == 1 and stats['hedge_wins'] == 1
+
+
+def test_budget_limits_hedges():
+    policy = _policy(budget_ratio=0.0)
+    _warm(policy)
+    attempts = []
+    assert policy.call(lambda: attempts.append(1) or time.sleep(0.1) or 'ok') == 'ok'
+    assert len(attempts) == 1
+    assert policy.get_stats()['budget_exhausted'] == 1
+
+
+def test_unsuccessful_results_not_recorded():
+    policy = _policy()
+    policy.call(lambda: (429, ''), is_success=lambda result: result[0] == 200)
+    assert policy.get_stats()['samples'] == 0
+    policy.call(lambda: (200, ''), is_success=lambda result: result[0] == 200)
+    assert policy.get_stats()['samples'] == 1
+
+
+def test_upstream_timer_excludes_queue_wait():
+    policy = _policy()
+
+    def call():
+        time.sleep(0.2)  # 等待并发名额
+        with upstream_timer():
+            time.sleep(0.02)
+        return 'ok'
+
+    policy.call(call)
+    assert policy._latencies[0] < 0.1
+
+
+def test_async_hedge_cancels_loser():
+    policy = _policy()
+    _warm(policy)
+    cancelled = []
+    attempts = []
+
+    async def call():
+        attempts.append(1)
+        first = len(attempts) == 1
+        try:
+            with upstream_timer():
+                await asyncio.sleep(1.0 if first else 0.01)
+        except asyncio.CancelledError:
+            cancelled.append(first)
+            raise
+        return 'slow' if first else 'fast'
+
+    async def scenario():
+        result = await policy.call_async(call)
+        await asyncio.sleep(0)
+        return result
+
+    assert asyncio.run(scenario()) == 'fast'
+    assert cancelled == [True]
+    assert policy.get_stats()['hedge_wins'] == 1
@@ -0,0 +1,139 @@
+# test_job_queue_db.py
+"""
+持久化任务队列测试
+- 领取、续约、完成，租约过期后被重新领取
+- 失败按退避重试，重试耗尽进入死信，死信可重放
+- 入队即持有租约、放弃租约、按任务类型领取、清理已完成任务
+- 后台处理池在持久化模式下失败重试，并定期清理已完成任务
+"""
+import time
+
+import pytest
+
+from src.database.job_queue_db import JobQueueDatabase
+from src.handlers.kf_event_worker import KfEventWorkerPool
+
+
+@pytest.fixture
+def job_queue(sqlite_db):
+    queue = JobQueueDatabase(sqlite_db, max_attempts=3, lease_seconds=30, base_backoff=0.01, max_backoff=0.05)
+    assert queue.create_job_table()
+    return queue
+
+
+def _wait_for(predicate, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.02)
+    return predicate()
+
+
+def test_lease_complete(job_queue):
+    job_id = job_queue.enqueue('callback', {'OpenKfId': 'wk_1'})
+    job = job_queue.lease('w1')
+    assert job['id'] == job_id
+    assert job['payload'] == {'OpenKfId': 'wk_1'}
+    assert job['attempts'] == 1
+    # 已被领取的任务不会再被领取
+    assert job_queue.lease('w2') is None
+    assert job_queue.renew(job_id, job['lease_token'])
+    assert job_queue.complete(job_id, job['lease_token'])
+    assert job_queue.get_stats()['done'] == 1
+
+
+def test_expired_lease_is_taken_over(job_queue):
+    job_queue.lease_seconds = 0
+    job_id = job_queue.enqueue('callback', {})
+    first = job_queue.lease('w1')
+    second = job_queue.lease('w2')
+    assert second['id'] == job_id and second['attempts'] == 2
+    # 原租约已失效，不能再续约或完成
+    assert not job_queue.renew(job_id, first['lease_token'])
+    assert not job_queue.complete(job_id, first['lease_token'])
+    assert job_queue.complete(job_id, second['lease_token'])
+
+
+def test_fail_retries_then_dead_and_replay(job_queue):
+    job_id = job_queue.enqueue('callback', {})
+    for attempt in range(1, 4):
+        assert _wait_for(lambda: job_queue.get_stats()['pending'] == 1)
+        job = None
+        while job is None:
+            job = job_queue.lease('w1')
+        assert job['attempts'] == attempt
+        status = job_queue.fail(job_id, job['lease_token'], job['attempts'], f"error {attempt}")
+    assert status == 'dead'
+
+    dead = job_queue.list_dead()
+    assert [item['id'] for item in dead] == [job_id]
+    assert dead[0]['last_error'] == 'error 3'
+
+    assert job_queue.replay_dead([job_id]) == 1
+    job = job_queue.lease('w1')
+    assert job['id'] == job_id and job['attempts'] == 1
+
+
+def test_failure_backs_off(job_queue):
+    job_queue.base_backoff = job_queue.max_backoff = 60
+    job_id = job_queue.enqueue('callback', {})
+    job = job_queue.lease('w1')
+    assert job_queue.fail(job_id, job['lease_token'], job['attempts'], 'boom') == 'pending'
+    assert job_queue.lease('w1') is None
+
+
+def test_enqueue_leased_and_release(job_queue):
+    job_id, token = job_queue.enqueue_leased('kf_send', {'content': 'hi'}, 'sender')
+    assert job_queue.lease('w1') is None
+    assert job_queue.release(job_id, token)
+    job = job_queue.lease('w1')
+    # 放弃租约不计为一次失败
+    assert job['id'] == job_id and job['attempts'] == 1
+
+
+def test_lease_filters_job_types(job_queue):
+    media_id = job_queue.enqueue('kf_media', {})
+    callback_id = job_queue.enqueue('callback', {})
+    assert job_queue.lease('w1', job_types=['callback'])['id'] == callback_id
+    assert job_queue.lease('w1', job_types=['callback']) is None
+    assert job_queue.lease('w1', job_types=['kf_media'])['id'] == media_id
+
+
+def test_purge_done_keeps_recent_and_unfinished(job_queue):
+    old_id = job_queue.enqueue('callback', {})
+    job_queue.complete(old_id, job_queue.lease('w1')['lease_token'])
+    time.sleep(0.1)
+    recent_id = job_queue.enqueue('callback', {})
+    job_queue.complete(recent_id, job_queue.lease('w1')['lease_token'])
+    job_queue.enqueue('callback', {})
+
+    assert job_queue.purge_done(older_than_seconds=0.05) == 1
+    stats = job_queue.get_stats()
+    assert stats['done'] == 1 and stats['pending'] == 1
+
+
+def test_durable_pool_retries_and_purges(job_queue):
+    calls = []
+
+    def handler(message):
+        calls.append(message['n'])
+        if message['n'] == 0 and calls.count(0) == 1:
+            raise RuntimeError('first attempt fails')
+
+    pool = KfEventWorkerPool(handler, worker_count=1, job_queue=job_queue, poll_interval=0.02,
+                             purge_every=1, retention_seconds=0)
+    pool.start()
+    try:
+        for n in range(3):
+            assert pool.submit({'n': n})
+        assert _wait_for(lambda: pool.get_stats()['processed'] == 3)
+    finally:
+        pool.stop(timeout=5)
+
+    stats = pool.get_stats()
+    assert calls.count(0) == 2
+    assert stats['failed'] == 1
+    # 每次领取都会清理之前已完成的任务，最后完成的任务还留在表中
+    assert stats['purged'] >= 1
+    assert stats['jobs']['done'] < 3 and stats['jobs']['pending'] == 0
@@ -0,0 +1,66 @@
+# test_json_stream.py
+"""
+增量JSON解析测试
+- user_profiles的每个元素一完整就返回，与分段方式无关
+- 字符串中的括号、引号转义不影响解析
+- 输出被截断时只恢复已完整解析的字段和元素
+"""
+import json
+
+from src.utils.json_stream import StreamingProfileParser
+
+RESPONSE = json.dumps({
+    'summary': '两位客户的自我介绍 {含括号}',
+    'user_profiles': [
+        {'name': '张三', 'personality': '说话带"引号"', 'tags': ['销售', '杭州']},
+        {'name': '李四', 'age': '30', 'extra': {'note': '[嵌套]'}}
+    ]
+}, ensure_ascii=False)
+
+
+def _feed_in_chunks(parser, text, size):
+    emitted = []
+    for i in range(0, len(text), size):
+        emitted.append(parser.feed(text[i:i + size]))
+    return emitted
+
+
+def test_items_emitted_as_soon_as_complete():
+    parser = StreamingProfileParser()
+    first_end = RESPONSE.index('},') + 1
+    assert [item['name'] for item in parser.feed(RESPONSE[:first_end])] == ['张三']
+    assert parser.fields['summary'] == '两位客户的自我介绍 {含括号}'
+    assert parser.feed(RESPONSE[first_end:]) == [{'name': '李四', 'age': '30', 'extra': {'note': '[嵌套]'}}]
+    assert parser.complete
+    assert parser.result() == json.loads(RESPONSE)
+
+
+def test_any_chunking_gives_same_result():
+    for size in (1, 2, 3, 7, 64):
+        parser = StreamingProfileParser()
+        emitted = [item for items in _feed_in_chunks(parser, RESPONSE, size) for item in items]
+        assert [item['name'] for item in emitted] == ['张三', '李四']
+        assert parser.result() == json.loads(RESPONSE)
+
+
+def test_markdown_prefix_and_trailing_text_ignored():
+    parser = StreamingProfileParser()
+    parser.feed('```json\n' + RESPONSE + '\n```')
+    assert parser.feed('更多文本 {"x": 1}') == []
+    assert parser.result() == json.loads(RESPONSE)
+
+
+def test_truncated_output_recovers_complete_items():
+    parser = StreamingProfileParser()
+    cut = RESPONSE.index('"李四"')
+    parser.feed(RESPONSE[:cut])
+    assert not parser.complete
+    result = parser.result()
+    assert result['summary'] == '两位客户的自我介绍 {含括号}'
+    assert [item['name'] for item in result['user_profiles']] == ['张三']
+
+
+def test_no_json_returns_none():
+    parser = StreamingProfileParser()
+    parser.feed('抱歉，我无法分析这条消息')
+    assert parser.result() is None
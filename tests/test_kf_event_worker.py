@@ -0,0 +1,69 @@
+# test_kf_event_worker.py
+"""
+后台处理池（内存队列模式）测试
+- 未启动时拒绝提交，回调接口改为同步处理
+- 处理函数的异常不影响后续消息
+- 停机时处理完已入队的消息
+- 队列已满时拒绝提交
+"""
+import threading
+
+from src.handlers.kf_event_worker import KfEventWorkerPool
+
+
+def test_submit_rejected_when_not_running():
+    pool = KfEventWorkerPool(lambda message: None, worker_count=1)
+    assert not pool.submit({'n': 1})
+
+
+def test_failed_message_does_not_stop_worker():
+    handled = []
+
+    def handler(message):
+        if message['n'] == 0:
+            raise RuntimeError('boom')
+        handled.append(message['n'])
+
+    pool = KfEventWorkerPool(handler, worker_count=1)
+    pool.start()
+    for n in range(3):
+        assert pool.submit({'n': n})
+    pool.stop(timeout=5)
+
+    assert handled == [1, 2]
+    stats = pool.get_stats()
+    assert stats['backend'] == 'memory'
+    assert stats['processed'] == 2 and stats['failed'] == 1
+
+
+def test_stop_drains_queued_messages():
+    gate = threading.Event()
+    handled = []
+
+    def handler(message):
+        gate.wait(5)
+        handled.append(message['n'])
+
+    pool = KfEventWorkerPool(handler, worker_count=2)
+    pool.start()
+    for n in range(6):
+        assert pool.submit({'n': n})
+    gate.set()
+    pool.stop(timeout=5)
+
+    assert sorted(handled) == list(range(6))
+    assert not pool.running
+
+
+def test_full_queue_rejects():
+    gate = threading.Event()
+    pool = KfEventWorkerPool(lambda message: gate.wait(5), worker_count=1, max_queue_size=1)
+    pool.start()
+    try:
+        results = [pool.submit({'n': n}) for n in range(4)]
+    finally:
+        gate.set()
+        pool.stop(timeout=5)
+
+    assert results[0] and not all(results)
+    assert pool.get_stats()['rejected'] >= 1
@@ -0,0 +1,154 @@
+# test_kf_lane_scheduler.py
+"""
+消息分道调度测试
+- 验证码/命令/文本/媒体分类
+- 快车道按优先级出队，不排在媒体任务后面
+- 媒体消息转为媒体处理池的持久化任务：OCR/PDF处理期间到达的验证码立即回复
+"""
+import threading
+import time
+import uuid
+
+import pytest
+
+from src.database.job_queue_db import JobQueueDatabase
+from src.handlers import kf_event_worker, message_handler
+from src.handlers.kf_event_worker import KfEventWorkerPool, JOB_TYPE_KF_MEDIA
+from src.handlers.kf_lane_scheduler import KfLaneScheduler, classify_kf_message
+from src.handlers.kf_sync_coordinator import KfSyncCoordinator
+from src.services.wework_client import wework_client
+
+
+def _text(content, msgid=None):
+    return {'msgid': msgid or uuid.uuid4().hex, 'msgtype': 'text', 'text': {'content': content},
+            'origin': 3, 'send_time': int(time.time()), 'external_userid': 'wm_user'}
+
+
+def _image(msgid=None):
+    return {'msgid': msgid or uuid.uuid4().hex, 'msgtype': 'image', 'image': {'media_id': 'm1'},
+            'origin': 3, 'send_time': int(time.time()), 'external_userid': 'wm_user'}
+
+
+def test_classify_kf_message():
+    assert classify_kf_message(_text('123456')) == 'verify_code'
+    assert classify_kf_message(_text('你好，我叫张三')) == 'text'
+    assert classify_kf_message(_image()) == 'media'
+    assert classify_kf_message(_text('12345')) == 'text'
+
+
+def test_submit_runs_inline_when_not_started():
+    scheduler = KfLaneScheduler(fast_workers=1, media_workers=1)
+    future = scheduler.submit('text', lambda: 42)
+    assert future.done() and future.result() == 42
+
+
+def test_fast_lane_not_blocked_by_media():
+    scheduler = KfLaneScheduler(fast_workers=1, media_workers=1)
+    scheduler.start()
+    try:
+        release = threading.Event()
+        media = scheduler.submit('media', lambda: release.wait(5))
+        started_at = time.time()
+        code = scheduler.submit('verify_code', lambda: time.time())
+        assert code.result(timeout=2) - started_at < 0.5
+        assert not media.done()
+        release.set()
+        assert media.result(timeout=2) is True
+    finally:
+        scheduler.stop()
+    stats = scheduler.get_stats()
+    assert stats['submitted']['verify_code'] == 1
+    assert 'verify_code.total' in stats['latency']
+
+
+def test_fast_lane_priority_order():
+    scheduler = KfLaneScheduler(fast_workers=1, media_workers=1)
+    scheduler.start()
+    try:
+        gate = threading.Event()
+        order = []
+        blocker = scheduler.submit('text', lambda: gate.wait(5))
+        futures = [
+            scheduler.submit('text', lambda: order.append('text')),
+            scheduler.submit('command', lambda: order.append('command')),
+            scheduler.submit('verify_code', lambda: order.append('verify_code'))
+        ]
+        gate.set()
+        blocker.result(timeout=2)
+        for future in futures:
+            future.result(timeout=2)
+    finally:
+        scheduler.stop()
+    assert order == ['verify_code', 'command', 'text']
+
+
+@pytest.fixture
+def media_pool(sqlite_db, monkeypatch):
+    job_queue = JobQueueDatabase(sqlite_db, max_attempts=3, lease_seconds=30)
+    job_queue.create_job_table()
+    pool = KfEventWorkerPool(message_handler.process_kf_media_job, worker_count=1, job_queue=job_queue,
+                             poll_interval=0.05, purge_every=0, job_type=JOB_TYPE_KF_MEDIA)
+    monkeypatch.setattr(kf_event_worker, 'kf_media_pool', pool)
+    pool.start()
+    yield pool
+    pool.stop(timeout=5)
+
+
+def test_verify_code_not_delayed_by_slow_media_job(media_pool, monkeypatch):
+    """验证码在媒体任务处理期间到达：不用等OCR结束，也不会因同步被合并而推迟拉取"""
+    import src.database.sync_state_db as sync_state_module
+
+    open_kfid = f"wk_{uuid.uuid4().hex[:8]}"
+    image, code = _image(), _text('654321')
+    pages = [[image], [code]]
+    commits = []
+    media_started, media_release = threading.Event(), threading.Event()
+    code_handled_at = []
+
+    def fake_iter_pages(token=None, open_kf_id=None, auto_commit=True, **kwargs):
+        if pages:
+            yield {'msg_list': pages.pop(0), 'next_cursor': uuid.uuid4().hex}
+
+    def fake_handle(kf_msg, kfid):
+        if kf_msg['msgtype'] == 'image':
+            media_started.set()
+            media_release.wait(10)
+        else:
+            code_handled_at.append(time.time())
+
+    monkeypatch.setattr(sync_state_module, 'sync_state_db', None)
+    monkeypatch.setattr(wework_client, 'iter_kf_message_pages', fake_iter_pages)
+    monkeypatch.setattr(wework_client, 'commit_kf_page', lambda kfid, cursor, marks=None: commits.append(marks))
+    monkeypatch.setattr(wework_client, 'has_kf_cursor', lambda kfid=None: True)
+    monkeypatch.setattr(wework_client, 'reload_kf_cursor', lambda kfid=None: None)
+    monkeypatch.setattr(message_handler, '_handle_kf_message', fake_handle)
+
+    coordinator = KfSyncCoordinator()
+
+    def sync():
+        coordinator.run(open_kfid, 'token', lambda t: message_handler._sync_kf_account(t, open_kfid))
+
+    first = threading.Thread(target=sync)
+    first.start()
+    assert media_started.wait(5)
+
+    # 图片还在OCR，用户发来验证码
+    code_arrived_at = time.time()
+    second = threading.Thread(target=sync)
+    second.start()
+    second.join(5)
+    first.join(5)
+    try:
+        assert code_handled_at, "验证码没有在媒体任务处理期间得到处理"
+        assert code_handled_at[0] - code_arrived_at < 0.5
+        assert not media_release.is_set()
+        # 两页的游标都已提交，不等媒体任务
+        assert len(commits) == 2
+    finally:
+        media_release.set()
+
+    deadline = time.time() + 5
+    while not message_handler.sync_optimizer.is_message_processed(image['msgid']) and time.time() < deadline:
+        time.sleep(0.05)
+    assert message_handler.sync_optimizer.is_message_processed(image['msgid'])
+    assert media_pool.job_queue.get_stats()['done'] == 1
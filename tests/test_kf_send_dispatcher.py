@@ -0,0 +1,154 @@
+# test_kf_send_dispatcher.py
+"""
+回复发送调度器测试
+- 频率限制错误带退避重试，msgid不变；不可重试的错误直接放弃
+- 每个客服账号按令牌桶限速
+- 持久化模式（临时SQLite任务表）：停机未发出的回复下次启动后发送，崩溃进程遗留的回复在租约过期后被恢复，
+  放弃发送的回复进入死信
+"""
+import threading
+import time
+
+import pytest
+
+from src.database.job_queue_db import JobQueueDatabase
+from src.services.kf_send_dispatcher import KfSendDispatcher, JOB_TYPE_SEND
+
+
+class FakeSendMsg:
+    """按预设的errcode序列返回结果"""
+
+    def __init__(self, errcodes=None):
+        self.errcodes = list(errcodes or [])
+        self.sent = []
+        self.calls = []
+        self.gate = threading.Event()
+        self.gate.set()
+        self._lock = threading.Lock()
+
+    def __call__(self, payload):
+        self.gate.wait(10)
+        with self._lock:
+            self.calls.append((time.monotonic(), payload))
+            errcode = self.errcodes.pop(0) if self.errcodes else 0
+            if errcode == 0:
+                self.sent.append(payload)
+        return {'errcode': errcode, 'errmsg': 'ok' if errcode == 0 else 'error'}
+
+
+def _wait_for(predicate, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.02)
+    return predicate()
+
+
+@pytest.fixture
+def job_queue(sqlite_db):
+    queue = JobQueueDatabase(sqlite_db, max_attempts=3, lease_seconds=1)
+    assert queue.create_job_table()
+    return queue
+
+
+def _dispatcher(send, **kwargs):
+    options = dict(worker_count=1, global_rate=100, per_kf_rate=100, base_backoff=0.01, max_backoff=0.05)
+    options.update(kwargs)
+    return KfSendDispatcher(send, **options)
+
+
+def test_throttled_send_is_retried_with_same_msgid():
+    send = FakeSendMsg([45009, 45033])
+    dispatcher = _dispatcher(send)
+    dispatcher.start()
+    try:
+        assert dispatcher.submit('wm_user', 'wk_1', '你好')
+        assert _wait_for(lambda: len(send.sent) == 1)
+    finally:
+        dispatcher.stop(timeout=5)
+
+    assert len({payload['msgid'] for _, payload in send.calls}) == 1
+    stats = dispatcher.get_stats()
+    assert stats['retried'] == 2 and stats['throttled'] == 2 and stats['sent'] == 1
+
+
+def test_non_retryable_error_gives_up():
+    send = FakeSendMsg([95001])
+    dispatcher = _dispatcher(send)
+    dispatcher.start()
+    try:
+        dispatcher.submit('wm_user', 'wk_1', '你好')
+        assert _wait_for(lambda: dispatcher.get_stats()['failed'] == 1)
+    finally:
+        dispatcher.stop(timeout=5)
+    assert len(send.calls) == 1
+
+
+def test_per_kf_rate_limit():
+    slow = FakeSendMsg()
+    dispatcher = _dispatcher(slow, per_kf_rate=1)
+    dispatcher.start()
+    try:
+        for n in range(2):
+            dispatcher.submit('wm_user', 'wk_1', f"消息{n}")
+        dispatcher.submit('wm_user', 'wk_2', '其他账号')
+        assert _wait_for(lambda: len(slow.sent) == 3)
+    finally:
+        dispatcher.stop(timeout=5)
+    wk_1_times = [at for at, payload in slow.calls if payload['open_kfid'] == 'wk_1']
+    wk_2_time = [at for at, payload in slow.calls if payload['open_kfid'] == 'wk_2'][0]
+    assert wk_1_times[1] - wk_1_times[0] >= 0.9
+    # 其他客服账号的消息不等wk_1的令牌
+    assert wk_2_time < wk_1_times[1]
+
+
+def test_unsent_replies_survive_restart(job_queue):
+    send = FakeSendMsg()
+    send.gate.clear()
+    first = _dispatcher(send, job_queue=job_queue)
+    first.start()
+    for n in range(3):
+        assert first.submit('wm_user', 'wk_1', f"回复{n}")
+    # 发送线程卡在第一条上，停机时剩下两条放回任务表
+    first.stop(timeout=0.2)
+    send.gate.set()
+    assert _wait_for(lambda: len(send.sent) == 1)
+
+    second = _dispatcher(send, job_queue=job_queue)
+    second.start()
+    try:
+        assert _wait_for(lambda: len(send.sent) == 3)
+    finally:
+        second.stop(timeout=5)
+    assert sorted(payload['text']['content'] for payload in send.sent) == ['回复0', '回复1', '回复2']
+    assert second.get_stats()['recovered'] == 2
+    assert _wait_for(lambda: job_queue.get_stats()['done'] == 3)
+
+
+def test_reply_left_by_crashed_process_is_recovered(job_queue):
+    payload = {'touser': 'wm_user', 'open_kfid': 'wk_1', 'msgid': 'fixed-msgid', 'msgtype': 'text',
+               'text': {'content': '崩溃前的回复'}}
+    job_queue.enqueue_leased(JOB_TYPE_SEND, payload, 'crashed-process')
+
+    send = FakeSendMsg()
+    dispatcher = _dispatcher(send, job_queue=job_queue)
+    dispatcher.start()
+    try:
+        assert _wait_for(lambda: len(send.sent) == 1, timeout=5)
+    finally:
+        dispatcher.stop(timeout=5)
+    assert send.sent[0]['msgid'] == 'fixed-msgid'
+    assert job_queue.get_stats()['done'] == 1
+
+
+def test_given_up_reply_goes_to_dead_letter(job_queue):
+    send = FakeSendMsg([95001])
+    dispatcher = _dispatcher(send, job_queue=job_queue)
+    dispatcher.start()
+    try:
+        dispatcher.submit('wm_user', 'wk_1', '你好')
+        assert _wait_for(lambda: job_queue.get_stats()['dead'] == 1)
+    finally:
+        dispatcher.stop(timeout=5)
+    assert 'errcode=95001' in job_queue.list_dead()[0]['last_error']
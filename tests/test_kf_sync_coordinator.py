@@ -0,0 +1,70 @@
+# test_kf_sync_coordinator.py
+"""
+同步合并器测试（进程内）
+- 同步进行中到达的多次回调合并为一次补拉，补拉使用最近一次回调的Token
+- 不同客服账号互不影响
+- 同步失败时清除状态，下一次回调可以重新同步
+"""
+import threading
+
+import pytest
+
+from src.handlers.kf_sync_coordinator import KfSyncCoordinator
+
+
+def test_callbacks_during_sync_coalesce_into_one_follow_up():
+    coordinator = KfSyncCoordinator()
+    entered, release = threading.Event(), threading.Event()
+    tokens = []
+
+    def sync(token):
+        tokens.append(token)
+        if len(tokens) == 1:
+            entered.set()
+            release.wait(5)
+
+    results = []
+    first = threading.Thread(target=lambda: results.append(coordinator.run('wk_1', 't1', sync)))
+    first.start()
+    assert entered.wait(5)
+    # 同步进行中到达三次回调
+    assert [coordinator.run('wk_1', token, sync) for token in ('t2', 't3', 't4')] == [False] * 3
+    release.set()
+    first.join(5)
+
+    assert results == [True]
+    assert tokens == ['t1', 't4']
+    stats = coordinator.get_stats()
+    assert stats['coalesced'] == 3 and stats['follow_ups'] == 1
+    assert stats['running_accounts'] == []
+
+
+def test_accounts_sync_independently():
+    coordinator = KfSyncCoordinator()
+    entered, release = threading.Event(), threading.Event()
+    synced = []
+
+    def slow_sync(token):
+        entered.set()
+        release.wait(5)
+
+    worker = threading.Thread(target=coordinator.run, args=('wk_1', 't1', slow_sync))
+    worker.start()
+    assert entered.wait(5)
+    assert coordinator.run('wk_2', 't2', synced.append)
+    release.set()
+    worker.join(5)
+    assert synced == ['t2']
+
+
+def test_failed_sync_resets_state():
+    coordinator = KfSyncCoordinator()
+
+    def failing_sync(token):
+        raise RuntimeError('sync_msg失败')
+
+    with pytest.raises(RuntimeError):
+        coordinator.run('wk_1', 't1', failing_sync)
+    synced = []
+    assert coordinator.run('wk_1', 't2', synced.append)
+    assert synced == ['t2']
@@ -0,0 +1,126 @@
+# test_media_cache.py
+"""
+媒体处理结果缓存测试（临时SQLite）
+- 相同内容换了media_id也命中；见过的media_id无需下载即可命中
+- 不可缓存的结果不保存
+- 同一内容的并发处理共享一次compute；进行中的处理失败时等待者自行处理
+- 超出容量预算时按最近使用时间淘汰
+"""
+import hashlib
+import threading
+import time
+
+import pytest
+
+from src.database.media_cache_db import MediaCacheDatabase
+from src.services.media_cache import MediaResultCache, file_sha256
+
+
+@pytest.fixture
+def store(sqlite_db):
+    cache_db = MediaCacheDatabase(sqlite_db, max_bytes=1024 * 1024)
+    assert cache_db.create_cache_tables()
+    return cache_db
+
+
+def test_file_sha256(tmp_path):
+    path = tmp_path / 'card.jpg'
+    data = b'card' * 500000
+    path.write_bytes(data)
+    # 超过一个读取块，分块计算结果与一次性计算一致
+    assert file_sha256(str(path)) == hashlib.sha256(data).hexdigest()
+
+
+def test_content_hash_and_alias_hits(store):
+    cache = MediaResultCache(store)
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return '张三 销售经理', {'pages': 1}, True
+
+    assert cache.get_by_media_id('media_1', 'ocr') is None
+    assert cache.get_or_compute('hash_a', 'ocr', 'media_1', compute) == '张三 销售经理'
+    # 同一内容被重新上传，media_id不同
+    assert cache.get_or_compute('hash_a', 'ocr', 'media_2', compute) == '张三 销售经理'
+    assert len(calls) == 1
+
+    entry = cache.get_by_media_id('media_2', 'ocr')
+    assert entry['text'] == '张三 销售经理' and entry['metadata'] == {'pages': 1}
+    # 处理方式不同不共享结果
+    assert cache.get_by_media_id('media_2', 'asr') is None
+
+    stats = cache.get_stats()
+    assert stats['alias_hits'] == 1 and stats['content_hits'] == 1 and stats['misses'] == 1
+    assert stats['entries'] == 1
+
+
+def test_uncacheable_result_not_saved(store):
+    cache = MediaResultCache(store)
+    assert cache.get_or_compute('hash_b', 'asr', 'media_3', lambda: ('', {}, False)) == ''
+    assert store.get('hash_b', 'asr') is None
+    assert cache.get_stats()['entries'] == 0
+
+
+def test_concurrent_same_content_shares_compute(store):
+    cache = MediaResultCache(store)
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.2)
+        return '名片文字', {}, True
+
+    results = []
+    threads = [threading.Thread(target=lambda i=i: results.append(
+        cache.get_or_compute('hash_c', 'ocr', f'media_{i}', compute))) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert results == ['名片文字'] * 4
+    stats = cache.get_stats()
+    assert stats['misses'] + stats['content_hits'] + stats['shared'] == 4 and stats['shared'] >= 1
+
+
+def test_waiter_recomputes_when_owner_fails(store):
+    cache = MediaResultCache(store)
+    started = threading.Event()
+    calls = []
+
+    def failing():
+        calls.append('owner')
+        started.set()
+        time.sleep(0.1)
+        raise RuntimeError('ocr failed')
+
+    def owner():
+        with pytest.raises(RuntimeError):
+            cache.get_or_compute('hash_d', 'ocr', 'media_1', failing)
+
+    thread = threading.Thread(target=owner)
+    thread.start()
+    started.wait(5)
+    result = cache.get_or_compute('hash_d', 'ocr', 'media_2',
+                                  lambda: calls.append('waiter') or ('重试结果', {}, True))
+    thread.join(5)
+
+    assert result == '重试结果'
+    assert calls == ['owner', 'waiter']
+    assert cache.get_stats()['shared'] == 1
+
+
+def test_evict_least_recently_used(sqlite_db):
+    store = MediaCacheDatabase(sqlite_db, max_bytes=40)
+    store.create_cache_tables()
+    store.put('old', 'ocr', 'a' * 20, {}, 0)
+    time.sleep(0.01)
+    store.put('new', 'ocr', 'b' * 20, {}, 0)
+    time.sleep(0.01)
+    store.put('newest', 'ocr', 'c' * 10, {}, 0)
+
+    assert store.evict() == 1
+    assert store.get('old', 'ocr') is None
+    assert store.get('new', 'ocr') is not None and store.get('newest', 'ocr') is not None
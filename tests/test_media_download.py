@@ -0,0 +1,118 @@
+# test_media_download.py
+"""
+媒体文件流式下载测试
+- 分块写入临时文件，按Content-Type或文件头确定扩展名，同一media_id每次下载得到不同路径
+- Content-Length或实际字节数超过该类型上限时中止并删除临时文件
+- 企业微信返回errcode时视为失败；token失效时作废并重试一次；真正的JSON附件不误判
+"""
+import json
+import os
+
+import pytest
+
+from src.services.media_processor import MediaProcessor
+from src.services.wework_client import wework_client
+
+
+class FakeResponse:
+    def __init__(self, body: bytes, content_type: str, status_code: int = 200, content_length: bool = True):
+        self.body = body
+        self.status_code = status_code
+        self.headers = {'Content-Type': content_type}
+        if content_length:
+            self.headers['Content-Length'] = str(len(body))
+        self.read_bytes = 0
+
+    def iter_content(self, chunk_size):
+        for i in range(0, len(self.body), chunk_size):
+            self.read_bytes += chunk_size
+            yield self.body[i:i + chunk_size]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+@pytest.fixture
+def processor(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    media_processor = MediaProcessor()
+    media_processor.download_chunk_size = 1024
+    media_processor.max_download_bytes = {'voice': 4096, 'image': 4096, 'video': 4096, 'file': 4096}
+    return media_processor
+
+
+@pytest.fixture
+def responses(monkeypatch):
+    queue = []
+    tokens = iter(['token_1', 'token_2'])
+    invalidated = []
+    monkeypatch.setattr(wework_client, 'get_access_token', lambda: next(tokens))
+    monkeypatch.setattr(wework_client.session, 'get', lambda url, **kwargs: queue.pop(0))
+    monkeypatch.setattr(wework_client.token_manager, 'invalidate', invalidated.append)
+    return queue, invalidated
+
+
+def _leftovers(processor):
+    return [name for name in os.listdir(processor.temp_dir) if name.endswith('.part')]
+
+
+def test_stream_download_unique_paths(processor, responses):
+    queue, _ = responses
+    body = b'%PDF-1.4' + b'x' * 3000
+    queue.extend([FakeResponse(body, 'application/octet-stream'), FakeResponse(body, 'application/pdf')])
+
+    first = processor.download_media('media_1', 'file')
+    second = processor.download_media('media_1', 'file')
+    # 按文件头识别出pdf
+    assert first.endswith('.pdf') and second.endswith('.pdf') and first != second
+    with open(first, 'rb') as f:
+        assert f.read() == body
+    assert processor.get_stats()['downloads'] == 2
+
+
+def test_content_length_over_limit_not_downloaded(processor, responses):
+    queue, _ = responses
+    response = FakeResponse(b'x' * 5000, 'audio/amr')
+    queue.append(response)
+    assert processor.download_media('media_2') is None
+    assert response.read_bytes == 0
+    assert processor.get_stats()['aborted'] == 1
+
+
+def test_stream_over_limit_aborted(processor, responses):
+    queue, _ = responses
+    response = FakeResponse(b'x' * 10000, 'image/jpeg', content_length=False)
+    queue.append(response)
+    assert processor.download_media('media_3', 'image') is None
+    # 超出上限后不再继续读取
+    assert response.read_bytes <= 4096 + 1024
+    assert _leftovers(processor) == []
+
+
+def test_invalid_token_refreshed_and_retried(processor, responses):
+    queue, invalidated = responses
+    error = json.dumps({'errcode': 42001, 'errmsg': 'access_token expired'}).encode()
+    queue.extend([FakeResponse(error, 'application/json'), FakeResponse(b'\xff\xd8\xff' + b'x' * 100, 'image/jpeg')])
+
+    file_path = processor.download_media('media_4', 'image')
+    assert file_path and file_path.endswith('.jpg')
+    assert invalidated == ['token_1']
+    assert _leftovers(processor) == []
+
+
+def test_other_errcode_fails_without_retry(processor, responses):
+    queue, invalidated = responses
+    error = json.dumps({'errcode': 40007, 'errmsg': 'invalid media_id'}).encode()
+    queue.append(FakeResponse(error, 'text/plain'))
+    assert processor.download_media('media_5', 'file') is None
+    assert invalidated == [] and _leftovers(processor) == []
+
+
+def test_json_attachment_is_not_an_error(processor, responses):
+    queue, invalidated = responses
+    queue.append(FakeResponse(json.dumps({'errcode': 0, 'name': '张三'}).encode(), 'application/json'))
+    assert processor.download_media('media_6', 'file') is not None
+    assert invalidated == []
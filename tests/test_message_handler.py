@@ -0,0 +1,77 @@
+# test_message_handler.py
+"""
+逐页处理微信客服消息测试
+- 每一条新的客户消息都会被处理，处理成功后提交本页游标和已处理标记
+- 任意一条失败时不提交游标，后面的消息留到重试时处理
+"""
+import time
+import uuid
+
+import pytest
+
+from src.handlers import message_handler
+from src.services.wework_client import wework_client
+
+
+def _text(content):
+    return {'msgid': uuid.uuid4().hex, 'msgtype': 'text', 'text': {'content': content}, 'origin': 3,
+            'send_time': int(time.time()), 'external_userid': 'wm_user'}
+
+
+@pytest.fixture
+def kf_pages(monkeypatch):
+    import src.database.sync_state_db as sync_state_module
+
+    pages = []
+    commits = []
+
+    def fake_iter_pages(token=None, open_kf_id=None, auto_commit=True, **kwargs):
+        while pages:
+            yield {'msg_list': pages.pop(0), 'next_cursor': uuid.uuid4().hex}
+
+    monkeypatch.setattr(sync_state_module, 'sync_state_db', None)
+    monkeypatch.setattr(wework_client, 'iter_kf_message_pages', fake_iter_pages)
+    monkeypatch.setattr(wework_client, 'commit_kf_page',
+                        lambda kfid, cursor, marks=None: commits.append([msgid for msgid, _ in marks]))
+    monkeypatch.setattr(wework_client, 'has_kf_cursor', lambda kfid=None: True)
+    return pages, commits
+
+
+def test_every_new_message_is_handled(kf_pages, monkeypatch):
+    pages, commits = kf_pages
+    first, second, third = _text('我叫张三'), _text('在杭州'), _text('做销售')
+    pages.extend([[second, first], [third]])
+    handled = []
+    monkeypatch.setattr(message_handler, '_handle_kf_message', lambda kf_msg, kfid: handled.append(kf_msg['msgid']))
+
+    message_handler._handle_kf_message_batches('token', 'wk_1')
+
+    # 同一页按发送时间处理，不只处理最新一条
+    assert set(handled[:2]) == {first['msgid'], second['msgid']} and handled[2] == third['msgid']
+    assert [sorted(marks) for marks in commits] == [sorted([first['msgid'], second['msgid']]), [third['msgid']]]
+    assert all(message_handler.sync_optimizer.is_message_processed(msgid) for msgid in handled)
+
+
+def test_failure_keeps_cursor(kf_pages, monkeypatch):
+    pages, commits = kf_pages
+    ok, bad, later = _text('我叫李四'), _text('今年30岁'), _text('住在上海')
+    ok['send_time'] -= 2
+    bad['send_time'] -= 1
+    pages.append([ok, bad, later])
+    handled = []
+
+    def fake_handle(kf_msg, kfid):
+        if kf_msg is bad:
+            raise RuntimeError('AI服务不可用')
+        handled.append(kf_msg['msgid'])
+
+    monkeypatch.setattr(message_handler, '_handle_kf_message', fake_handle)
+
+    with pytest.raises(RuntimeError):
+        message_handler._handle_kf_message_batches('token', 'wk_1')
+
+    assert handled == [ok['msgid']]
+    assert commits == []
+    # 已成功的消息记为已处理，重试时不会重复回复
+    assert message_handler.sync_optimizer.is_message_processed(ok['msgid'])
+    assert not message_handler.sync_optimizer.is_message_processed(bad['msgid'])
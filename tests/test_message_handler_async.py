@@ -0,0 +1,138 @@
+# test_message_handler_async.py
+"""
+同步回调模式的事件循环处理路径测试
+本地aiohttp服务模拟企业微信接口和大模型接口：sync_msg拉取、画像分析和send_msg回复都在事件循环中异步完成，
+企业微信token失效时刷新后重试一次
+"""
+import asyncio
+import json
+import time
+import uuid
+
+import pytest
+from aiohttp import web
+
+from src.handlers import message_handler_async
+from src.services import wework_client_async
+from src.services.ai_service import UserProfileExtractor
+from src.services.kf_send_dispatcher import kf_send_dispatcher
+from src.services.wework_client import wework_client
+
+
+class FakeWeWork:
+    """模拟kf/sync_msg、kf/send_msg和chat/completions"""
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.sent = []
+        self.tokens = []
+        self.expired_tokens = set()
+        self.completions = 0
+
+    async def handle(self, request):
+        token = request.query.get('access_token')
+        self.tokens.append(token)
+        if token in self.expired_tokens:
+            return web.json_response({'errcode': 42001, 'errmsg': 'access_token expired'})
+        body = await request.json()
+        if request.path.endswith('sync_msg'):
+            msg_list = self.pages.pop(0) if self.pages else []
+            return web.json_response({'errcode': 0, 'msg_list': msg_list, 'has_more': 1 if self.pages else 0,
+                                      'next_cursor': uuid.uuid4().hex})
+        self.sent.append(body)
+        return web.json_response({'errcode': 0, 'errmsg': 'ok', 'msgid': uuid.uuid4().hex})
+
+    async def complete(self, request):
+        self.completions += 1
+        body = await request.json()
+        name = body['messages'][-1]['content'].split('我叫')[-1][:2]
+        content = json.dumps({'summary': '自我介绍', 'user_profiles': [{'name': name}]}, ensure_ascii=False)
+        return web.json_response({'choices': [{'message': {'content': content}}]})
+
+
+async def _serve(fake: FakeWeWork):
+    app = web.Application()
+    app.router.add_post('/cgi-bin/kf/{name}', fake.handle)
+    app.router.add_post('/v1/chat/completions', fake.complete)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}/cgi-bin"
+
+
+@pytest.fixture
+def kf_env(monkeypatch):
+    import src.database.sync_state_db as sync_state_module
+    commits = []
+    tokens = ['T1']
+    monkeypatch.setattr(sync_state_module, 'sync_state_db', None)
+    monkeypatch.setattr(wework_client, 'commit_kf_page', lambda kfid, cursor, marks=None: commits.append(marks))
+    monkeypatch.setattr(wework_client, 'has_kf_cursor', lambda kfid=None: True)
+    monkeypatch.setattr(wework_client, 'reload_kf_cursor', lambda kfid=None: None)
+    monkeypatch.setattr(wework_client, '_get_kf_cursor', lambda key: 'cursor')
+    monkeypatch.setattr(wework_client.token_manager, 'peek', lambda: tokens[0])
+    monkeypatch.setattr(wework_client.token_manager, 'invalidate', lambda token: tokens.append(tokens.pop(0) + 'x'))
+    monkeypatch.setattr(kf_send_dispatcher, '_running', False)
+    saved = []
+    monkeypatch.setattr(message_handler_async, '_make_profile_saver',
+                        lambda *args: lambda profile, ai_response: saved.append(profile))
+    return commits, saved
+
+
+def _text(content):
+    return {'msgid': uuid.uuid4().hex, 'msgtype': 'text', 'text': {'content': content}, 'origin': 3,
+            'send_time': int(time.time()), 'external_userid': 'wm_user', 'open_kfid': 'wk_1'}
+
+
+def test_kf_event_pulls_and_replies_through_async_client(kf_env, monkeypatch):
+    commits, saved = kf_env
+    fake = FakeWeWork([[_text('我叫张三，在杭州做销售')], [_text('我叫李四，今年30岁')]])
+
+    async def scenario():
+        runner, base = await _serve(fake)
+        monkeypatch.setattr(wework_client_async, 'WEWORK_API_BASE', base)
+        client = wework_client_async.AsyncWeWorkClient(wework_client_async.config, wework_client)
+        monkeypatch.setattr(message_handler_async, 'async_wework_client', client)
+        extractor = UserProfileExtractor(max_concurrency=2, timeout=5)
+        extractor.api_endpoint = base.replace('/cgi-bin', '/v1')
+        monkeypatch.setattr(message_handler_async, 'profile_extractor', extractor)
+        try:
+            await message_handler_async.dispatch_callback_message_async({
+                'MsgType': 'event', 'Event': 'kf_msg_or_event', 'ToUserName': 'corp',
+                'OpenKfId': f"wk_{uuid.uuid4().hex[:8]}", 'Token': 'tk', 'CreateTime': str(time.time())
+            })
+        finally:
+            await extractor.close()
+            await client.close()
+            await runner.cleanup()
+
+    asyncio.run(scenario())
+    assert fake.completions == 2
+    assert [profile['name'] for profile in saved] == ['张三', '李四']
+    replies = [body['text']['content'] for body in fake.sent]
+    assert len(replies) == 2
+    assert '姓名: 张三' in replies[0] and '姓名: 李四' in replies[1]
+    # 两页分别提交游标，并带上本页已处理的msgid
+    assert [len(marks) for marks in commits] == [1, 1]
+
+
+def test_async_client_retries_once_on_expired_token(kf_env, monkeypatch):
+    fake = FakeWeWork([])
+    fake.expired_tokens.add('T1')
+
+    async def scenario():
+        runner, base = await _serve(fake)
+        monkeypatch.setattr(wework_client_async, 'WEWORK_API_BASE', base)
+        client = wework_client_async.AsyncWeWorkClient(wework_client_async.config, wework_client)
+        try:
+            return await client.send_text_message('wm_user', 'wk_1', '你好')
+        finally:
+            await client.close()
+            await runner.cleanup()
+
+    result = asyncio.run(scenario())
+    assert result['errcode'] == 0
+    assert fake.tokens == ['T1', 'T1x']
+    assert len(fake.sent) == 1
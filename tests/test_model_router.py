@@ -0,0 +1,93 @@
+# test_model_router.py
+"""
+模型分级路由与熔断测试
+- 短消息用最快档位，聊天记录和长文本用最强档位
+- 错误率或p95超出SLO时熔断，降级到更快的档位
+- 冷却后放行一次探测：正常则恢复，失败则再次熔断；探测未上报结果时重新探测
+"""
+import time
+
+import pytest
+
+from src.services.model_router import ModelRouter, CLOSED, OPEN
+
+TIERS = ['qwen-turbo', 'qwen-plus', 'qwen-max']
+
+
+def _router(**kwargs):
+    options = dict(short_chars=10, long_chars=100, slo_p95_ms=1000, max_error_rate=0.2, window_size=10,
+                   min_samples=5, cooldown=0.1)
+    options.update(kwargs)
+    return ModelRouter(TIERS, **options)
+
+
+def _state(router, model):
+    return next(tier for tier in router.get_stats()['tiers'] if tier['model'] == model)['state']
+
+
+def test_requires_tiers():
+    with pytest.raises(ValueError):
+        ModelRouter([])
+
+
+def test_choose_by_input():
+    router = _router()
+    assert router.choose('你好') == 'qwen-turbo'
+    assert router.choose('我' * 50) == 'qwen-plus'
+    assert router.choose('我' * 200) == 'qwen-max'
+    assert router.choose('你好', is_chat_record=True) == 'qwen-max'
+
+
+def test_error_rate_trips_and_fails_over():
+    router = _router()
+    for _ in range(5):
+        router.record('qwen-max', 0.1, False)
+    assert _state(router, 'qwen-max') == OPEN
+    assert router.choose('我' * 200) == 'qwen-plus'
+    assert router.get_stats()['failovers'] == 1
+
+
+def test_slow_p95_trips():
+    router = _router()
+    for _ in range(5):
+        router.record('qwen-plus', 2.0, True)
+    assert _state(router, 'qwen-plus') == OPEN
+    assert router.choose('我' * 50) == 'qwen-turbo'
+
+
+def test_all_tripped_uses_preferred():
+    router = _router(cooldown=60)
+    for model in TIERS:
+        for _ in range(5):
+            router.record(model, 0.1, False)
+    assert router.choose('我' * 50) == 'qwen-plus'
+
+
+def test_probe_recovers_or_trips_again():
+    router = _router()
+    for _ in range(5):
+        router.record('qwen-max', 0.1, False)
+    time.sleep(0.15)
+
+    # 冷却结束后只放行一次探测
+    assert router.choose('我' * 200) == 'qwen-max'
+    assert router.choose('我' * 200) == 'qwen-plus'
+    router.record('qwen-max', 3.0, True)
+    assert _state(router, 'qwen-max') == OPEN
+
+    time.sleep(0.15)
+    assert router.choose('我' * 200) == 'qwen-max'
+    router.record('qwen-max', 0.2, True)
+    assert _state(router, 'qwen-max') == CLOSED
+    assert router.choose('我' * 200) == 'qwen-max'
+
+
+def test_unreported_probe_is_retried():
+    router = _router()
+    for _ in range(5):
+        router.record('qwen-max', 0.1, False)
+    time.sleep(0.15)
+    assert router.choose('我' * 200) == 'qwen-max'
+    # 探测请求命中缓存，没有上报结果
+    time.sleep(0.15)
+    assert router.choose('我' * 200) == 'qwen-max'
@@ -0,0 +1,116 @@
+# test_profile_batcher.py
+"""
+短消息批处理测试
+- 窗口内的短消息合并为一次请求，结果按编号拆分给各自的调用方
+- 凑满max_items立即发送；模型漏掉的消息单独重试；不同模型分开请求
+- 聊天记录和长消息不参与批处理
+- 批量响应（m1..mN）解析
+"""
+import json
+import threading
+import time
+
+from src.services.ai_service import UserProfileExtractor
+from src.services.profile_batcher import ProfileBatcher
+
+
+class FakeExtractor:
+    timeout = 5
+
+    def __init__(self, drop=()):
+        self.drop = set(drop)
+        self.batches = []
+        self.singles = []
+        self._lock = threading.Lock()
+
+    def extract_batch(self, texts, model=None):
+        with self._lock:
+            self.batches.append((model, list(texts)))
+        return [None if text in self.drop else {'success': True, 'text': text, 'model': model} for text in texts]
+
+    def _extract_single(self, text, is_chat_record, model=None):
+        with self._lock:
+            self.singles.append(text)
+        return {'success': True, 'text': text, 'model': model, 'single': True}
+
+    def _error_result(self, summary, error):
+        return {'success': False, 'error': error}
+
+
+def _submit_all(batcher, texts, model=None):
+    results = {}
+    threads = [threading.Thread(target=lambda t=text: results.__setitem__(t, batcher.submit(t, model)))
+               for text in texts]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    return results
+
+
+def test_messages_in_window_share_one_request():
+    extractor = FakeExtractor()
+    batcher = ProfileBatcher(extractor, window_ms=200, max_items=8)
+    results = _submit_all(batcher, ['我叫张三', '今年30岁', '在杭州'])
+
+    assert len(extractor.batches) == 1
+    assert sorted(extractor.batches[0][1]) == sorted(results)
+    assert all(result['text'] == text for text, result in results.items())
+    stats = batcher.get_stats()
+    assert stats['batches'] == 1 and stats['batched_items'] == 3
+
+
+def test_full_batch_sent_without_waiting_window():
+    extractor = FakeExtractor()
+    batcher = ProfileBatcher(extractor, window_ms=5000, max_items=2)
+    started_at = time.time()
+    _submit_all(batcher, ['a', 'b'])
+    assert time.time() - started_at < 2
+    assert len(extractor.batches) == 1
+
+
+def test_missing_results_retried_individually():
+    extractor = FakeExtractor(drop={'b'})
+    batcher = ProfileBatcher(extractor, window_ms=200, max_items=8)
+    results = _submit_all(batcher, ['a', 'b', 'c'])
+    assert extractor.singles == ['b']
+    assert results['b']['single'] and not results['a'].get('single')
+    assert batcher.get_stats()['fallbacks'] == 1
+
+
+def test_models_are_batched_separately():
+    extractor = FakeExtractor()
+    batcher = ProfileBatcher(extractor, window_ms=200, max_items=8)
+    results = {}
+    threads = [threading.Thread(target=lambda t=text, m=model: results.__setitem__(t, batcher.submit(t, m)))
+               for text, model in [('a', 'qwen-plus'), ('b', 'qwen-turbo'), ('c', 'qwen-plus')]]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert results['b']['model'] == 'qwen-turbo'
+    assert results['a']['model'] == results['c']['model'] == 'qwen-plus'
+    assert sorted(model for model, _ in extractor.batches) == ['qwen-plus']
+    assert extractor.singles == ['b']
+
+
+def test_accepts_only_short_plain_messages():
+    batcher = ProfileBatcher(FakeExtractor(), max_chars=10)
+    assert batcher.accepts('我叫张三', False)
+    assert not batcher.accepts('我叫张三', True)
+    assert not batcher.accepts('很长' * 10, False)
+
+
+def test_extract_batch_splits_results_by_id(monkeypatch):
+    extractor = UserProfileExtractor()
+    content = json.dumps({'results': [
+        {'id': 'm2', 'summary': '年龄', 'user_profiles': [{'age': '30'}]},
+        {'id': 'm1', 'summary': '自我介绍', 'user_profiles': [{'name': '张三'}]}
+    ]}, ensure_ascii=False)
+    body = json.dumps({'choices': [{'message': {'content': content}}]})
+    monkeypatch.setattr(extractor, 'post_chat_completion', lambda data: (200, body))
+
+    results = extractor.extract_batch(['我叫张三', '今年30岁', '在杭州'])
+    assert results[0]['data']['user_profiles'] == [{'name': '张三'}]
+    assert results[1]['data']['summary'] == '年龄'
+    assert results[2] is None
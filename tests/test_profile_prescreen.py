@@ -0,0 +1,65 @@
+# test_profile_prescreen.py
+"""
+画像信号本地预筛测试
+- 寒暄、致谢等无画像信号的文本得分低于阈值，被跳过；自我介绍、电话等文本放行
+- 统计跳过率
+- 只在开启预筛时对普通文本生效，跳过时不调用大模型并返回固定回复
+"""
+import pytest
+
+from src.config.config import config
+from src.handlers import message_handler
+from src.handlers.profile_prescreen import ProfilePrescreener
+
+
+@pytest.mark.parametrize('text', ['好的', '谢谢', '[微笑]', '', '   '])
+def test_small_talk_is_skipped(text):
+    prescreener = ProfilePrescreener(threshold=2)
+    assert prescreener.score(text)[0] == 0
+    assert not prescreener.should_extract(text)
+
+
+def test_profile_signals_pass():
+    prescreener = ProfilePrescreener(threshold=2)
+    total, signals = prescreener.score('我叫张三，在杭州做销售')
+    assert {'name_intro', 'chinese_name', 'location', 'position'} <= set(signals)
+    assert total >= 2 and prescreener.should_extract('我叫张三，在杭州做销售')
+
+    assert prescreener.score('13812345678') == (3, ['phone'])
+    assert prescreener.should_extract('13812345678')
+    # 单个弱信号不足以调用大模型
+    assert prescreener.score('在杭州') == (1, ['location'])
+    assert not prescreener.should_extract('在杭州')
+
+
+def test_skip_rate_stats():
+    prescreener = ProfilePrescreener(threshold=2)
+    for text in ('好的', '谢谢', '我今年30岁', '收到'):
+        prescreener.should_extract(text)
+    assert prescreener.get_stats() == {'threshold': 2, 'screened': 4, 'skipped': 3, 'skip_rate': 0.75}
+
+
+def _message(content):
+    return {'MsgType': 'text', 'Content': content, 'FromUserName': 'wm_user'}
+
+
+def test_prescreen_only_applies_when_enabled(monkeypatch):
+    monkeypatch.setattr(config, 'prescreen_enabled', False)
+    assert not message_handler._prescreen_skip(_message('好的'), 'general_text')
+
+    monkeypatch.setattr(config, 'prescreen_enabled', True)
+    assert message_handler._prescreen_skip(_message('好的'), 'general_text')
+    assert not message_handler._prescreen_skip(_message('我叫张三'), 'general_text')
+    # 聊天记录、文件等其他类型不预筛
+    assert not message_handler._prescreen_skip(_message('好的'), 'chat_record')
+
+
+def test_skipped_message_does_not_call_model(monkeypatch):
+    monkeypatch.setattr(config, 'prescreen_enabled', True)
+    monkeypatch.setattr(config, 'prescreen_reply', '收到')
+    calls = []
+    monkeypatch.setattr(message_handler.profile_extractor, 'extract_user_profile',
+                        lambda *args, **kwargs: calls.append(args))
+
+    assert message_handler.process_message_and_get_result(_message('好的')) == '收到'
+    assert calls == []
@@ -0,0 +1,108 @@
+# test_sync_lease_db.py
+"""
+跨进程同步租约测试
+- 同一客服账号同一时间只有一个持有者，过期后可被接管
+- 其他进程的回调转为租约上的待补拉标记，持有者释放前补拉一次
+- 既拿不到租约也无法标记待补拉时抛出SyncLeaseUnavailableError，交由任务队列重试
+"""
+import threading
+import time
+
+import pytest
+
+from src.database.sync_lease_db import SyncLeaseDatabase, MemorySyncLease
+from src.handlers.kf_sync_coordinator import KfSyncCoordinator, SyncLeaseUnavailableError
+
+
+@pytest.fixture
+def lease_db(sqlite_db):
+    leases = SyncLeaseDatabase(sqlite_db, lease_seconds=30)
+    assert leases.create_lease_table()
+    return leases
+
+
+def test_single_holder_and_expiry(lease_db):
+    assert lease_db.acquire('wk_1', 'proc-a')
+    assert not lease_db.acquire('wk_1', 'proc-b')
+    assert lease_db.renew('wk_1', 'proc-a')
+    assert not lease_db.renew('wk_1', 'proc-b')
+
+    lease_db.abandon('wk_1', 'proc-a')
+    assert lease_db.acquire('wk_1', 'proc-b')
+    assert not lease_db.renew('wk_1', 'proc-a')
+
+
+def test_release_with_pending_keeps_lease(lease_db):
+    lease_db.acquire('wk_1', 'proc-a')
+    assert lease_db.mark_pending('wk_1', 'tk2')
+    assert lease_db.release('wk_1', 'proc-a') == (False, 'tk2')
+    assert not lease_db.acquire('wk_1', 'proc-b')
+    assert lease_db.release('wk_1', 'proc-a') == (True, '')
+    # 租约已释放，待补拉标记无处可写
+    assert not lease_db.mark_pending('wk_1', 'tk3')
+
+
+def test_two_processes_forward_callback_to_holder(lease_db):
+    proc_a = KfSyncCoordinator(lease_backend=lease_db, owner_id='proc-a')
+    proc_b = KfSyncCoordinator(lease_backend=lease_db, owner_id='proc-b')
+    entered, release = threading.Event(), threading.Event()
+    tokens = []
+
+    def sync(token):
+        tokens.append(token)
+        if len(tokens) == 1:
+            entered.set()
+            release.wait(5)
+
+    worker = threading.Thread(target=proc_a.run, args=('wk_1', 't1', sync))
+    worker.start()
+    assert entered.wait(5)
+    # 另一个进程收到回调：不自己拉取，转为待补拉
+    assert not proc_b.run('wk_1', 't2', sync)
+    release.set()
+    worker.join(5)
+
+    assert tokens == ['t1', 't2']
+    assert proc_b.get_stats()['forwarded'] == 1
+    assert proc_a.get_stats()['follow_ups'] == 1
+    assert lease_db.acquire('wk_1', 'proc-b')
+
+
+class _FlakyLease(MemorySyncLease):
+    """租约在acquire和mark_pending之间总是恰好过期"""
+
+    def acquire(self, open_kfid, owner):
+        return False
+
+    def mark_pending(self, open_kfid, token=''):
+        return False
+
+
+def test_unavailable_lease_raises_and_counts():
+    coordinator = KfSyncCoordinator(lease_backend=_FlakyLease(), owner_id='proc-a')
+    synced = []
+    with pytest.raises(SyncLeaseUnavailableError):
+        coordinator.run('wk_1', 't1', synced.append)
+    assert synced == []
+    stats = coordinator.get_stats()
+    assert stats['lease_failures'] == 1
+    assert stats['running_accounts'] == []
+
+
+def test_lease_backend_error_resets_state():
+    class BrokenLease(MemorySyncLease):
+        def acquire(self, open_kfid, owner):
+            raise RuntimeError('database is locked')
+
+    coordinator = KfSyncCoordinator(lease_backend=BrokenLease(), owner_id='proc-a')
+    with pytest.raises(RuntimeError):
+        coordinator.run('wk_1', 't1', lambda token: None)
+    assert coordinator.get_stats()['running_accounts'] == []
+
+
+def test_memory_lease_expires():
+    leases = MemorySyncLease(lease_seconds=0.05)
+    assert leases.acquire('wk_1', 'proc-a')
+    assert not leases.acquire('wk_1', 'proc-b')
+    time.sleep(0.1)
+    assert leases.acquire('wk_1', 'proc-b')
@@ -0,0 +1,67 @@
+# test_sync_state_db.py
+"""
+同步游标和已处理消息标记测试
+- 游标和本页已处理标记一起提交，重启后读到同一个游标
+- 已处理的msgid在后续拉取中被跳过，过期标记可清理
+"""
+import time
+import uuid
+
+import pytest
+
+from src.database.sync_state_db import SyncStateDatabase
+from src.handlers.message_handler import _select_new_kf_messages
+
+
+@pytest.fixture
+def sync_state(sqlite_db):
+    state = SyncStateDatabase(sqlite_db)
+    assert state.create_sync_tables()
+    return state
+
+
+def _msg(origin=3, send_time=None):
+    return {'msgid': uuid.uuid4().hex, 'msgtype': 'text', 'text': {'content': 'hi'}, 'origin': origin,
+            'send_time': send_time if send_time is not None else int(time.time())}
+
+
+def test_commit_page_persists_cursor_and_marks(sync_state, sqlite_db):
+    assert sync_state.get_cursor('wk_1') is None
+    assert sync_state.commit_page('wk_1', 'c1', [('m1', 1), ('m2', 2)])
+    assert sync_state.commit_page('wk_1', None, [('m3', 3)])
+
+    # 新实例（重启）读到同一份状态
+    reopened = SyncStateDatabase(sqlite_db)
+    assert reopened.get_cursor('wk_1') == 'c1'
+    assert reopened.get_cursor('wk_2') is None
+    assert reopened.filter_processed(['m1', 'm3', 'm4']) == {'m1', 'm3'}
+
+
+def test_mark_processed_does_not_move_cursor(sync_state):
+    sync_state.commit_page('wk_1', 'c1', [])
+    assert sync_state.mark_processed('wk_1', 'm1', 1)
+    assert sync_state.get_cursor('wk_1') == 'c1'
+    assert sync_state.filter_processed(['m1']) == {'m1'}
+
+
+def test_purge_processed(sync_state):
+    sync_state.commit_page('wk_1', None, [('old', 1)])
+    time.sleep(0.1)
+    sync_state.commit_page('wk_1', None, [('new', 2)])
+    assert sync_state.purge_processed(older_than_seconds=0.05) == 1
+    assert sync_state.filter_processed(['old', 'new']) == {'new'}
+
+
+def test_select_skips_processed_and_non_customer_messages(sync_state):
+    done, fresh, agent, old = _msg(), _msg(), _msg(origin=5), _msg(send_time=int(time.time()) - 3600)
+    duplicate = dict(fresh)
+    sync_state.mark_processed('wk_1', done['msgid'], done['send_time'])
+
+    to_handle, page_marks, skipped = _select_new_kf_messages(
+        [done, fresh, duplicate, agent, old], 'wk_1', time.time() - 600, sync_state
+    )
+
+    assert [m['msgid'] for m in to_handle] == [fresh['msgid']]
+    # 客服消息和冷启动窗口之前的消息直接标记已处理，随本页游标提交
+    assert {msgid for msgid, _ in page_marks} == {agent['msgid'], old['msgid']}
+    assert skipped == 4
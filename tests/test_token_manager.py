@@ -0,0 +1,102 @@
+# test_token_manager.py
+"""
+access_token管理器测试
+- 并发获取只触发一次gettoken（单飞）
+- 作废后重新获取，作废其他token不影响当前token
+- 共享存储（临时SQLite）：一个进程刷新，另一个进程直接读取，不再调用gettoken
+"""
+import threading
+import time
+
+import pytest
+
+from src.database.token_store_db import TokenStoreDatabase
+from src.services.token_manager import AccessTokenManager
+
+
+class FakeGetToken:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        with self._lock:
+            self.calls += 1
+            n = self.calls
+        time.sleep(self.delay)
+        return f"T{n}", 7200
+
+
+@pytest.fixture
+def token_store(sqlite_db):
+    store = TokenStoreDatabase(sqlite_db)
+    assert store.create_token_table()
+    return store
+
+
+def test_concurrent_callers_share_one_fetch():
+    fetch = FakeGetToken(delay=0.1)
+    manager = AccessTokenManager('wework', fetch)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(manager.get_token())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert results == ['T1'] * 8
+    assert fetch.calls == 1
+
+
+def test_invalidate_forces_refresh():
+    fetch = FakeGetToken()
+    manager = AccessTokenManager('wework', fetch)
+    assert manager.get_token() == 'T1'
+    # 其他调用方已作废过的旧token不影响当前token
+    manager.invalidate('T0')
+    assert manager.get_token() == 'T1'
+    manager.invalidate('T1')
+    assert manager.peek() is None
+    assert manager.get_token() == 'T2'
+    assert manager.get_stats()['invalidations'] == 2
+
+
+def test_token_expiring_soon_is_refreshed():
+    fetch = FakeGetToken()
+    manager = AccessTokenManager('wework', fetch, expiry_margin=60)
+    manager.fetch_func = lambda: ('short', 30)
+    assert manager.get_token() == 'short'
+    manager.fetch_func = fetch
+    assert manager.get_token() == 'T1'
+
+
+def test_processes_share_token_through_store(token_store):
+    fetch_a, fetch_b = FakeGetToken(), FakeGetToken()
+    proc_a = AccessTokenManager('wework', fetch_a, store=token_store)
+    proc_b = AccessTokenManager('wework', fetch_b, store=token_store)
+    proc_b.owner_id = 'other-process'
+
+    assert proc_a.get_token() == 'T1'
+    assert proc_b.get_token() == 'T1'
+    assert fetch_b.calls == 0
+    assert proc_b.get_stats()['store_hits'] == 1
+
+    # proc_b的调用返回42001时proc_a已经刷新过，proc_b作废旧token后直接读取新token
+    proc_a.invalidate('T1')
+    assert proc_a.get_token() == 'T2'
+    proc_b.invalidate('T1')
+    assert proc_b.get_token() == 'T2'
+    assert fetch_a.calls == 2 and fetch_b.calls == 0
+
+
+def test_waits_for_other_process_refresh(token_store):
+    fetch = FakeGetToken()
+    manager = AccessTokenManager('wework', fetch, store=token_store, wait_timeout=5)
+    assert token_store.claim_refresh('wework', 'other-process', 5)
+    saver = threading.Timer(0.3, lambda: token_store.save_token('wework', 'FROM_OTHER', time.time() + 7200))
+    saver.start()
+    try:
+        assert manager.get_token() == 'FROM_OTHER'
+    finally:
+        saver.join()
+    assert fetch.calls == 0